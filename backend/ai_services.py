@@ -328,9 +328,10 @@ class AIServiceOrchestrator:
                     
                     logger.info(f"📂 Loaded image data: {len(input_data)} bytes")
                     
-                    # Remove background
+                    # Remove background with the pooled session (model set up once per process)
                     logger.info("🔥 Processing with rembg...")
-                    output_data = remove(input_data)
+                    from modules.background_remover.sessions import get_rembg_sessions
+                    output_data = remove(input_data, session=get_rembg_sessions().get('u2net'))
                     
                     # Validate output
                     if not isinstance(output_data, bytes):
@@ -659,6 +660,7 @@ class AIServiceOrchestrator:
                 import numpy as np
                 import os
                 import urllib.request
+                from modules.upscaler.backends import DEFAULT_BACKEND, apply_backend
                 
                 logger.info(f"Initializing Real-ESRGAN for {scale_factor}x upscaling")
             except ImportError as e:
@@ -705,6 +707,7 @@ class AIServiceOrchestrator:
                 pre_pad=0,
                 half=False  # Use full precision
             )
+            upsampler = apply_backend(upsampler, DEFAULT_BACKEND, model_name, model_path)
             
             # Load and process image
             logger.info(f"Loading image: {input_path}")
@@ -0,0 +1,43 @@
+"""
+Benchmark: Real-ESRGAN inference backends
+Checks each backend against eager fp32 output and reports per-tile speed
+"""
+
+import argparse
+import json
+
+from modules.upscaler import UpscalerEngine
+from modules.upscaler.backends import available_backends
+
+
+def run_benchmark(scale, tile, batch_size, backends):
+    print("🧪 Real-ESRGAN backend parity and speed")
+    print("=" * 60)
+    print(f"📦 Available backends: {', '.join(available_backends()) or 'none'}")
+
+    engine = UpscalerEngine()
+    report = engine.backend_report(scale=scale, backends=backends, tile=tile, batch_size=batch_size)
+
+    print(f"\n📐 {scale}x network, {tile}px tiles, batch {batch_size}")
+    print(f"   eager        {report['eager_ms']:8.1f} ms")
+    for backend, result in report['backends'].items():
+        if 'error' in result:
+            print(f"   {backend:<12} ❌ {result['error']}")
+            continue
+        print(f"   {backend:<12} {result['ms']:8.1f} ms  {result['speedup']:.2f}x  "
+              f"max err {result['max_abs_error']}  mean err {result['mean_abs_error']}  PSNR {result['psnr']} dB")
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scale', type=int, default=4, choices=[2, 4])
+    parser.add_argument('--tile', type=int, default=128)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--backends', nargs='*', default=None)
+    parser.add_argument('--json', action='store_true', help="Print the raw report as JSON")
+    args = parser.parse_args()
+    report = run_benchmark(args.scale, args.tile, args.batch_size, args.backends)
+    if args.json:
+        print(json.dumps(report, indent=2))
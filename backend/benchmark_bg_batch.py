@@ -0,0 +1,82 @@
+"""
+Benchmark: batched rembg background removal
+Images per second at batch sizes 1, 4, 8 and 16 on the same set of images
+"""
+
+import argparse
+import glob
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from modules.background_remover import BackgroundRemover
+from modules.background_remover.batching import adaptive_batch_size
+from modules.background_remover.mask_store import MaskStore
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.webp')
+
+
+def sample_images(source, count, size, workdir):
+    """`count` images from `source` (repeated as needed), or synthetic ones"""
+    paths = []
+    if source:
+        for pattern in IMAGE_PATTERNS:
+            paths.extend(sorted(glob.glob(os.path.join(source, pattern))))
+    if paths:
+        return [paths[i % len(paths)] for i in range(count)]
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        path = os.path.join(workdir, f"batch_input_{i}.png")
+        Image.fromarray(rng.integers(0, 256, (size, size, 3), dtype=np.uint8)).save(path)
+        paths.append(path)
+    return paths
+
+
+def run_benchmark(method, count, batch_sizes, source, size):
+    print("🧪 Batched background removal")
+    print("=" * 60)
+    remover = BackgroundRemover()
+    if method not in remover.get_available_methods():
+        print(f"❌ {method} is not available")
+        return {}
+    # A memory-only store, so every run segments instead of reusing masks
+    remover.mask_store = MaskStore(max_bytes=0, disk_dir=None)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        inputs = sample_images(source, count, size, workdir)
+        jobs = [(path, os.path.join(workdir, f"batch_output_{i}.png")) for i, path in enumerate(inputs)]
+        model = remover.available_methods[method]['model']
+        print(f"📐 {count} images, {method}; adaptive batch size here: "
+              f"{adaptive_batch_size(model, size * size)}")
+
+        # Untimed run loads the session
+        remover.remove_background_batch(jobs[:1], method, batch_size=1)
+        for batch_size in batch_sizes:
+            stats = {}
+            start = time.perf_counter()
+            ok = remover.remove_background_batch(jobs, method, batch_size=batch_size, stats=stats)
+            elapsed = time.perf_counter() - start
+            results[batch_size] = count / elapsed
+            print(f"   batch {batch_size:>2}  {count / elapsed:6.2f} images/s  "
+                  f"(inference {stats['batch']['inference_time']:.2f} s of {elapsed:.2f} s, {sum(ok)}/{count} ok)")
+
+    baseline = results.get(batch_sizes[0])
+    if baseline:
+        print(f"\n📊 Speedup over batch {batch_sizes[0]}: " +
+              ", ".join(f"{b}: {r / baseline:.2f}x" for b, r in results.items()))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--method', default='rembg_u2netp')
+    parser.add_argument('--images', type=int, default=32)
+    parser.add_argument('--batch-sizes', type=int, nargs='*', default=[1, 4, 8, 16])
+    parser.add_argument('--source', default=None, help="Directory of sample images (synthetic if omitted)")
+    parser.add_argument('--size', type=int, default=1024, help="Side of synthetic images")
+    args = parser.parse_args()
+    run_benchmark(args.method, args.images, args.batch_sizes, args.source, args.size)
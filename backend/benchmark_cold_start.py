@@ -0,0 +1,85 @@
+"""
+Benchmark: orchestrator cold start and info endpoint latency
+Each run is a fresh interpreter; point --backend-dir at a checkout of an older commit to compare
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Runs inside the fresh interpreter; prints one JSON line
+PROBE = r"""
+import json, sys, time
+start = time.perf_counter()
+import modular_ai_services
+imported = time.perf_counter()
+orchestrator = modular_ai_services.ModularAIOrchestrator()
+ready = time.perf_counter()
+
+def latency(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        try:
+            func()
+        except Exception as e:
+            return {'error': str(e)}
+    return {'ms': (time.perf_counter() - start) / calls * 1000}
+
+calls = int(sys.argv[1])
+upscaler = orchestrator.modules.get('upscaler')
+print(json.dumps({
+    'import_s': imported - start,
+    'init_s': ready - imported,
+    'torch_imported': 'torch' in sys.modules,
+    'rembg_imported': 'rembg' in sys.modules,
+    'models': latency(orchestrator.list_available_models, calls),
+    'system_info': latency(orchestrator.get_system_info, calls),
+    'upscaler_info': latency(upscaler.get_module_info, calls) if upscaler else None,
+}))
+"""
+
+
+def measure(backend_dir, calls):
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE, str(calls)],
+        cwd=backend_dir, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def show_latency(name, result):
+    if result is None:
+        print(f"   {name:<14} module not loaded")
+    elif 'error' in result:
+        print(f"   {name:<14} ❌ {result['error']}")
+    else:
+        print(f"   {name:<14} {result['ms']:8.2f} ms")
+
+
+def run_benchmark(backend_dir, runs, calls):
+    print("🧪 Cold start and info endpoint latency")
+    print("=" * 60)
+    print(f"📁 {os.path.abspath(backend_dir)}")
+
+    results = [measure(backend_dir, calls) for _ in range(runs)]
+    best = min(results, key=lambda r: r['import_s'] + r['init_s'])
+    print(f"\n🚀 Cold start (best of {runs})")
+    print(f"   import         {best['import_s'] * 1000:8.0f} ms")
+    print(f"   init           {best['init_s'] * 1000:8.0f} ms")
+    print(f"   torch imported at startup: {best['torch_imported']}, rembg: {best['rembg_imported']}")
+    print(f"\n📡 Info calls (mean of {calls})")
+    show_latency('models', best['models'])
+    show_latency('system_info', best['system_info'])
+    show_latency('upscaler_info', best['upscaler_info'])
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--backend-dir', default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--calls', type=int, default=20)
+    args = parser.parse_args()
+    run_benchmark(args.backend_dir, args.runs, args.calls)
@@ -0,0 +1,111 @@
+"""
+Benchmark: legacy PIL upscalers vs. the fused OpenCV pipelines
+Times 4x upscaling of a synthetic photo-like image and reports speedup and pixel drift
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageEnhance, ImageFilter
+
+from modules.upscaler.fused_filters import enhanced_pipeline, lanczos_pipeline, super_enhanced_pipeline
+
+
+def legacy_lanczos(img, scale):
+    """The PIL chain UpscalerEngine._lanczos_upscale used to run"""
+    size = img.size
+    if scale > 2:
+        img = img.resize((size[0] * 2, size[1] * 2), Image.Resampling.LANCZOS)
+    img = img.resize((size[0] * scale, size[1] * scale), Image.Resampling.LANCZOS)
+    img = img.filter(ImageFilter.UnsharpMask(radius=1, percent=200, threshold=0))
+    img = ImageEnhance.Sharpness(img).enhance(2.0)
+    img = ImageEnhance.Contrast(img).enhance(1.3)
+    return img.filter(ImageFilter.UnsharpMask(radius=2, percent=250, threshold=0))
+
+
+def legacy_super_enhanced(img, scale):
+    """The PIL chain UpscalerEngine._super_enhanced_pil_upscale used to run"""
+    img = Image.fromarray(cv2.bilateralFilter(np.array(img), 5, 50, 50))
+    size = img.size
+    if scale > 2:
+        img = img.resize((size[0] * 2, size[1] * 2), Image.Resampling.LANCZOS)
+        img = img.filter(ImageFilter.UnsharpMask(radius=1, percent=120, threshold=2))
+    img = img.resize((size[0] * scale, size[1] * scale), Image.Resampling.LANCZOS)
+    img = img.filter(ImageFilter.UnsharpMask(radius=2, percent=130, threshold=2))
+    return ImageEnhance.Contrast(img).enhance(1.15)
+
+
+def legacy_enhanced(img, scale):
+    """The PIL chain UpscalerEngine._enhanced_pil_upscale used to run"""
+    current_scale = 1
+    while current_scale < scale:
+        next_scale = min(2, scale // current_scale)
+        img = img.resize((img.width * next_scale, img.height * next_scale), Image.Resampling.LANCZOS)
+        img = img.filter(ImageFilter.UnsharpMask(radius=1, percent=150, threshold=3))
+        current_scale *= next_scale
+    return img
+
+
+def make_test_image(megapixels):
+    """Smooth gradients, texture and hard edges, roughly like a photo"""
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([
+        127 + 100 * np.sin(x / 180.0),
+        127 + 100 * np.cos(y / 140.0),
+        127 + 80 * np.sin((x + y) / 90.0),
+    ], axis=-1)
+    noise = cv2.GaussianBlur(rng.normal(0, 25, (height, width, 3)).astype(np.float32), (0, 0), 1.2)
+    img = np.clip(base + noise, 0, 255).astype(np.uint8)
+    for i in range(40):
+        cv2.rectangle(img, (int(rng.integers(width)), int(rng.integers(height))),
+                      (int(rng.integers(width)), int(rng.integers(height))),
+                      tuple(int(c) for c in rng.integers(0, 255, 3)), 3)
+    return img
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float32) - b.astype(np.float32)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+def run_benchmark(megapixels, scale):
+    print("🧪 Fused upscaler benchmark")
+    print("=" * 60)
+
+    rgb = make_test_image(megapixels)
+    bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+    print(f"📐 Input {rgb.shape[1]}x{rgb.shape[0]} ({rgb.shape[0] * rgb.shape[1] / 1e6:.1f} MP), scale {scale}x")
+
+    cases = [
+        ("lanczos", legacy_lanczos, lanczos_pipeline),
+        ("enhanced", legacy_enhanced, enhanced_pipeline),
+        ("super_enhanced", legacy_super_enhanced, super_enhanced_pipeline),
+    ]
+    for name, legacy, fused in cases:
+        start = time.perf_counter()
+        reference = np.asarray(legacy(Image.fromarray(rgb), scale))
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = cv2.cvtColor(fused(bgr.copy(), scale), cv2.COLOR_BGR2RGB)
+        fused_time = time.perf_counter() - start
+
+        diff = np.abs(reference.astype(np.int16) - result.astype(np.int16))
+        print(f"\n🎨 {name}")
+        print(f"   Legacy PIL: {legacy_time:.2f}s")
+        print(f"   Fused:      {fused_time:.2f}s  ({legacy_time / fused_time:.1f}x faster)")
+        print(f"   Mean abs diff {diff.mean():.2f}, max {diff.max()}, PSNR {psnr(reference, result):.1f} dB")
+        del reference, result, diff
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--megapixels', type=float, default=12.0)
+    parser.add_argument('--scale', type=int, default=4)
+    args = parser.parse_args()
+    run_benchmark(args.megapixels, args.scale)
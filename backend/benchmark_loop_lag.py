@@ -0,0 +1,93 @@
+"""
+Benchmark: event-loop lag under sustained background removal / restoration load
+Runs jobs through the orchestrator and, for comparison, the blocking engine call directly on the loop
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from modular_ai_services import ModularAIOrchestrator
+from modules.loop_monitor import LoopLagMonitor
+
+OPERATIONS = {
+    'background_removal': ('background_remover', 'remove_background', 'rembg_u2netp'),
+    'photo_restoration': ('photo_restoration', 'restore_photo', 'gfpgan_face_restore'),
+}
+
+
+def synthetic_image(path, size):
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(path)
+
+
+async def run_load(orchestrator, operation, image_path, jobs, concurrency, blocking):
+    """Run `jobs` jobs, `concurrency` at a time; returns (wall seconds, lag stats)"""
+    module_name, method, model = OPERATIONS[operation]
+    engine = orchestrator.modules[module_name]
+    monitor = LoopLagMonitor(interval=0.01)
+    monitor.start()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_job(index):
+        async with semaphore:
+            if blocking:
+                # The pre-executor behaviour: the engine runs on the loop thread
+                output_path = os.path.join(tempfile.gettempdir(), f"loop_lag_{index}.png")
+                if operation == 'background_removal':
+                    getattr(engine, method)(image_path, output_path, model)
+                else:
+                    getattr(engine, method)(image_path=image_path, method=model, output_path=output_path)
+            else:
+                await orchestrator.process_image(image_path, operation, model)
+            # Let the monitor observe the loop between jobs
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_job(i) for i in range(jobs)))
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0.05)
+    monitor.stop()
+    return elapsed, monitor.get_stats()
+
+
+def show(name, elapsed, jobs, stats):
+    print(f"   {name:<10} {jobs / elapsed:6.2f} jobs/s  lag p50 {stats.get('p50_ms', 0):7.1f} ms  "
+          f"p99 {stats.get('p99_ms', 0):7.1f} ms  max {stats['max_ms']:7.1f} ms")
+
+
+async def run_benchmark(operation, jobs, concurrency, size):
+    print(f"🧪 Event-loop lag during {operation}")
+    print("=" * 60)
+    orchestrator = ModularAIOrchestrator()
+    if OPERATIONS[operation][0] not in orchestrator.modules:
+        print(f"❌ {OPERATIONS[operation][0]} module not available")
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        image_path = os.path.join(workdir, 'loop_lag_input.png')
+        synthetic_image(image_path, size)
+        print(f"📐 {jobs} jobs on a {size}x{size} image, {concurrency} at a time\n")
+
+        # One untimed job loads models and sessions
+        await orchestrator.process_image(image_path, operation, OPERATIONS[operation][2])
+        for name, blocking in (('executor', False), ('blocking', True)):
+            elapsed, stats = await run_load(orchestrator, operation, image_path, jobs, concurrency, blocking)
+            show(name, elapsed, jobs, stats)
+    orchestrator.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--operation', default='background_removal', choices=sorted(OPERATIONS))
+    parser.add_argument('--jobs', type=int, default=12)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--size', type=int, default=1024)
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.operation, args.jobs, args.concurrency, args.size))
@@ -0,0 +1,80 @@
+"""
+Benchmark: low-resolution background-removal masks against full-resolution masks
+Reports mask IoU, boundary-band IoU and speedup per method over a set of sample images
+"""
+
+import argparse
+import glob
+import os
+import time
+
+from PIL import Image
+
+from modules.background_remover import bg_remover
+from modules.background_remover.mask_refine import boundary_band, mask_iou
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.webp')
+
+
+def sample_images(paths):
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in IMAGE_PATTERNS:
+                images.extend(sorted(glob.glob(os.path.join(path, pattern))))
+        else:
+            images.append(path)
+    return images
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run_benchmark(paths, methods):
+    print("🧪 Low-resolution masks vs full resolution")
+    print("=" * 60)
+    remover = bg_remover.BackgroundRemover()
+    available = remover.get_available_methods()
+    methods = [m for m in methods if m in available]
+    images = sample_images(paths)
+    print(f"📐 Mask side {bg_remover.LOWRES_MASK_SIDE}px, band {bg_remover.REFINE_BAND_PX}px, "
+          f"{len(images)} images, methods: {', '.join(methods)}")
+
+    totals = {}
+    for path in images:
+        with Image.open(path) as img:
+            image = img.convert('RGB')
+        if max(image.size) <= bg_remover.LOWRES_MASK_SIDE:
+            print(f"\n⏭️  {os.path.basename(path)}: {image.width}x{image.height} is already below the mask side")
+            continue
+        print(f"\n🖼️  {os.path.basename(path)} ({image.width}x{image.height})")
+        for method in methods:
+            full, full_s = timed(remover.compute_mask, image, method)
+            band = boundary_band(full.astype('float32') / 255, bg_remover.REFINE_BAND_PX)
+            for mode, refine in (('low_res', False), ('low_res+band', True)):
+                mask, seconds = timed(remover.compute_mask, image, method, low_res=True, refine_band=refine)
+                iou, edge_iou = mask_iou(mask, full), mask_iou(mask, full, band)
+                print(f"   {method:<14} {mode:<13} {seconds * 1000:8.0f} ms vs {full_s * 1000:8.0f} ms  "
+                      f"{full_s / seconds:5.1f}x  IoU {iou:.4f}  boundary IoU {edge_iou:.4f}")
+                totals.setdefault((method, mode), []).append((full_s / seconds, iou, edge_iou))
+
+    if totals:
+        print("\n📊 Mean over the sample set")
+        for (method, mode), rows in totals.items():
+            n = len(rows)
+            print(f"   {method:<14} {mode:<13} {sum(r[0] for r in rows) / n:5.1f}x  "
+                  f"IoU {sum(r[1] for r in rows) / n:.4f}  boundary IoU {sum(r[2] for r in rows) / n:.4f}")
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('images', nargs='*', default=['uploads'], help="Image files or directories")
+    parser.add_argument('--methods', nargs='*', default=['rembg_u2netp', 'rembg', 'grabcut', 'threshold'])
+    parser.add_argument('--mask-side', type=int, default=bg_remover.LOWRES_MASK_SIDE)
+    args = parser.parse_args()
+    bg_remover.LOWRES_MASK_SIDE = args.mask_side
+    run_benchmark(args.images, args.methods)
@@ -13,6 +13,12 @@ import logging
 
 # Import the new modular AI services
 from modular_ai_services import ModularAIOrchestrator
+from modules.admission import (
+    AdmissionRejected, InvalidImage, estimate_batch, estimate_file, estimate_region, get_admission_controller
+)
+from modules.background_remover.batching import BATCH_MAX_SIZE
+from modules.background_remover.compositing import BACKGROUNDS
+from modules.upscaler.tile_autotuner import AUTOTUNE_ON_STARTUP
 
 from database import init_db, get_db, ProcessingHistory, UserSession
 
@@ -43,11 +49,102 @@ app.add_middleware(
 # Initialize Modular AI Services
 ai_orchestrator = ModularAIOrchestrator()
 
+# Jobs reserve their estimated peak memory before they start
+admission = get_admission_controller()
+
+
+def admission_http_error(e: AdmissionRejected) -> HTTPException:
+    """429 with Retry-After when the server is busy, 413 when the job can never fit"""
+    if e.retry_after is None:
+        return HTTPException(status_code=413, detail=str(e))
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+async def process_admitted(image_path: str, operation: str, model: Optional[str] = None,
+                           options: str = "{}") -> Dict[str, Any]:
+    """Run an orchestrator job once the admission controller has room for it"""
+    try:
+        scale = json.loads(options or "{}").get('scale') if operation == "photo_restoration" else None
+    except (ValueError, AttributeError):
+        scale = None
+    try:
+        estimate = estimate_file(image_path, operation, model, scale)
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        async with admission.reserve(estimate, label=f"{operation}:{Path(image_path).name}"):
+            return await ai_orchestrator.process_image(
+                image_path=image_path,
+                operation=operation,
+                model=model,
+                options=options or "{}"
+            )
+    except AdmissionRejected as e:
+        raise admission_http_error(e)
+
+
+def rejected_result(filename: str, e: HTTPException) -> Dict[str, Any]:
+    """Batch entry for a file the admission controller turned away"""
+    return {
+        "filename": filename,
+        "status": "rejected",
+        "error": e.detail,
+        "retry_after": (e.headers or {}).get("Retry-After")
+    }
+
+
+async def process_batch_admitted(saved: List[tuple], operation: str, model: Optional[str],
+                                 options: str = "{}") -> Optional[List[Dict[str, Any]]]:
+    """
+    Run a multi-file job as batched inference under one admission reservation
+    
+    Returns None when the batch as a whole can never fit the memory budget or
+    holds an unreadable file, so the caller falls back to admitting the files
+    one at a time (and reports the bad ones).
+    """
+    try:
+        estimates = [estimate_file(path, operation, model) for _, path in saved]
+    except InvalidImage:
+        return None
+    estimate = estimate_batch(estimates, concurrent=min(len(saved), BATCH_MAX_SIZE))
+    try:
+        async with admission.reserve(estimate, label=f"batch:{operation}:{len(saved)}"):
+            batch_results = await ai_orchestrator.process_batch(
+                [path for _, path in saved], operation, model, options or "{}"
+            )
+    except AdmissionRejected as e:
+        if e.retry_after is None:
+            return None
+        error = admission_http_error(e)
+        return [rejected_result(filename, error) for filename, _ in saved]
+    
+    return [
+        {"filename": filename, "result": result, "status": "success"}
+        for (filename, _), result in zip(saved, batch_results)
+    ]
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup"""
     init_db()
     logger.info("✅ Database initialized")
+    
+    # Sample event-loop lag from startup so /api/v1/health shows whether engine calls block the loop
+    ai_orchestrator.loop_monitor.start()
+    
+    # Restoration models load in the background; /api/v1/ready reports 503 until they are warm
+    ai_orchestrator.start_warmup()
+    
+    # Opt-in (UPSCALER_AUTOTUNE=1): tune Real-ESRGAN tile sizes in the background; profiled hosts return immediately
+    if 'upscaler' in ai_orchestrator.modules and AUTOTUNE_ON_STARTUP:
+        loop = asyncio.get_event_loop()
+        loop.run_in_executor(None, ai_orchestrator.modules['upscaler'].autotune_tiles)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop supervised worker processes"""
+    ai_orchestrator.shutdown()
 
 @app.get("/")
 async def root():
@@ -88,9 +185,17 @@ async def health_check_v1():
     return {
         "status": "healthy",
         "timestamp": asyncio.get_event_loop().time(),
-        "ai_services": ai_orchestrator.get_available_services()
+        "ai_services": ai_orchestrator.get_available_services(),
+        "readiness": ai_orchestrator.get_readiness(),
+        "event_loop": ai_orchestrator.loop_monitor.get_stats()
     }
 
+@app.get("/api/v1/ready")
+async def readiness_check():
+    """Readiness probe: 503 while warmed modules are cold, warming or failed"""
+    readiness = ai_orchestrator.get_readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
 @app.post("/api/v1/enhance")
 async def enhance_image(
     file: UploadFile = File(...),
@@ -113,12 +218,7 @@ async def enhance_image(
             buffer.write(content)
         
         # Process image
-        result = await ai_orchestrator.process_image(
-            image_path=upload_path,
-            operation=operation,
-            model=model,
-            options=options or "{}"
-        )
+        result = await process_admitted(upload_path, operation, model, options or "{}")
         
         return JSONResponse(content={
             "status": "success",
@@ -129,6 +229,8 @@ async def enhance_image(
             "model_used": result.get("model_used", model or "auto")
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Enhancement error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Enhancement failed: {str(e)}")
@@ -215,12 +317,7 @@ async def process_image(
             buffer.write(content)
         
         # Process image
-        result = await ai_orchestrator.process_image(
-            image_path=upload_path,
-            operation=operation,
-            model=model,
-            options=options or "{}"
-        )
+        result = await process_admitted(upload_path, operation, model, options or "{}")
         
         return JSONResponse(content={
             "status": "success",
@@ -239,6 +336,8 @@ async def process_image(
             "model_used": result.get("model_used", model or "auto")
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Processing error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
@@ -247,13 +346,14 @@ async def process_image(
 async def batch_process(
     files: List[UploadFile] = File(...),
     operation: str = Form(...),
-    model: Optional[str] = Form(None)
+    model: Optional[str] = Form(None),
+    options: Optional[str] = Form("{}")
 ):
     """Process multiple images in batch"""
     try:
         logger.info(f"Batch processing {len(files)} images")
         
-        results = []
+        saved = []
         for file in files:
             if not file.content_type or not file.content_type.startswith('image/'):
                 continue
@@ -263,26 +363,33 @@ async def batch_process(
             with open(upload_path, "wb") as buffer:
                 content = await file.read()
                 buffer.write(content)
-            
-            # Process image
-            result = await ai_orchestrator.process_image(
-                image_path=upload_path,
-                operation=operation,
-                model=model
-            )
-            
-            results.append({
-                "filename": file.filename,
-                "result": result,
-                "status": "success"
-            })
+            saved.append((file.filename, upload_path))
+        
+        results = None
+        if operation == "background_removal" and len(saved) > 1:
+            results = await process_batch_admitted(saved, operation, model, options or "{}")
+        if results is None:
+            results = []
+            for filename, upload_path in saved:
+                # Process image; a file the server has no room for is reported, not fatal
+                try:
+                    result = await process_admitted(upload_path, operation, model, options or "{}")
+                except HTTPException as e:
+                    results.append(rejected_result(filename, e))
+                    continue
+                
+                results.append({
+                    "filename": filename,
+                    "result": result,
+                    "status": "success"
+                })
         
         return JSONResponse(content={
             "status": "success",
             "message": f"Batch processed {len(results)} images",
             "results": results,
-            "total_cost": sum(r["result"].get("cost", 0) for r in results),
-            "total_processing_time": sum(r["result"].get("processing_time", 0) for r in results)
+            "total_cost": sum(r["result"].get("cost", 0) for r in results if "result" in r),
+            "total_processing_time": sum(r["result"].get("processing_time", 0) for r in results if "result" in r)
         })
         
     except Exception as e:
@@ -327,12 +434,7 @@ async def restore_photo(
         parsed_options['scale'] = scale
         
         # Process with photo restoration
-        result = await ai_orchestrator.process_image(
-            image_path=upload_path,
-            operation="photo_restoration",
-            model=method,
-            options=json.dumps(parsed_options)
-        )
+        result = await process_admitted(upload_path, "photo_restoration", method, json.dumps(parsed_options))
         
         return JSONResponse(content={
             "status": "success", 
@@ -352,10 +454,154 @@ async def restore_photo(
             "ai_enhanced": result.get("metadata", {}).get("method", "").startswith("gfpgan")
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Photo restoration error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Photo restoration failed: {str(e)}")
 
+@app.post("/api/v1/upscale-region")
+async def upscale_region(
+    filename: str = Form(...),
+    x: int = Form(...),
+    y: int = Form(...),
+    width: int = Form(...),
+    height: int = Form(...),
+    scale: Optional[int] = Form(4),
+    model: Optional[str] = Form(None),
+    options: Optional[str] = Form("{}")
+):
+    """
+    Upscale only the visible part of an image (viewport pan/zoom)
+    
+    `filename` is the name returned by /api/upload; x, y, width and height are
+    the viewport rectangle in original image pixels. Tile outputs are cached,
+    so requests for overlapping viewports only compute newly exposed tiles.
+    """
+    try:
+        # Only files that went through /api/upload
+        upload_path = Path("uploads") / Path(filename).name
+        if not upload_path.exists():
+            raise HTTPException(status_code=404, detail="Uploaded file not found")
+        if width <= 0 or height <= 0:
+            raise HTTPException(status_code=400, detail="Region width and height must be positive")
+        if scale not in (2, 4):
+            raise HTTPException(status_code=400, detail="Scale must be 2 or 4")
+        
+        logger.info(f"Region upscaling: {upload_path.name} ({x}, {y}, {width}x{height}) at {scale}x")
+        try:
+            estimate = estimate_region(str(upload_path), width, height, model, scale)
+        except InvalidImage as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        try:
+            async with admission.reserve(estimate, label=f"region:{upload_path.name}"):
+                result = await ai_orchestrator.upscale_region(
+                    image_path=str(upload_path),
+                    x=x, y=y, width=width, height=height,
+                    scale=scale,
+                    model=model,
+                    options=options or "{}"
+                )
+        except AdmissionRejected as e:
+            raise admission_http_error(e)
+        if result.get("status") != "success":
+            raise HTTPException(status_code=400, detail=f"Region upscaling failed: {result.get('error')}")
+        
+        return JSONResponse(content={
+            "status": "success",
+            "message": "Region upscaled successfully",
+            "result": {
+                "output_path": result.get("output_path"),
+                "output_filename": result.get("output_filename"),
+                "processing_time": result.get("processing_time", 0),
+                "model_used": result.get("model_used"),
+                "operation": result.get("operation"),
+                "module": result.get("module", "upscaler"),
+                "metadata": result.get("metadata", {})
+            },
+            "processing_time": result.get("processing_time", 0)
+        })
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Region upscaling error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Region upscaling failed: {str(e)}")
+
+@app.post("/api/v1/replace-background")
+async def replace_background(
+    filename: str = Form(...),
+    background: str = Form("transparent"),
+    model: Optional[str] = Form(None),
+    options: Optional[str] = Form("{}"),
+    background_file: Optional[UploadFile] = File(None)
+):
+    """
+    Composite a background-removed subject over a new background
+    
+    `filename` is the name returned by /api/upload. `background` is one of
+    transparent, color, blur, image (uses `background_file`) or mask (the
+    single-channel alpha mask). The mask of an earlier removal of the same
+    image and model is reused, so changing background or format
+    (options: color, blur_radius, format) does not run segmentation again.
+    """
+    background_path = None
+    try:
+        upload_path = Path("uploads") / Path(filename).name
+        if not upload_path.exists():
+            raise HTTPException(status_code=404, detail="Uploaded file not found")
+        if background not in BACKGROUNDS:
+            raise HTTPException(status_code=400, detail=f"Background must be one of: {', '.join(BACKGROUNDS)}")
+        if background == "image":
+            if background_file is None or not (background_file.content_type or "").startswith('image/'):
+                raise HTTPException(status_code=400, detail="An image background needs an image background_file")
+            background_path = f"uploads/bg_{uuid.uuid4()}{Path(background_file.filename or '').suffix}"
+            with open(background_path, "wb") as buffer:
+                buffer.write(await background_file.read())
+        
+        logger.info(f"Background replacement: {upload_path.name} -> {background}")
+        try:
+            estimate = estimate_file(str(upload_path), "background_removal", model)
+        except InvalidImage as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        try:
+            async with admission.reserve(estimate, label=f"background:{upload_path.name}"):
+                result = await ai_orchestrator.replace_background(
+                    image_path=str(upload_path),
+                    background=background,
+                    model=model,
+                    options=options or "{}",
+                    background_path=background_path
+                )
+        except AdmissionRejected as e:
+            raise admission_http_error(e)
+        if result.get("status") != "success":
+            raise HTTPException(status_code=400, detail=f"Background replacement failed: {result.get('error')}")
+        
+        return JSONResponse(content={
+            "status": "success",
+            "message": "Background replaced successfully",
+            "result": {
+                "output_path": result.get("output_path"),
+                "output_filename": result.get("output_filename"),
+                "processing_time": result.get("processing_time", 0),
+                "model_used": result.get("model_used"),
+                "operation": result.get("operation"),
+                "module": result.get("module", "background_remover"),
+                "metadata": result.get("metadata", {})
+            },
+            "processing_time": result.get("processing_time", 0)
+        })
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Background replacement error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Background replacement failed: {str(e)}")
+    finally:
+        if background_path and os.path.exists(background_path):
+            os.remove(background_path)
+
 @app.get("/api/v1/download/{filename}")
 async def download_processed_image(filename: str):
     """Download processed image"""
@@ -410,6 +656,11 @@ async def upload_image(file: UploadFile = File(...)):
         logger.error(f"Upload error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+@app.get("/api/v1/admission")
+async def get_admission_status():
+    """Memory budget, current reservations and queue of the admission controller"""
+    return admission.get_stats()
+
 @app.get("/api/v1/stats")
 async def get_processing_stats():
     """Get processing statistics"""
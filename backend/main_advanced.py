@@ -19,6 +19,7 @@ import json
 import logging
 import os
 import tempfile
+import threading
 import time
 import uuid
 from contextlib import asynccontextmanager
@@ -37,6 +38,20 @@ from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 import uvicorn
 
+from modular_ai_services import OUTPUT_FORMATS
+from modules.admission import (
+    AdmissionRejected, InvalidImage, JobEstimate, estimate_file, estimate_job, get_admission_controller,
+    read_dimensions
+)
+from modules.loop_monitor import get_loop_monitor
+from modules.model_registry import ModelKey, get_model_registry
+from modules.thread_budget import get_thread_budget
+from modules.upscaler.backends import apply_backend, split_model_id
+from modules.upscaler.image_io import ENCODER_PROFILES, save_bgr, write_preview
+from modules.upscaler.tile_autotuner import AUTOTUNE_ON_STARTUP, autotune, get_tile_config, max_tile_size, network_id
+from modules.upscaler.tile_cache import get_tile_cache
+from modules.upscaler.upscaler_engine import realesrgan_model_spec, tiled_copy
+
 # Configure advanced logging
 logging.basicConfig(
     level=logging.INFO,
@@ -64,7 +79,6 @@ class Config:
     # Processing configuration
     MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
     SUPPORTED_FORMATS = {".jpg", ".jpeg", ".png", ".webp", ".tiff"}
-    TILE_SIZE = 512  # For memory-efficient processing
     
     # Model configuration
     MODELS = {
@@ -104,18 +118,118 @@ class Config:
 
 config = Config()
 
+def model_network_id(model_name: str) -> str:
+    """Tile profile key for a configured model"""
+    model_config = config.MODELS[model_name]
+    depth = model_config.get("num_block", model_config.get("num_conv"))
+    return network_id(model_config["arch"], model_config["scale"], depth)
+
+def realesrganer_spec(model_name: str, backend: str):
+    """
+    Model registry key and loader for a configured model
+
+    RealESRGAN_x2plus/x4plus use the upscaler engine's spec, so this server,
+    the upscaler and photo restoration hold one resident copy of those
+    weights. Tiling is not part of the key; see tiled_copy().
+    """
+    import torch
+
+    model_config = config.MODELS[model_name]
+    if model_config["arch"] == "RRDBNet" and model_config["num_block"] == 23:
+        return realesrgan_model_spec(model_config["scale"], backend)
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    key = ModelKey(
+        architecture=f"{model_config['arch']}/{model_name}",
+        scale=model_config["scale"],
+        precision='fp16' if device == 'cuda' else 'fp32',  # Half precision on GPU
+        device=device,
+        backend=backend
+    )
+
+    def loader():
+        from realesrgan import RealESRGANer
+        from basicsr.archs.rrdbnet_arch import RRDBNet
+        from basicsr.archs.srvgg_arch import SRVGGNetCompact
+
+        model_path = config.MODEL_CACHE_DIR / f"{model_name}.pth"
+        # Create model architecture
+        if model_config["arch"] == "RRDBNet":
+            model = RRDBNet(
+                num_in_ch=3,
+                num_out_ch=3,
+                num_feat=model_config["num_feat"],
+                num_block=model_config["num_block"],
+                num_grow_ch=model_config["num_grow_ch"],
+                scale=model_config["scale"]
+            )
+        elif model_config["arch"] == "SRVGGNetCompact":
+            model = SRVGGNetCompact(
+                num_in_ch=3,
+                num_out_ch=3,
+                num_feat=model_config["num_feat"],
+                num_conv=model_config["num_conv"],
+                upsampler=model_config["upsampler"],
+                act_type='prelu'
+            )
+        else:
+            raise ValueError(f"Unknown architecture: {model_config['arch']}")
+
+        tile, tile_pad = get_tile_config(model_network_id(model_name))
+        upsampler = RealESRGANer(
+            scale=model_config["scale"],
+            model_path=str(model_path),
+            model=model,
+            tile=tile,
+            tile_pad=tile_pad,
+            pre_pad=0,
+            half=key.precision == 'fp16',
+            gpu_id=0 if device == 'cuda' else None,
+            device=torch.device(device)
+        )
+        return apply_backend(upsampler, backend, model_name, str(model_path))
+
+    return key, loader
+
+# Operations served by the modular engines (modular_ai_services) rather than RealESRGANer here
+ORCHESTRATOR_OPERATIONS = {"upscaling", "background_removal"}
+_orchestrator = None
+_orchestrator_lock = threading.Lock()
+
+def get_orchestrator():
+    """Modular AI orchestrator, created on first use so plain Real-ESRGAN tasks never load it"""
+    global _orchestrator
+    with _orchestrator_lock:
+        if _orchestrator is None:
+            from modular_ai_services import ModularAIOrchestrator
+            _orchestrator = ModularAIOrchestrator()
+        return _orchestrator
+
 # Ensure directories exist
 for directory in [config.UPLOAD_DIR, config.PROCESSED_DIR, config.CACHE_DIR, config.MODEL_CACHE_DIR]:
     directory.mkdir(exist_ok=True)
 
+# Upscaled tile cores that get reused spill to the cache dir unless UPSCALER_TILE_CACHE_DIR points elsewhere
+tile_cache = get_tile_cache()
+if tile_cache.disk_dir is None:
+    tile_cache.enable_disk(str(config.CACHE_DIR / "tiles"))
+
+# Tasks reserve their estimated peak memory before they start
+admission = get_admission_controller()
+
+# Event-loop lag, reported by /health
+loop_monitor = get_loop_monitor()
+
 # Pydantic models
 class ProcessingRequest(BaseModel):
-    operation: str = Field(..., description="Processing operation: upscale, denoise, face_enhance")
+    operation: str = Field(..., description="Processing operation: upscale, denoise, face_enhance, upscaling, background_removal")
     model: str = Field(..., description="Model to use for processing")
     output_format: str = Field(default="png", description="Output format: png, jpg, webp")
     denoise_strength: Optional[float] = Field(default=None, ge=-1, le=1, description="Denoising strength (-1 to 1)")
     face_enhance: bool = Field(default=False, description="Apply face enhancement")
     tile_size: Optional[int] = Field(default=None, ge=128, le=1024, description="Tile size for processing")
+    progressive: bool = Field(default=False, description="Send a fast preview before the full-quality result")
+    encoder_profile: Optional[str] = Field(default=None, pattern="^(fast|balanced|smallest)$", description="Output encoder profile: fast, balanced, smallest")
 
 class ProcessingStatus(BaseModel):
     task_id: str
@@ -123,6 +237,7 @@ class ProcessingStatus(BaseModel):
     progress: float = Field(ge=0, le=100)
     message: str = ""
     result_url: Optional[str] = None
+    preview_url: Optional[str] = None
     error: Optional[str] = None
     processing_time: Optional[float] = None
     created_at: str
@@ -150,6 +265,11 @@ class AdvancedAIProcessor:
         # Download essential models
         await self.download_essential_models()
         
+        # Opt-in (UPSCALER_AUTOTUNE=1): tune tile sizes in the background; profiled hosts return immediately
+        if AUTOTUNE_ON_STARTUP:
+            networks = sorted({model_network_id(name) for name in config.MODELS})
+            asyncio.get_event_loop().run_in_executor(None, autotune, networks)
+        
     async def download_essential_models(self):
         """Download and cache essential models"""
         essential_models = ["realesrgan_x4plus", "realesrgan_x4plus_anime"]
@@ -194,7 +314,7 @@ class AdvancedAIProcessor:
                 await progress_callback(10, "Initializing processing...")
                 
             # Ensure model is available
-            if not await self.ensure_model_available(request.model):
+            if not await self.ensure_model_available(split_model_id(request.model)[0]):
                 raise Exception(f"Model {request.model} not available")
                 
             if progress_callback:
@@ -220,6 +340,37 @@ class AdvancedAIProcessor:
             logger.error(f"❌ Processing failed: {e}")
             raise e
 
+    async def process_with_modules(
+        self,
+        input_path: Path,
+        output_path: Path,
+        request: ProcessingRequest,
+        preview_callback=None,
+        progress_callback=None
+    ) -> Dict[str, Any]:
+        """Run an orchestrator operation (upscaling, background_removal) through the modular engines"""
+        if progress_callback:
+            await progress_callback(10, "Loading AI modules...")
+        
+        orchestrator = await asyncio.get_event_loop().run_in_executor(None, get_orchestrator)
+        options = {"output_format": request.output_format}
+        if request.denoise_strength is not None:
+            options["denoise_strength"] = request.denoise_strength
+        if request.encoder_profile is not None:
+            options["encoder_profile"] = request.encoder_profile
+        
+        result = await orchestrator.process_image(
+            str(input_path), request.operation, request.model, json.dumps(options),
+            on_preview=preview_callback
+        )
+        if result.get("status") != "success":
+            raise Exception(result.get("error", "Processing failed"))
+        
+        # The engine wrote the requested format; keep the task's naming so the download endpoint finds it
+        os.replace(result["output_path"], output_path)
+        result["output_path"] = str(output_path)
+        return result
+    
     async def _real_esrgan_advanced_processing(
         self, 
         input_path: Path, 
@@ -231,52 +382,14 @@ class AdvancedAIProcessor:
         
         def process_sync():
             try:
-                from realesrgan import RealESRGANer
-                from basicsr.archs.rrdbnet_arch import RRDBNet
-                from basicsr.archs.srvgg_arch import SRVGGNetCompact
                 import cv2
-                import numpy as np
-                from PIL import Image
                 import torch
                 
-                # Model configuration
-                model_config = config.MODELS[request.model]
-                model_path = config.MODEL_CACHE_DIR / f"{request.model}.pth"
-                
-                # Create model architecture
-                if model_config["arch"] == "RRDBNet":
-                    model = RRDBNet(
-                        num_in_ch=3,
-                        num_out_ch=3,
-                        num_feat=model_config["num_feat"],
-                        num_block=model_config["num_block"],
-                        num_grow_ch=model_config["num_grow_ch"],
-                        scale=model_config["scale"]
-                    )
-                elif model_config["arch"] == "SRVGGNetCompact":
-                    model = SRVGGNetCompact(
-                        num_in_ch=3,
-                        num_out_ch=3,
-                        num_feat=model_config["num_feat"],
-                        num_conv=model_config["num_conv"],
-                        upsampler=model_config["upsampler"],
-                        act_type='prelu'
-                    )
-                else:
-                    raise ValueError(f"Unknown architecture: {model_config['arch']}")
-                
-                # Initialize upsampler with advanced settings
-                upsampler = RealESRGANer(
-                    scale=model_config["scale"],
-                    model_path=str(model_path),
-                    model=model,
-                    tile=request.tile_size or config.TILE_SIZE,
-                    tile_pad=10,
-                    pre_pad=0,
-                    half=torch.cuda.is_available(),  # Use half precision on GPU
-                    gpu_id=0 if torch.cuda.is_available() else None,
-                    device=torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-                )
+                # Model configuration ('name@backend' picks the inference backend)
+                model_name, backend = split_model_id(request.model)
+                model_config = config.MODELS[model_name]
+                key, loader = realesrganer_spec(model_name, backend)
+                tile, tile_pad = get_tile_config(model_network_id(model_name))
                 
                 # Load and process image
                 img = cv2.imread(str(input_path), cv2.IMREAD_COLOR)
@@ -285,30 +398,37 @@ class AdvancedAIProcessor:
                 
                 logger.info(f"🖼️ Input image: {img.shape}")
                 
-                # Enhanced processing with optimal parameters
-                if request.denoise_strength is not None:
-                    # Apply denoising if specified
-                    output, _ = upsampler.enhance(
-                        img, 
-                        outscale=model_config["scale"],
-                        alpha_upsampler='realesrgan'
-                    )
-                else:
-                    output, _ = upsampler.enhance(
-                        img,
-                        outscale=model_config["scale"]
-                    )
+                # Resident weights shared with the modular engines; enhance() keeps state on the
+                # instance, so each request runs its own shallow copy with its own tiling
+                # torch_work() takes turns with the modular engines' torch work on the same cores
+                with get_model_registry().lease(key, loader, owner='advanced') as shared, get_thread_budget().torch_work():
+                    upsampler = tiled_copy(shared, request.tile_size or tile, tile_pad)
+                    # Enhanced processing with optimal parameters
+                    if request.denoise_strength is not None:
+                        # Apply denoising if specified
+                        output, _ = upsampler.enhance(
+                            img, 
+                            outscale=model_config["scale"],
+                            alpha_upsampler='realesrgan'
+                        )
+                    else:
+                        output, _ = upsampler.enhance(
+                            img,
+                            outscale=model_config["scale"]
+                        )
                 
                 # Face enhancement if requested
                 if request.face_enhance:
                     try:
                         from gfpgan import GFPGANer
+                        # `output` is already upscaled: without a bg_upsampler GFPGAN pastes the
+                        # restored faces back onto it instead of running Real-ESRGAN over it again
                         face_enhancer = GFPGANer(
                             model_path='https://github.com/TencentARC/GFPGAN/releases/download/v1.3.0/GFPGANv1.4.pth',
                             upscale=1,  # Don't upscale faces, just enhance
                             arch='clean',
                             channel_multiplier=2,
-                            bg_upsampler=upsampler
+                            bg_upsampler=None
                         )
                         _, _, output = face_enhancer.enhance(
                             output, 
@@ -322,17 +442,8 @@ class AdvancedAIProcessor:
                     except Exception as e:
                         logger.warning(f"⚠️ Face enhancement failed: {e}")
                 
-                # Convert and save with optimal quality
-                if request.output_format.lower() in ['jpg', 'jpeg']:
-                    output_rgb = cv2.cvtColor(output, cv2.COLOR_BGR2RGB)
-                    pil_img = Image.fromarray(output_rgb)
-                    pil_img.save(output_path, 'JPEG', quality=95, optimize=True)
-                elif request.output_format.lower() == 'webp':
-                    output_rgb = cv2.cvtColor(output, cv2.COLOR_BGR2RGB) 
-                    pil_img = Image.fromarray(output_rgb)
-                    pil_img.save(output_path, 'WEBP', quality=95, lossless=False)
-                else:  # PNG
-                    cv2.imwrite(str(output_path), output)
+                # Encode with the requested profile (the extension picks the format)
+                encode_seconds = save_bgr(str(output_path), output, profile=request.encoder_profile)
                 
                 logger.info(f"✅ Output saved: {output_path}")
                 logger.info(f"📊 Output size: {output.shape}")
@@ -342,7 +453,8 @@ class AdvancedAIProcessor:
                     "output_dimensions": output.shape[:2][::-1],
                     "scale_factor": model_config["scale"],
                     "model_arch": model_config["arch"],
-                    "device_used": "GPU" if torch.cuda.is_available() else "CPU"
+                    "device_used": "GPU" if torch.cuda.is_available() else "CPU",
+                    "encode_time": round(encode_seconds, 3)
                 }
                 
             except Exception as e:
@@ -399,6 +511,7 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 Starting AI Image Studio Advanced Backend")
     await processor.initialize()
+    loop_monitor.start()
     yield
     # Shutdown
     logger.info("🛑 Shutting down AI Image Studio Advanced Backend")
@@ -437,6 +550,8 @@ async def health_check():
         "models_available": list(config.MODELS.keys()),
         "gpu_available": await check_gpu_availability(),
         "disk_space": await get_disk_space(),
+        "event_loop": loop_monitor.get_stats(),
+        "model_memory": get_model_registry().get_stats()["owners"],
         "timestamp": time.time()
     }
 
@@ -495,15 +610,46 @@ async def process_image_advanced(
     output_format: str = Form(default="png"),
     denoise_strength: Optional[float] = Form(default=None),
     face_enhance: bool = Form(default=False),
-    tile_size: Optional[int] = Form(default=None)
+    tile_size: Optional[int] = Form(default=None),
+    progressive: bool = Form(default=False),
+    encoder_profile: Optional[str] = Form(default=None)
 ):
     """Advanced image processing with background tasks"""
     
     # Validate request
     await validate_upload_file(file)
+    if encoder_profile is not None and encoder_profile not in ENCODER_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown encoder profile: {encoder_profile} (expected one of {', '.join(ENCODER_PROFILES)})"
+        )
     
-    if model not in config.MODELS:
-        raise HTTPException(status_code=400, detail=f"Unknown model: {model}")
+    # The direct Real-ESRGAN operations encode with image_io.save_bgr, as upscaling does
+    formats = OUTPUT_FORMATS.get(operation, OUTPUT_FORMATS["upscaling"])
+    if output_format.lower() not in formats:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{operation} cannot write '{output_format}' output (expected one of {', '.join(formats)})"
+        )
+    output_format = output_format.lower()
+    
+    # Orchestrator operations take the modular engines' model ids (or 'auto')
+    if operation not in ORCHESTRATOR_OPERATIONS:
+        try:
+            model_name, _ = split_model_id(model)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if model_name not in config.MODELS:
+            raise HTTPException(status_code=400, detail=f"Unknown model: {model}")
+        
+        # Tile overrides must fit the memory limit measured for this host
+        if tile_size is not None:
+            max_tile = max_tile_size(model_network_id(model_name))
+            if tile_size > max_tile:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"tile_size {tile_size} exceeds the tuned maximum of {max_tile} for {model}"
+                )
     
     # Create processing request
     request = ProcessingRequest(
@@ -512,7 +658,9 @@ async def process_image_advanced(
         output_format=output_format,
         denoise_strength=denoise_strength,
         face_enhance=face_enhance,
-        tile_size=tile_size
+        tile_size=tile_size,
+        progressive=progressive,
+        encoder_profile=encoder_profile
     )
     
     # Generate task ID
@@ -527,6 +675,19 @@ async def process_image_advanced(
         content = await file.read()
         await f.write(content)
     
+    # Turn the task away now if the memory budget has no room for it soon
+    try:
+        estimate = estimate_task(input_path, request)
+        admission.check(estimate)
+    except InvalidImage as e:
+        input_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    except AdmissionRejected as e:
+        input_path.unlink(missing_ok=True)
+        if e.retry_after is None:
+            raise HTTPException(status_code=413, detail=str(e))
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    
     # Create output path
     output_filename = f"{task_id}_output.{output_format}"
     output_path = config.PROCESSED_DIR / output_filename
@@ -549,7 +710,8 @@ async def process_image_advanced(
         task_id,
         input_path,
         output_path,
-        request
+        request,
+        estimate
     )
     
     logger.info(f"🎯 Task {task_id} queued for processing")
@@ -565,7 +727,8 @@ async def process_image_background(
     task_id: str, 
     input_path: Path, 
     output_path: Path, 
-    request: ProcessingRequest
+    request: ProcessingRequest,
+    estimate: JobEstimate
 ):
     """Background image processing with progress updates"""
     
@@ -580,14 +743,36 @@ async def process_image_background(
             # Send WebSocket update
             await websocket_manager.send_update(task_id, task_storage[task_id])
     
+    async def preview_callback(preview: Dict[str, Any]):
+        """Publish the fast first phase of a progressive task"""
+        preview_path = Path(preview["output_path"])
+        target = config.PROCESSED_DIR / f"{task_id}_preview{preview_path.suffix}"
+        if preview_path != target:
+            os.replace(preview_path, target)
+        if task_id in task_storage:
+            task_storage[task_id].preview_url = f"/api/v2/preview/{task_id}"
+        await progress_callback(30, f"Preview ready in {preview['preview_time']:.2f}s, refining...")
+    
     try:
-        # Update status to processing
-        await progress_callback(5, "Starting processing...")
+        if admission.predicted_wait(estimate) > 0:
+            await progress_callback(2, "Waiting for memory...")
         
-        # Process image
-        result = await processor.process_image_advanced(
-            input_path, output_path, request, progress_callback
-        )
+        async with admission.reserve(estimate, label=task_id):
+            # Update status to processing
+            await progress_callback(5, "Starting processing...")
+            
+            # Process image
+            if request.operation in ORCHESTRATOR_OPERATIONS:
+                result = await processor.process_with_modules(
+                    input_path, output_path, request,
+                    preview_callback if request.progressive else None, progress_callback
+                )
+            else:
+                if request.progressive:
+                    await send_lanczos_preview(task_id, input_path, request, preview_callback)
+                result = await processor.process_image_advanced(
+                    input_path, output_path, request, progress_callback
+                )
         
         # Update final status
         task_storage[task_id].status = "completed"
@@ -623,6 +808,35 @@ async def process_image_background(
         except Exception as e:
             logger.warning(f"⚠️ Failed to cleanup input file: {e}")
 
+def estimate_task(input_path: Path, request: ProcessingRequest) -> JobEstimate:
+    """Peak memory and runtime of a task, from the image header and model"""
+    if request.operation in ORCHESTRATOR_OPERATIONS:
+        return estimate_file(str(input_path), request.operation, request.model)
+    # Direct RealESRGANer path: the whole output is held as float tensors
+    width, height = read_dimensions(str(input_path))
+    scale = config.MODELS[split_model_id(request.model)[0]]["scale"]
+    return estimate_job("realesrganer", width, height, scale, face_enhance=request.face_enhance)
+
+async def send_lanczos_preview(task_id: str, input_path: Path, request: ProcessingRequest, preview_callback):
+    """Preview phase for Real-ESRGAN tasks: a capped Lanczos upscale; failures only skip the phase"""
+    start_time = time.time()
+    preview_path = config.PROCESSED_DIR / f"{task_id}_preview.jpg"
+    scale = config.MODELS[split_model_id(request.model)[0]]["scale"]
+    try:
+        await asyncio.get_event_loop().run_in_executor(
+            None, write_preview, str(input_path), str(preview_path), scale
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ Preview failed for task {task_id}: {e}")
+        return
+    await preview_callback({"output_path": str(preview_path), "preview_time": time.time() - start_time})
+
+# Admission controller status
+@app.get("/api/v2/admission")
+async def get_admission_status():
+    """Memory budget, current reservations and queue of the admission controller"""
+    return admission.get_stats()
+
 # Task status endpoint
 @app.get("/api/v2/status/{task_id}", response_model=ProcessingStatus)
 async def get_task_status(task_id: str):
@@ -656,6 +870,23 @@ async def download_processed_file(task_id: str):
         media_type="application/octet-stream"
     )
 
+# Download the preview of a progressive task
+@app.get("/api/v2/preview/{task_id}")
+async def download_preview_file(task_id: str):
+    """Download the fast preview sent before the full-quality result"""
+    if task_id not in task_storage:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    preview_files = list(config.PROCESSED_DIR.glob(f"{task_id}_preview.*"))
+    if not preview_files:
+        raise HTTPException(status_code=404, detail="Preview not available")
+    
+    return FileResponse(
+        path=preview_files[0],
+        filename=f"preview_{preview_files[0].name}",
+        media_type="application/octet-stream"
+    )
+
 # WebSocket endpoint for real-time updates
 @app.websocket("/api/v2/ws/{task_id}")
 async def websocket_endpoint(websocket: WebSocket, task_id: str):
@@ -29,6 +29,11 @@ import numpy as np
 from PIL import Image
 import torch
 
+from modules.admission import (
+    AdmissionRejected, InvalidImage, JobEstimate, estimate_job, get_admission_controller, read_dimensions
+)
+from modules.upscaler.tile_autotuner import get_tile_config, network_id
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -41,8 +46,7 @@ class Config:
     MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
     SUPPORTED_FORMATS = {".jpg", ".jpeg", ".png", ".webp", ".tiff"}
     
-    # AI Model Settings
-    TILE_SIZE = 512
+    # AI Model Settings (tile size comes from the autotuned profile)
     TILE_PADDING = 32
     DEFAULT_MODEL = "x4plus"
     FACE_ENHANCE_DEFAULT = True
@@ -110,17 +114,16 @@ class AdvancedAIProcessor:
             config = model_configs.get(model_name, model_configs['x4'])
             
             # Create RRDBNet model
-            if 'anime' in model_name:
-                model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=6, num_grow_ch=32, scale=config['scale'])
-            else:
-                model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=config['scale'])
+            num_block = 6 if 'anime' in model_name else 23
+            model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=num_block, num_grow_ch=32, scale=config['scale'])
+            tile, _ = get_tile_config(network_id('RRDBNet', config['scale'], num_block))
             
             # Create upsampler
             self.models[model_name] = RealESRGANer(
                 scale=config['scale'],
                 model_path=config['model_path'],
                 model=model,
-                tile=Config.TILE_SIZE,
+                tile=tile,
                 tile_pad=Config.TILE_PADDING,
                 pre_pad=0,
                 half=True if self.device == 'cuda' else False,
@@ -260,6 +263,9 @@ app.mount("/processed", StaticFiles(directory=Config.PROCESSED_DIR), name="proce
 tasks: Dict[str, Dict[str, Any]] = {}
 connections: Dict[str, WebSocket] = {}
 
+# Tasks reserve their estimated peak memory before they start
+admission = get_admission_controller()
+
 # Utility functions
 def generate_task_id() -> str:
     """Generate unique task ID"""
@@ -285,7 +291,8 @@ async def background_process_image(
     task_id: str,
     input_path: Path,
     output_path: Path,
-    config: ProcessingRequest
+    config: ProcessingRequest,
+    estimate: JobEstimate
 ):
     """Background image processing with WebSocket updates"""
     async def progress_callback(progress: int, message: str):
@@ -312,16 +319,20 @@ async def background_process_image(
                     del connections[task_id]
     
     try:
+        if admission.predicted_wait(estimate) > 0:
+            await progress_callback(0, "Waiting for memory...")
+        
         # Process image
-        result = await processor.process_image(
-            input_path=input_path,
-            output_path=output_path,
-            enhancement=config.enhancement,
-            face_enhance=config.face_enhance,
-            denoise=config.denoise,
-            outscale=config.outscale,
-            progress_callback=progress_callback
-        )
+        async with admission.reserve(estimate, label=task_id):
+            result = await processor.process_image(
+                input_path=input_path,
+                output_path=output_path,
+                enhancement=config.enhancement,
+                face_enhance=config.face_enhance,
+                denoise=config.denoise,
+                outscale=config.outscale,
+                progress_callback=progress_callback
+            )
         
         # Update task with final result
         if task_id in tasks:
@@ -420,6 +431,21 @@ async def enhance_image(
             content = await file.read()
             await f.write(content)
         
+        # Turn the task away now if the memory budget has no room for it soon
+        # (enhance() holds the whole output as float tensors)
+        try:
+            width, height = read_dimensions(str(input_path))
+            estimate = estimate_job("realesrganer", width, height, outscale, face_enhance=face_enhance)
+            admission.check(estimate)
+        except InvalidImage as e:
+            input_path.unlink(missing_ok=True)
+            raise HTTPException(status_code=400, detail=str(e))
+        except AdmissionRejected as e:
+            input_path.unlink(missing_ok=True)
+            if e.retry_after is None:
+                raise HTTPException(status_code=413, detail=str(e))
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+        
         # Create task record
         tasks[task_id] = {
             "task_id": task_id,
@@ -450,7 +476,8 @@ async def enhance_image(
             task_id,
             input_path,
             output_path,
-            config
+            config,
+            estimate
         )
         
         logger.info(f"🚀 Started processing task: {task_id}")
@@ -462,6 +489,8 @@ async def enhance_image(
             message="Image uploaded and queued for processing"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Upload failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -499,6 +528,11 @@ async def websocket_endpoint(websocket: WebSocket, task_id: str):
         if task_id in connections:
             del connections[task_id]
 
+@app.get("/api/v1/admission")
+async def get_admission_status():
+    """Memory budget, current reservations and queue of the admission controller"""
+    return admission.get_stats()
+
 @app.get("/api/v1/stats")
 async def get_stats():
     """Get processing statistics"""
@@ -149,12 +149,16 @@ async def upload_and_process(
                     )
                     logger.info(f"✅ Ultra quality model downloaded: {model_path}")
                 
+                # Tile size comes from the host's autotuned profile
+                from modules.upscaler.tile_autotuner import get_tile_config, network_id
+                tile, _ = get_tile_config(network_id('RRDBNet', netscale, 23))
+                
                 # ULTRA QUALITY Real-ESRGAN parameters for maximum enhancement
                 upsampler = RealESRGANer(
                     scale=netscale,
                     model_path=model_path,
                     model=model_arch,
-                    tile=512,      # Enable advanced tiling for high-quality processing
+                    tile=tile,     # Enable advanced tiling for high-quality processing
                     tile_pad=32,   # Large padding to eliminate tile artifacts  
                     pre_pad=10,    # Pre-padding for perfect border quality
                     half=False,    # Use fp32 for absolute maximum quality (no half precision)
@@ -162,7 +166,7 @@ async def upload_and_process(
                 )
                 
                 logger.info(f"🚀 ULTRA QUALITY Real-ESRGAN initialized: {model_name}")
-                logger.info("📊 Configuration: tiling=512, tile_pad=32, fp32 precision, advanced preprocessing")
+                logger.info(f"📊 Configuration: tiling={tile}, tile_pad=32, fp32 precision, advanced preprocessing")
                 
                 # ADVANCED IMAGE PREPROCESSING for optimal quality input
                 logger.info("🔧 Applying advanced preprocessing for maximum quality...")
@@ -7,16 +7,36 @@ import logging
 import time
 import json
 import asyncio
-from typing import Dict, Any, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 from pathlib import Path
 
 # Import independent modules
 from modules.background_remover import BackgroundRemover
+from modules.background_remover.compositing import BLUR_RADIUS
 from modules.upscaler import UpscalerEngine
 from modules.photo_restoration import PhotoRestorationEngine
+from modules.capabilities import get_capabilities, has_capability
+from modules.executors import get_executor_stats
+from modules.loop_monitor import get_loop_monitor
+from modules.model_registry import get_model_registry
+from modules.thread_budget import get_thread_budget
+from modules.worker_pool import POOL_SIZE, WorkerPool
 
 logger = logging.getLogger(__name__)
 
+# Hard deadlines for jobs run in the supervised worker pool (seconds)
+BACKGROUND_REMOVAL_TIMEOUT = 120
+PHOTO_RESTORATION_TIMEOUT = 300
+
+# Operations that can send a fast preview before the full-quality result
+PROGRESSIVE_OPERATIONS = ("upscaling", "background_removal")
+# Output extensions each operation can write (options["output_format"]); the first is the default
+OUTPUT_FORMATS = {
+    "background_removal": ("png", "webp"),  # The cut-out keeps its alpha channel
+    "upscaling": ("jpg", "jpeg", "png", "webp"),
+    "photo_restoration": ("jpg", "jpeg", "png", "webp"),
+}
+
 
 class ModularAIOrchestrator:
     """
@@ -26,7 +46,12 @@ class ModularAIOrchestrator:
     
     def __init__(self):
         self.modules = {}
+        self.worker_pool: Optional[WorkerPool] = None
+        self.thread_budget = get_thread_budget()
+        self.loop_monitor = get_loop_monitor()
+        self._warmed_modules = set()
         self._initialize_modules()
+        self._start_worker_pool()
     
     def _initialize_modules(self):
         """Initialize all independent modules"""
@@ -49,6 +74,64 @@ class ModularAIOrchestrator:
             logger.error(f"Failed to initialize modules: {e}")
             self.modules = {}
     
+    def _start_worker_pool(self):
+        """Fork the supervised worker pool once models are loaded (AI_WORKER_PROCESSES > 0)"""
+        if POOL_SIZE <= 0 or not self.modules:
+            return
+        if not WorkerPool.is_supported(self._engine_device()):
+            logger.warning("⚠️ Worker pool requires fork() and CPU engines; running engines in-process")
+            return
+        
+        # Load the default upscaling network and the warmed modules' models first so every
+        # worker inherits them and readiness reports whether they loaded
+        if 'upscaler' in self.modules:
+            self.modules['upscaler'].preload_models()
+        for name, module in self.modules.items():
+            if hasattr(module, 'load_before_fork') and module.load_before_fork():
+                self._warmed_modules.add(name)
+        
+        self.worker_pool = WorkerPool(targets=self.modules, size=POOL_SIZE)
+        if 'upscaler' in self.modules:
+            self.modules['upscaler'].worker_pool = self.worker_pool
+    
+    def _engine_device(self) -> str:
+        """Device the engines' torch models run on"""
+        if not has_capability('torch'):
+            return 'cpu'
+        import torch
+        return 'cuda' if torch.cuda.is_available() else 'cpu'
+    
+    def start_warmup(self):
+        """Load and warm modules with slow model setup in background threads (call once the server is up)"""
+        if self.worker_pool is not None:
+            # Models were loaded before the workers were forked
+            logger.info("Worker pool enabled; models were loaded before forking")
+            return
+        for name, module in self.modules.items():
+            if hasattr(module, 'start_warmup') and module.start_warmup():
+                self._warmed_modules.add(name)
+                logger.info(f"🔥 Warming {name} in the background")
+    
+    def get_readiness(self) -> Dict[str, Any]:
+        """
+        Per-module readiness ('cold', 'warming', 'ready', 'failed')
+        
+        Only modules being warmed gate `ready`, and only once they are
+        'ready': a failed warm-up keeps the probe failing and is listed under
+        `failed`. Lazily loaded modules are cold until their first job by design.
+        """
+        modules = {name: module.get_readiness() for name, module in self.modules.items()}
+        warmed = [modules[name] for name in self._warmed_modules]
+        failed = sorted(name for name in self._warmed_modules if modules[name] == 'failed')
+        ready = bool(modules) and all(state == 'ready' for state in warmed)
+        return {"ready": ready, "failed": failed, "modules": modules}
+    
+    def shutdown(self):
+        """Stop worker processes"""
+        if self.worker_pool is not None:
+            self.worker_pool.shutdown()
+            self.worker_pool = None
+    
     def get_available_services(self) -> Dict[str, Any]:
         """Get all available AI services from all modules"""
         services = {}
@@ -73,8 +156,8 @@ class ModularAIOrchestrator:
         if 'photo_restoration' in self.modules:
             restoration_methods = self.modules['photo_restoration'].get_available_restoration_methods()
             services['photo_restoration'] = {
-                method: {'available': True, 'type': 'photo_restoration'}
-                for method in restoration_methods.keys()
+                method['id']: {'available': True, 'type': 'photo_restoration'}
+                for method in restoration_methods
             }
         
         return services
@@ -84,7 +167,8 @@ class ModularAIOrchestrator:
         image_path: str,
         operation: str,
         model: Optional[str] = None,
-        options: str = "{}"
+        options: str = "{}",
+        on_preview: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
     ) -> Dict[str, Any]:
         """
         Process image using the appropriate independent module
@@ -94,11 +178,16 @@ class ModularAIOrchestrator:
             operation: Operation type ('background_removal', 'upscaling')
             model: Specific model/method to use
             options: JSON string with additional options
+            on_preview: Progressive mode; awaited with a fast preview result
+                (Lanczos upscale or low-res u2netp cut-out) before the full
+                result is computed
         
         Returns:
             Processing result dictionary
         """
         start_time = time.time()
+        # Lag sampling starts with the first job on the server's loop
+        self.loop_monitor.start()
         
         try:
             # Parse options
@@ -113,15 +202,36 @@ class ModularAIOrchestrator:
             # Generate output filename
             input_path = Path(image_path)
             
+            preview_time = None
+            if on_preview is not None and operation in PROGRESSIVE_OPERATIONS:
+                preview_time = await self._send_preview(operation, image_path, model, on_preview)
+            
             if operation == "background_removal":
-                output_filename = f"bg_removed_{model or 'auto'}_{input_path.stem}.png"
+                # mask_only returns the single-channel alpha mask instead of the RGBA cut-out
+                mask_only = bool(parsed_options.get('mask_only', False))
+                prefix = "mask" if mask_only else "bg_removed"
+                extension = self._output_extension(operation, parsed_options)
+                output_filename = f"{prefix}_{model or 'auto'}_{input_path.stem}.{extension}"
                 output_path = f"processed/{output_filename}"
                 
                 # Use Background Remover module
                 if 'background_remover' in self.modules:
-                    success = self.modules['background_remover'].remove_background(
-                        image_path, output_path, model or 'auto'
-                    )
+                    low_res = bool(parsed_options.get('low_res', False))
+                    refine_band = bool(parsed_options.get('refine_band', False))
+                    mask_stats: Dict[str, Any] = {}
+                    if self.worker_pool is not None:
+                        success, worker_stats = await self.worker_pool.run(
+                            'background_remover', 'remove_background_with_stats',
+                            image_path, output_path, model or 'auto', low_res, refine_band, mask_only,
+                            timeout=BACKGROUND_REMOVAL_TIMEOUT
+                        )
+                        mask_stats.update(worker_stats)
+                    else:
+                        with self.thread_budget.lane(operation):
+                            success = await self.modules['background_remover'].remove_background_async(
+                                image_path, output_path, model or 'auto', low_res, refine_band, mask_only,
+                                stats=mask_stats
+                            )
                     
                     if success:
                         processing_time = time.time() - start_time
@@ -135,7 +245,12 @@ class ModularAIOrchestrator:
                             "module": "background_remover",
                             "metadata": {
                                 "input_file": input_path.name,
-                                "method": model or 'auto'
+                                "method": model or 'auto',
+                                "low_res": low_res,
+                                "refine_band": refine_band,
+                                "mask_only": mask_only,
+                                "mask_cached": mask_stats.get('mask_cached'),
+                                "preview_time": preview_time
                             }
                         }
                     else:
@@ -144,17 +259,24 @@ class ModularAIOrchestrator:
                     raise Exception("Background Remover module not available")
             
             elif operation == "upscaling":
-                output_filename = f"upscaled_{model or 'auto'}_{input_path.stem}.jpg"
+                extension = self._output_extension(operation, parsed_options)
+                output_filename = f"upscaled_{model or 'auto'}_{input_path.stem}.{extension}"
                 output_path = f"processed/{output_filename}"
                 
                 # Use Upscaler Engine module
                 if 'upscaler' in self.modules:
-                    success = await self.modules['upscaler'].upscale_image(
-                        image_path, output_path, model or 'auto'
-                    )
+                    tile_stats: Dict[str, Any] = {}
+                    with self.thread_budget.lane(operation):
+                        success = await self.modules['upscaler'].upscale_image(
+                            image_path, output_path, model or 'auto',
+                            denoise_strength=parsed_options.get('denoise_strength'),
+                            stats=tile_stats,
+                            encoder_profile=parsed_options.get('encoder_profile')
+                        )
                     
                     if success:
                         processing_time = time.time() - start_time
+                        encode_time = tile_stats.pop('encode_seconds', None)
                         return {
                             "status": "success",
                             "output_path": output_path,
@@ -165,7 +287,10 @@ class ModularAIOrchestrator:
                             "module": "upscaler",
                             "metadata": {
                                 "input_file": input_path.name,
-                                "model": model or 'auto'
+                                "model": model or 'auto',
+                                "tile_routing": tile_stats or None,
+                                "encode_time": encode_time,
+                                "preview_time": preview_time
                             }
                         }
                     else:
@@ -174,7 +299,8 @@ class ModularAIOrchestrator:
                     raise Exception("Upscaler Engine module not available")
             
             elif operation == "photo_restoration":
-                output_filename = f"restored_{model or 'auto'}_{input_path.stem}.jpg"
+                extension = self._output_extension(operation, parsed_options)
+                output_filename = f"restored_{model or 'auto'}_{input_path.stem}.{extension}"
                 output_path = f"processed/{output_filename}"
                 
                 # Use Photo Restoration Engine module
@@ -187,12 +313,23 @@ class ModularAIOrchestrator:
                         scale = 2
                     
                     # Call photo restoration (returns tuple: output_path, metadata)
-                    output_path_result, metadata = self.modules['photo_restoration'].restore_photo(
-                        image_path=image_path,
-                        method=model or 'gfpgan_face_restore',
-                        scale=scale,
-                        output_path=output_path
-                    )
+                    if self.worker_pool is not None:
+                        output_path_result, metadata = await self.worker_pool.run(
+                            'photo_restoration', 'restore_photo',
+                            image_path=image_path,
+                            method=model or 'gfpgan_face_restore',
+                            scale=scale,
+                            output_path=output_path,
+                            timeout=PHOTO_RESTORATION_TIMEOUT
+                        )
+                    else:
+                        with self.thread_budget.lane(operation):
+                            output_path_result, metadata = await self.modules['photo_restoration'].restore_photo_async(
+                                image_path=image_path,
+                                method=model or 'gfpgan_face_restore',
+                                scale=scale,
+                                output_path=output_path
+                            )
                     
                     if output_path_result:
                         processing_time = time.time() - start_time
@@ -207,8 +344,12 @@ class ModularAIOrchestrator:
                             "metadata": {
                                 "input_file": input_path.name,
                                 "method": model or 'gfpgan_face_restore',
-                                "faces_restored": metadata.get('faces_restored', 0),
-                                "enhancement_applied": metadata.get('enhancement_applied', False)
+                                "faces_restored": metadata.get('faces_found', 0),
+                                "enhancement_applied": metadata.get('enhancement_applied', False),
+                                "faces_found": metadata.get('faces_found', 0),
+                                "face_detection_time": metadata.get('face_detection_time'),
+                                "face_detection_cached": metadata.get('face_detection_cached', False),
+                                "gfpgan_skipped": metadata.get('gfpgan_skipped', False)
                             }
                         }
                     else:
@@ -230,6 +371,278 @@ class ModularAIOrchestrator:
                 "model_attempted": model or "auto"
             }
     
+    async def upscale_region(
+        self,
+        image_path: str,
+        x: int,
+        y: int,
+        width: int,
+        height: int,
+        scale: int = 4,
+        model: Optional[str] = None,
+        options: str = "{}"
+    ) -> Dict[str, Any]:
+        """
+        Upscale the viewport rectangle of an image (interactive pan/zoom)
+        
+        Args:
+            image_path: Path to the full input image
+            x, y, width, height: Visible rectangle in input pixels
+            scale: 2 or 4; picks the network when no model is given
+            model: Specific Real-ESRGAN model to use
+            options: JSON string with additional options
+        
+        Returns:
+            Processing result dictionary; metadata reports how many tiles came from the cache
+        """
+        start_time = time.time()
+        model = model or ('realesrgan_2x' if scale == 2 else 'auto')
+        
+        try:
+            try:
+                parsed_options = json.loads(options)
+            except:
+                parsed_options = {}
+            
+            if 'upscaler' not in self.modules:
+                raise Exception("Upscaler Engine module not available")
+            
+            Path("processed").mkdir(exist_ok=True)
+            input_path = Path(image_path)
+            output_filename = f"region_{input_path.stem}_{x}_{y}_{width}x{height}_{scale}x.jpg"
+            output_path = f"processed/{output_filename}"
+            
+            region_stats: Dict[str, Any] = {}
+            with self.thread_budget.lane("upscaling"):
+                await self.modules['upscaler'].upscale_region(
+                    image_path, output_path, (x, y, width, height), model,
+                    denoise_strength=parsed_options.get('denoise_strength'),
+                    stats=region_stats,
+                    encoder_profile=parsed_options.get('encoder_profile')
+                )
+            
+            processing_time = time.time() - start_time
+            return {
+                "status": "success",
+                "output_path": output_path,
+                "output_filename": output_filename,
+                "model_used": model,
+                "operation": "region_upscaling",
+                "processing_time": round(processing_time, 2),
+                "module": "upscaler",
+                "metadata": {
+                    "input_file": input_path.name,
+                    **region_stats
+                }
+            }
+        
+        except Exception as e:
+            logger.error(f"Region upscaling failed: {str(e)}")
+            return {
+                "status": "error",
+                "error": str(e),
+                "processing_time": time.time() - start_time,
+                "operation": "region_upscaling",
+                "model_attempted": model
+            }
+    
+    async def process_batch(
+        self,
+        image_paths: List[str],
+        operation: str,
+        model: Optional[str] = None,
+        options: str = "{}"
+    ) -> List[Dict[str, Any]]:
+        """
+        Process several images, returning one process_image-style result per image
+        
+        Background removal stacks the images into batched rembg runs (options:
+        batch_size, default adaptive, plus mask_only, low_res and refine_band as
+        for a single image); other operations run image by image. Batches run
+        in-process, outside the worker pool.
+        """
+        if operation != "background_removal" or 'background_remover' not in self.modules:
+            return [await self.process_image(path, operation, model, options) for path in image_paths]
+        
+        start_time = time.time()
+        self.loop_monitor.start()
+        try:
+            parsed_options = json.loads(options)
+        except:
+            parsed_options = {}
+        
+        try:
+            extension = self._output_extension(operation, parsed_options)
+        except ValueError as e:
+            return [{
+                "status": "error",
+                "error": str(e),
+                "processing_time": 0.0,
+                "operation": operation,
+                "model_attempted": model or "auto"
+            } for _ in image_paths]
+        
+        Path("processed").mkdir(exist_ok=True)
+        mask_only = bool(parsed_options.get('mask_only', False))
+        low_res = bool(parsed_options.get('low_res', False))
+        refine_band = bool(parsed_options.get('refine_band', False))
+        prefix = "mask" if mask_only else "bg_removed"
+        jobs = [(path, f"processed/{prefix}_{model or 'auto'}_{Path(path).stem}.{extension}") for path in image_paths]
+        batch_stats: Dict[str, Any] = {}
+        try:
+            with self.thread_budget.lane(operation):
+                successes = await self.modules['background_remover'].remove_background_batch_async(
+                    jobs, model or 'auto', parsed_options.get('batch_size'), stats=batch_stats,
+                    low_res=low_res, refine_band=refine_band, mask_only=mask_only
+                )
+        except Exception as e:
+            logger.error(f"Batch processing failed: {str(e)}")
+            successes = [False] * len(jobs)
+            batch_stats['error'] = str(e)
+        
+        # Each image is charged its share of the batch so totals add up
+        processing_time = round((time.time() - start_time) / max(1, len(jobs)), 2)
+        results = []
+        for (image_path, output_path), success in zip(jobs, successes):
+            if not success:
+                results.append({
+                    "status": "error",
+                    "error": batch_stats.get('error', "Background removal failed"),
+                    "processing_time": processing_time,
+                    "operation": operation,
+                    "model_attempted": model or "auto"
+                })
+                continue
+            results.append({
+                "status": "success",
+                "output_path": output_path,
+                "output_filename": Path(output_path).name,
+                "model_used": model or 'auto',
+                "operation": operation,
+                "processing_time": processing_time,
+                "module": "background_remover",
+                "metadata": {
+                    "input_file": Path(image_path).name,
+                    "method": model or 'auto',
+                    "low_res": low_res,
+                    "refine_band": refine_band,
+                    "mask_only": mask_only,
+                    "batch": batch_stats.get('batch')
+                }
+            })
+        return results
+    
+    async def replace_background(
+        self,
+        image_path: str,
+        background: str = "transparent",
+        model: Optional[str] = None,
+        options: str = "{}",
+        background_path: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Put the subject of `image_path` on a new background
+        
+        Reuses the alpha mask of an earlier background removal of the same
+        image and method, so only the composite is computed. Options:
+        color ('#RRGGBB'), blur_radius, format ('png', 'jpeg', 'webp'),
+        low_res and refine_band (must match the earlier run to reuse its mask).
+        """
+        start_time = time.time()
+        self.loop_monitor.start()
+        
+        try:
+            if 'background_remover' not in self.modules:
+                raise Exception("Background Remover module not available")
+            try:
+                parsed_options = json.loads(options)
+            except:
+                parsed_options = {}
+            
+            Path("processed").mkdir(exist_ok=True)
+            image_format = "png" if background == "mask" else parsed_options.get('format', 'png').lower()
+            extension = "jpg" if image_format == "jpeg" else image_format
+            output_filename = f"bg_{background}_{model or 'auto'}_{Path(image_path).stem}.{extension}"
+            output_path = f"processed/{output_filename}"
+            
+            with self.thread_budget.lane("background_removal"):
+                info = await self.modules['background_remover'].replace_background_async(
+                    image_path, output_path,
+                    method=model or 'auto',
+                    background=background,
+                    color=parsed_options.get('color', '#ffffff'),
+                    background_path=background_path,
+                    blur_radius=int(parsed_options.get('blur_radius', BLUR_RADIUS)),
+                    low_res=bool(parsed_options.get('low_res', False)),
+                    refine_band=bool(parsed_options.get('refine_band', False))
+                )
+            
+            return {
+                "status": "success",
+                "output_path": output_path,
+                "output_filename": output_filename,
+                "model_used": info['method'],
+                "operation": "background_replacement",
+                "processing_time": round(time.time() - start_time, 2),
+                "module": "background_remover",
+                "metadata": {
+                    "input_file": Path(image_path).name,
+                    **info
+                }
+            }
+        
+        except Exception as e:
+            logger.error(f"Background replacement failed: {str(e)}")
+            return {
+                "status": "error",
+                "error": str(e),
+                "processing_time": time.time() - start_time,
+                "operation": "background_replacement",
+                "model_attempted": model or "auto"
+            }
+    
+    async def _send_preview(
+        self,
+        operation: str,
+        image_path: str,
+        model: Optional[str],
+        on_preview: Callable[[Dict[str, Any]], Awaitable[None]]
+    ) -> Optional[float]:
+        """Build and deliver the first phase of a progressive job; a failed preview only skips that phase"""
+        start_time = time.time()
+        stem = Path(image_path).stem
+        loop = asyncio.get_event_loop()
+        try:
+            if operation == "upscaling" and 'upscaler' in self.modules:
+                upscaler = self.modules['upscaler']
+                scale = upscaler.available_models.get((model or 'auto').partition('@')[0], {}).get('scale', 4)
+                preview_path = f"processed/preview_upscaled_{stem}.jpg"
+                info = await loop.run_in_executor(
+                    None, upscaler.preview_upscale, image_path, preview_path, scale
+                )
+            elif operation == "background_removal" and 'background_remover' in self.modules:
+                preview_path = f"processed/preview_bg_removed_{stem}.png"
+                info = await loop.run_in_executor(
+                    None, self.modules['background_remover'].preview_removal, image_path, preview_path
+                )
+            else:
+                return None
+        except Exception as e:
+            logger.warning(f"⚠️ Preview for {operation} failed, sending the final result only: {e}")
+            return None
+        
+        preview_time = round(time.time() - start_time, 3)
+        logger.info(f"⚡ Preview for {operation} ready in {preview_time * 1000:.0f} ms")
+        await on_preview({
+            "status": "preview",
+            "output_path": preview_path,
+            "output_filename": Path(preview_path).name,
+            "operation": operation,
+            "preview_time": preview_time,
+            "metadata": info
+        })
+        return preview_time
+    
     def get_module_info(self, module_name: str) -> Dict[str, Any]:
         """Get information about a specific module"""
         if module_name in self.modules:
@@ -237,11 +650,20 @@ class ModularAIOrchestrator:
         else:
             return {"error": f"Module {module_name} not found"}
     
+    def _output_extension(self, operation: str, parsed_options: Dict[str, Any]) -> str:
+        """Requested output extension, or the operation's default; ValueError if it cannot write it"""
+        formats = OUTPUT_FORMATS[operation]
+        extension = str(parsed_options.get('output_format') or formats[0]).lower().lstrip('.')
+        if extension not in formats:
+            raise ValueError(f"{operation} cannot write '{extension}' output (expected one of {', '.join(formats)})")
+        return extension
+    
     def get_system_info(self) -> Dict[str, Any]:
         """Get overall system information"""
         services = self.get_available_services()
         
         total_services = sum(len(category) for category in services.values())
+        registry = get_model_registry().get_stats()
         
         return {
             "orchestrator": "Modular AI Services",
@@ -249,6 +671,18 @@ class ModularAIOrchestrator:
             "architecture": "Independent Modules",
             "total_modules": len(self.modules),
             "total_services": total_services,
+            "worker_pool": self.worker_pool.get_stats() if self.worker_pool else None,
+            "thread_budget": self.thread_budget.get_stats(),
+            "executors": get_executor_stats(),
+            "event_loop": self.loop_monitor.get_stats(),
+            "capabilities": get_capabilities(),
+            "readiness": self.get_readiness(),
+            # Weights shared through the model registry count towards every module using them
+            "model_memory": {
+                "modules": registry["owners"],
+                "resident_bytes": registry["resident_bytes"],
+                "shared_saving_bytes": registry["shared_saving_bytes"]
+            },
             "modules": {
                 name: module.get_module_info() 
                 for name, module in self.modules.items()
@@ -0,0 +1,338 @@
+"""
+Admission Control - Shared Module
+Estimates each job's peak memory and runtime and keeps concurrent jobs inside a memory budget
+"""
+
+import os
+import re
+import time
+import asyncio
+import logging
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 0 means a fraction of physical memory (MEMORY_BUDGET_FRACTION)
+MEMORY_BUDGET_MB = int(os.getenv('AI_MEMORY_BUDGET_MB', '0'))
+MEMORY_BUDGET_FRACTION = 0.75
+# Longest a job may wait in the queue for memory before it is turned away
+ADMISSION_MAX_WAIT = float(os.getenv('AI_ADMISSION_MAX_WAIT', '30'))
+# Same switch as the upscaler engine: 'auto' runs the compact network only when it is set
+AUTO_COMPACT = os.getenv('UPSCALER_AUTO_COMPACT', '0') == '1'
+
+
+class JobCost(NamedTuple):
+    """
+    Memory and runtime model of one kind of job
+
+    Peak bytes = fixed + per input pixel + per output pixel; the figures are
+    deliberately on the high side (weights, framework overhead, float
+    intermediates, the output buffer and its encode).
+    """
+    fixed_mb: int
+    input_bytes_per_px: float
+    output_bytes_per_px: float
+    seconds_per_output_mp: float
+
+
+JOB_COSTS = {
+    # Tiled RRDBNet: weights, runtime and tile activations, plus the uint8 output buffer
+    'realesrgan': JobCost(600, 16, 4, 8.0),
+    'realesrgan_compact': JobCost(300, 16, 4, 1.5),
+    # RealESRGANer.enhance() keeps the whole output as float tensors
+    'realesrganer': JobCost(600, 16, 28, 8.0),
+    'pil': JobCost(50, 8, 8, 0.15),
+    'rembg': JobCost(500, 24, 0, 1.0),
+    'grabcut': JobCost(50, 40, 0, 2.0),
+    'gfpgan': JobCost(1200, 16, 16, 5.0),
+}
+# GFPGAN face pass on top of an upscale (main_advanced face_enhance)
+FACE_ENHANCE_COST = JobCost(400, 0, 8, 1.0)
+# Decoding a whole source image: PIL's RGB image (4 bytes/px) plus its numpy copy
+DECODE_BYTES_PER_PX = 7
+
+PIL_UPSCALERS = ('lanczos', 'bicubic', 'enhanced', 'super_enhanced', 'enhanced_pro')
+
+
+class JobEstimate(NamedTuple):
+    family: str
+    width: int
+    height: int
+    scale: int
+    peak_bytes: int
+    seconds: float
+
+
+class InvalidImage(ValueError):
+    """An upload whose header no image decoder can read (the client's fault, not the server's)"""
+
+
+class AdmissionRejected(Exception):
+    """A job cannot start now (retry later) or can never fit the budget (retry_after is None)"""
+
+    def __init__(self, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def physical_memory() -> int:
+    """Total RAM in bytes"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        import psutil
+        return psutil.virtual_memory().total
+
+
+def available_memory() -> int:
+    """RAM the kernel could hand out now (MemAvailable), in bytes"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import psutil
+    return psutil.virtual_memory().available
+
+
+def read_dimensions(path: str) -> Tuple[int, int]:
+    """Width and height from the image header; PIL does not decode pixels here. InvalidImage if unreadable"""
+    from PIL import Image
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise InvalidImage(f"Not a readable image: {e}") from e
+
+
+def job_family(operation: str, model: Optional[str] = None) -> str:
+    """Cost family for an orchestrator operation and model id"""
+    model = (model or 'auto').partition('@')[0]
+    if operation == 'background_removal':
+        return 'grabcut' if model in ('grabcut', 'threshold') else 'rembg'
+    if operation == 'photo_restoration':
+        return 'gfpgan' if model.startswith('gfpgan') or model == 'complete_photo_restore' else 'pil'
+    if model.startswith(PIL_UPSCALERS):
+        return 'pil'
+    if model == 'realesrgan_general_4x' or (model == 'auto' and AUTO_COMPACT):
+        return 'realesrgan_compact'
+    return 'realesrgan'
+
+
+def model_scale(operation: str, model: Optional[str] = None) -> int:
+    """Output scale implied by an operation and model id ('realesrgan_2x' -> 2)"""
+    if operation == 'background_removal':
+        return 1
+    if operation == 'photo_restoration':
+        return 2
+    match = re.search(r'(\d+)x', model or '')
+    # 8x runs the 4x network and resizes its output to 8x
+    return int(match.group(1)) if match else 4
+
+
+def estimate_file(path: str, operation: str, model: Optional[str] = None,
+                  scale: Optional[int] = None, face_enhance: bool = False) -> JobEstimate:
+    """Estimate an orchestrator job on an image file, reading only its header"""
+    width, height = read_dimensions(path)
+    return estimate_job(job_family(operation, model), width, height,
+                        scale or model_scale(operation, model), face_enhance)
+
+
+def estimate_region(path: str, width: int, height: int, model: Optional[str] = None,
+                    scale: int = 4) -> JobEstimate:
+    """
+    Estimate a viewport upscale of a width x height region of an image file
+
+    Only the region is inferred, but the whole source image is decoded
+    (and kept for panning), so its decode is charged on top.
+    """
+    full_width, full_height = read_dimensions(path)
+    estimate = estimate_job(job_family('upscaling', model), width, height, scale)
+    return estimate._replace(peak_bytes=estimate.peak_bytes + full_width * full_height * DECODE_BYTES_PER_PX)
+
+
+def estimate_job(family: str, width: int, height: int, scale: int = 1,
+                 face_enhance: bool = False) -> JobEstimate:
+    """Peak memory and runtime of a job on a width x height input"""
+    costs = [JOB_COSTS[family]] + ([FACE_ENHANCE_COST] if face_enhance else [])
+    input_px = width * height
+    output_px = input_px * scale * scale
+    peak = sum(c.fixed_mb * 1024 * 1024 + c.input_bytes_per_px * input_px + c.output_bytes_per_px * output_px
+               for c in costs)
+    seconds = sum(c.seconds_per_output_mp * output_px / 1_000_000 for c in costs)
+    return JobEstimate(family, width, height, scale, int(peak), round(max(1.0, seconds), 1))
+
+
+def estimate_batch(estimates: List[JobEstimate], concurrent: int) -> JobEstimate:
+    """
+    One job working through `estimates` `concurrent` images at a time
+
+    The fixed cost (weights, runtime) is paid once; the largest
+    `concurrent` per-image costs can be resident together.
+    """
+    family = estimates[0].family
+    fixed = JOB_COSTS[family].fixed_mb * 1024 * 1024
+    per_image = sorted((e.peak_bytes - fixed for e in estimates), reverse=True)
+    largest = max(estimates, key=lambda e: e.width * e.height)
+    return JobEstimate(family, largest.width, largest.height, largest.scale,
+                       int(fixed + sum(per_image[:max(1, concurrent)])),
+                       round(sum(e.seconds for e in estimates), 1))
+
+
+class _Reservation(NamedTuple):
+    estimate: JobEstimate
+    label: str
+    started: float
+
+
+class AdmissionController:
+    """
+    Memory budget shared by all jobs of one server process
+
+    Jobs reserve their estimated peak before they start and release it when
+    they finish. A job that does not fit waits in a FIFO queue; if the
+    predicted wait exceeds `max_wait` it is rejected with a Retry-After
+    hint instead. Runs on the event loop, so no locking is needed.
+    """
+
+    def __init__(self, budget_bytes: Optional[int] = None, max_wait: float = ADMISSION_MAX_WAIT):
+        if budget_bytes is None:
+            budget_bytes = (MEMORY_BUDGET_MB * 1024 * 1024 if MEMORY_BUDGET_MB
+                            else int(physical_memory() * MEMORY_BUDGET_FRACTION))
+        self.budget_bytes = budget_bytes
+        self.max_wait = max_wait
+        self._reservations: Dict[int, _Reservation] = {}
+        self._waiters: Deque[Tuple[int, JobEstimate, str, asyncio.Future]] = deque()
+        self._ids = itertools.count()
+        self._stats = {'admitted': 0, 'queued': 0, 'rejected': 0, 'too_large': 0}
+
+    @property
+    def reserved_bytes(self) -> int:
+        return sum(r.estimate.peak_bytes for r in self._reservations.values())
+
+    def check(self, estimate: JobEstimate) -> None:
+        """Raise AdmissionRejected now if the job would not get in within `max_wait`"""
+        if estimate.peak_bytes > self.budget_bytes:
+            self._stats['too_large'] += 1
+            raise AdmissionRejected(
+                f"Job needs ~{estimate.peak_bytes / 1e9:.1f} GB, more than this server's "
+                f"{self.budget_bytes / 1e9:.1f} GB budget; use a smaller image or scale"
+            )
+        wait = self.predicted_wait(estimate)
+        if wait > self.max_wait:
+            self._stats['rejected'] += 1
+            raise AdmissionRejected(
+                f"Server busy: ~{self.reserved_bytes / 1e9:.1f} GB of {self.budget_bytes / 1e9:.1f} GB reserved",
+                retry_after=max(1, int(wait + 0.5))
+            )
+
+    def predicted_wait(self, estimate: JobEstimate) -> float:
+        """Seconds until running jobs free enough memory for `estimate` (and everything queued ahead)"""
+        needed = (self.reserved_bytes + sum(w[1].peak_bytes for w in self._waiters)
+                  + estimate.peak_bytes - self.budget_bytes)
+        if needed <= 0:
+            return 0.0
+        now = time.monotonic()
+        ends = sorted((r.started + r.estimate.seconds, r.estimate.peak_bytes) for r in self._reservations.values())
+        freed = 0
+        for end, peak in ends:
+            freed += peak
+            if freed >= needed:
+                return max(0.0, end - now)
+        # Queued jobs must run first; assume they run one after another
+        last_end = ends[-1][0] if ends else now
+        return max(0.0, last_end - now) + sum(w[1].seconds for w in self._waiters)
+
+    @asynccontextmanager
+    async def reserve(self, estimate: JobEstimate, label: str = '') -> AsyncIterator[int]:
+        """Hold `estimate.peak_bytes` of the budget while the job runs, queueing for it if needed"""
+        self.check(estimate)
+        reservation_id = next(self._ids)
+        if not self._waiters and self.reserved_bytes + estimate.peak_bytes <= self.budget_bytes:
+            self._grant(reservation_id, estimate, label)
+        else:
+            await self._queue(reservation_id, estimate, label)
+        try:
+            yield reservation_id
+        finally:
+            self._reservations.pop(reservation_id, None)
+            self._wake()
+
+    async def _queue(self, reservation_id: int, estimate: JobEstimate, label: str) -> None:
+        """Wait for `_wake` to grant the reservation"""
+        self._stats['queued'] += 1
+        future = asyncio.get_event_loop().create_future()
+        self._waiters.append((reservation_id, estimate, label, future))
+        logger.info(f"⏳ Queued {label or estimate.family} job for {estimate.peak_bytes / 1e9:.1f} GB")
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # Granted just as the wait ended; keep it unless the caller is going away
+                if isinstance(e, asyncio.TimeoutError):
+                    return
+                self._reservations.pop(reservation_id, None)
+            else:
+                future.cancel()
+                self._waiters = deque(w for w in self._waiters if w[0] != reservation_id)
+            self._wake()
+            if isinstance(e, asyncio.TimeoutError):
+                self._stats['rejected'] += 1
+                raise AdmissionRejected(
+                    "Timed out waiting for memory", retry_after=max(1, int(self.predicted_wait(estimate) + 0.5))
+                )
+            raise
+
+    def _grant(self, reservation_id: int, estimate: JobEstimate, label: str) -> None:
+        self._reservations[reservation_id] = _Reservation(estimate, label, time.monotonic())
+        self._stats['admitted'] += 1
+
+    def _wake(self) -> None:
+        """Admit queued jobs in order while the head of the queue fits"""
+        while self._waiters:
+            reservation_id, estimate, label, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if self.reserved_bytes + estimate.peak_bytes > self.budget_bytes:
+                break
+            self._waiters.popleft()
+            self._grant(reservation_id, estimate, label)
+            future.set_result(True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            **self._stats,
+            'budget_mb': round(self.budget_bytes / 1024 / 1024),
+            'reserved_mb': round(self.reserved_bytes / 1024 / 1024),
+            'queue_length': len(self._waiters),
+            'reservations': [
+                {
+                    'job': r.label or r.estimate.family,
+                    'family': r.estimate.family,
+                    'input': f"{r.estimate.width}x{r.estimate.height}",
+                    'scale': r.estimate.scale,
+                    'reserved_mb': round(r.estimate.peak_bytes / 1024 / 1024),
+                    'running_seconds': round(now - r.started, 1),
+                    'estimated_seconds': r.estimate.seconds,
+                }
+                for r in self._reservations.values()
+            ],
+        }
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """Return the process-wide admission controller"""
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController()
+    return _controller
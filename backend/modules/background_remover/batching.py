@@ -0,0 +1,99 @@
+"""
+Batched rembg Inference - Background Remover Module
+Pre/post-processing that mirrors rembg's sessions, so several images share one onnxruntime run
+"""
+
+import os
+import logging
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+from PIL import Image
+
+from ..admission import available_memory
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_SIZE = int(os.getenv('BG_BATCH_MAX_SIZE', '16'))
+BATCH_POST_THREADS = int(os.getenv('BG_BATCH_POST_THREADS', '4'))
+# Share of currently available memory one batch may use
+BATCH_MEMORY_FRACTION = 0.5
+
+
+class ModelInput(NamedTuple):
+    """Input geometry and normalisation of a rembg model, plus its activation memory per image"""
+    side: int
+    mean: Tuple[float, float, float]
+    std: Tuple[float, float, float]
+    activation_mb: int
+
+
+IMAGENET = ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225))
+MODEL_INPUTS = {
+    'u2net': ModelInput(320, *IMAGENET, 250),
+    'u2netp': ModelInput(320, *IMAGENET, 60),
+    'silueta': ModelInput(320, *IMAGENET, 250),
+    'isnet-general-use': ModelInput(1024, (0.5, 0.5, 0.5), (1.0, 1.0, 1.0), 900),
+}
+
+
+def preprocess(image: Image.Image, spec: ModelInput) -> np.ndarray:
+    """CHW float32 network input, normalised the way rembg's sessions do it"""
+    resized = np.asarray(image.resize((spec.side, spec.side), Image.LANCZOS), np.float32)
+    resized /= max(float(resized.max()), 1e-6)
+    resized -= np.asarray(spec.mean, np.float32)
+    resized /= np.asarray(spec.std, np.float32)
+    return resized.transpose(2, 0, 1)
+
+
+def postprocess(prediction: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """Min-max normalise one predicted map and resize it to the image (uint8 mask)"""
+    low, high = float(prediction.min()), float(prediction.max())
+    scaled = (prediction - low) / max(high - low, 1e-6)
+    mask = Image.fromarray((scaled * 255).astype(np.uint8), 'L')
+    return np.asarray(mask.resize(size, Image.LANCZOS))
+
+
+def adaptive_batch_size(model_name: str, image_pixels: int, limit: int = BATCH_MAX_SIZE) -> int:
+    """
+    Largest batch whose activations and decoded images fit the available memory
+
+    Each image in flight costs the model's activations plus its full
+    resolution RGB, RGBA and mask buffers (~16 bytes per pixel).
+    """
+    per_image = MODEL_INPUTS[model_name].activation_mb * 1024 * 1024 + 16 * image_pixels
+    budget = available_memory() * BATCH_MEMORY_FRACTION
+    return int(max(1, min(limit, budget // per_image)))
+
+
+class BatchRunner:
+    """
+    Runs stacked inputs through a rembg session's onnxruntime session
+
+    Exported models with a fixed batch dimension reject larger batches; such
+    models are remembered and run one image per call from then on.
+    """
+
+    def __init__(self):
+        self._unbatchable: Dict[str, str] = {}
+
+    def run(self, session: Any, model_name: str, inputs: np.ndarray) -> np.ndarray:
+        """Predicted maps (N, H, W) for an (N, 3, H, W) input"""
+        ort_session = session.inner_session
+        input_name = ort_session.get_inputs()[0].name
+        if len(inputs) > 1 and model_name not in self._unbatchable:
+            try:
+                return ort_session.run(None, {input_name: inputs})[0][:, 0]
+            except Exception as e:
+                self._unbatchable[model_name] = str(e)
+                logger.warning(f"⚠️ {model_name} does not accept batched input, running images one by one: {e}")
+        return np.concatenate([
+            ort_session.run(None, {input_name: inputs[i:i + 1]})[0][:, 0] for i in range(len(inputs))
+        ])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'max_batch_size': BATCH_MAX_SIZE, 'unbatchable_models': sorted(self._unbatchable)}
+
+
+def chunks(items: List[Any], size: int) -> List[List[Any]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
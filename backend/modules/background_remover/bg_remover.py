@@ -4,72 +4,375 @@ Handles all background removal functionality with multiple methods
 """
 
 import os
+import time
 import logging
-from typing import Optional, Dict, Any
-from PIL import Image, ImageFilter
+import concurrent.futures
+from typing import Optional, Dict, Any, List, Tuple
+from PIL import Image, ImageFilter, ImageOps
 import numpy as np
 
+from ..capabilities import has_capability, mark_unavailable
+from ..executors import get_engine_executor
+from ..thread_budget import get_thread_budget
+from .batching import BATCH_POST_THREADS, MODEL_INPUTS, BatchRunner, adaptive_batch_size, chunks, postprocess, preprocess
+from .compositing import BACKGROUNDS, BLUR_RADIUS, blend, blurred, fitted, output_format, parse_color
+from .grabcut import pyramid_grabcut
+from .mask_refine import guided_upsample, refine_boundary
+from .mask_store import get_mask_store, mask_key
+from .sessions import DEFAULT_REMBG_MODEL, REMBG_MODELS, get_rembg_sessions
+
 logger = logging.getLogger(__name__)
 
+# Progressive previews: a u2netp mask at its native input size, shown at most this large
+PREVIEW_MAX_SIDE = int(os.getenv('PREVIEW_MAX_SIDE', '1600'))
+PREVIEW_MASK_SIDE = 320
+
+# Low-resolution mode: masks are computed at most this large and guided-filter upsampled
+LOWRES_MASK_SIDE = int(os.getenv('BG_LOWRES_MASK_SIDE', '1024'))
+GUIDED_RADIUS = 4  # At mask resolution
+GUIDED_EPS = 1e-3
+REFINE_BAND_PX = int(os.getenv('BG_REFINE_BAND_PX', '12'))  # Full-resolution band width
+REFINE_RADIUS = 2
+
 
 class BackgroundRemover:
     """Independent Background Remover with multiple methods"""
     
     def __init__(self):
+        rembg = self._check_rembg()
         self.available_methods = {
-            'rembg': {'available': self._check_rembg(), 'quality': 9},
+            # 'rembg' is the default u2net model; the others pick a specific rembg model
+            'rembg': {'available': rembg, 'quality': 9, 'model': DEFAULT_REMBG_MODEL,
+                      'speed': REMBG_MODELS[DEFAULT_REMBG_MODEL]['speed']},
+            **{
+                f"rembg_{model}": {'available': rembg, 'quality': info['quality'], 'model': model,
+                                   'speed': info['speed']}
+                for model, info in REMBG_MODELS.items() if model != DEFAULT_REMBG_MODEL
+            },
             'grabcut': {'available': True, 'quality': 6},
             'threshold': {'available': True, 'quality': 4}
         }
+        # Sessions are shared per process, so every request after the first skips model setup
+        self.rembg_sessions = get_rembg_sessions()
+        # Masks by input content and method; new backgrounds and formats reuse them
+        self.mask_store = get_mask_store()
+        self.batch_runner = BatchRunner()
         logger.info(f"Background Remover initialized with {len(self.available_methods)} methods")
     
     def _check_rembg(self) -> bool:
-        """Check if rembg is available with safe error handling"""
+        """Check if rembg is installed (cached per process; the import is deferred to first use)"""
+        return has_capability('rembg')
+    
+    def _rembg_remove(self) -> Optional[Any]:
+        """
+        rembg's remove(), imported on first use
+
+        An installed rembg can still fail to import (e.g. a numba/numpy ABI
+        mismatch). The rembg methods are then disabled for the rest of the
+        process and None is returned, so callers fall back to GrabCut.
+        """
         try:
-            logger.info("🔍 Checking rembg availability...")
-            import rembg
-            logger.info("✅ rembg successfully imported and available")
-            return True
+            from rembg import remove
+            return remove
         except (ImportError, AttributeError, SystemError) as e:
-            logger.warning(f"⚠️ rembg not available due to dependency issue: {e}")
-            return False
+            mark_unavailable('rembg', e)
+            for info in self.available_methods.values():
+                if 'model' in info:
+                    info['available'] = False
+            return None
     
     def get_available_methods(self) -> Dict[str, Any]:
         """Get all available background removal methods"""
         return {k: v for k, v in self.available_methods.items() if v['available']}
     
-    def remove_background(self, input_path: str, output_path: str, method: str = 'auto') -> bool:
+    def remove_background(self, input_path: str, output_path: str, method: str = 'auto',
+                          low_res: bool = False, refine_band: bool = False, mask_only: bool = False,
+                          stats: Optional[Dict[str, Any]] = None) -> bool:
         """
         Remove background from image using specified method
         
         Args:
             input_path: Path to input image
             output_path: Path to save output image
-            method: Method to use ('auto', 'rembg', 'grabcut', 'threshold')
+            method: Method to use ('auto', 'rembg', 'rembg_u2netp', 'rembg_isnet-general-use',
+                'rembg_silueta', 'grabcut', 'threshold'); 'rembg_u2netp' is the fast bulk path
+            low_res: Compute the mask on a copy of at most LOWRES_MASK_SIDE pixels and
+                upsample it with a guided filter; alpha is still applied at full resolution
+            refine_band: With low_res, re-filter a narrow band around the mask edge at full resolution
+            mask_only: Save the alpha mask as a single-channel PNG instead of the cut-out
+            stats: Optional dict; receives 'mask_cached'
         
         Returns:
             bool: Success status
         """
         try:
-            if method == 'auto':
-                method = self._select_best_method()
-            
+            method = self._resolve_method(method)
             logger.info(f"Removing background using method: {method}")
             
-            if method == 'rembg' and self.available_methods['rembg']['available']:
-                return self._rembg_removal(input_path, output_path)
-            elif method == 'grabcut':
-                return self._grabcut_removal(input_path, output_path)
-            elif method == 'threshold':
-                return self._threshold_removal(input_path, output_path)
+            # PNG or WebP, from the extension; JPEG cannot hold the alpha channel
+            image_format = output_format(output_path)
+            if image_format == 'JPEG':
+                raise ValueError("A background removal result needs PNG or WebP output")
+            save_options = {'quality': 92} if image_format == 'WEBP' else {}
+            
+            image = self._load_rgb(input_path)
+            alpha = self.get_mask(input_path, method, low_res, refine_band, image=image, stats=stats)
+            if mask_only:
+                Image.fromarray(alpha, 'L').save(output_path, image_format, **save_options)
             else:
-                logger.warning(f"Method {method} not available, using fallback")
-                return self._grabcut_removal(input_path, output_path)
+                image.putalpha(Image.fromarray(alpha, 'L'))
+                image.save(output_path, image_format, **save_options)
+            
+            logger.info(f"✅ {method} background removal completed")
+            return True
                 
         except Exception as e:
             logger.error(f"Background removal failed: {e}")
             return False
     
+    def remove_background_with_stats(self, *args, **kwargs) -> Tuple[bool, Dict[str, Any]]:
+        """remove_background() for pool workers: a stats dict does not come back from another process"""
+        stats: Dict[str, Any] = {}
+        return self.remove_background(*args, stats=stats, **kwargs), stats
+    
+    async def remove_background_async(self, input_path: str, output_path: str, method: str = 'auto',
+                                      low_res: bool = False, refine_band: bool = False,
+                                      mask_only: bool = False, stats: Optional[Dict[str, Any]] = None) -> bool:
+        """remove_background() on the background-removal executor, leaving the event loop free"""
+        return await get_engine_executor('background_remover').run(
+            self._sized, self.remove_background, input_path, output_path, method,
+            low_res, refine_band, mask_only, stats
+        )
+    
+    def remove_background_batch(self, jobs: List[Tuple[str, str]], method: str = 'auto',
+                                batch_size: Optional[int] = None,
+                                stats: Optional[Dict[str, Any]] = None, low_res: bool = False,
+                                refine_band: bool = False, mask_only: bool = False) -> List[bool]:
+        """
+        Remove the backgrounds of several images, stacking rembg inputs into shared ONNX runs
+        
+        Args:
+            jobs: (input_path, output_path) pairs
+            method: As for remove_background; GrabCut and threshold run image by image
+            batch_size: Images per run; by default the largest that fits in available memory
+            stats: Optional dict; receives batch sizes, cached masks and inference time
+            low_res, refine_band, mask_only: As for remove_background
+        
+        Returns:
+            Success per job, in order
+        """
+        method = self._resolve_method(method)
+        info = self.available_methods[method]
+        if 'model' not in info:
+            return [self.remove_background(input_path, output_path, method, low_res, refine_band, mask_only)
+                    for input_path, output_path in jobs]
+        
+        model_name = info['model']
+        spec = MODEL_INPUTS[model_name]
+        variant = self._mask_variant(method, low_res, refine_band)
+        batch_stats = {'model': model_name, 'batch_sizes': [], 'masks_cached': 0, 'inference_time': 0.0}
+        if stats is not None:
+            stats['batch'] = batch_stats
+        
+        results = [False] * len(jobs)
+        finished: Dict[int, concurrent.futures.Future] = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=BATCH_POST_THREADS,
+                                                   thread_name_prefix='bg-batch') as pool:
+            keys = list(pool.map(lambda job: self._try(mask_key, job[0], variant), jobs))
+            pending = []
+            for index, ((input_path, output_path), key) in enumerate(zip(jobs, keys)):
+                alpha = self.mask_store.get(key) if key else None
+                if alpha is not None:
+                    batch_stats['masks_cached'] += 1
+                    finished[index] = pool.submit(self._finish_batch_job, input_path, output_path, key,
+                                                  alpha=alpha, mask_only=mask_only)
+                elif key:
+                    pending.append(index)
+            
+            if pending:
+                size = batch_size or adaptive_batch_size(model_name, max(self._pixels(jobs[i][0]) for i in pending))
+                session = self._get_rembg_session(model_name)
+                logger.info(f"Processing {len(pending)} images with rembg ({model_name}) in batches of {size}...")
+                for group in chunks(pending, size):
+                    images = list(pool.map(lambda i: self._try(self._load_rgb, jobs[i][0]), group))
+                    group = [i for i, image in zip(group, images) if image is not None]
+                    images = [image for image in images if image is not None]
+                    if not group:
+                        continue
+                    smalls = [self._mask_input(image, low_res) for image in images]
+                    inputs = np.stack(list(pool.map(lambda small: preprocess(small, spec), smalls)))
+                    start_time = time.time()
+                    predictions = self.batch_runner.run(session, model_name, inputs)
+                    batch_stats['inference_time'] += time.time() - start_time
+                    batch_stats['batch_sizes'].append(len(group))
+                    # Masks are resized and saved while the next batch runs
+                    for index, image, small, prediction in zip(group, images, smalls, predictions):
+                        finished[index] = pool.submit(self._finish_batch_job, jobs[index][0], jobs[index][1],
+                                                      keys[index], image=image, prediction=prediction,
+                                                      small=small, refine_band=refine_band, mask_only=mask_only)
+            
+            for index, future in finished.items():
+                results[index] = future.result()
+        
+        batch_stats['inference_time'] = round(batch_stats['inference_time'], 3)
+        logger.info(f"✅ Batch background removal: {sum(results)}/{len(jobs)} images")
+        return results
+    
+    async def remove_background_batch_async(self, jobs: List[Tuple[str, str]], method: str = 'auto',
+                                            batch_size: Optional[int] = None,
+                                            stats: Optional[Dict[str, Any]] = None, low_res: bool = False,
+                                            refine_band: bool = False, mask_only: bool = False) -> List[bool]:
+        """remove_background_batch() on the background-removal executor"""
+        return await get_engine_executor('background_remover').run(
+            self._sized, self.remove_background_batch, jobs, method, batch_size, stats,
+            low_res, refine_band, mask_only
+        )
+    
+    def _finish_batch_job(self, input_path: str, output_path: str, key: str, alpha: Optional[np.ndarray] = None,
+                          image: Optional[Image.Image] = None, prediction: Optional[np.ndarray] = None,
+                          small: Optional[Image.Image] = None, refine_band: bool = False,
+                          mask_only: bool = False) -> bool:
+        """Mask from a stored alpha or a network prediction (made from `small`), then the cut-out or mask"""
+        try:
+            if alpha is None:
+                alpha = postprocess(prediction, small.size)
+                if small is not image:
+                    alpha = self._lift_mask(image, small, alpha, refine_band)
+                self.mask_store.put(key, alpha)
+            image_format = output_format(output_path)
+            save_options = {'quality': 92} if image_format == 'WEBP' else {}
+            if mask_only:
+                Image.fromarray(alpha, 'L').save(output_path, image_format, **save_options)
+            else:
+                if image is None:
+                    image = self._load_rgb(input_path)
+                image.putalpha(Image.fromarray(alpha, 'L'))
+                image.save(output_path, image_format, **save_options)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Batch background removal failed for {input_path}: {e}")
+            return False
+    
+    def _try(self, func, *args) -> Any:
+        """`func(*args)`, or None with the error logged (one bad file must not fail a batch)"""
+        try:
+            return func(*args)
+        except Exception as e:
+            logger.error(f"❌ Skipping {args[0]}: {e}")
+            return None
+    
+    def _pixels(self, input_path: str) -> int:
+        """Pixel count from the image header"""
+        try:
+            with Image.open(input_path) as img:
+                return img.width * img.height
+        except OSError:
+            return 0
+    
+    def replace_background(self, input_path: str, output_path: str, method: str = 'auto',
+                           background: str = 'transparent', color: str = '#ffffff',
+                           background_path: Optional[str] = None, blur_radius: int = BLUR_RADIUS,
+                           low_res: bool = False, refine_band: bool = False) -> Dict[str, Any]:
+        """
+        Composite the subject over a new background, reusing a stored mask when there is one
+        
+        Args:
+            background: 'transparent', 'color', 'blur' (blurred original), 'image'
+                (`background_path`, scaled to cover) or 'mask' (the alpha mask itself)
+            color: Background colour for 'color' ('#RRGGBB' or 'r,g,b')
+        
+        The output format follows `output_path`'s extension (PNG, JPEG or WebP);
+        JPEG cannot hold a transparent result.
+        """
+        if background not in BACKGROUNDS:
+            raise ValueError(f"Unknown background '{background}', expected one of {', '.join(BACKGROUNDS)}")
+        image_format = output_format(output_path)
+        if background == 'transparent' and image_format == 'JPEG':
+            raise ValueError("A transparent background needs PNG or WebP output")
+        if background == 'image' and not background_path:
+            raise ValueError("An 'image' background needs a background file")
+        rgb = parse_color(color) if background == 'color' else None
+        
+        method = self._resolve_method(method)
+        stats: Dict[str, Any] = {}
+        image = self._load_rgb(input_path)
+        alpha = self.get_mask(input_path, method, low_res, refine_band, image=image, stats=stats)
+        
+        start_time = time.time()
+        if background == 'mask':
+            result = Image.fromarray(alpha, 'L')
+        elif background == 'transparent':
+            result = image
+            result.putalpha(Image.fromarray(alpha, 'L'))
+        else:
+            if background == 'color':
+                backdrop = rgb
+            elif background == 'blur':
+                backdrop = blurred(image, blur_radius)
+            else:
+                with Image.open(background_path) as bg_img:
+                    backdrop = fitted(bg_img, image.size)
+            result = Image.fromarray(blend(np.asarray(image), backdrop, alpha), 'RGB')
+        
+        save_options = {'quality': 92} if image_format in ('JPEG', 'WEBP') else {'compress_level': 3}
+        result.save(output_path, image_format, **save_options)
+        return {
+            "method": method,
+            "background": background,
+            "format": image_format.lower(),
+            "width": image.width,
+            "height": image.height,
+            "mask_cached": stats['mask_cached'],
+            "composite_time": round(time.time() - start_time, 3)
+        }
+    
+    async def replace_background_async(self, input_path: str, output_path: str, **kwargs) -> Dict[str, Any]:
+        """replace_background() on the background-removal executor"""
+        return await get_engine_executor('background_remover').run(
+            self._sized, self.replace_background, input_path, output_path, **kwargs
+        )
+    
+    def _sized(self, func, *args, **kwargs) -> Any:
+        """Size the executor thread to the caller's lane share, then run `func`"""
+        get_thread_budget().apply()
+        return func(*args, **kwargs)
+    
+    def get_mask(self, input_path: str, method: str, low_res: bool = False, refine_band: bool = False,
+                 image: Optional[Image.Image] = None, stats: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """Alpha mask of `input_path` from the mask store, segmenting (and storing) it on a miss"""
+        key = mask_key(input_path, self._mask_variant(method, low_res, refine_band))
+        alpha = self.mask_store.get(key)
+        if stats is not None:
+            stats['mask_cached'] = alpha is not None
+        if alpha is None:
+            if image is None:
+                image = self._load_rgb(input_path)
+            alpha = self.compute_mask(image, method, low_res, refine_band)
+            self.mask_store.put(key, alpha)
+        return alpha
+    
+    def _mask_variant(self, method: str, low_res: bool, refine_band: bool) -> str:
+        """Everything besides the input bytes that changes the mask"""
+        if not low_res:
+            return method
+        return f"{method}@{LOWRES_MASK_SIDE}" + (f"+band{REFINE_BAND_PX}" if refine_band else "")
+    
+    def _resolve_method(self, method: str) -> str:
+        """'auto' picks the best available method; unavailable methods fall back to GrabCut"""
+        if method == 'auto':
+            method = self._select_best_method()
+        info = self.available_methods.get(method, {})
+        # rembg is imported here, before the method goes into a mask key
+        if not info.get('available') or ('model' in info and self._rembg_remove() is None):
+            logger.warning(f"Method {method} not available, using fallback")
+            return 'grabcut'
+        return method
+    
+    def _load_rgb(self, input_path: str) -> Image.Image:
+        """Decode as RGB with EXIF orientation applied, like rembg does for its inputs"""
+        with Image.open(input_path) as img:
+            return ImageOps.exif_transpose(img).convert('RGB')
+    
     def _select_best_method(self) -> str:
         """Select the best available method"""
         available = self.get_available_methods()
@@ -80,110 +383,96 @@ class BackgroundRemover:
         best = max(available.items(), key=lambda x: x[1]['quality'])
         return best[0]
     
-    def _rembg_removal(self, input_path: str, output_path: str) -> bool:
-        """Remove background using rembg library"""
-        try:
-            from rembg import remove
-            
-            with open(input_path, 'rb') as input_file:
-                input_data = input_file.read()
-            
-            logger.info("Processing with rembg...")
-            output_data = remove(input_data)
-            
-            with open(output_path, 'wb') as output_file:
-                if isinstance(output_data, bytes):
-                    output_file.write(output_data)
-                else:
-                    # Handle other types by converting to bytes
-                    output_file.write(bytes(output_data))
-            
-            logger.info("✅ rembg background removal completed")
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ rembg removal failed: {e}")
-            return False
+    def _get_rembg_session(self, model_name: str = DEFAULT_REMBG_MODEL) -> Any:
+        """Pooled session sized to the caller's current thread share"""
+        return self.rembg_sessions.get(model_name)
     
-    def _grabcut_removal(self, input_path: str, output_path: str) -> bool:
-        """Remove background using GrabCut algorithm"""
-        try:
-            import cv2
-            
-            # Load image
-            img = cv2.imread(input_path)
-            if img is None:
-                raise ValueError("Could not load image")
-            
-            height, width = img.shape[:2]
-            
-            # Create mask
-            mask = np.zeros((height, width), np.uint8)
-            
-            # Define rectangle for foreground (center 80% of image)
-            margin_x = int(width * 0.1)
-            margin_y = int(height * 0.1)
-            rect = (margin_x, margin_y, width - 2*margin_x, height - 2*margin_y)
-            
-            # Initialize models
-            bgdModel = np.zeros((1, 65), np.float64)
-            fgdModel = np.zeros((1, 65), np.float64)
-            
-            # Apply GrabCut
-            logger.info("Applying GrabCut algorithm...")
-            cv2.grabCut(img, mask, rect, bgdModel, fgdModel, 5, cv2.GC_INIT_WITH_RECT)
-            
-            # Create final mask
-            mask2 = np.where((mask == 2) | (mask == 0), 0, 1).astype('uint8')
-            
-            # Apply mask to create transparency
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            img_pil = Image.fromarray(img_rgb)
-            
-            # Convert to RGBA
-            img_rgba = img_pil.convert('RGBA')
-            img_array = np.array(img_rgba)
-            
-            # Apply mask to alpha channel
-            img_array[:, :, 3] = mask2 * 255
-            
-            # Save result
-            result_img = Image.fromarray(img_array, 'RGBA')
-            result_img.save(output_path, 'PNG')
-            
-            logger.info("✅ GrabCut background removal completed")
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ GrabCut removal failed: {e}")
-            return False
+    def compute_mask(self, image: Image.Image, method: str, low_res: bool = False,
+                     refine_band: bool = False) -> np.ndarray:
+        """
+        Alpha mask (uint8, image size) of an RGB image
+
+        With `low_res` the method sees a copy of at most LOWRES_MASK_SIDE
+        pixels; the fast guided filter then lifts the mask back to full
+        resolution with edges snapped to the full-resolution image.
+        """
+        small = self._mask_input(image, low_res)
+        mask = self._method_mask(small, method)
+        return mask if small is image else self._lift_mask(image, small, mask, refine_band)
     
-    def _threshold_removal(self, input_path: str, output_path: str) -> bool:
-        """Remove background using simple thresholding"""
-        try:
-            img = Image.open(input_path).convert('RGBA')
-            img_array = np.array(img)
-            
-            # Convert to grayscale for thresholding
-            gray = np.mean(img_array[:, :, :3], axis=2)
-            
-            # Simple thresholding (works best with images having clear background)
-            threshold = 240  # Adjust based on background color
-            mask = gray < threshold
-            
-            # Apply mask to alpha channel
-            img_array[:, :, 3] = mask.astype(np.uint8) * 255
-            
-            # Save result
-            result_img = Image.fromarray(img_array, 'RGBA')
-            result_img.save(output_path, 'PNG')
-            
-            logger.info("✅ Threshold background removal completed")
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Threshold removal failed: {e}")
-            return False
+    def _mask_input(self, image: Image.Image, low_res: bool) -> Image.Image:
+        """The image a mask is computed from: `image` itself, or with `low_res` a copy of at most LOWRES_MASK_SIDE"""
+        if not low_res or max(image.size) <= LOWRES_MASK_SIDE:
+            return image
+        small = image.copy()
+        small.thumbnail((LOWRES_MASK_SIDE, LOWRES_MASK_SIDE), Image.BILINEAR)
+        return small
+    
+    def _lift_mask(self, image: Image.Image, small: Image.Image, mask_small: np.ndarray,
+                   refine_band: bool) -> np.ndarray:
+        """Guided-filter upsample a mask of `small` to `image`, optionally re-filtering the edge band"""
+        guide_small = np.asarray(small.convert('L'), np.float32) / 255
+        guide = np.asarray(image.convert('L'), np.float32) / 255
+        
+        alpha = guided_upsample(mask_small.astype(np.float32) / 255, guide_small, guide, GUIDED_RADIUS, GUIDED_EPS)
+        if refine_band:
+            alpha = refine_boundary(alpha, guide, REFINE_BAND_PX, REFINE_RADIUS, GUIDED_EPS)
+        return (alpha * 255 + 0.5).astype(np.uint8)
+    
+    def _method_mask(self, image: Image.Image, method: str) -> np.ndarray:
+        """Mask of `image` at its own size, falling back to GrabCut like remove_background"""
+        info = self.available_methods.get(method, {})
+        remove = self._rembg_remove() if 'model' in info and info['available'] else None
+        if remove is not None:
+            mask = remove(image, session=self._get_rembg_session(info['model']), only_mask=True)
+            return np.asarray(mask.convert('L'))
+        if method == 'threshold':
+            return self._threshold_mask(np.asarray(image))
+        return self._grabcut_mask(np.ascontiguousarray(np.asarray(image)[:, :, ::-1]))
+    
+    def preview_removal(self, input_path: str, output_path: str, max_side: int = PREVIEW_MAX_SIDE) -> Dict[str, Any]:
+        """
+        Fast cut-out preview from a low-resolution u2netp mask
+
+        The small network runs at its native 320 px input and its mask is
+        stretched to a preview of at most `max_side` pixels.
+        """
+        remove = self._rembg_remove() if self.available_methods['rembg']['available'] else None
+        if remove is None:
+            raise RuntimeError("rembg is required for background removal previews")
+        
+        # Oriented like the final result that replaces it
+        preview = self._load_rgb(input_path)
+        preview.thumbnail((max_side, max_side), Image.BILINEAR)
+        small = preview.copy()
+        small.thumbnail((PREVIEW_MASK_SIDE, PREVIEW_MASK_SIDE), Image.BILINEAR)
+        
+        mask = remove(small, session=self._get_rembg_session('u2netp'), only_mask=True)
+        preview.putalpha(mask.convert('L').resize(preview.size, Image.BILINEAR))
+        preview.save(output_path, 'PNG', compress_level=1)
+        return {"width": preview.width, "height": preview.height, "mask_model": "u2netp"}
+    
+    def _grabcut_mask(self, img: np.ndarray) -> np.ndarray:
+        """GrabCut foreground mask (0/255) of a BGR image seeded with its centre 80%"""
+        mask, stats = pyramid_grabcut(img)
+        logger.info(f"GrabCut: {stats['levels']} levels, {stats['coarse_iterations']} coarse iterations, "
+                    f"{stats['refined_tiles']} boundary tiles refined")
+        return mask
+    
+    def _threshold_mask(self, img_array: np.ndarray) -> np.ndarray:
+        """Foreground where the pixel is darker than a near-white background"""
+        # Convert to grayscale for thresholding
+        gray = np.mean(img_array[:, :, :3], axis=2)
+        
+        # Simple thresholding (works best with images having clear background)
+        threshold = 240  # Adjust based on background color
+        return (gray < threshold).astype(np.uint8) * 255
+    
+    def get_readiness(self) -> str:
+        """'ready' once a rembg session is loaded (or when only GrabCut/threshold exist), else 'cold'"""
+        if not self.available_methods['rembg']['available'] or self.rembg_sessions.get_stats()['sessions']:
+            return 'ready'
+        return 'cold'
     
     def get_module_info(self) -> Dict[str, Any]:
         """Get module information"""
@@ -191,5 +480,11 @@ class BackgroundRemover:
             "name": "Background Remover",
             "version": "1.0.0",
             "available_methods": list(self.get_available_methods().keys()),
-            "total_methods": len(self.available_methods)
+            "total_methods": len(self.available_methods),
+            "rembg_sessions": self.rembg_sessions.get_stats(),
+            "low_res_mask_side": LOWRES_MASK_SIDE,
+            "backgrounds": list(BACKGROUNDS),
+            "mask_store": self.mask_store.get_stats(),
+            "batching": self.batch_runner.get_stats(),
+            "executor": get_engine_executor('background_remover').get_stats()
         }
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""
+Pyramid GrabCut - Background Remover Module
+Coarse-to-fine GrabCut: full iterations on a small pyramid level, then boundary-band refinement only
+"""
+
+import os
+import logging
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+GRABCUT_COARSE_SIDE = int(os.getenv('BG_GRABCUT_COARSE_SIDE', '512'))  # Largest side of the coarsest level
+GRABCUT_MAX_ITERATIONS = 5
+GRABCUT_CONVERGENCE = 0.002  # Stop once fewer than this fraction of pixels change label
+GRABCUT_BAND_PX = 4  # Uncertain band around the propagated edge, in pixels of each finer level
+GRABCUT_TILE = 256
+GRABCUT_MARGIN = 0.1  # The centre 80% of the image seeds the foreground
+
+
+def pyramid_grabcut(img: np.ndarray) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Foreground mask (0/255) of a BGR image and stats about the run
+
+    The coarsest level gets the usual rectangle-seeded GrabCut, iterated
+    until the labels settle. Each finer level inherits those labels; only
+    pixels in a narrow band around the edge are left uncertain and solved
+    again, tile by tile, with colour models learned from their surroundings.
+    """
+    import cv2
+
+    levels = [img]
+    while max(levels[-1].shape[:2]) > GRABCUT_COARSE_SIDE:
+        levels.append(cv2.pyrDown(levels[-1]))
+
+    foreground, iterations = _coarse_grabcut(levels[-1])
+    stats = {'levels': len(levels), 'coarse_iterations': iterations, 'refined_tiles': 0, 'skipped_tiles': 0}
+    for level in reversed(levels[:-1]):
+        height, width = level.shape[:2]
+        foreground = cv2.resize(foreground, (width, height), interpolation=cv2.INTER_NEAREST)
+        foreground = _refine_band(level, foreground, stats)
+    return foreground * 255, stats
+
+
+def _coarse_grabcut(img: np.ndarray) -> Tuple[np.ndarray, int]:
+    """Rectangle-seeded GrabCut with early stopping; returns a 0/1 mask and the iterations run"""
+    import cv2
+
+    height, width = img.shape[:2]
+    margin_x, margin_y = int(width * GRABCUT_MARGIN), int(height * GRABCUT_MARGIN)
+    rect = (margin_x, margin_y, width - 2 * margin_x, height - 2 * margin_y)
+
+    mask = np.zeros((height, width), np.uint8)
+    bgd_model = np.zeros((1, 65), np.float64)
+    fgd_model = np.zeros((1, 65), np.float64)
+    cv2.grabCut(img, mask, rect, bgd_model, fgd_model, 1, cv2.GC_INIT_WITH_RECT)
+    foreground = _foreground(mask)
+
+    iterations = 1
+    while iterations < GRABCUT_MAX_ITERATIONS:
+        cv2.grabCut(img, mask, None, bgd_model, fgd_model, 1, cv2.GC_EVAL)
+        iterations += 1
+        updated = _foreground(mask)
+        changed = np.count_nonzero(updated != foreground) / updated.size
+        foreground = updated
+        if changed < GRABCUT_CONVERGENCE:
+            break
+    return foreground, iterations
+
+
+def _refine_band(img: np.ndarray, foreground: np.ndarray, stats: Dict[str, Any]) -> np.ndarray:
+    """Re-solve only the pixels near the inherited edge"""
+    import cv2
+
+    kernel = np.ones((2 * GRABCUT_BAND_PX + 1, 2 * GRABCUT_BAND_PX + 1), np.uint8)
+    band = cv2.dilate(foreground, kernel) != cv2.erode(foreground, kernel)
+
+    # Outside the band the inherited labels are fixed; inside they are only a hint
+    seeds = np.where(foreground == 1, cv2.GC_FGD, cv2.GC_BGD).astype(np.uint8)
+    seeds[band] = np.where(foreground[band] == 1, cv2.GC_PR_FGD, cv2.GC_PR_BGD)
+
+    refined = foreground.copy()
+    height, width = foreground.shape
+    # Context around each tile so its colour models see both sides of the edge
+    pad = 4 * GRABCUT_BAND_PX
+    for y0, x0, y1, x1 in _band_tiles(band):
+        cy0, cx0 = max(0, y0 - pad), max(0, x0 - pad)
+        cy1, cx1 = min(height, y1 + pad), min(width, x1 + pad)
+        mask = seeds[cy0:cy1, cx0:cx1].copy()
+        if not (np.any(mask == cv2.GC_FGD) and np.any(mask == cv2.GC_BGD)):
+            # A tile entirely on one side of the edge has nothing to learn from
+            stats['skipped_tiles'] += 1
+            continue
+        bgd_model = np.zeros((1, 65), np.float64)
+        fgd_model = np.zeros((1, 65), np.float64)
+        try:
+            cv2.grabCut(np.ascontiguousarray(img[cy0:cy1, cx0:cx1]), mask, None,
+                        bgd_model, fgd_model, 1, cv2.GC_INIT_WITH_MASK)
+        except cv2.error as e:
+            logger.debug(f"GrabCut band tile ({x0}, {y0}) kept its inherited labels: {e}")
+            stats['skipped_tiles'] += 1
+            continue
+        tile_band = band[y0:y1, x0:x1]
+        solved = _foreground(mask)[y0 - cy0:y1 - cy0, x0 - cx0:x1 - cx0]
+        refined[y0:y1, x0:x1][tile_band] = solved[tile_band]
+        stats['refined_tiles'] += 1
+    return refined
+
+
+def _band_tiles(band: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    """(y0, x0, y1, x1) of the GRABCUT_TILE tiles that contain band pixels"""
+    height, width = band.shape
+    return [
+        (y, x, min(height, y + GRABCUT_TILE), min(width, x + GRABCUT_TILE))
+        for y in range(0, height, GRABCUT_TILE)
+        for x in range(0, width, GRABCUT_TILE)
+        if band[y:y + GRABCUT_TILE, x:x + GRABCUT_TILE].any()
+    ]
+
+
+def _foreground(mask: np.ndarray) -> np.ndarray:
+    """0/1 foreground from GrabCut's four-label mask"""
+    return ((mask == 1) | (mask == 3)).astype(np.uint8)
@@ -0,0 +1,208 @@
+"""
+Mask Store - Background Remover Module
+Content-addressed alpha masks, so re-exports with another background or format skip segmentation
+"""
+
+import os
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MASK_STORE_MB = int(os.getenv('BG_MASK_STORE_MB', '256'))
+# Shared with pool workers and kept across restarts; masks are single-channel PNGs
+MASK_STORE_DIR = os.getenv('BG_MASK_STORE_DIR', 'cache/masks')
+MASK_STORE_DISK_MB = int(os.getenv('BG_MASK_STORE_DISK_MB', '1024'))
+
+
+def mask_key(input_path: str, variant: str) -> str:
+    """Hash of the input file's bytes plus the method variant that produced the mask"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(variant.encode())
+    with open(input_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MaskStore:
+    """
+    In-memory LRU of uint8 alpha masks backed by PNG files on disk
+
+    The disk tier is the source of truth: a mask computed in a pool worker
+    is found by the server process on the next compositing request.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, disk_dir: Optional[str] = MASK_STORE_DIR,
+                 disk_max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes if max_bytes is not None else MASK_STORE_MB * 1024 * 1024
+        self.disk_dir = str(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes if disk_max_bytes is not None else MASK_STORE_DISK_MB * 1024 * 1024
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._disk_writes_since_prune = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'disk_hits': 0, 'disk_writes': 0, 'evictions': 0}
+
+    def path(self, key: str) -> Optional[str]:
+        """PNG path of `key` in the disk tier (which may not exist yet)"""
+        if self.disk_dir is None:
+            return None
+        return os.path.join(self.disk_dir, key[:2], f"{key}.png")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            mask = self._entries.get(key)
+            if mask is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return mask
+        mask = self._disk_get(key)
+        with self._lock:
+            if mask is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            self._stats['disk_hits'] += 1
+        self._remember(key, mask)
+        return mask
+
+    def put(self, key: str, mask: np.ndarray) -> None:
+        mask = np.ascontiguousarray(mask, dtype=np.uint8)
+        mask.setflags(write=False)
+        self._disk_put(key, mask)
+        self._remember(key, mask)
+
+    def _remember(self, key: str, mask: np.ndarray) -> None:
+        if mask.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[key] = mask
+            self._bytes += mask.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self._stats['evictions'] += 1
+
+    def _disk_get(self, key: str) -> Optional[np.ndarray]:
+        path = self.path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        from PIL import Image
+        try:
+            with Image.open(path) as img:
+                mask = np.asarray(img.convert('L'))
+        except OSError as e:
+            logger.warning(f"⚠️ Dropping unreadable cached mask {path}: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        # Touch it so pruning treats recently used masks as new
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return mask
+
+    def _disk_put(self, key: str, mask: np.ndarray) -> None:
+        path = self.path(key)
+        if path is None or os.path.exists(path):
+            return
+        from PIL import Image
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers (other workers) never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            Image.fromarray(mask, 'L').save(tmp_path, 'PNG', compress_level=1)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write cached mask {path}: {e}")
+            return
+        with self._lock:
+            self._stats['disk_writes'] += 1
+            self._disk_writes_since_prune += 1
+            # Walking the directory is not free; check the budget every 32 writes
+            prune = self._disk_writes_since_prune >= 32
+            if prune:
+                self._disk_writes_since_prune = 0
+        if prune:
+            self._prune_disk()
+
+    def _disk_files(self) -> List[Tuple[str, int, float]]:
+        """(path, size, mtime) of every mask in the disk tier"""
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if name.endswith('.png'):
+                    path = os.path.join(root, name)
+                    try:
+                        info = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((path, info.st_size, info.st_mtime))
+        return files
+
+    def _prune_disk(self) -> None:
+        """Delete the least recently used masks until the disk tier is under 90% of its budget"""
+        files = sorted(self._disk_files(), key=lambda f: f[2])
+        total = sum(size for _, size, _ in files)
+        if total <= self.disk_max_bytes:
+            return
+        target = self.disk_max_bytes * 0.9
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'hit_ratio': round(self._stats['hits'] / lookups, 3) if lookups else 0.0,
+                'masks': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'disk_dir': self.disk_dir,
+            }
+
+
+_store: Optional[MaskStore] = None
+_store_lock = threading.Lock()
+
+
+def get_mask_store() -> MaskStore:
+    """Return the process-wide mask store"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MaskStore()
+        return _store
+
+
+def _reset_after_fork() -> None:
+    global _store_lock
+    _store_lock = threading.Lock()
+    if _store is not None:
+        _store._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,106 @@
+"""
+rembg Session Pool
+One onnxruntime session per model and thread share, created on first use and reused by every request
+"""
+
+import os
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from ..thread_budget import get_thread_budget, ort_session_options, session_threads
+
+logger = logging.getLogger(__name__)
+
+# rembg models offered as methods: u2netp is the fast path for bulk jobs
+REMBG_MODELS = {
+    'u2net': {'name': 'U2-Net', 'quality': 9, 'speed': 'standard', 'size_mb': 176},
+    'u2netp': {'name': 'U2-Net (small)', 'quality': 7, 'speed': 'fast', 'size_mb': 4},
+    'isnet-general-use': {'name': 'IS-Net', 'quality': 9, 'speed': 'slow', 'size_mb': 179},
+    'silueta': {'name': 'Silueta', 'quality': 8, 'speed': 'standard', 'size_mb': 43},
+}
+DEFAULT_REMBG_MODEL = 'u2net'
+
+
+class RembgSessionPool:
+    """
+    Lazily created rembg sessions keyed by (model, intra-op threads)
+
+    onnxruntime fixes a session's thread count when it is created, so a
+    session is kept per power-of-two thread share (see thread_budget).
+    Sessions are thread-safe for concurrent run() calls.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[Tuple[str, int], Any] = {}
+        self._creating: Dict[Tuple[str, int], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str = DEFAULT_REMBG_MODEL) -> Any:
+        """Session for `model_name` sized to the caller's current thread share"""
+        if model_name not in REMBG_MODELS:
+            raise ValueError(f"Unknown rembg model '{model_name}', expected one of {', '.join(REMBG_MODELS)}")
+        threads = session_threads(get_thread_budget().apply())
+        key = (model_name, threads)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                return session
+            creating = self._creating.setdefault(key, threading.Lock())
+        # Loading (and on first use, downloading) one model must not block the others
+        with creating:
+            with self._lock:
+                session = self._sessions.get(key)
+            if session is None:
+                logger.info(f"🧵 Creating rembg session {model_name} with {threads} intra-op threads")
+                session = _new_session(model_name, threads)
+                with self._lock:
+                    self._sessions[key] = session
+            return session
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._creating = {}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'sessions': sorted(f"{model}@{threads}" for model, threads in self._sessions)}
+
+
+def _new_session(model_name: str, threads: int) -> Any:
+    """Build a rembg session with our own onnxruntime SessionOptions"""
+    import rembg
+    try:
+        from rembg.sessions import sessions_class
+    except ImportError:
+        # Older rembg cannot take SessionOptions; it sizes threads from OMP_NUM_THREADS
+        return rembg.new_session(model_name)
+
+    for session_class in sessions_class:
+        if session_class.name() == model_name:
+            return session_class(model_name, ort_session_options(threads))
+    raise ValueError(f"rembg has no session class for {model_name}")
+
+
+_pool: Optional[RembgSessionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_rembg_sessions() -> RembgSessionPool:
+    """Return the process-wide rembg session pool"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RembgSessionPool()
+        return _pool
+
+
+def _reset_after_fork() -> None:
+    global _pool_lock
+    _pool_lock = threading.Lock()
+    if _pool is not None:
+        _pool._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
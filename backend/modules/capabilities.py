@@ -0,0 +1,72 @@
+"""
+Capabilities - Shared Module
+Cached checks for optional dependencies that never import them
+"""
+
+import logging
+import threading
+import importlib.util
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# Capability -> top-level modules it needs
+CAPABILITIES = {
+    'torch': ('torch',),
+    'realesrgan': ('torch', 'realesrgan', 'basicsr'),
+    'gfpgan': ('torch', 'gfpgan', 'facexlib'),
+    'rembg': ('rembg', 'onnxruntime'),
+    'onnx': ('onnx', 'onnxruntime'),
+}
+
+_modules: Dict[str, bool] = {}
+_probed: Dict[str, bool] = {}
+_lock = threading.Lock()
+
+
+def module_available(name: str) -> bool:
+    """
+    Whether a top-level module is installed, without importing it
+
+    find_spec only locates the package on sys.path, so probing torch or
+    rembg costs microseconds instead of seconds. A package that is present
+    but broken fails at first real use; the caller then falls back to a
+    lighter method and reports it with mark_unavailable().
+    """
+    with _lock:
+        if name in _modules:
+            return _modules[name]
+    try:
+        found = importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        found = False
+    with _lock:
+        _modules[name] = found
+    return found
+
+
+def has_capability(name: str) -> bool:
+    """Probe a capability from CAPABILITIES once per process"""
+    with _lock:
+        if name in _probed:
+            return _probed[name]
+    missing = [module for module in CAPABILITIES[name] if not module_available(module)]
+    if missing:
+        logger.info(f"⚠️ {name} not available (missing {', '.join(missing)})")
+    else:
+        logger.info(f"✅ {name} available")
+    with _lock:
+        _probed[name] = not missing
+    return not missing
+
+
+def mark_unavailable(name: str, error: Exception) -> None:
+    """Record that an installed capability failed to import, so later probes report it missing"""
+    logger.warning(f"⚠️ {name} not available due to dependency issue: {error}")
+    with _lock:
+        _probed[name] = False
+
+
+def get_capabilities() -> Dict[str, bool]:
+    """Every known capability and whether it is installed"""
+    return {name: has_capability(name) for name in CAPABILITIES}
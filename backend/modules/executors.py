@@ -0,0 +1,92 @@
+"""
+Engine Executors - Shared Module
+Dedicated, sized thread pools for blocking engine calls, kept off the event loop's default executor
+"""
+
+import os
+import asyncio
+import logging
+import functools
+import threading
+import concurrent.futures
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# Concurrent jobs per engine; the thread budget splits cores between whatever runs
+EXECUTOR_SIZES = {
+    'background_remover': int(os.getenv('AI_BG_REMOVAL_WORKERS', '2')),
+    'photo_restoration': int(os.getenv('AI_RESTORATION_WORKERS', '1')),
+}
+
+
+class EngineExecutor:
+    """
+    Thread pool for one engine's blocking calls
+
+    Jobs beyond `size` queue here instead of taking threads from the loop's
+    default executor, which file I/O and previews keep using.
+    """
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = max(1, size)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.size, thread_name_prefix=f"{name}-engine")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {'jobs': 0, 'peak_in_flight': 0}
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Await `func(*args, **kwargs)` on this executor"""
+        with self._lock:
+            self._in_flight += 1
+            self._stats['jobs'] += 1
+            self._stats['peak_in_flight'] = max(self._stats['peak_in_flight'], self._in_flight)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, functools.partial(func, *args, **kwargs))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                'size': self.size,
+                'running': min(self._in_flight, self.size),
+                'queued': max(0, self._in_flight - self.size),
+            }
+
+
+_executors: Dict[str, EngineExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_engine_executor(name: str) -> EngineExecutor:
+    """Return the process-wide executor for engine `name`, created on first use"""
+    with _executors_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            executor = _executors[name] = EngineExecutor(name, EXECUTOR_SIZES.get(name, 1))
+            logger.info(f"🧵 {name} executor started with {executor.size} threads")
+        return executor
+
+
+def get_executor_stats() -> Dict[str, Any]:
+    with _executors_lock:
+        return {name: executor.get_stats() for name, executor in _executors.items()}
+
+
+def _reset_after_fork() -> None:
+    """A forked child has none of the parent's pool threads; it builds its own executors"""
+    global _executors, _executors_lock
+    _executors = {}
+    _executors_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
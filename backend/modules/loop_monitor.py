@@ -0,0 +1,85 @@
+"""
+Event Loop Monitor - Shared Module
+Measures event-loop lag so blocking calls on the loop show up in system info
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_INTERVAL = float(os.getenv('AI_LOOP_LAG_INTERVAL', '0.1'))  # Seconds between probes
+LOOP_LAG_WARN_MS = float(os.getenv('AI_LOOP_LAG_WARN_MS', '250'))
+LOOP_LAG_WINDOW = 600  # Samples kept for percentiles (one minute at the default interval)
+
+
+class LoopLagMonitor:
+    """
+    Sleeps `interval` seconds in a loop and records how late each wake-up is
+
+    Lag is the time the loop spent unable to run ready callbacks; anything
+    blocking the loop (a synchronous engine call, a large decode) adds to it.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self._samples: Deque[float] = deque(maxlen=LOOP_LAG_WINDOW)
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {'samples': 0, 'max_ms': 0.0, 'stalls': 0}
+
+    def start(self) -> None:
+        """Start probing on the running loop; a no-op if already running there"""
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._task = loop.create_task(self._probe())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _probe(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (time.perf_counter() - start - self.interval) * 1000)
+            self._samples.append(lag_ms)
+            self._stats['samples'] += 1
+            self._stats['max_ms'] = max(self._stats['max_ms'], lag_ms)
+            if lag_ms > LOOP_LAG_WARN_MS:
+                self._stats['stalls'] += 1
+                logger.warning(f"🐢 Event loop blocked for {lag_ms:.0f} ms")
+
+    def get_stats(self) -> Dict[str, Any]:
+        samples = sorted(self._samples)
+        if not samples:
+            return {**self._stats, 'running': self._task is not None}
+
+        def percentile(p: float) -> float:
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))], 1)
+
+        return {
+            **self._stats,
+            'max_ms': round(self._stats['max_ms'], 1),
+            'running': self._task is not None and not self._task.done(),
+            'mean_ms': round(sum(samples) / len(samples), 1),
+            'p50_ms': percentile(0.5),
+            'p99_ms': percentile(0.99),
+            'window_max_ms': round(samples[-1], 1),
+        }
+
+
+_monitor: Optional[LoopLagMonitor] = None
+
+
+def get_loop_monitor() -> LoopLagMonitor:
+    """Return the process-wide event loop monitor"""
+    global _monitor
+    if _monitor is None:
+        _monitor = LoopLagMonitor()
+    return _monitor
@@ -0,0 +1,332 @@
+"""
+Model Registry - Shared Module
+Keeps loaded upsampler models resident across requests with LRU eviction, one copy per process
+shared by every module that asks for the same key
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Defaults can be overridden per deployment through the environment
+DEFAULT_MEMORY_BUDGET_MB = int(os.getenv('MODEL_REGISTRY_BUDGET_MB', '2048'))
+DEFAULT_IDLE_TIMEOUT = float(os.getenv('MODEL_REGISTRY_IDLE_TIMEOUT', '900'))
+
+
+class ModelKey(NamedTuple):
+    """
+    Identity of a resident model; two requests with equal keys share weights
+
+    Only what decides the weights belongs here. Per-call settings such as
+    tiling go on the caller's own wrapper (see upscaler_engine.tiled_copy),
+    or a changed tile profile would load a second copy of the same weights.
+    """
+    architecture: str  # e.g. 'RRDBNet/RealESRGAN_x4plus'
+    scale: int
+    precision: str  # 'fp32' or 'fp16'
+    device: str  # 'cpu' or 'cuda'
+    backend: str = 'eager'  # see modules/upscaler/backends.py
+
+
+def estimate_model_bytes(model: Any) -> int:
+    """Estimate resident bytes of a torch model (or an object wrapping one in `.model`)"""
+    net = getattr(model, 'model', model)
+    # Compiled backends (ONNX Runtime, frozen TorchScript) report their own footprint
+    if hasattr(net, 'resident_bytes'):
+        return net.resident_bytes
+    try:
+        tensors = list(net.parameters()) + list(net.buffers())
+    except AttributeError:
+        return 0
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class _ResidentModel:
+    """A loaded model plus its bookkeeping"""
+
+    def __init__(self, key: ModelKey, model: Any, nbytes: int, load_time: float):
+        self.key = key
+        self.model = model
+        self.nbytes = nbytes
+        self.load_time = load_time
+        self.last_used = time.monotonic()
+        self.in_use = 0
+        self.lock = threading.Lock()
+        self.owners: Dict[str, int] = {}  # Modules that used this model while resident, and how often
+        self.held: Dict[str, int] = {}  # Long-lived references taken with hold(); they survive fork
+
+
+class ModelRegistry:
+    """Process-wide LRU registry of loaded models bounded by a memory budget"""
+
+    def __init__(self, memory_budget_bytes: Optional[int] = None, idle_timeout: Optional[float] = None):
+        self.memory_budget_bytes = (
+            memory_budget_bytes if memory_budget_bytes is not None
+            else DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024
+        )
+        self.idle_timeout = idle_timeout if idle_timeout is not None else DEFAULT_IDLE_TIMEOUT
+        self._entries: "OrderedDict[ModelKey, _ResidentModel]" = OrderedDict()
+        self._load_locks: Dict[ModelKey, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'idle_unloads': 0,
+            'total_load_time': 0.0,
+        }
+
+    @contextmanager
+    def lease(self, key: ModelKey, loader: Callable[[], Any], exclusive: bool = False,
+              owner: str = 'upscaler') -> Iterator[Any]:
+        """
+        Borrow a resident model, loading it with `loader` on a miss
+
+        Leased models are pinned and never evicted while in use. With
+        `exclusive=True` the caller also holds the model's lock, which is
+        needed for wrappers such as RealESRGANer whose enhance() keeps state
+        on the instance. `owner` names the module, for per-module reporting.
+        """
+        entry = self._acquire(key, loader, owner)
+        try:
+            if exclusive:
+                with entry.lock:
+                    yield entry.model
+            else:
+                yield entry.model
+        finally:
+            self._release(entry)
+
+    def hold(self, key: ModelKey, loader: Callable[[], Any], owner: str) -> Any:
+        """
+        Take a long-lived reference to a model, e.g. one wired into another wrapper
+
+        The model stays pinned until release(); holders must not call
+        stateful methods of a shared wrapper concurrently with other users
+        (take a shallow copy instead).
+        """
+        entry = self._acquire(key, loader, owner)
+        with self._lock:
+            entry.held[owner] = entry.held.get(owner, 0) + 1
+        return entry.model
+
+    def release(self, key: ModelKey, owner: str) -> None:
+        """Drop a reference taken with hold()"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not entry.held.get(owner):
+                return
+            entry.held[owner] -= 1
+            if not entry.held[owner]:
+                del entry.held[owner]
+        self._release(entry)
+
+    def _release(self, entry: _ResidentModel) -> None:
+        with self._lock:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+
+    def _acquire(self, key: ModelKey, loader: Callable[[], Any], owner: str) -> _ResidentModel:
+        with self._lock:
+            entry = self._checkout(key, owner)
+            if entry is not None:
+                return entry
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given key; the others wait and then hit
+        with load_lock:
+            with self._lock:
+                entry = self._checkout(key, owner)
+                if entry is not None:
+                    return entry
+                self._stats['misses'] += 1
+
+            logger.info(f"📦 Loading model into registry: {key.architecture} ({key.scale}x, {key.precision}, {key.device})")
+            start = time.perf_counter()
+            model = loader()
+            load_time = time.perf_counter() - start
+            nbytes = estimate_model_bytes(model)
+
+            with self._lock:
+                self._evict_for(nbytes)
+                entry = _ResidentModel(key, model, nbytes, load_time)
+                entry.in_use = 1
+                entry.owners[owner] = 1
+                self._entries[key] = entry
+                self._load_locks.pop(key, None)
+                self._stats['total_load_time'] += load_time
+
+        logger.info(f"✅ Model resident: {key.architecture} ({nbytes / 1024 / 1024:.1f} MB, loaded in {load_time:.2f}s)")
+        self._ensure_reaper()
+        return entry
+
+    def _checkout(self, key: ModelKey, owner: str) -> Optional[_ResidentModel]:
+        """Pin an already resident entry; caller holds self._lock"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        entry.in_use += 1
+        entry.owners[owner] = entry.owners.get(owner, 0) + 1
+        entry.last_used = time.monotonic()
+        self._stats['hits'] += 1
+        return entry
+
+    def _evict_for(self, incoming_bytes: int) -> None:
+        """Evict least-recently-used idle models until `incoming_bytes` fits; caller holds self._lock"""
+        resident = sum(e.nbytes for e in self._entries.values())
+        for key in list(self._entries.keys()):
+            if resident + incoming_bytes <= self.memory_budget_bytes:
+                return
+            entry = self._entries[key]
+            if entry.in_use:
+                continue
+            self._unload(key)
+            resident -= entry.nbytes
+            self._stats['evictions'] += 1
+            logger.info(f"♻️ Evicted model {key.architecture} ({key.scale}x) to stay within memory budget")
+
+        if resident + incoming_bytes > self.memory_budget_bytes:
+            logger.warning("⚠️ Model registry over budget: all resident models are in use")
+
+    def _unload(self, key: ModelKey) -> None:
+        entry = self._entries.pop(key)
+        entry.model = None
+        # Only touch torch if something already imported it
+        torch = sys.modules.get('torch')
+        if torch is not None and key.device == 'cuda' and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def sweep_idle(self) -> int:
+        """Unload models that have not been used within the idle timeout"""
+        if self.idle_timeout <= 0:
+            return 0
+        now = time.monotonic()
+        unloaded = 0
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.in_use == 0 and now - entry.last_used > self.idle_timeout:
+                    self._unload(key)
+                    self._stats['idle_unloads'] += 1
+                    unloaded += 1
+                    logger.info(f"💤 Unloaded idle model {key.architecture} ({key.scale}x)")
+        return unloaded
+
+    def _ensure_reaper(self) -> None:
+        if self.idle_timeout <= 0:
+            return
+        with self._lock:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._reaper = threading.Thread(target=self._reap_forever, name='model-registry-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap_forever(self) -> None:
+        interval = max(1.0, min(self.idle_timeout / 2, 60.0))
+        while True:
+            time.sleep(interval)
+            self.sweep_idle()
+            with self._lock:
+                if not self._entries:
+                    self._reaper = None
+                    return
+
+    def clear(self) -> None:
+        """Unload every model that is not currently leased"""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.in_use == 0:
+                    self._unload(key)
+
+    def _after_fork(self) -> None:
+        """Threads do not survive fork: give the child fresh locks and no reaper"""
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._reaper = None
+        for entry in self._entries.values():
+            entry.lock = threading.Lock()
+            # Leases belonged to threads of the parent; held references live on in the child's objects
+            entry.in_use = sum(entry.held.values())
+
+    def _owner_stats(self) -> Dict[str, Any]:
+        """
+        Resident memory per module; caller holds self._lock
+
+        A model used by several modules counts towards each of them, so
+        `shared_saving_bytes` is what separate copies per module would add.
+        """
+        owners: Dict[str, Dict[str, int]] = {}
+        saving = 0
+        for entry in self._entries.values():
+            for owner in entry.owners:
+                usage = owners.setdefault(owner, {'models': 0, 'bytes': 0, 'shared_bytes': 0})
+                usage['models'] += 1
+                usage['bytes'] += entry.nbytes
+                if len(entry.owners) > 1:
+                    usage['shared_bytes'] += entry.nbytes
+            saving += entry.nbytes * max(0, len(entry.owners) - 1)
+        return {'owners': owners, 'shared_saving_bytes': saving}
+
+    def get_owner_stats(self, owner: str) -> Dict[str, int]:
+        """Resident models and bytes used by one module"""
+        with self._lock:
+            return self._owner_stats()['owners'].get(owner, {'models': 0, 'bytes': 0, 'shared_bytes': 0})
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, load times and resident memory"""
+        now = time.monotonic()
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'total_load_time': round(self._stats['total_load_time'], 3),
+                'hit_ratio': round(self._stats['hits'] / lookups, 3) if lookups else 0.0,
+                'resident_models': len(self._entries),
+                'resident_bytes': sum(e.nbytes for e in self._entries.values()),
+                'memory_budget_bytes': self.memory_budget_bytes,
+                'idle_timeout': self.idle_timeout,
+                **self._owner_stats(),
+                'models': [
+                    {
+                        **entry.key._asdict(),
+                        'bytes': entry.nbytes,
+                        'load_time': round(entry.load_time, 3),
+                        'in_use': entry.in_use,
+                        'owners': sorted(entry.owners),
+                        'idle_seconds': round(now - entry.last_used, 1),
+                    }
+                    for entry in self._entries.values()
+                ],
+            }
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Return the process-wide model registry"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
+
+
+def _reset_after_fork() -> None:
+    global _registry_lock
+    _registry_lock = threading.Lock()
+    if _registry is not None:
+        _registry._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
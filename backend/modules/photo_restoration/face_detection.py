@@ -0,0 +1,161 @@
+"""
+Face Detection - Photo Restoration Module
+Runs GFPGAN's face detector on a downscaled copy and caches boxes and landmarks by image content
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, NamedTuple, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Longest side the detector sees; RetinaFace still finds faces of ~20 px at this size
+FACE_DETECT_SIDE = int(os.getenv('RESTORATION_FACE_DETECT_SIDE', '1024'))
+FACE_CACHE_ENTRIES = int(os.getenv('RESTORATION_FACE_CACHE_ENTRIES', '512'))
+EYE_DIST_THRESHOLD = 5  # Pixels at full resolution, as GFPGANer.enhance() uses
+# Detector confidence FaceRestoreHelper.get_face_landmarks_5() uses (RetinaFace defaults to 0.8)
+CONF_THRESHOLD = 0.97
+
+
+class Faces(NamedTuple):
+    """Detected faces in full-resolution coordinates"""
+    boxes: np.ndarray  # (N, 5): x0, y0, x1, y1, score
+    landmarks: np.ndarray  # (N, 5, 2): eyes, nose, mouth corners
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+
+def image_digest(image_path: str) -> str:
+    """Hash of the input file's bytes"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def detect_faces(face_helper: Any, img: np.ndarray, side: int = FACE_DETECT_SIDE,
+                 resize: Optional[int] = None) -> Faces:
+    """
+    Faces in a BGR image, detected on a copy whose longest side is at most `side`
+
+    `face_helper` is the facexlib FaceRestoreHelper of a GFPGANer; its
+    RetinaFace detector returns boxes, scores and five landmarks per face.
+    With `resize`, the copy is sized the way get_face_landmarks_5(resize=...)
+    sizes it instead: small images are enlarged so their short side reaches it.
+    """
+    import cv2
+    import torch
+
+    height, width = img.shape[:2]
+    if resize is not None:
+        factor = max(1.0, resize / min(height, width))
+    else:
+        factor = min(1.0, side / max(height, width))
+    scaled = img
+    if factor != 1.0:
+        interpolation = cv2.INTER_AREA if factor < 1.0 else cv2.INTER_LINEAR
+        scaled = cv2.resize(img, (int(width * factor), int(height * factor)), interpolation=interpolation)
+
+    with torch.no_grad():
+        detections = face_helper.face_det.detect_faces(scaled, conf_threshold=CONF_THRESHOLD)
+    if detections is None or len(detections) == 0:
+        return Faces(np.zeros((0, 5), np.float32), np.zeros((0, 5, 2), np.float32))
+
+    detections = np.asarray(detections, np.float32)
+    boxes = detections[:, :5].copy()
+    boxes[:, :4] /= factor
+    landmarks = detections[:, 5:15].reshape(-1, 5, 2) / factor
+    eye_dist = np.linalg.norm(landmarks[:, 0] - landmarks[:, 1], axis=1)
+    keep = eye_dist >= EYE_DIST_THRESHOLD
+    return Faces(boxes[keep], landmarks[keep])
+
+
+def center_face(faces: Faces, width: int, height: int) -> Faces:
+    """Only the face closest to the image centre, as get_face_landmarks_5(only_center_face=True) keeps"""
+    if len(faces) <= 1:
+        return faces
+    centers = (faces.boxes[:, :2] + faces.boxes[:, 2:4]) / 2
+    index = int(np.argmin(np.linalg.norm(centers - np.array([width / 2, height / 2]), axis=1)))
+    return Faces(faces.boxes[index:index + 1], faces.landmarks[index:index + 1])
+
+
+@contextmanager
+def preset_landmarks(face_helper: Any, faces: Faces) -> Iterator[None]:
+    """Make the helper's get_face_landmarks_5() use `faces` instead of running the detector"""
+    def get_face_landmarks_5(*args, **kwargs):
+        face_helper.det_faces = list(faces.boxes)
+        face_helper.all_landmarks_5 = list(faces.landmarks)
+        return len(faces)
+
+    face_helper.get_face_landmarks_5 = get_face_landmarks_5
+    try:
+        yield
+    finally:
+        # Back to the class method
+        del face_helper.get_face_landmarks_5
+
+
+class FaceCache:
+    """LRU of detected faces keyed by image hash; entries are a few hundred bytes each"""
+
+    def __init__(self, max_entries: int = FACE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Faces]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'detect_time': 0.0}
+
+    def get(self, key: str) -> Optional[Faces]:
+        with self._lock:
+            faces = self._entries.get(key)
+            if faces is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return faces
+
+    def put(self, key: str, faces: Faces, detect_time: float = 0.0) -> None:
+        with self._lock:
+            self._entries[key] = faces
+            self._entries.move_to_end(key)
+            self._stats['detect_time'] += detect_time
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def lookup(self, image_path: str, img: np.ndarray, face_helper: Any, only_center_face: bool = False,
+               resize: Optional[int] = None) -> Dict[str, Any]:
+        """Faces of an image from the cache or the detector, with timing for the response metadata"""
+        start = time.perf_counter()
+        # Every face is cached; only_center_face is applied per request
+        key = f"{image_digest(image_path)}-{FACE_DETECT_SIDE}-{resize}"
+        faces = self.get(key)
+        cached = faces is not None
+        if faces is None:
+            faces = detect_faces(face_helper, img, resize=resize)
+            self.put(key, faces, time.perf_counter() - start)
+        if only_center_face:
+            faces = center_face(faces, img.shape[1], img.shape[0])
+        return {'faces': faces, 'cached': cached, 'time': round(time.perf_counter() - start, 3)}
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'detect_time': round(self._stats['detect_time'], 3),
+                'hit_ratio': round(self._stats['hits'] / lookups, 3) if lookups else 0.0,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+            }
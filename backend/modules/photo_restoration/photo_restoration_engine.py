@@ -1,21 +1,44 @@
 ﻿import os
-import cv2
 import numpy as np
-import torch
 import logging
+import threading
 from pathlib import Path
 from typing import Optional, Dict, Any, Tuple, List
 import time
 
+from ..capabilities import has_capability
+from ..executors import get_engine_executor
+from ..model_registry import estimate_model_bytes, get_model_registry
+from .face_detection import FaceCache, preset_landmarks
+from ..thread_budget import get_thread_budget
+
 logger = logging.getLogger(__name__)
 
+# 'background' loads and warms the models in a thread after startup, 'lazy' on the first restoration
+RESTORATION_WARMUP = os.getenv('AI_RESTORATION_WARMUP', 'background')
+WARMUP_IMAGE_SIDE = 256
+# GFPGAN restores aligned 512x512 face crops
+WARMUP_FACE_SIDE = 512
+
+
 class PhotoRestorationEngine:
     def __init__(self):
         logger.info("Initializing Photo Restoration Engine...")
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        # torch, GFPGAN and Real-ESRGAN are imported and loaded by ensure_loaded()
+        self.device = None
         self.gfpgan_model = None
         self.bg_upsampler = None
+        self._bg_upsampler_key = None
+        self.model_registry = get_model_registry()
         self.initialized = False
+        self.state = 'cold'  # cold -> warming -> ready (or failed)
+        self.load_time: Optional[float] = None
+        self.warmup_time: Optional[float] = None
+        self._load_lock = threading.Lock()
+        self._warming_up = False
+        # GFPGANer and RealESRGANer keep per-call state on the instance
+        self._gfpgan_lock = threading.Lock()
+        self.face_cache = FaceCache()
         self.models_dir = Path("models/photo_restoration")
         self.models_dir.mkdir(parents=True, exist_ok=True)
         self.available_models = {
@@ -25,45 +48,141 @@ class PhotoRestorationEngine:
                 'url': 'https://github.com/TencentARC/GFPGAN/releases/download/v1.3.0/GFPGANv1.3.pth'
             }
         }
-        self._init_background_upsampler()
-        self._init_gfpgan()
-        logger.info("Photo Restoration Engine initialized")
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+        logger.info(f"Photo Restoration Engine initialized (models load {'on first use' if RESTORATION_WARMUP == 'lazy' else 'after startup'})")
+    
+    def ensure_loaded(self) -> None:
+        """Load the background upsampler and GFPGAN once; concurrent callers wait for the first"""
+        if self.load_time is not None:
+            return
+        with self._load_lock:
+            if self.load_time is not None:
+                return
+            self.state = 'warming'
+            start_time = time.time()
+            try:
+                import torch
+                self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+                self._init_background_upsampler()
+                self._init_gfpgan()
+            except Exception as e:
+                logger.error(f"❌ Photo restoration models failed to load: {e}")
+                self.state = 'failed'
+                raise
+            finally:
+                self.load_time = round(time.time() - start_time, 2)
+            if not self.initialized:
+                # Every restoration method runs GFPGAN
+                self.state = 'failed'
+            elif not self._warming_up:
+                # A warm-up marks the engine ready only after its first inference
+                self.state = 'ready'
+            logger.info(f"✅ Photo restoration models loaded in {self.load_time:.1f}s")
+    
+    def warm_up(self) -> None:
+        """
+        Load the models and run one restoration on a synthetic image
+        
+        The first inference allocates torch's (and CUDA's) memory pools and
+        picks kernels; doing it here keeps that cost off the first request.
+        The synthetic image has no faces, so the generator also runs once on
+        an aligned face crop.
+        """
+        self._warming_up = True
+        try:
+            self.ensure_loaded()
+            if self.state == 'failed':
+                return
+            start_time = time.time()
+            rng = np.random.default_rng(0)
+            image = rng.integers(0, 256, (WARMUP_IMAGE_SIDE, WARMUP_IMAGE_SIDE, 3), dtype=np.uint8)
+            with self._gfpgan_lock, get_thread_budget().torch_work():
+                if self.gfpgan_model is not None:
+                    self.gfpgan_model.enhance(image, has_aligned=False, only_center_face=False, paste_back=True)
+                    face = np.zeros((WARMUP_FACE_SIDE, WARMUP_FACE_SIDE, 3), dtype=np.uint8)
+                    self.gfpgan_model.enhance(face, has_aligned=True, only_center_face=False, paste_back=False)
+                elif self.bg_upsampler is not None:
+                    self.bg_upsampler.enhance(image, outscale=2)
+            self.warmup_time = round(time.time() - start_time, 2)
+            self.state = 'ready'
+            logger.info(f"🔥 Photo restoration warmed up in {self.warmup_time:.1f}s")
+        except Exception as e:
+            logger.error(f"❌ Photo restoration warm-up failed: {e}")
+            self.state = 'failed'
+        finally:
+            self._warming_up = False
+    
+    def start_warmup(self) -> bool:
+        """Warm up in a daemon thread unless AI_RESTORATION_WARMUP=lazy; returns whether it started"""
+        if RESTORATION_WARMUP == 'lazy' or self.state != 'cold':
+            return False
+        self.state = 'warming'
+        threading.Thread(target=self.warm_up, name='restoration-warmup', daemon=True).start()
+        return True
+    
+    def load_before_fork(self) -> bool:
+        """
+        Load the models in this thread unless AI_RESTORATION_WARMUP=lazy; returns whether it tried
+        
+        Stands in for start_warmup() when jobs run in forked workers, which
+        then inherit the loaded weights. The warm-up inference is left out:
+        it would start torch's thread pool in the process workers fork from.
+        """
+        if RESTORATION_WARMUP == 'lazy' or self.state != 'cold':
+            return False
+        try:
+            self.ensure_loaded()
+        except Exception:
+            pass  # Reported through get_readiness() as 'failed'
+        return True
+    
+    def get_readiness(self) -> str:
+        """'cold', 'warming', 'ready' or 'failed'"""
+        return self.state
+    
+    def _after_fork(self) -> None:
+        """A fork during loading leaves the lock held by a thread the child does not have"""
+        self._load_lock = threading.Lock()
+        self._gfpgan_lock = threading.Lock()
+        self.face_cache._after_fork()
+        if self.state == 'warming':
+            self.state = 'cold'
     
     def _init_background_upsampler(self) -> None:
-        """Initialize Real-ESRGAN background upsampler for complete image restoration"""
+        """
+        Real-ESRGAN x2plus background upsampler for complete image restoration
+        
+        The network comes from the shared model registry, so it is the same
+        copy the upscaler's realesrgan_2x uses. GFPGAN gets a shallow copy:
+        RealESRGANer.enhance() keeps per-call state on the instance, and the
+        copy's tiling follows the tile profile per request.
+        """
         try:
-            from basicsr.archs.rrdbnet_arch import RRDBNet
-            from realesrgan import RealESRGANer
+            from ..upscaler.backends import DEFAULT_BACKEND
+            from ..upscaler.upscaler_engine import realesrgan_model_spec, tiled_copy
             
-            # Use Real-ESRGAN for background upsampling (non-face regions)
-            # This works on both CUDA and CPU
-            model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=2)
-            self.bg_upsampler = RealESRGANer(
-                scale=2,
-                model_path='https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.1/RealESRGAN_x2plus.pth',
-                model=model,
-                tile=400,
-                tile_pad=10,
-                pre_pad=0,
-                half=torch.cuda.is_available()  # Use half precision only if CUDA available
-            )
-            logger.info(f"Real-ESRGAN background upsampler initialized successfully (CUDA: {torch.cuda.is_available()})")
+            key, loader = realesrgan_model_spec(2, DEFAULT_BACKEND)
+            # Held for the engine's lifetime, since GFPGAN keeps a reference to it
+            shared = self.model_registry.hold(key, loader, owner='photo_restoration')
+            self._bg_upsampler_key = key
+            self.bg_upsampler = tiled_copy(shared, *self._bg_tile_config())
+            logger.info(f"Real-ESRGAN background upsampler initialized successfully ({key.device}, shared)")
         except Exception as e:
             logger.warning(f"Background upsampler init failed: {e}")
             self.bg_upsampler = None
     
+    def _bg_tile_config(self) -> Tuple[int, int]:
+        from ..upscaler.tile_autotuner import get_tile_config, network_id
+        return get_tile_config(network_id('RRDBNet', 2, 23))
+    
     def _init_gfpgan(self) -> None:
         try:
             import gfpgan
             from gfpgan import GFPGANer
-            model_path = None
-            for model_key, model_info in self.available_models.items():
-                model_file_path = self.models_dir / model_info['file']
-                if model_file_path.exists():
-                    model_path = str(model_file_path)
-                    logger.info(f"Found existing model: {model_info['name']}")
-                    break
+            model_path = self._find_gfpgan_weights()
             if model_path:
+                logger.info(f"Found existing model: {model_path}")
                 # Initialize GFPGAN with Real-ESRGAN background upsampler for complete image restoration
                 self.gfpgan_model = GFPGANer(
                     model_path=model_path,
@@ -80,6 +199,13 @@ class PhotoRestorationEngine:
             logger.warning(f"GFPGAN init failed: {e}")
             self.initialized = False
     
+    def _find_gfpgan_weights(self) -> Optional[str]:
+        for model_info in self.available_models.values():
+            model_file_path = self.models_dir / model_info['file']
+            if model_file_path.exists():
+                return str(model_file_path)
+        return None
+    
     def get_available_restoration_methods(self) -> List[Dict[str, Any]]:
         methods = [
             {
@@ -90,7 +216,9 @@ class PhotoRestorationEngine:
                 'suitable_for': ['old_photos', 'damaged_photos', 'all_images']
             }
         ]
-        if self.initialized:
+        # Before the models load, GFPGAN counts as available if it is installed and has weights
+        gfpgan_expected = self.load_time is None and has_capability('gfpgan') and self._find_gfpgan_weights() is not None
+        if self.initialized or gfpgan_expected:
             methods.append({
                 'id': 'gfpgan_face_restore',
                 'name': 'Face Restoration Only',
@@ -105,6 +233,8 @@ class PhotoRestorationEngine:
             logger.info(f"Starting photo restoration: {method}")
             if not os.path.exists(image_path):
                 raise FileNotFoundError(f"Input image not found: {image_path}")
+            # Lazy mode loads here; during a background warm-up this waits for it
+            self.ensure_loaded()
             if method == 'complete_photo_restore':
                 return self._complete_photo_restore(image_path, scale, output_path, **kwargs)
             elif method == 'gfpgan_face_restore':
@@ -115,8 +245,20 @@ class PhotoRestorationEngine:
             logger.error(f"Error in photo restoration: {e}")
             return None, {'error': str(e)}
     
+    async def restore_photo_async(self, image_path: str, method: str = 'complete_photo_restore', scale: int = 2, output_path: Optional[str] = None, **kwargs) -> Tuple[Optional[str], Dict[str, Any]]:
+        """restore_photo() on the restoration executor, leaving the event loop free"""
+        return await get_engine_executor('photo_restoration').run(
+            self._restore_photo_sized, image_path, method, scale, output_path, **kwargs
+        )
+    
+    def _restore_photo_sized(self, image_path: str, method: str, scale: int, output_path: Optional[str], **kwargs) -> Tuple[Optional[str], Dict[str, Any]]:
+        """Pick up this executor thread's lane share (onnxruntime backends use it), then restore"""
+        get_thread_budget().apply()
+        return self.restore_photo(image_path, method, scale, output_path, **kwargs)
+    
     def _complete_photo_restore(self, image_path: str, scale: int = 2, output_path: Optional[str] = None, **kwargs) -> Tuple[Optional[str], Dict[str, Any]]:
         try:
+            import cv2
             logger.info("Starting complete photo restoration using GFPGAN + Real-ESRGAN...")
             
             if not self.initialized:
@@ -128,21 +270,14 @@ class PhotoRestorationEngine:
             
             logger.info("Applying GFPGAN with background upsampler for complete image restoration...")
             
-            # Use GFPGAN's official enhance method with background upsampler
-            # This will restore faces AND enhance background regions using Real-ESRGAN
-            cropped_faces, restored_faces, restored_img = self.gfpgan_model.enhance(
-                input_img,
-                has_aligned=False,
-                only_center_face=False,
-                paste_back=True,  # Paste restored faces back to the image
-                weight=kwargs.get('weight', 0.5)  # Balance between original and restored
-            )
+            # Restores faces AND enhances background regions using Real-ESRGAN
+            restored_img, faces = self._restore(image_path, input_img, **kwargs)
             
             if restored_img is None:
                 logger.warning("GFPGAN restoration failed, using original image")
                 restored_img = input_img
             
-            logger.info(f"Complete restoration successful: {len(restored_faces)} faces restored, background enhanced")
+            logger.info(f"Complete restoration successful: {faces['faces_found']} faces restored, background enhanced")
             
             # Additional scaling if requested
             if scale > 2:  # GFPGAN already does 2x upscaling
@@ -163,12 +298,12 @@ class PhotoRestorationEngine:
             metadata = {
                 'method': 'Complete Photo Restoration (GFPGAN + Real-ESRGAN)',
                 'complete_image_restored': True,
-                'faces_enhanced': len(restored_faces) > 0,
+                'faces_enhanced': faces['faces_found'] > 0,
                 'background_enhanced': self.bg_upsampler is not None,
-                'faces_found': len(restored_faces),
+                **faces,
                 'real_esrgan_used': self.bg_upsampler is not None,
                 'scale_factor': scale,
-                'ai_model_used': 'GFPGAN v1.3 + Real-ESRGAN',
+                'ai_model_used': 'Real-ESRGAN' if faces['gfpgan_skipped'] else 'GFPGAN v1.3 + Real-ESRGAN',
                 'restoration_quality': 'Professional'
             }
             
@@ -181,34 +316,100 @@ class PhotoRestorationEngine:
     
     def _gfpgan_face_restore(self, image_path: str, scale: int = 2, output_path: Optional[str] = None, **kwargs) -> Tuple[Optional[str], Dict[str, Any]]:
         try:
+            import cv2
             if not self.initialized:
                 raise ValueError("GFPGAN not available")
             input_img = cv2.imread(image_path, cv2.IMREAD_COLOR)
             if input_img is None:
                 raise ValueError("Could not load image")
-            _, _, restored_img = self.gfpgan_model.enhance(input_img, has_aligned=False, only_center_face=False, paste_back=True, weight=kwargs.get('weight', 0.5))
+            restored_img, faces = self._restore(image_path, input_img, **kwargs)
             if output_path is None:
                 output_path = self._generate_output_path(image_path, 'face_restored')
             cv2.imwrite(output_path, restored_img)
-            metadata = {'method': 'GFPGAN Face Restoration', 'faces_only': True, 'complete_image_restored': False}
+            metadata = {'method': 'GFPGAN Face Restoration', 'faces_only': True, 'complete_image_restored': False, **faces}
             return output_path, metadata
         except Exception as e:
             logger.error(f"Error in face restoration: {e}")
             return None, {'error': str(e)}
     
+    def _restore(self, image_path: str, input_img: np.ndarray, weight: float = 0.5, only_center_face: bool = False,
+                 resize: Optional[int] = None, **kwargs) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        GFPGAN restoration with detection done up front
+        
+        Faces are detected on a downscaled copy (cached by image hash) and
+        handed to GFPGAN, so its own full-resolution detection never runs.
+        Without faces GFPGAN is skipped: the image goes straight to the
+        background upsampler, which is what GFPGAN would return for it.
+        """
+        import cv2
+        
+        upscale = self.gfpgan_model.upscale
+        # torch_work() keeps this enhance() and the upscaler's tile batches from sharing the cores twice
+        with self._gfpgan_lock, get_thread_budget().torch_work():
+            # The detector is the shared face_helper's RetinaFace, which keeps per-call state
+            detection = self.face_cache.lookup(
+                image_path, input_img, self.gfpgan_model.face_helper, only_center_face=only_center_face, resize=resize
+            )
+            faces = detection['faces']
+            info = {
+                'faces_found': len(faces),
+                'face_detection_time': detection['time'],
+                'face_detection_cached': detection['cached'],
+                'gfpgan_skipped': len(faces) == 0,
+            }
+            if self.bg_upsampler is not None:
+                # Picks up a tile profile written after the weights were loaded
+                self.bg_upsampler.tile_size, self.bg_upsampler.tile_pad = self._bg_tile_config()
+            if len(faces):
+                with preset_landmarks(self.gfpgan_model.face_helper, faces):
+                    _, _, restored_img = self.gfpgan_model.enhance(
+                        input_img,
+                        has_aligned=False,
+                        only_center_face=only_center_face,
+                        paste_back=True,  # Paste restored faces back to the image
+                        weight=weight  # Balance between original and restored
+                    )
+            elif self.bg_upsampler is not None:
+                restored_img = self.bg_upsampler.enhance(input_img, outscale=upscale)[0]
+            else:
+                height, width = input_img.shape[:2]
+                restored_img = cv2.resize(input_img, (width * upscale, height * upscale), interpolation=cv2.INTER_LANCZOS4)
+        return restored_img, info
+    
     def _generate_output_path(self, input_path: str, suffix: str) -> str:
         input_path = Path(input_path)
         timestamp = int(time.time())
         output_filename = f"{input_path.stem}_{suffix}_{timestamp}{input_path.suffix}"
         return str(Path("processed") / output_filename)
     
+    def get_resident_memory(self) -> Dict[str, Any]:
+        """Bytes of model weights this engine keeps resident; registry models may be shared"""
+        registry = self.model_registry.get_owner_stats('photo_restoration')
+        gfpgan_bytes = estimate_model_bytes(self.gfpgan_model.gfpgan) if self.gfpgan_model is not None else 0
+        return {
+            'registry_bytes': registry['bytes'],
+            'shared_bytes': registry['shared_bytes'],
+            'gfpgan_bytes': gfpgan_bytes,
+            'total_bytes': registry['bytes'] + gfpgan_bytes,
+        }
+    
     def get_status(self) -> Dict[str, Any]:
         return {
             'initialized': True,
+            'readiness': self.state,
+            'load_time': self.load_time,
+            'warmup_time': self.warmup_time,
             'gfpgan_available': self.gfpgan_model is not None,
             'bg_upsampler_available': self.bg_upsampler is not None,
-            'device': str(self.device),
+            'device': str(self.device) if self.device is not None else None,
             'restoration_methods': len(self.get_available_restoration_methods()),
             'complete_restoration_available': True,
-            'real_esrgan_enabled': self.bg_upsampler is not None
+            'real_esrgan_enabled': self.bg_upsampler is not None,
+            'resident_memory': self.get_resident_memory(),
+            'face_cache': self.face_cache.get_stats(),
+            'executor': get_engine_executor('photo_restoration').get_stats()
         }
+    
+    def get_module_info(self) -> Dict[str, Any]:
+        return {'name': 'Photo Restoration Engine', **self.get_status()}
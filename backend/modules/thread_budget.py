@@ -0,0 +1,179 @@
+"""
+Thread Budget - Shared Module
+Splits the host's cores between concurrent jobs; torch work takes turns at its jobs' share
+"""
+
+import os
+import sys
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# 0 means every core this process may run on
+THREAD_BUDGET = int(os.getenv('AI_THREAD_BUDGET', '0'))
+
+
+def available_cores() -> int:
+    """Cores this process may run on (respects taskset/cgroup CPU affinity)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class ThreadBudget:
+    """
+    Fair share of intra-op threads for the jobs currently running
+
+    Every running job holds a lane. A job's share is `total // lanes`, so
+    shares shrink when jobs start and grow back when they finish. Compute
+    threads call `apply()` before each unit of work (a tile batch, an image)
+    to pick up the current share, which sizes the onnxruntime session they
+    run. torch's intra-op pool is process-wide, so torch units run one at a
+    time inside `torch_work()`, which sizes the pool to the holder's share.
+    """
+
+    def __init__(self, total: Optional[int] = None):
+        self.total = max(1, total or THREAD_BUDGET or available_cores())
+        self._lanes: Dict[int, str] = {}
+        self._next_lane = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._torch_lock = threading.Lock()
+        self._torch_waiting = 0  # Lanes queued for torch_work()
+        self._torch_threads: Optional[int] = None
+        self._stats = {'jobs': 0, 'rebalances': 0, 'peak_lanes': 0}
+
+    @contextmanager
+    def lane(self, name: str) -> Iterator[int]:
+        """Hold a lane for the duration of one job"""
+        with self._lock:
+            lane_id = self._next_lane
+            self._next_lane += 1
+            self._lanes[lane_id] = name
+            self._stats['jobs'] += 1
+            self._stats['rebalances'] += 1
+            self._stats['peak_lanes'] = max(self._stats['peak_lanes'], len(self._lanes))
+        try:
+            yield lane_id
+        finally:
+            with self._lock:
+                self._lanes.pop(lane_id, None)
+                self._stats['rebalances'] += 1
+
+    def threads(self, lanes: int = 1) -> int:
+        """Threads owed to work serving `lanes` jobs (e.g. a batch mixing tiles of several jobs)"""
+        with self._lock:
+            active = max(1, len(self._lanes))
+        return max(1, min(self.total, self.total * max(1, lanes) // active))
+
+    def apply(self, lanes: int = 1) -> int:
+        """
+        Record the calling thread's current share and return it
+        """
+        threads = self.threads(lanes)
+        self._local.threads = threads
+        return threads
+
+    @contextmanager
+    def torch_work(self, lanes: int = 1) -> Iterator[int]:
+        """
+        Run one unit of torch work (a tile batch, an enhance() call) at the share of `lanes` jobs
+
+        torch.set_num_threads() is process-global, so two units sized per job
+        would still overlap on the same pool. Units therefore take turns: the
+        holder sets the pool to its share plus that of the lanes queued
+        behind it, which are idle meanwhile, and onnxruntime jobs keep theirs.
+        """
+        with self._lock:
+            self._torch_waiting += lanes
+        with self._torch_lock:
+            with self._lock:
+                self._torch_waiting -= lanes
+                waiting = self._torch_waiting
+            threads = self.apply(lanes + waiting)
+            # Only touch torch if something already imported it
+            torch = sys.modules.get('torch')
+            if torch is not None and self._torch_threads != threads:
+                torch.set_num_threads(threads)
+                self._torch_threads = threads
+            yield threads
+
+    def current(self) -> int:
+        """Share last applied on the calling thread, e.g. to pick an onnxruntime session"""
+        return getattr(self._local, 'threads', None) or self.threads()
+
+    def set_total(self, total: int) -> None:
+        """Shrink or grow the budget, e.g. to a worker process's slice of the host"""
+        with self._lock:
+            self.total = max(1, total)
+            self._stats['rebalances'] += 1
+
+    def _after_fork(self) -> None:
+        """The child inherits none of the parent's running jobs"""
+        self._lock = threading.Lock()
+        self._lanes = {}
+        self._local = threading.local()
+        self._torch_lock = threading.Lock()
+        self._torch_waiting = 0
+        # torch's pool settings are not guaranteed to survive fork
+        self._torch_threads = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = len(self._lanes)
+            return {
+                **self._stats,
+                'total_threads': self.total,
+                'active_jobs': active,
+                'threads_per_job': max(1, self.total // max(1, active)),
+                'torch_threads': self._torch_threads,
+                'jobs_running': sorted(self._lanes.values()),
+            }
+
+
+def ort_session_options(threads: int) -> Any:
+    """onnxruntime SessionOptions pinned to `threads` intra-op threads"""
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    return options
+
+
+def session_threads(threads: int) -> int:
+    """
+    Round a thread share down to a power of two
+
+    onnxruntime fixes a session's thread count at creation, so sessions are
+    cached per thread count; rounding keeps that to a handful per model.
+    """
+    return 1 << (max(1, threads).bit_length() - 1)
+
+
+_budget: Optional[ThreadBudget] = None
+_budget_lock = threading.Lock()
+
+
+def get_thread_budget() -> ThreadBudget:
+    """Return the process-wide thread budget"""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = ThreadBudget()
+        return _budget
+
+
+def _reset_after_fork() -> None:
+    global _budget_lock
+    _budget_lock = threading.Lock()
+    if _budget is not None:
+        _budget._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
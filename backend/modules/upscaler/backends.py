@@ -0,0 +1,251 @@
+"""
+Inference backends for Real-ESRGAN networks
+Exports RRDBNet/SRVGGNet once to TorchScript or ONNX and swaps the compiled runner into a RealESRGANer
+"""
+
+import os
+import copy
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..capabilities import has_capability
+from ..thread_budget import get_thread_budget, ort_session_options, session_threads
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('eager', 'bf16', 'torchscript', 'onnx', 'onnx-int8')
+DEFAULT_BACKEND = os.getenv('UPSCALER_BACKEND', 'eager')
+COMPILED_DIR = os.getenv('UPSCALER_COMPILED_DIR', os.path.join('models', 'compiled'))
+ONNX_OPSET = 17
+
+_compiled: Dict[Tuple[str, str], Any] = {}
+_compiled_lock = threading.Lock()
+
+
+def split_model_id(model: str) -> Tuple[str, str]:
+    """'realesrgan_4x@onnx-int8' -> ('realesrgan_4x', 'onnx-int8'); no suffix means the default backend"""
+    name, _, backend = model.partition('@')
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    return name, backend
+
+
+def available_backends() -> List[str]:
+    """Backends whose dependencies are installed"""
+    if not has_capability('torch'):
+        return []
+    backends = ['eager', 'bf16', 'torchscript']
+    if has_capability('onnx'):
+        backends += ['onnx', 'onnx-int8']
+    return backends
+
+
+class _AutocastModel:
+    """Eager network run under bf16 autocast; outputs are returned as fp32"""
+
+    def __init__(self, net: Any):
+        self.net = net
+
+    def __call__(self, tensor):
+        import torch
+        with torch.autocast(tensor.device.type, dtype=torch.bfloat16):
+            return self.net(tensor).float()
+
+    def parameters(self):
+        return self.net.parameters()
+
+    def buffers(self):
+        return self.net.buffers()
+
+
+class _TorchScriptModel:
+    """Frozen TorchScript module; freezing folds weights into constants"""
+
+    def __init__(self, module: Any, path: str):
+        self.module = module
+        self.resident_bytes = os.path.getsize(path)
+
+    def __call__(self, tensor):
+        return self.module(tensor)
+
+
+class _OnnxModel:
+    """
+    ONNX Runtime session behind the torch call signature RealESRGANer expects
+
+    A session's intra-op thread count is fixed when it is created, so one
+    session is kept per power-of-two thread share (see thread_budget).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.resident_bytes = os.path.getsize(path)
+        self._sessions: Dict[int, Any] = {}
+        self._lock = threading.Lock()
+
+    def _session(self, threads: int) -> Any:
+        with self._lock:
+            session = self._sessions.get(threads)
+            if session is None:
+                import onnxruntime as ort
+                options = ort_session_options(threads)
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                session = self._sessions[threads] = ort.InferenceSession(
+                    self.path, options, providers=['CPUExecutionProvider']
+                )
+            return session
+
+    def __call__(self, tensor):
+        import torch
+        session = self._session(session_threads(get_thread_budget().current()))
+        output = session.run(None, {'input': tensor.float().cpu().numpy()})[0]
+        return torch.from_numpy(output).to(tensor.device)
+
+
+def _artifact_path(weights_name: str, backend: str) -> str:
+    ext = 'pt' if backend == 'torchscript' else 'onnx'
+    return os.path.join(COMPILED_DIR, f"{weights_name}.{backend}.{ext}")
+
+
+def _is_fresh(artifact: str, weights_path: Optional[str]) -> bool:
+    """An export is reused unless the weights file on disk is newer"""
+    if not os.path.exists(artifact):
+        return False
+    if weights_path and os.path.exists(weights_path):
+        return os.path.getmtime(artifact) >= os.path.getmtime(weights_path)
+    return True
+
+
+def _export_torchscript(net: Any, path: str) -> None:
+    import torch
+    example = torch.rand(1, 3, 64, 64)
+    with torch.no_grad():
+        traced = torch.jit.trace(net, example, check_trace=False)
+    frozen = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+    torch.jit.save(frozen, path)
+
+
+def _export_onnx(net: Any, path: str) -> None:
+    import torch
+    example = torch.rand(1, 3, 64, 64)
+    dynamic = {0: 'batch', 2: 'height', 3: 'width'}
+    with torch.no_grad():
+        torch.onnx.export(
+            net, example, path,
+            input_names=['input'], output_names=['output'],
+            dynamic_axes={'input': dynamic, 'output': dynamic},
+            opset_version=ONNX_OPSET,
+        )
+
+
+def _quantize_onnx(source: str, path: str) -> None:
+    """Dynamic int8: conv weights stored as int8, activations quantized per call"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(source, path, weight_type=QuantType.QInt8)
+
+
+def _compile(net: Any, backend: str, weights_name: str, weights_path: Optional[str]) -> Any:
+    """Build (or load a cached export of) the runner for `backend`"""
+    import torch
+
+    if backend == 'bf16':
+        return _AutocastModel(net)
+
+    os.makedirs(COMPILED_DIR, exist_ok=True)
+    artifact = _artifact_path(weights_name, backend)
+    if not _is_fresh(artifact, weights_path):
+        logger.info(f"🔨 Exporting {weights_name} for the {backend} backend...")
+        start = time.perf_counter()
+        # Export from a CPU copy; the eager network may still be serving requests
+        cpu_net = copy.deepcopy(net).float().cpu().eval()
+        if backend == 'torchscript':
+            _export_torchscript(cpu_net, artifact)
+        elif backend == 'onnx':
+            _export_onnx(cpu_net, artifact)
+        elif backend == 'onnx-int8':
+            fp32 = _artifact_path(weights_name, 'onnx')
+            if not _is_fresh(fp32, weights_path):
+                _export_onnx(cpu_net, fp32)
+            _quantize_onnx(fp32, artifact)
+        logger.info(f"✅ Exported {artifact} in {time.perf_counter() - start:.1f}s")
+
+    if backend == 'torchscript':
+        return _TorchScriptModel(torch.jit.load(artifact, map_location='cpu'), artifact)
+    return _OnnxModel(artifact)
+
+
+def apply_backend(upsampler: Any, backend: str, weights_name: str, weights_path: Optional[str] = None) -> Any:
+    """
+    Swap the network of a RealESRGANer for the `backend` runner, in place
+
+    Both RealESRGANer.enhance() and the tile pipeline only call
+    `upsampler.model(tensor)`, so every caller keeps working unchanged.
+    Compiled runners run on the CPU and are shared by all upsamplers built
+    from the same weights.
+    """
+    if backend == 'eager':
+        return upsampler
+
+    key = (weights_name, backend)
+    with _compiled_lock:
+        runner = _compiled.get(key)
+        if runner is None:
+            runner = _compiled[key] = _compile(upsampler.model, backend, weights_name, weights_path)
+
+    if backend != 'bf16':
+        import torch
+        upsampler.device = torch.device('cpu')
+        upsampler.half = False
+    upsampler.model = runner
+    upsampler.backend = backend
+    return upsampler
+
+
+def parity_report(upsampler: Any, weights_name: str, backends: Optional[List[str]] = None,
+                  tile: int = 128, batch_size: int = 1, runs: int = 3) -> Dict[str, Any]:
+    """
+    Compare each backend with eager fp32 on the same random tiles
+
+    Returns max/mean absolute error in 8-bit levels, PSNR and mean
+    milliseconds per forward pass, plus the speedup over eager.
+    """
+    from .tiling import infer_batch
+
+    rng = np.random.default_rng(0)
+    tiles = [rng.integers(0, 256, (tile, tile, 3), dtype=np.uint8) for _ in range(batch_size)]
+    scale = upsampler.scale
+
+    def measure(candidate):
+        infer_batch(candidate, tiles, scale)  # Warm-up (session creation, autotuning)
+        start = time.perf_counter()
+        for _ in range(runs):
+            outputs = infer_batch(candidate, tiles, scale)
+        return np.stack(outputs), (time.perf_counter() - start) / runs * 1000
+
+    reference, eager_ms = measure(upsampler)
+    report: Dict[str, Any] = {'tile': tile, 'batch_size': batch_size, 'eager_ms': round(eager_ms, 1), 'backends': {}}
+
+    for backend in backends or [b for b in available_backends() if b != 'eager']:
+        try:
+            candidate = apply_backend(copy.copy(upsampler), backend, weights_name)
+            outputs, ms = measure(candidate)
+        except Exception as e:
+            logger.warning(f"⚠️ Backend {backend} failed: {e}")
+            report['backends'][backend] = {'error': str(e)}
+            continue
+        diff = np.abs(outputs.astype(np.int16) - reference.astype(np.int16))
+        mse = float(np.mean(diff.astype(np.float32) ** 2))
+        report['backends'][backend] = {
+            'ms': round(ms, 1),
+            'speedup': round(eager_ms / ms, 2) if ms else 0.0,
+            'max_abs_error': int(diff.max()),
+            'mean_abs_error': round(float(diff.mean()), 3),
+            'psnr': round(10 * np.log10(255.0 ** 2 / mse), 2) if mse else float('inf'),
+        }
+
+    return report
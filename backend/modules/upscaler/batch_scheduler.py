@@ -0,0 +1,192 @@
+"""
+Inference Scheduler
+Batches Real-ESRGAN tiles from all in-flight jobs that share a model
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future
+from typing import Any, Dict, Hashable, List, Optional
+
+import numpy as np
+
+from ..thread_budget import ThreadBudget, get_thread_budget
+from .tiling import infer_batch
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv('UPSCALER_MAX_BATCH_SIZE', '8'))
+DEFAULT_MAX_WAIT_MS = float(os.getenv('UPSCALER_MAX_BATCH_WAIT_MS', '10'))
+WORKER_IDLE_EXIT = 30.0  # Seconds before an idle per-model worker thread exits
+
+
+class _TileRequest:
+    __slots__ = ('upsampler', 'tile', 'scale', 'future', 'enqueued_at', 'owner')
+
+    def __init__(self, upsampler: Any, tile: np.ndarray, scale: int):
+        self.upsampler = upsampler
+        self.tile = tile
+        self.scale = scale
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+        self.owner = threading.get_ident()  # One submitting thread per job
+
+
+def _fail(requests: List[_TileRequest], error: Exception) -> None:
+    """Resolve every request not yet answered with `error`"""
+    for r in requests:
+        if not r.future.done():
+            r.future.set_exception(error)
+
+
+class InferenceScheduler:
+    """
+    Dynamic batcher for tile inference
+
+    One worker thread per model key pulls queued tiles, waits at most
+    `max_wait_ms` for more to arrive, and runs up to `max_batch_size` of them
+    through the network together. Tiles of different shapes (image borders)
+    are grouped by shape within a batch. Each forward pass runs inside the
+    thread budget's torch_work() with the share of every job it carries
+    tiles for.
+    """
+
+    def __init__(self, max_batch_size: Optional[int] = None, max_wait_ms: Optional[float] = None,
+                 thread_budget: Optional[ThreadBudget] = None):
+        self.thread_budget = thread_budget or get_thread_budget()
+        self.max_batch_size = max(1, max_batch_size or DEFAULT_MAX_BATCH_SIZE)
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else DEFAULT_MAX_WAIT_MS) / 1000.0
+        self._queues: Dict[Hashable, "queue.Queue[_TileRequest]"] = {}
+        self._workers: Dict[Hashable, threading.Thread] = {}
+        self._lock = threading.Lock()
+        self._batch_sizes: Counter = Counter()
+        self._queue_waits: deque = deque(maxlen=2048)
+        self._stats = {'batches': 0, 'tiles': 0, 'forward_time': 0.0}
+
+    def submit(self, key: Hashable, upsampler: Any, tile: np.ndarray, scale: int) -> Future:
+        """Queue one RGB uint8 tile for the model identified by `key`"""
+        request = _TileRequest(upsampler, tile, scale)
+        with self._lock:
+            q = self._queues.get(key)
+            if q is None:
+                q = self._queues[key] = queue.Queue()
+            q.put(request)
+            worker = self._workers.get(key)
+            if worker is None or not worker.is_alive():
+                worker = threading.Thread(target=self._run, args=(key, q), name=f"tile-batcher-{key}", daemon=True)
+                self._workers[key] = worker
+                worker.start()
+        return request.future
+
+    def infer_many(self, key: Hashable, upsampler: Any, tiles: List[np.ndarray], scale: int) -> List[np.ndarray]:
+        """Submit several tiles and block until all of their outputs are back"""
+        futures = [self.submit(key, upsampler, tile, scale) for tile in tiles]
+        return [f.result() for f in futures]
+
+    def _run(self, key: Hashable, q: "queue.Queue[_TileRequest]") -> None:
+        while True:
+            try:
+                first = q.get(timeout=WORKER_IDLE_EXIT)
+            except queue.Empty:
+                with self._lock:
+                    if q.empty():
+                        self._workers.pop(key, None)
+                        self._queues.pop(key, None)
+                        return
+                continue
+
+            batch = [first]
+            deadline = first.enqueued_at + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    remaining = deadline - time.perf_counter()
+                    batch.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List[_TileRequest]) -> None:
+        started = time.perf_counter()
+        try:
+            groups: Dict[tuple, List[_TileRequest]] = {}
+            for request in batch:
+                groups.setdefault((id(request.upsampler), request.tile.shape, request.scale), []).append(request)
+
+            with self.thread_budget.torch_work(lanes=len({r.owner for r in batch})):
+                for requests in groups.values():
+                    try:
+                        outputs = infer_batch(requests[0].upsampler, [r.tile for r in requests], requests[0].scale)
+                    except Exception as e:
+                        logger.error(f"❌ Batched tile inference failed: {e}")
+                        _fail(requests, e)
+                        continue
+                    for r, output in zip(requests, outputs):
+                        r.future.set_result(output)
+        except Exception as e:
+            # Callers block on these futures; an error must not leave any unresolved
+            logger.error(f"❌ Tile batch failed: {e}")
+            _fail(batch, e)
+        _fail(batch, RuntimeError("Batched tile inference returned no output for this tile"))
+
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['tiles'] += len(batch)
+            self._stats['forward_time'] += time.perf_counter() - started
+            self._batch_sizes[len(batch)] += 1
+            self._queue_waits.extend(started - r.enqueued_at for r in batch)
+
+    def _after_fork(self) -> None:
+        """Worker threads do not survive fork; the child starts its own on demand"""
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._workers = {}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Batch size distribution and queue-wait latency, for tuning batch size vs. wait time"""
+        with self._lock:
+            waits = sorted(self._queue_waits)
+            batches = self._stats['batches']
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'batches': batches,
+                'tiles': self._stats['tiles'],
+                'mean_batch_size': round(self._stats['tiles'] / batches, 2) if batches else 0.0,
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+                'mean_forward_ms': round(self._stats['forward_time'] / batches * 1000, 2) if batches else 0.0,
+                'queue_wait_ms': {
+                    'mean': round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+                    'p95': round(waits[int(len(waits) * 0.95) - 1] * 1000, 2) if waits else 0.0,
+                    'max': round(waits[-1] * 1000, 2) if waits else 0.0,
+                },
+                'active_models': len(self._workers),
+            }
+
+
+_scheduler: Optional[InferenceScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_inference_scheduler() -> InferenceScheduler:
+    """Return the process-wide inference scheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = InferenceScheduler()
+        return _scheduler
+
+
+def _reset_after_fork() -> None:
+    global _scheduler_lock
+    _scheduler_lock = threading.Lock()
+    if _scheduler is not None:
+        _scheduler._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
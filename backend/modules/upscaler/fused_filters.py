@@ -0,0 +1,230 @@
+"""
+Fused post-processing for the PIL-style upscalers
+Applies unsharp/sharpness/contrast chains in one float32 strip buffer instead of full-size passes
+"""
+
+import math
+import logging
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import cv2
+
+logger = logging.getLogger(__name__)
+
+STRIP_ROWS = 256
+
+# ImageFilter.SMOOTH, the degenerate image ImageEnhance.Sharpness blends against
+SMOOTH_KERNEL = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype=np.float32) / 13.0
+
+# Operations: ('unsharp', radius, percent, threshold, pil_blur), ('sharpness', factor), ('contrast', factor)
+Op = Tuple
+
+
+def unsharp(radius: float, percent: int, threshold: int, pil_blur: bool = True) -> Op:
+    """
+    Equivalent of ImageFilter.UnsharpMask(radius, percent, threshold)
+
+    With `pil_blur=False` the mask comes from a true Gaussian, which is
+    cheaper than PIL's rounded box passes but drifts further from PIL.
+    """
+    return ('unsharp', radius, percent, threshold, pil_blur)
+
+
+def sharpness(factor: float) -> Op:
+    """Equivalent of ImageEnhance.Sharpness(...).enhance(factor)"""
+    return ('sharpness', factor)
+
+
+def contrast(factor: float) -> Op:
+    """Equivalent of ImageEnhance.Contrast(...).enhance(factor)"""
+    return ('contrast', factor)
+
+
+def luminance_mean(bgr: np.ndarray, strip_rows: int = STRIP_ROWS) -> float:
+    """Mean of PIL's 8-bit 'L' conversion, rounded like ImageEnhance.Contrast does"""
+    total = 0
+    for y0 in range(0, bgr.shape[0], strip_rows):
+        strip = bgr[y0:y0 + strip_rows].astype(np.uint32)
+        luma = strip[..., 2] * 19595 + strip[..., 1] * 38470 + strip[..., 0] * 7471 + 0x8000
+        luma >>= 16
+        total += int(luma.sum(dtype=np.uint64))
+    return float(int(total / (bgr.shape[0] * bgr.shape[1]) + 0.5))
+
+
+def resize_lanczos(bgr: np.ndarray, scale: int) -> np.ndarray:
+    """Single Lanczos resize straight to the target size (no intermediate 2x image)"""
+    height, width = bgr.shape[:2]
+    return cv2.resize(bgr, (width * scale, height * scale), interpolation=cv2.INTER_LANCZOS4)
+
+
+def resize_pil_lanczos(bgr: np.ndarray, scale: int) -> np.ndarray:
+    """
+    PIL's Lanczos resize, through a 2x intermediate above 2x like the legacy chain
+
+    Resampling is per channel, so the BGR buffer goes through PIL as-is.
+    """
+    from PIL import Image
+    height, width = bgr.shape[:2]
+    image = Image.fromarray(bgr)
+    if scale > 2:
+        image = image.resize((width * 2, height * 2), Image.Resampling.LANCZOS)
+    image = image.resize((width * scale, height * scale), Image.Resampling.LANCZOS)
+    return np.array(image)
+
+
+def _box_radius(radius: float, passes: int = 3) -> float:
+    """Box radius whose `passes`-fold repetition approximates a Gaussian (PIL's ImagingGaussianBlur)"""
+    sigma2 = radius * radius / passes
+    length = math.sqrt(12.0 * sigma2 + 1.0)
+    whole = math.floor((length - 1.0) / 2.0)
+    fraction = (2 * whole + 1) * (whole * (whole + 1) - 3 * sigma2) / (6 * (sigma2 - (whole + 1) ** 2))
+    return whole + fraction
+
+
+def _box_kernel(radius: float) -> np.ndarray:
+    """One box pass with PIL's 24-bit fixed-point weights (the fractional part weights the two far taps)"""
+    box_radius = float(np.float32(_box_radius(radius)))
+    whole = int(box_radius)
+    inner = int(np.float32(1 << 24) / np.float32(box_radius * 2 + 1))
+    outer = ((1 << 24) - (whole * 2 + 1) * inner) // 2
+    return np.array([outer] + [inner] * (whole * 2 + 1) + [outer], np.float32) / (1 << 24)
+
+
+def _pil_gaussian_blur(block: np.ndarray, radius: float) -> np.ndarray:
+    """
+    PIL's GaussianBlur: three box passes per axis, each rounded to 8 bits
+
+    The rounding matters: UnsharpMask amplifies the blur's error, and the
+    lanczos chain amplifies it again through three more sharpening stages.
+    OpenCV's uint8 filter rounds each pass too; PIL's fixed-point weights
+    fall just short of the exact fractions, so results that land on .5
+    round down in PIL and are nudged down here to match (exactly at radius
+    1, to within one level on a few percent of pixels at radius 2).
+    """
+    kernel = _box_kernel(radius)
+    one = np.ones(1, np.float32)
+    blurred = block.astype(np.uint8)
+    for kernel_x, kernel_y in [(kernel, one)] * 3 + [(one, kernel)] * 3:
+        blurred = cv2.sepFilter2D(blurred, -1, kernel_x, kernel_y, delta=-1e-3, borderType=cv2.BORDER_REPLICATE)
+    return blurred.astype(np.float32)
+
+
+def _halo(ops: Sequence[Op]) -> int:
+    """Rows of context a strip needs so chained filters match a full-image pass"""
+    halo = 0
+    for op in ops:
+        if op[0] == 'unsharp' and op[4]:
+            halo += 3 * (int(_box_radius(op[1])) + 1)
+        elif op[0] == 'unsharp':
+            halo += int(math.ceil(3 * op[1])) + 1
+        elif op[0] == 'sharpness':
+            halo += 1
+    return halo
+
+
+def _apply(block: np.ndarray, ops: Sequence[Op], mean: float, first_row: bool, last_row: bool) -> None:
+    """
+    Run `ops` in place on a float32 block, rounding after each like PIL's 8-bit stages
+
+    `first_row`/`last_row` say whether the block's edge rows are the image's,
+    which ImageFilter.SMOOTH leaves unfiltered.
+    """
+    for op in ops:
+        kind = op[0]
+        if kind == 'unsharp':
+            # out = in + diff * percent / 100 in C integer arithmetic where |diff| > threshold
+            _, radius, percent, threshold, pil_blur = op
+            if pil_blur:
+                diff = block - _pil_gaussian_blur(block, radius)
+            else:
+                diff = block - np.rint(cv2.GaussianBlur(block, (0, 0), radius))
+            if threshold > 0:
+                diff[np.abs(diff) <= threshold] = 0
+            diff *= percent
+            diff /= 100
+            np.trunc(diff, out=diff)
+            block += diff
+        elif kind == 'sharpness':
+            smooth = np.rint(cv2.filter2D(block, -1, SMOOTH_KERNEL, borderType=cv2.BORDER_REPLICATE))
+            smooth[:, [0, -1]] = block[:, [0, -1]]
+            if first_row:
+                smooth[0] = block[0]
+            if last_row:
+                smooth[-1] = block[-1]
+            block -= smooth
+            block *= op[1]
+            block += smooth
+        elif kind == 'contrast':
+            # mean + factor * (x - mean), in the same float32 order as Image.blend
+            block -= mean
+            block *= op[1]
+            block += mean
+        np.clip(block, 0, 255, out=block)
+        if kind != 'unsharp':
+            # Image.blend truncates
+            np.floor(block, out=block)
+
+
+def apply_in_place(image: np.ndarray, ops: List[Op], mean: float, strip_rows: int = STRIP_ROWS) -> np.ndarray:
+    """
+    Apply a filter chain to a uint8 image in place, one horizontal strip at a time
+
+    Each strip is lifted to float32 with enough halo rows for the chained
+    blurs, processed, and written back. Original rows still needed as the
+    next strip's upper halo are saved before they are overwritten, so no
+    second full-size image is ever allocated.
+    """
+    height = image.shape[0]
+    halo = _halo(ops)
+    strip_rows = max(strip_rows, halo)
+    previous_tail = image[0:0].copy()
+
+    for y0 in range(0, height, strip_rows):
+        y1 = min(y0 + strip_rows, height)
+        below = image[y1:min(y1 + halo, height)]
+        block = np.concatenate([previous_tail, image[y0:y1], below]).astype(np.float32)
+        top = len(previous_tail)
+        previous_tail = image[max(y1 - halo, y0):y1].copy()
+
+        _apply(block, ops, mean, first_row=y0 == 0, last_row=y1 + halo >= height)
+        image[y0:y1] = block[top:top + (y1 - y0)].astype(np.uint8)
+
+    return image
+
+
+def lanczos_pipeline(bgr: np.ndarray, scale: int) -> np.ndarray:
+    """Fused 'lanczos_Nx': resize, unsharp, sharpness, contrast, unsharp"""
+    # The chain sharpens fine detail more than tenfold, which would magnify even
+    # the small difference between OpenCV's and PIL's Lanczos, so PIL resamples here
+    upscaled = resize_pil_lanczos(bgr, scale)
+    apply_in_place(upscaled, [unsharp(radius=1, percent=200, threshold=0), sharpness(2.0)], mean=0.0)
+    # Every stage is rounded to 8 bits, so splitting the chain here is exact and
+    # ImageEnhance.Contrast gets the luma mean of the image it actually sees
+    return apply_in_place(upscaled, [
+        contrast(1.3),
+        unsharp(radius=2, percent=250, threshold=0),
+    ], mean=luminance_mean(upscaled))
+
+
+def super_enhanced_pipeline(bgr: np.ndarray, scale: int) -> np.ndarray:
+    """Fused 'super_enhanced_Nx': bilateral denoise, resize, two unsharps and contrast"""
+    # Quick bilateral filter for noise reduction (reduced parameters for speed)
+    denoised = cv2.bilateralFilter(bgr, 5, 50, 50)
+    # The unsharp formerly run on the 2x intermediate is applied at full size
+    # with its radius doubled so it covers the same image detail. That replay
+    # dominates the drift from PIL, so the cheaper true Gaussian masks suffice
+    ops = [unsharp(radius=2, percent=120, threshold=2, pil_blur=False)] if scale > 2 else []
+    ops += [unsharp(radius=2, percent=130, threshold=2, pil_blur=False), contrast(1.15)]
+    return apply_in_place(resize_lanczos(denoised, scale), ops, mean=luminance_mean(denoised))
+
+
+def enhanced_pipeline(bgr: np.ndarray, scale: int) -> np.ndarray:
+    """Fused 'enhanced_Nx': one resize, then the per-2x-step unsharps replayed at full size"""
+    ops = []
+    current_scale = 1
+    while current_scale < scale:
+        current_scale *= min(2, scale // current_scale)
+        # Replayed at full size, so like super_enhanced it uses Gaussian masks
+        ops.append(unsharp(radius=scale // current_scale, percent=150, threshold=3, pil_blur=False))
+    return apply_in_place(resize_lanczos(bgr, scale), ops, mean=0.0)
@@ -0,0 +1,258 @@
+"""
+Upscaler image I/O
+Disk-backed output buffers, incremental encoders and encoder profiles
+"""
+
+import os
+import zlib
+import time
+import struct
+import logging
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Outputs larger than this are kept in a disk-backed np.memmap instead of RAM
+OUT_OF_CORE_THRESHOLD_MB = int(os.getenv('UPSCALER_OUT_OF_CORE_MB', '256'))
+PNG_ROWS_PER_BAND = 64
+# Progressive previews are capped so they come back in milliseconds
+PREVIEW_MAX_SIDE = int(os.getenv('PREVIEW_MAX_SIDE', '1600'))
+
+
+class EncoderProfile(NamedTuple):
+    """How final outputs are encoded; PNG always goes through the streamed writer"""
+    backend: str  # JPEG/WebP encoder: 'cv2' (cv2.imwrite from the buffer) or 'pil' (one RGB copy)
+    png_compress_level: int
+    png_adaptive_filter: bool  # Pick the smallest PNG filter per row instead of always "Up"
+    jpeg_optimize: bool
+    jpeg_progressive: bool
+    webp_quality: int
+    webp_method: int  # libwebp effort, 0 (fastest) to 6 (smallest)
+
+
+# OpenCV cannot set the libwebp method and always encodes with the library default
+CV2_WEBP_METHOD = 4
+
+# For 4x outputs the encode can rival inference; 'fast' trades file size for latency
+ENCODER_PROFILES = {
+    'fast': EncoderProfile('cv2', png_compress_level=1, png_adaptive_filter=False, jpeg_optimize=False,
+                           jpeg_progressive=False, webp_quality=90, webp_method=CV2_WEBP_METHOD),
+    'balanced': EncoderProfile('cv2', png_compress_level=4, png_adaptive_filter=False, jpeg_optimize=True,
+                               jpeg_progressive=False, webp_quality=95, webp_method=CV2_WEBP_METHOD),
+    'smallest': EncoderProfile('cv2', png_compress_level=9, png_adaptive_filter=True, jpeg_optimize=True,
+                               jpeg_progressive=True, webp_quality=95, webp_method=6),
+}
+DEFAULT_ENCODER_PROFILE = os.getenv('UPSCALER_ENCODER_PROFILE', 'balanced')
+
+
+def get_encoder_profile(name: Optional[str] = None) -> EncoderProfile:
+    """Look up a profile by name; None means the configured default"""
+    name = name or DEFAULT_ENCODER_PROFILE
+    if name not in ENCODER_PROFILES:
+        raise ValueError(f"Unknown encoder profile '{name}', expected one of {', '.join(ENCODER_PROFILES)}")
+    return ENCODER_PROFILES[name]
+
+
+@contextmanager
+def output_buffer(shape: Tuple[int, int, int], output_path: str) -> Iterator[np.ndarray]:
+    """
+    Allocate a uint8 output buffer, memory-mapped to a temp file when large
+
+    The temp file lives next to `output_path` so the final encode reads from
+    the same disk, and is removed when the context exits.
+    """
+    nbytes = int(np.prod(shape))
+    if nbytes <= OUT_OF_CORE_THRESHOLD_MB * 1024 * 1024:
+        yield np.empty(shape, dtype=np.uint8)
+        return
+
+    directory = os.path.dirname(os.path.abspath(output_path))
+    fd, buffer_path = tempfile.mkstemp(prefix='upscale_', suffix='.raw', dir=directory)
+    os.close(fd)
+    logger.info(f"💽 Using out-of-core output buffer ({nbytes / 1024 / 1024:.0f} MB): {buffer_path}")
+    try:
+        buffer = np.memmap(buffer_path, dtype=np.uint8, mode='w+', shape=shape)
+        yield buffer
+        buffer.flush()
+    finally:
+        try:
+            os.remove(buffer_path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not remove output buffer {buffer_path}: {e}")
+
+
+def resize_banded(src: np.ndarray, dst: np.ndarray, factor: int, rows: int = 256) -> None:
+    """
+    Lanczos-resize `src` by an integer factor into `dst` a band of output rows at a time
+
+    Each band is resized from its source rows plus enough context for the
+    8-tap kernel, so the result matches a whole-image cv2.resize while only
+    one band is ever held in memory (both buffers may be memory-mapped).
+    """
+    import cv2
+
+    height, width = src.shape[:2]
+    context = 4  # Lanczos4 reads 4 source rows on either side
+    for y0 in range(0, height * factor, rows):
+        y1 = min(y0 + rows, height * factor)
+        s0, s1 = max(0, y0 // factor - context), min(height, -(-y1 // factor) + context)
+        band = cv2.resize(np.ascontiguousarray(src[s0:s1]), (width * factor, (s1 - s0) * factor),
+                          interpolation=cv2.INTER_LANCZOS4)
+        dst[y0:y1] = band[y0 - s0 * factor:y1 - s0 * factor]
+
+
+def _write_chunk(f, tag: bytes, data: bytes) -> None:
+    f.write(struct.pack('>I', len(data)))
+    f.write(tag)
+    f.write(data)
+    f.write(struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+
+def _adaptive_filter(rows: np.ndarray, above: np.ndarray, bpp: int = 3) -> np.ndarray:
+    """
+    Filter each row with whichever PNG filter gives the smallest sum of absolute values
+
+    This is libpng's own heuristic. Filters only read unfiltered bytes, so all
+    five are computed for the whole band at once. Returns the filtered rows
+    with their filter-type byte prepended.
+    """
+    left = np.zeros_like(rows)
+    left[:, bpp:] = rows[:, :-bpp]
+    upper_left = np.zeros_like(above)
+    upper_left[:, bpp:] = above[:, :-bpp]
+
+    a, b, c = left.astype(np.int16), above.astype(np.int16), upper_left.astype(np.int16)
+    p = a + b - c
+    pa, pb, pc = np.abs(p - a), np.abs(p - b), np.abs(p - c)
+    paeth = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c)).astype(np.uint8)
+    average = ((a + b) >> 1).astype(np.uint8)
+
+    # uint8 arithmetic wraps modulo 256 as PNG requires
+    candidates = np.stack([rows, rows - left, rows - above, rows - average, rows - paeth])
+    cost = np.abs(candidates.view(np.int8).astype(np.int16)).sum(axis=2)
+    choice = np.argmin(cost, axis=0)
+    chosen = candidates[choice, np.arange(len(rows))]
+    return np.hstack([choice.astype(np.uint8)[:, None], chosen])
+
+
+def write_png_streamed(path: str, bgr: np.ndarray, compress_level: int = 6, adaptive_filter: bool = False,
+                       rows_per_band: int = PNG_ROWS_PER_BAND) -> None:
+    """
+    Encode a BGR uint8 array as an RGB PNG a band of rows at a time
+
+    Rows use the PNG "Up" filter, or the per-row best of the five filters
+    with `adaptive_filter`, and are deflated incrementally, so only one band
+    is ever converted and held in memory.
+    """
+    height, width = bgr.shape[:2]
+    compressor = zlib.compressobj(compress_level)
+    previous = np.zeros((1, width * 3), dtype=np.uint8)
+    filter_type = np.full((rows_per_band, 1), 2, dtype=np.uint8)  # 2 = Up
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        _write_chunk(f, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+        for y in range(0, height, rows_per_band):
+            rows = np.ascontiguousarray(bgr[y:y + rows_per_band, :, ::-1]).reshape(-1, width * 3)
+            above = np.vstack([previous, rows[:-1]])
+            if adaptive_filter:
+                filtered = _adaptive_filter(rows, above)
+            else:
+                filtered = np.hstack([filter_type[:len(rows)], rows - above])
+            previous = rows[-1:].copy()
+            data = compressor.compress(filtered.tobytes())
+            if data:
+                _write_chunk(f, b'IDAT', data)
+
+        _write_chunk(f, b'IDAT', compressor.flush())
+        _write_chunk(f, b'IEND', b'')
+
+
+def save_bgr(path: str, bgr: np.ndarray, jpeg_quality: int = 95, profile: Optional[str] = None) -> float:
+    """
+    Save a BGR uint8 array (possibly memory-mapped) with an encoder profile
+
+    Returns the seconds spent encoding and writing, reported as its own
+    stage. PNG is streamed in bands. With the cv2 backend other formats go
+    through cv2.imwrite, reading straight from the (mapped) buffer. PIL
+    needs an RGB copy of the whole image, so it is used by the 'pil'
+    backend and for WebP at a method OpenCV cannot set only while that copy
+    stays under OUT_OF_CORE_THRESHOLD_MB; larger outputs fall back to cv2.
+    Formats the OpenCV build cannot write always go through PIL.
+    """
+    import cv2
+
+    settings = get_encoder_profile(profile)
+    start = time.perf_counter()
+    ext = os.path.splitext(path)[1].lower()
+    wants_pil = settings.backend == 'pil' or (ext == '.webp' and settings.webp_method != CV2_WEBP_METHOD)
+    if ext == '.png':
+        write_png_streamed(path, bgr, compress_level=settings.png_compress_level,
+                           adaptive_filter=settings.png_adaptive_filter)
+    elif cv2.haveImageWriter(path) and (not wants_pil or bgr.nbytes > OUT_OF_CORE_THRESHOLD_MB * 1024 * 1024):
+        if wants_pil:
+            logger.info(f"💽 {os.path.basename(path)} is too large to copy for PIL, encoding with cv2")
+        _save_cv2(path, bgr, ext, jpeg_quality, settings)
+    else:
+        _save_pil(path, bgr, ext, jpeg_quality, settings)
+    elapsed = time.perf_counter() - start
+    logger.info(f"💾 Encoded {os.path.basename(path)} ({bgr.shape[1]}x{bgr.shape[0]}) in {elapsed:.2f}s")
+    return elapsed
+
+
+def _save_cv2(path: str, bgr: np.ndarray, ext: str, jpeg_quality: int, settings: EncoderProfile) -> None:
+    import cv2
+    if ext == '.webp':
+        params = [cv2.IMWRITE_WEBP_QUALITY, settings.webp_quality]
+    elif ext in ('.jpg', '.jpeg'):
+        params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality,
+                  cv2.IMWRITE_JPEG_OPTIMIZE, int(settings.jpeg_optimize),
+                  cv2.IMWRITE_JPEG_PROGRESSIVE, int(settings.jpeg_progressive)]
+    else:
+        params = []
+    # A C-contiguous memmap is wrapped, not copied
+    if not cv2.imwrite(path, np.ascontiguousarray(bgr), params):
+        raise IOError(f"Could not encode {path}")
+
+
+def _save_pil(path: str, bgr: np.ndarray, ext: str, jpeg_quality: int, settings: EncoderProfile) -> None:
+    """Encode with PIL in the format of `ext`; holds one RGB copy of the image"""
+    from PIL import Image
+    image_format = Image.registered_extensions().get(ext)
+    if image_format is None:
+        raise ValueError(f"Cannot write {ext or 'files without an extension'}")
+    options: Dict[str, Any] = {}
+    if image_format == 'WEBP':
+        options = {'quality': settings.webp_quality, 'method': settings.webp_method}
+    elif image_format == 'JPEG':
+        options = {'quality': jpeg_quality, 'optimize': settings.jpeg_optimize,
+                   'progressive': settings.jpeg_progressive}
+    img = Image.fromarray(np.ascontiguousarray(bgr[..., ::-1]))
+    img.save(path, image_format, **options)
+
+
+def write_preview(input_path: str, output_path: str, scale: int = 4,
+                  max_side: int = PREVIEW_MAX_SIDE) -> Dict[str, Any]:
+    """
+    Fast Lanczos stand-in for an upscale, shown while the real one runs
+
+    The preview is capped at `max_side` pixels on its long edge; clients
+    display it stretched to the final size until it is replaced.
+    """
+    import cv2
+    from PIL import Image
+
+    with Image.open(input_path) as img:
+        bgr = cv2.cvtColor(np.asarray(img.convert('RGB')), cv2.COLOR_RGB2BGR)
+    height, width = bgr.shape[:2]
+    factor = min(float(scale), max_side / max(width, height))
+    size = (max(1, round(width * factor)), max(1, round(height * factor)))
+    interpolation = cv2.INTER_LANCZOS4 if factor >= 1 else cv2.INTER_AREA
+    if not cv2.imwrite(output_path, cv2.resize(bgr, size, interpolation=interpolation), [cv2.IMWRITE_JPEG_QUALITY, 85]):
+        raise IOError(f"Could not encode {output_path}")
+    return {"width": size[0], "height": size[1], "final_scale": scale}
@@ -0,0 +1,220 @@
+"""
+Tile Autotuner
+Benchmarks tile/tile_pad combinations per network on this host and persists the winner
+"""
+
+import os
+import json
+import time
+import logging
+import platform
+import threading
+from functools import lru_cache, partial
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PATH = os.getenv('UPSCALER_TILE_PROFILE', os.path.join('models', 'tile_profile.json'))
+MEMORY_LIMIT_MB = int(os.getenv('UPSCALER_TILE_MEMORY_MB', '1024'))
+CANDIDATE_TILES = (128, 192, 256, 384, 512)
+CANDIDATE_PADS = (8, 10, 16)
+BENCHMARK_SIZE = 512  # Side of the synthetic benchmark image
+# Benchmarking takes minutes on CPU and competes with live traffic, so startup tuning is opt-in
+AUTOTUNE_ON_STARTUP = os.getenv('UPSCALER_AUTOTUNE', '0') == '1'
+
+# Used until a profile exists for the network on this host
+DEFAULT_TILE = 256
+DEFAULT_TILE_PAD = 10
+
+# Networks in use, described by what drives their cost: architecture, depth, scale
+NETWORKS = {
+    'RRDBNet-b23-x2': {'arch': 'RRDBNet', 'num_block': 23, 'scale': 2},
+    'RRDBNet-b23-x4': {'arch': 'RRDBNet', 'num_block': 23, 'scale': 4},
+    'RRDBNet-b6-x4': {'arch': 'RRDBNet', 'num_block': 6, 'scale': 4},
+    'SRVGGNetCompact-c32-x4': {'arch': 'SRVGGNetCompact', 'num_conv': 32, 'scale': 4},
+}
+
+_profile_lock = threading.Lock()  # Serialises autotune runs
+_cache_lock = threading.Lock()
+_cached_profile: Optional[Dict[str, Any]] = None
+
+
+def network_id(arch: str, scale: int, depth: int) -> str:
+    """Profile key for a network; depth is num_block for RRDBNet and num_conv for SRVGGNetCompact"""
+    prefix = 'b' if arch == 'RRDBNet' else 'c'
+    return f"{arch}-{prefix}{depth}-x{scale}"
+
+
+def estimate_tile_memory(network: str, tile: int, tile_pad: int, batch_size: int = 1) -> int:
+    """Rough peak activation bytes (fp32) for a batch of padded tiles"""
+    spec = NETWORKS[network]
+    pixels = (tile + 2 * tile_pad) ** 2
+    scale = spec['scale']
+    if spec['arch'] == 'RRDBNet':
+        # Dense blocks keep ~384 channels live; the upsampler runs 64 channels at full output size
+        per_pixel = 384 * 4 + 64 * 4 * 2 * scale * scale
+    else:
+        per_pixel = 64 * 4 * 2 + 3 * scale * scale * 4
+    return pixels * per_pixel * batch_size
+
+
+@lru_cache(maxsize=None)
+def host_fingerprint() -> str:
+    """Identify the hardware/software combination a profile was measured on (computed once)"""
+    try:
+        import torch
+        device = torch.cuda.get_device_name(0) if torch.cuda.is_available() else 'cpu'
+        torch_version = torch.__version__
+    except Exception:
+        device, torch_version = 'cpu', 'none'
+    return f"{platform.machine()}|{platform.processor() or 'unknown'}|{os.cpu_count()}cpu|{device}|torch-{torch_version}"
+
+
+def _read_profile() -> Dict[str, Any]:
+    """Read the tile profile for this host from disk; empty if missing or measured elsewhere"""
+    try:
+        with open(PROFILE_PATH) as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if profile.get('host') != host_fingerprint():
+        return {}
+    return profile.get('networks', {})
+
+
+def load_profile() -> Dict[str, Any]:
+    """The tile profile for this host, read from disk on first use and kept in memory"""
+    global _cached_profile
+    with _cache_lock:
+        if _cached_profile is None:
+            _cached_profile = _read_profile()
+        return _cached_profile
+
+
+def reload_profile() -> Dict[str, Any]:
+    """Re-read the tile profile, e.g. after autotune() has written it"""
+    global _cached_profile
+    profile = _read_profile()
+    with _cache_lock:
+        _cached_profile = profile
+    return profile
+
+
+def _save_profile(networks: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(PROFILE_PATH) or '.', exist_ok=True)
+    tmp_path = f"{PROFILE_PATH}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'host': host_fingerprint(), 'networks': networks}, f, indent=2)
+    os.replace(tmp_path, PROFILE_PATH)
+
+
+def get_tile_config(network: str) -> Tuple[int, int]:
+    """Tuned (tile, tile_pad) for a network, or the shared defaults"""
+    entry = load_profile().get(network)
+    if entry:
+        return entry['tile'], entry['tile_pad']
+    return DEFAULT_TILE, DEFAULT_TILE_PAD
+
+
+def max_tile_size(network: str, batch_size: int = 1) -> int:
+    """Largest tile that fits the memory limit for a network"""
+    entry = load_profile().get(network)
+    if entry:
+        return entry['max_tile']
+    limit = MEMORY_LIMIT_MB * 1024 * 1024
+    fitting = [t for t in CANDIDATE_TILES if estimate_tile_memory(network, t, DEFAULT_TILE_PAD, batch_size) <= limit]
+    return max(fitting) if fitting else min(CANDIDATE_TILES)
+
+
+class _BenchmarkUpsampler:
+    """Randomly initialised network in the shape tiling.infer_batch expects"""
+
+    def __init__(self, network: str):
+        import torch
+
+        spec = NETWORKS[network]
+        if spec['arch'] == 'RRDBNet':
+            from basicsr.archs.rrdbnet_arch import RRDBNet
+            net = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=spec['num_block'],
+                          num_grow_ch=32, scale=spec['scale'])
+        else:
+            from basicsr.archs.srvgg_arch import SRVGGNetCompact
+            net = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=spec['num_conv'],
+                                  upscale=spec['scale'], act_type='prelu')
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.half = False
+        self.model = net.eval().to(self.device)
+
+
+def _infer_grouped(upsampler: Any, tiles: List[np.ndarray], scale: int) -> List[np.ndarray]:
+    """Run tiles as batches of equal shape, the way the inference scheduler groups them"""
+    from .tiling import infer_batch
+
+    groups: Dict[tuple, List[int]] = {}
+    for i, tile in enumerate(tiles):
+        groups.setdefault(tile.shape, []).append(i)
+    outputs: List[Optional[np.ndarray]] = [None] * len(tiles)
+    for indices in groups.values():
+        for i, output in zip(indices, infer_batch(upsampler, [tiles[i] for i in indices], scale)):
+            outputs[i] = output
+    return outputs
+
+
+def autotune(networks: Iterable[str], batch_size: int = 1, force: bool = False) -> Dict[str, Any]:
+    """
+    Benchmark candidate tiles for each network and persist the fastest that fits memory
+
+    Tiles are run `batch_size` at a time, as the inference scheduler serves
+    them. Networks already profiled on this host are skipped unless `force`
+    is set.
+    """
+    from .tiling import upscale_tiled
+
+    with _profile_lock:
+        profile = dict(_read_profile())
+        limit = MEMORY_LIMIT_MB * 1024 * 1024
+        rng = np.random.default_rng(0)
+        # Smooth gradients plus noise, closer to photos than pure noise
+        ramp = np.linspace(0, 255, BENCHMARK_SIZE, dtype=np.float32)
+        image = np.clip(ramp[None, :, None] * 0.5 + ramp[:, None, None] * 0.3
+                        + rng.normal(0, 12, (BENCHMARK_SIZE, BENCHMARK_SIZE, 3)), 0, 255).astype(np.uint8)
+
+        for network in networks:
+            if network in profile and not force:
+                continue
+            scale = NETWORKS[network]['scale']
+            fitting = [(t, p) for t in CANDIDATE_TILES for p in CANDIDATE_PADS
+                       if estimate_tile_memory(network, t, p, batch_size) <= limit]
+            if not fitting:
+                fitting = [(min(CANDIDATE_TILES), min(CANDIDATE_PADS))]
+
+            logger.info(f"⏱️ Autotuning tiles for {network}: {len(fitting)} candidates")
+            upsampler = _BenchmarkUpsampler(network)
+            out = np.empty((BENCHMARK_SIZE * scale, BENCHMARK_SIZE * scale, 3), dtype=np.uint8)
+            # Bound now, so each candidate runs this network's upsampler
+            infer = partial(_infer_grouped, upsampler, scale=scale)
+            results = []
+            for tile, tile_pad in fitting:
+                start = time.perf_counter()
+                upscale_tiled(upsampler, image, out, scale, tile, tile_pad, infer=infer, window=batch_size)
+                elapsed = time.perf_counter() - start
+                results.append({'tile': tile, 'tile_pad': tile_pad, 'seconds': round(elapsed, 3)})
+
+            best = min(results, key=lambda r: r['seconds'])
+            profile[network] = {
+                'tile': best['tile'],
+                'tile_pad': best['tile_pad'],
+                'max_tile': max(t for t, _ in fitting),
+                'seconds_per_megapixel': round(best['seconds'] / (BENCHMARK_SIZE ** 2 / 1_000_000), 2),
+                'memory_limit_mb': MEMORY_LIMIT_MB,
+                'batch_size': batch_size,
+                'candidates': results,
+                'tuned_at': time.time(),
+            }
+            logger.info(f"✅ {network}: tile={best['tile']} pad={best['tile_pad']} ({best['seconds']:.2f}s)")
+            _save_profile(profile)
+            reload_profile()
+
+        return profile
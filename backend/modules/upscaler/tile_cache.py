@@ -0,0 +1,329 @@
+"""
+Tile Cache
+Keeps upscaled tile outputs so overlapping requests (pan/zoom) and repeated
+content (re-uploads, templated product shots) skip the network
+"""
+
+import os
+import logging
+import hashlib
+import threading
+import concurrent.futures
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_MB = int(os.getenv('UPSCALER_TILE_CACHE_MB', '512'))
+# Only cache a tile's output once its content comes back, so one-off uploads skip the copy
+REQUIRE_REPEAT = os.getenv('UPSCALER_TILE_CACHE_REQUIRE_REPEAT', '0') == '1'
+# Content keys remembered from first sightings (used with REQUIRE_REPEAT)
+SEEN_KEYS = int(os.getenv('UPSCALER_TILE_CACHE_SEEN_KEYS', '65536'))
+# On-disk tier for content-keyed tiles; empty (the default) leaves it to the server (main_advanced uses cache/tiles)
+DISK_CACHE_DIR = os.getenv('UPSCALER_TILE_CACHE_DIR', '')
+DISK_CACHE_MB = int(os.getenv('UPSCALER_TILE_CACHE_DISK_MB', '2048'))
+# Disk writes queued behind the background writer; more are dropped (and retried on a later hit)
+DISK_MAX_PENDING = int(os.getenv('UPSCALER_TILE_CACHE_DISK_PENDING', '64'))
+
+
+def content_key(tile: np.ndarray, model_id: str, core: Tuple[int, ...] = ()) -> str:
+    """
+    Hash of a padded input tile's pixels and shape, plus the model (architecture, precision, backend)
+
+    `core` is the box (x, y, w, h) of the tile's own pixels within the padding;
+    tiles at the image edge have the same shape but a differently placed core.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(model_id.encode())
+    digest.update(repr((tile.shape, tuple(core))).encode())
+    digest.update(np.ascontiguousarray(tile).data)
+    return digest.hexdigest()
+
+
+class TileCache:
+    """
+    In-memory LRU of tile outputs bounded by total bytes
+
+    String (content-hash) keys can also spill to an on-disk tier, which
+    survives restarts and is shared by pool workers. A tile is written there
+    on its first repeat hit, compressed, by a background writer, so one-off
+    content never costs a disk write and inference never waits on one.
+    Other keys are memory-only. `seen()` remembers content keys without
+    their outputs, so callers can opt to leave one-off content out of the
+    cache.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, disk_dir: Optional[str] = None,
+                 disk_max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes if max_bytes is not None else DEFAULT_CACHE_MB * 1024 * 1024
+        self._entries: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+        self._persisted: set = set()  # Entries already on disk, or queued for it
+        self._seen: "OrderedDict[Hashable, None]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'disk_hits': 0, 'disk_writes': 0,
+                       'disk_dropped': 0, 'skipped': 0}
+        self.disk_dir: Optional[str] = None
+        self.disk_max_bytes = disk_max_bytes if disk_max_bytes is not None else DISK_CACHE_MB * 1024 * 1024
+        self._disk_bytes = 0
+        self._writer: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._pending: Dict[Hashable, concurrent.futures.Future] = {}
+        if disk_dir:
+            self.enable_disk(disk_dir)
+
+    def enable_disk(self, disk_dir: str, max_bytes: Optional[int] = None) -> None:
+        """Turn on the on-disk tier under `disk_dir`"""
+        os.makedirs(disk_dir, exist_ok=True)
+        with self._lock:
+            self.disk_dir = str(disk_dir)
+            if max_bytes is not None:
+                self.disk_max_bytes = max_bytes
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+        logger.info(f"💾 Tile cache disk tier at {self.disk_dir} ({self._disk_bytes / 1e6:.0f} MB in use)")
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        with self._lock:
+            tile = self._entries.get(key)
+            if tile is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                persist = self._disk_path(key) is not None and key not in self._persisted
+                if persist:
+                    self._persisted.add(key)
+        if tile is not None:
+            if persist:
+                self._write_behind(key, tile)
+            return tile
+        tile = self._disk_get(key)
+        if tile is None:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+        self.put(key, tile)
+        with self._lock:
+            if key in self._entries:
+                self._persisted.add(key)
+            self._stats['hits'] += 1
+            self._stats['disk_hits'] += 1
+        return tile
+
+    def seen(self, key: Hashable) -> bool:
+        """Whether `key` was looked up before; records it otherwise (in a bounded LRU of keys)"""
+        with self._lock:
+            if key in self._seen:
+                self._seen.move_to_end(key)
+                return True
+            self._seen[key] = None
+            while len(self._seen) > SEEN_KEYS:
+                self._seen.popitem(last=False)
+            self._stats['skipped'] += 1
+            return False
+
+    def put(self, key: Hashable, tile: np.ndarray) -> None:
+        # Callers often pass views into a larger batch output; keep only the tile. A
+        # contiguous view would otherwise pin the whole batch and see the caller's writes
+        if tile.base is not None or not tile.flags.c_contiguous:
+            tile = np.array(tile, order='C')
+        tile.setflags(write=False)
+        if tile.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[key] = tile
+            self._bytes += tile.nbytes
+            while self._bytes > self.max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self._persisted.discard(evicted_key)
+                self._bytes -= evicted.nbytes
+                self._stats['evictions'] += 1
+
+    def flush(self) -> None:
+        """Wait for queued disk writes"""
+        with self._lock:
+            pending = list(self._pending.values())
+        concurrent.futures.wait(pending)
+
+    def _write_behind(self, key: Hashable, tile: np.ndarray) -> None:
+        """Queue a disk write on the background writer (the tile is read-only, so it is not copied)"""
+        with self._lock:
+            if len(self._pending) >= DISK_MAX_PENDING:
+                # Written on a later hit instead
+                self._persisted.discard(key)
+                self._stats['disk_dropped'] += 1
+                return
+            if self._writer is None:
+                self._writer = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+                                                                     thread_name_prefix='tile-cache-disk')
+            future = self._writer.submit(self._disk_put, key, tile)
+            self._pending[key] = future
+        future.add_done_callback(lambda _: self._written(key))
+
+    def _written(self, key: Hashable) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def _disk_path(self, key: Hashable) -> Optional[str]:
+        if self.disk_dir is None or not isinstance(key, str):
+            return None
+        return os.path.join(self.disk_dir, key[:2], f"{key}.npz")
+
+    def _disk_get(self, key: Hashable) -> Optional[np.ndarray]:
+        path = self._disk_path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                return data['tile']
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️ Dropping unreadable cached tile {path}: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def _disk_put(self, key: Hashable, tile: np.ndarray) -> None:
+        path = self._disk_path(key)
+        if path is None or os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers (other workers) never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(f, tile=tile)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write cached tile {path}: {e}")
+            return
+        with self._lock:
+            self._stats['disk_writes'] += 1
+            self._disk_bytes += os.path.getsize(path)
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._prune_disk()
+
+    def _disk_files(self) -> List[tuple]:
+        """(path, size, mtime) of every tile in the disk tier"""
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if name.endswith('.npz'):
+                    path = os.path.join(root, name)
+                    try:
+                        info = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((path, info.st_size, info.st_mtime))
+        return files
+
+    def _prune_disk(self) -> None:
+        """Delete the oldest tiles until the disk tier is back under 90% of its budget"""
+        files = sorted(self._disk_files(), key=lambda f: f[2])
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * 0.9
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._persisted.clear()
+            self._seen.clear()
+            self._bytes = 0
+
+    def _after_fork(self) -> None:
+        """The writer thread does not survive fork; the child queues its own writes"""
+        self._lock = threading.Lock()
+        self._writer = None
+        self._persisted.difference_update(self._pending)
+        self._pending = {}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'hit_ratio': round(self._stats['hits'] / lookups, 3) if lookups else 0.0,
+                'tiles': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'disk_dir': self.disk_dir,
+                'disk_bytes': self._disk_bytes if self.disk_dir else 0,
+                'disk_pending': len(self._pending),
+            }
+
+
+class JobTileCache:
+    """
+    One job's content-keyed view of a TileCache
+
+    Keys cover the padded input tile, the model and where the tile's core
+    sits in the padding; values are the upscaled cores, without the padding.
+    Cores are stored on first sight, bounded by the cache's byte budgets, so
+    a re-upload hits. With `require_repeat` (default REQUIRE_REPEAT) they are
+    only stored for content seen once before: one-off uploads then cost a
+    hash per tile instead of a copy, and the cores left out are counted as
+    `skipped`. `stats` collects this job's own counts, independent of other
+    jobs sharing the cache.
+    """
+
+    def __init__(self, cache: TileCache, model_id: str, stats: Optional[Dict[str, Any]] = None,
+                 require_repeat: Optional[bool] = None):
+        self.cache = cache
+        self.model_id = model_id
+        self.require_repeat = REQUIRE_REPEAT if require_repeat is None else require_repeat
+        self.stats = {'hits': 0, 'misses': 0, 'skipped': 0, 'hit_ratio': 0.0}
+        if stats is not None:
+            stats['tile_cache'] = self.stats
+
+    def key(self, tile: np.ndarray, core: Tuple[int, int, int, int]) -> str:
+        return content_key(tile, self.model_id, core)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        core = self.cache.get(key)
+        self.stats['hits' if core is not None else 'misses'] += 1
+        self.stats['hit_ratio'] = round(self.stats['hits'] / (self.stats['hits'] + self.stats['misses']), 3)
+        return core
+
+    def put(self, key: str, core: np.ndarray) -> None:
+        if not self.require_repeat or self.cache.seen(key):
+            self.cache.put(key, core)
+        else:
+            self.stats['skipped'] += 1
+
+
+_cache: Optional[TileCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_tile_cache() -> TileCache:
+    """Return the process-wide tile cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TileCache(disk_dir=DISK_CACHE_DIR or None)
+        return _cache
+
+
+def _reset_after_fork() -> None:
+    global _cache_lock
+    _cache_lock = threading.Lock()
+    if _cache is not None:
+        _cache._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
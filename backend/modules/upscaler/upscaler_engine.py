@@ -4,44 +4,148 @@ Handles all image upscaling functionality with multiple algorithms
 """
 
 import os
+import copy
 import logging
 import asyncio
 from typing import Optional, Dict, Any
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image, ImageEnhance
 import numpy as np
+import hashlib
 import threading
-import concurrent.futures
-from functools import wraps
+from collections import OrderedDict
+
+from ..capabilities import has_capability
+from ..model_registry import ModelKey, ModelRegistry, get_model_registry
+from .backends import DEFAULT_BACKEND, apply_backend, available_backends, parity_report, split_model_id
+from .batch_scheduler import InferenceScheduler, get_inference_scheduler
+from .image_io import (
+    DEFAULT_ENCODER_PROFILE, ENCODER_PROFILES, get_encoder_profile, output_buffer, resize_banded, save_bgr,
+    write_preview
+)
+from .tile_autotuner import autotune, get_tile_config, load_profile, network_id
+from .tile_cache import JobTileCache, get_tile_cache
+from .tiling import crop_core, plan_tiles, tiles_in_region, upscale_tiled
 
 logger = logging.getLogger(__name__)
 
-def timeout_wrapper(timeout_seconds=120):
-    """Decorator to add timeout to functions"""
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(func, *args, **kwargs)
-                try:
-                    return future.result(timeout=timeout_seconds)
-                except concurrent.futures.TimeoutError:
-                    logger.warning(f"Function {func.__name__} timed out after {timeout_seconds} seconds")
-                    raise TimeoutError(f"Operation timed out after {timeout_seconds} seconds")
-        return wrapper
-    return decorator
+# Real-ESRGAN weights per network scale: (model name, download url)
+REALESRGAN_WEIGHTS = {
+    2: ('RealESRGAN_x2plus', 'https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.1/RealESRGAN_x2plus.pth'),
+    4: ('RealESRGAN_x4plus', 'https://github.com/xinntao/Real-ESRGAN/releases/download/v0.1.0/RealESRGAN_x4plus.pth'),
+}
+# Compact SRVGG tier: the general weights plus their weak-denoise twin, blended by denoise strength
+GENERAL_WEIGHTS = ('realesr-general-x4v3', 'https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.5.0/realesr-general-x4v3.pth')
+GENERAL_WDN_WEIGHTS = ('realesr-general-wdn-x4v3', 'https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.5.0/realesr-general-wdn-x4v3.pth')
+DEFAULT_DENOISE_STRENGTH = 0.5
+# 'auto' picks the compact network instead of super_enhanced_4x (changes default output and latency)
+AUTO_COMPACT = os.getenv('UPSCALER_AUTO_COMPACT', '0') == '1'
+# Tiles whose texture score (8-bit gradient levels) is below this are Lanczos-resampled;
+# off (0) by default since it trades output fidelity for speed, ~4 skips only near-uniform tiles
+FLAT_TILE_THRESHOLD = float(os.getenv('UPSCALER_FLAT_TILE_THRESHOLD', '0'))
+REGION_DECODED_IMAGES = 2  # Decoded inputs kept for viewport requests
+REALESRGAN_TIMEOUT = 90  # Seconds, for small inputs
+REALESRGAN_SECONDS_PER_MEGAPIXEL = 120  # CPU budget per input megapixel at 4x
+
+
+def download_weights(model_name: str, model_url: str) -> str:
+    """Local path of a weights file, downloading it into models/ on first use"""
+    import urllib.request
+
+    # Create models directory if it doesn't exist
+    models_dir = "models"
+    os.makedirs(models_dir, exist_ok=True)
+    model_path = os.path.join(models_dir, f"{model_name}.pth")
+
+    # Download model if not exists
+    if not os.path.exists(model_path):
+        logger.info(f"⬇️  Downloading {model_name} model...")
+        urllib.request.urlretrieve(model_url, model_path)
+        logger.info(f"✅ Model downloaded: {model_path}")
+    return model_path
+
+
+def realesrgan_model_spec(scale_factor: int, backend: str = 'eager'):
+    """
+    Registry key and loader for the Real-ESRGAN network serving `scale_factor`
+
+    Every module building a RealESRGANer from these weights goes through
+    here, so equal requests map to one resident copy in the model registry.
+    """
+    import torch
+
+    # 8x reuses the 4x network
+    net_scale = 2 if scale_factor == 2 else 4
+    model_name, model_url = REALESRGAN_WEIGHTS[net_scale]
+    # Exported backends run on the CPU
+    device = 'cuda' if torch.cuda.is_available() and backend in ('eager', 'bf16') else 'cpu'
+    key = ModelKey(
+        architecture=f"RRDBNet/{model_name}",
+        scale=net_scale,
+        precision='fp32',  # Keep full precision for CPU stability
+        device=device,
+        backend=backend
+    )
+
+    def loader():
+        from realesrgan import RealESRGANer
+        from basicsr.archs.rrdbnet_arch import RRDBNet
+
+        net = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=net_scale)
+        model_path = download_weights(model_name, model_url)
+        # Tiling of the shared instance is only a default; enhance() callers use tiled_copy()
+        tile, tile_pad = get_tile_config(network_id('RRDBNet', net_scale, 23))
+
+        upsampler = RealESRGANer(
+            scale=net_scale,
+            model_path=model_path,
+            model=net,
+            tile=tile,
+            tile_pad=tile_pad,
+            pre_pad=0,
+            half=key.precision == 'fp16',
+            gpu_id=None  # Let PyTorch auto-detect best device
+        )
+        return apply_backend(upsampler, backend, model_name, model_path)
+
+    return key, loader
+
+
+def tiled_copy(upsampler: Any, tile: int, tile_pad: int) -> Any:
+    """
+    Shallow copy of a shared RealESRGANer with its own tiling
+
+    The copy shares the network (the resident weights) but not the state
+    enhance() keeps on the instance, so it can run alongside other users.
+    """
+    wrapper = copy.copy(upsampler)
+    wrapper.tile_size = tile
+    wrapper.tile_pad = tile_pad
+    return wrapper
 
 
 class UpscalerEngine:
     """Independent Upscaler Engine with multiple algorithms"""
     
-    def __init__(self):
+    def __init__(self, model_registry: Optional[ModelRegistry] = None,
+                 scheduler: Optional[InferenceScheduler] = None):
+        self.model_registry = model_registry or get_model_registry()
+        self.scheduler = scheduler or get_inference_scheduler()
+        self.worker_pool = None  # Set by the orchestrator when a supervised pool is enabled
+        self.tile_cache = get_tile_cache()
+        self._region_lock = threading.Lock()
+        self._digests: Dict[Any, str] = {}
+        self._decoded: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        realesrgan = self._check_realesrgan()
         self.available_models = {
             # Real-ESRGAN models (highest quality)
-            'realesrgan_2x': {'available': self._check_realesrgan(), 'scale': 2, 'quality': 9},
-            'realesrgan_4x': {'available': self._check_realesrgan(), 'scale': 4, 'quality': 9},
-            'realesrgan_8x': {'available': self._check_realesrgan(), 'scale': 8, 'quality': 8},
-            'realesrgan_anime': {'available': self._check_realesrgan(), 'scale': 4, 'quality': 9},
-            'realesrgan_face': {'available': self._check_realesrgan(), 'scale': 4, 'quality': 8},
+            'realesrgan_2x': {'available': realesrgan, 'scale': 2, 'quality': 9},
+            'realesrgan_4x': {'available': realesrgan, 'scale': 4, 'quality': 9},
+            'realesrgan_8x': {'available': realesrgan, 'scale': 8, 'quality': 8},
+            'realesrgan_anime': {'available': realesrgan, 'scale': 4, 'quality': 9},
+            'realesrgan_face': {'available': realesrgan, 'scale': 4, 'quality': 8},
+            
+            # Compact SRVGG models (neural quality at a fraction of RRDBNet's CPU cost)
+            'realesrgan_general_4x': {'available': realesrgan, 'scale': 4, 'quality': 8, 'compact': True},
             
             # Super Enhanced PIL models (advanced processing)
             'super_enhanced_2x': {'available': True, 'scale': 2, 'quality': 8},
@@ -62,58 +166,28 @@ class UpscalerEngine:
         logger.info(f"Upscaler Engine initialized with {len(self.available_models)} models")
     
     def _check_realesrgan(self) -> bool:
-        """Check if Real-ESRGAN is available"""
-        try:
-            import torch
-            logger.info("🔍 Checking Real-ESRGAN availability...")
-            
-            # First check if basic torch is working
-            if not torch.cuda.is_available():
-                logger.info("⚠️ CUDA not available, Real-ESRGAN will use CPU")
-            
-            # Try importing Real-ESRGAN in a safer way
-            try:
-                # Import in isolation to avoid side effects
-                import importlib.util
-                spec = importlib.util.find_spec("realesrgan")
-                if spec is None:
-                    logger.warning("⚠️ Real-ESRGAN module not found")
-                    return False
-                
-                # Try the actual import but catch any initialization errors
-                try:
-                    from realesrgan import RealESRGANer
-                    from basicsr.archs.rrdbnet_arch import RRDBNet
-                    logger.info("✅ Real-ESRGAN successfully imported")
-                    return True
-                except (ImportError, RuntimeError, KeyboardInterrupt) as e:
-                    logger.warning(f"⚠️ Real-ESRGAN import failed: {e}")
-                    logger.info("📝 Real-ESRGAN will be disabled, falling back to enhanced PIL methods")
-                    return False
-                    
-            except Exception as e:
-                logger.warning(f"⚠️ Real-ESRGAN check failed: {e}")
-                return False
-                
-        except ImportError:
-            logger.warning("⚠️ PyTorch not available")
-            return False
-        except Exception as e:
-            logger.warning(f"⚠️ Real-ESRGAN availability check failed: {e}")
-            return False
+        """Check if Real-ESRGAN is installed (cached per process; the import is deferred to first use)"""
+        return has_capability('realesrgan')
     
     def get_available_models(self) -> Dict[str, Any]:
         """Get all available upscaling models"""
         return {k: v for k, v in self.available_models.items() if v['available']}
     
-    async def upscale_image(self, input_path: str, output_path: str, model: str = 'auto') -> bool:
+    async def upscale_image(self, input_path: str, output_path: str, model: str = 'auto',
+                            denoise_strength: Optional[float] = None,
+                            stats: Optional[Dict[str, Any]] = None,
+                            encoder_profile: Optional[str] = None) -> bool:
         """
         Upscale image using specified model
         
         Args:
             input_path: Path to input image
             output_path: Path to save upscaled image
-            model: Model to use ('auto', 'realesrgan_4x', 'lanczos_4x', etc.)
+            model: Model to use ('auto', 'realesrgan_4x', 'lanczos_4x', etc.); Real-ESRGAN
+                ids take an optional backend suffix, e.g. 'realesrgan_4x@onnx-int8'
+            denoise_strength: 0 (keep noise) to 1 (strong denoise), for the compact general models
+            stats: Filled with encode time, plus tile routing statistics when a Real-ESRGAN model runs
+            encoder_profile: 'fast', 'balanced' or 'smallest' (see image_io.ENCODER_PROFILES)
         
         Returns:
             bool: Success status
@@ -123,28 +197,35 @@ class UpscalerEngine:
                 model = self._select_best_model()
             
             logger.info(f"Upscaling image using model: {model}")
+            model, backend = split_model_id(model)
+            get_encoder_profile(encoder_profile)  # Reject unknown profiles before any work
             
             # Real-ESRGAN models (highest quality)
             if 'realesrgan' in model and self.available_models.get(model, {}).get('available'):
-                return await self._realesrgan_upscale(input_path, output_path, model)
+                return await self._realesrgan_upscale(
+                    input_path, output_path, f"{model}@{backend}", denoise_strength, stats, encoder_profile
+                )
             # Super enhanced PIL models
             elif model in ['super_enhanced_4x', 'enhanced_pro_4x']:
-                return await self._super_enhanced_pil_upscale(input_path, output_path, model, 4)
+                return await self._super_enhanced_pil_upscale(input_path, output_path, model, 4, encoder_profile, stats)
             elif model in ['super_enhanced_2x', 'enhanced_pro_2x']:
-                return await self._super_enhanced_pil_upscale(input_path, output_path, model, 2)
+                return await self._super_enhanced_pil_upscale(input_path, output_path, model, 2, encoder_profile, stats)
             # Standard enhanced PIL models
             elif model in ['enhanced_4x', 'enhanced_2x']:
                 scale = 4 if '4x' in model else 2
-                return await self._enhanced_pil_upscale(input_path, output_path, model, scale)
+                return await self._enhanced_pil_upscale(input_path, output_path, model, scale, encoder_profile, stats)
             # Lanczos models
             elif 'lanczos' in model:
-                return await self._lanczos_upscale(input_path, output_path, model)
+                return await self._lanczos_upscale(input_path, output_path, model, encoder_profile, stats)
             # Bicubic models
             elif 'bicubic' in model:
-                return await self._bicubic_upscale(input_path, output_path, model)
+                return await self._bicubic_upscale(input_path, output_path, model, encoder_profile, stats)
             else:
-                logger.warning(f"Model {model} not available, using super enhanced fallback")
-                return await self._super_enhanced_pil_upscale(input_path, output_path, 'super_enhanced_4x', 4)
+                scale = self._model_scale(model)
+                logger.warning(f"Model {model} not available, using super enhanced {scale}x fallback")
+                return await self._super_enhanced_pil_upscale(
+                    input_path, output_path, f'super_enhanced_{scale}x', scale, encoder_profile, stats
+                )
                 
         except Exception as e:
             logger.error(f"Image upscaling failed: {e}")
@@ -156,6 +237,10 @@ class UpscalerEngine:
         if not available:
             return 'enhanced_4x'  # Use standard enhanced as fast fallback
         
+        # Opt-in (UPSCALER_AUTO_COMPACT=1): the compact network is a neural upscale we can afford on CPU
+        if AUTO_COMPACT and 'realesrgan_general_4x' in available:
+            return 'realesrgan_general_4x'
+        
         # Always prefer super enhanced PIL for reliability and speed on CPU
         if 'super_enhanced_4x' in available:
             return 'super_enhanced_4x'
@@ -168,186 +253,433 @@ class UpscalerEngine:
         best = max(available.items(), key=lambda x: x[1]['quality'])
         return best[0]
     
-    async def _realesrgan_upscale(self, input_path: str, output_path: str, model: str) -> bool:
+    def _model_scale(self, model: str) -> int:
+        """Output scale of a model id: its registered scale, else the 'Nx' in its name, else 4"""
+        model_name, _ = split_model_id(model)
+        if model_name in self.available_models:
+            return self.available_models[model_name]['scale']
+        for scale in (2, 8):
+            if f"{scale}x" in model_name:
+                return scale
+        return 4
+
+    def _realesrgan_model_spec(self, scale_factor: int, backend: str = 'eager'):
+        return realesrgan_model_spec(scale_factor, backend)
+
+    def _download_weights(self, model_name: str, model_url: str) -> str:
+        return download_weights(model_name, model_url)
+
+    def _general_weights(self, denoise_strength: float):
+        """
+        (name, path) of realesr-general-x4v3 blended with its wdn twin (deep network interpolation)
+
+        Strength 1 is the plain general model (strongest denoise), 0 the weak
+        denoise model. Blends are cached as their own weights file so they
+        load, export and key like any other model.
+        """
+        import torch
+
+        general_path = self._download_weights(*GENERAL_WEIGHTS)
+        if denoise_strength >= 1.0:
+            return GENERAL_WEIGHTS[0], general_path
+
+        wdn_path = self._download_weights(*GENERAL_WDN_WEIGHTS)
+        name = f"{GENERAL_WEIGHTS[0]}-dn{round(denoise_strength * 100):03d}"
+        path = os.path.join("models", f"{name}.pth")
+        if not os.path.exists(path):
+            def params(weights_path):
+                loaded = torch.load(weights_path, map_location='cpu')
+                return loaded['params_ema'] if 'params_ema' in loaded else loaded['params']
+
+            general, wdn = params(general_path), params(wdn_path)
+            blended = {k: denoise_strength * general[k] + (1 - denoise_strength) * wdn[k] for k in general}
+            torch.save({'params': blended}, f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+            logger.info(f"✅ Blended general weights at denoise strength {denoise_strength:.2f}: {path}")
+        return name, path
+
+    def _compact_model_spec(self, denoise_strength: Optional[float] = None, backend: str = 'eager'):
+        """Registry key and loader for the compact SRVGG general network"""
+        import torch
+
+        strength = DEFAULT_DENOISE_STRENGTH if denoise_strength is None else denoise_strength
+        # Steps of 0.05 keep the number of blended weight sets (and resident models) small
+        strength = min(1.0, max(0.0, round(strength * 20) / 20))
+        device = 'cuda' if torch.cuda.is_available() and backend in ('eager', 'bf16') else 'cpu'
+        key = ModelKey(
+            architecture=f"SRVGGNetCompact/{GENERAL_WEIGHTS[0]}-dn{round(strength * 100):03d}",
+            scale=4,
+            precision='fp32',
+            device=device,
+            backend=backend
+        )
+
+        def loader():
+            from realesrgan import RealESRGANer
+            from basicsr.archs.srvgg_arch import SRVGGNetCompact
+
+            net = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=32, upscale=4, act_type='prelu')
+            model_name, model_path = self._general_weights(strength)
+            tile, tile_pad = get_tile_config(network_id('SRVGGNetCompact', 4, 32))
+
+            upsampler = RealESRGANer(
+                scale=4,
+                model_path=model_path,
+                model=net,
+                tile=tile,
+                tile_pad=tile_pad,
+                pre_pad=0,
+                half=False,
+                gpu_id=None
+            )
+            return apply_backend(upsampler, backend, model_name, model_path)
+
+        return key, loader
+
+    def preload_models(self, scales=(4,)) -> None:
+        """Load Real-ESRGAN networks into the registry, e.g. before forking workers"""
+        if not self._check_realesrgan():
+            return
+        for scale in scales:
+            key, loader = self._realesrgan_model_spec(scale)
+            with self.model_registry.lease(key, loader):
+                pass
+
+    def autotune_tiles(self, force: bool = False) -> Dict[str, Any]:
+        """Benchmark tile sizes for the Real-ESRGAN networks this engine uses (skips profiled ones)"""
+        if not self._check_realesrgan():
+            return {}
+        networks = [network_id('RRDBNet', scale, 23) for scale in REALESRGAN_WEIGHTS]
+        networks.append(network_id('SRVGGNetCompact', 4, 32))
+        return autotune(networks, batch_size=self.scheduler.max_batch_size, force=force)
+
+    def backend_report(self, scale: int = 4, backends=None, tile: int = 128, batch_size: int = 1) -> Dict[str, Any]:
+        """Parity (vs. eager fp32) and speed of each inference backend on random tiles"""
+        key, loader = self._realesrgan_model_spec(scale)
+        with self.model_registry.lease(key, loader) as upsampler:
+            return parity_report(upsampler, REALESRGAN_WEIGHTS[key.scale][0], backends, tile, batch_size)
+
+    def _realesrgan_timeout(self, input_path: str) -> float:
+        """Timeout for a Real-ESRGAN job, growing with input size now that inputs are not pre-shrunk"""
+        try:
+            with Image.open(input_path) as img:
+                megapixels = img.width * img.height / 1_000_000
+        except Exception:
+            megapixels = 0
+        return max(REALESRGAN_TIMEOUT, megapixels * REALESRGAN_SECONDS_PER_MEGAPIXEL)
+
+    async def _realesrgan_upscale(self, input_path: str, output_path: str, model: str,
+                                  denoise_strength: Optional[float] = None,
+                                  stats: Optional[Dict[str, Any]] = None,
+                                  encoder_profile: Optional[str] = None) -> bool:
         """Upscale using Real-ESRGAN with timeout and fallback"""
-        @timeout_wrapper(timeout_seconds=90)  # 90 second timeout
-        def process_sync():
-            try:
-                logger.info(f"🔧 Starting Real-ESRGAN upscaling with model: {model}")
-                
-                from realesrgan import RealESRGANer
-                from basicsr.archs.rrdbnet_arch import RRDBNet
-                from PIL import Image
-                import numpy as np
-                import os
-                import urllib.request
-
-                logger.info("📦 Imports successful")
-                
-                # Extract scale factor from model name
-                scale_factor = 4  # default
-                if "2x" in model:
-                    scale_factor = 2
-                elif "4x" in model:
-                    scale_factor = 4
-                elif "8x" in model:
-                    scale_factor = 8
-
-                logger.info(f"🖥️  Using scale factor: {scale_factor}x")
-                
-                # Determine model based on scale factor
-                if scale_factor == 2:
-                    net = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=2)
-                    model_url = 'https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.1/RealESRGAN_x2plus.pth'
-                    model_name = 'RealESRGAN_x2plus'
-                elif scale_factor == 4:
-                    net = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)
-                    model_url = 'https://github.com/xinntao/Real-ESRGAN/releases/download/v0.1.0/RealESRGAN_x4plus.pth'
-                    model_name = 'RealESRGAN_x4plus'
-                else:  # 8x - use 4x model twice
-                    net = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)
-                    model_url = 'https://github.com/xinntao/Real-ESRGAN/releases/download/v0.1.0/RealESRGAN_x4plus.pth'
-                    model_name = 'RealESRGAN_x4plus'
-
-                logger.info("✅ Neural network created")
-                
-                # Create models directory if it doesn't exist
-                models_dir = "models"
-                os.makedirs(models_dir, exist_ok=True)
-                model_path = os.path.join(models_dir, f"{model_name}.pth")
-
-                # Download model if not exists
-                if not os.path.exists(model_path):
-                    logger.info(f"⬇️  Downloading {model_name} model...")
-                    urllib.request.urlretrieve(model_url, model_path)
-                    logger.info(f"✅ Model downloaded: {model_path}")
-
-                # Initialize upsampler with smaller tiles for CPU
-                logger.info("🚀 Creating upsampler...")
-                upsampler = RealESRGANer(
-                    scale=4 if scale_factor >= 4 else 2,
-                    model_path=model_path,
-                    model=net,
-                    tile=128,  # Further reduced for CPU performance
-                    tile_pad=8,   # Reduced padding
-                    pre_pad=0,
-                    half=False,  # Keep full precision for CPU stability
-                    gpu_id=None  # Let PyTorch auto-detect best device
+        timeout = self._realesrgan_timeout(input_path)
+        cancel_event = threading.Event()
+        try:
+            if self.worker_pool is not None:
+                # Hard deadline: a worker that overruns is killed and replaced
+                tile_stats = await self.worker_pool.run(
+                    'upscaler', '_realesrgan_process', input_path, output_path, model,
+                    denoise_strength=denoise_strength, encoder_profile=encoder_profile, timeout=timeout
                 )
-                logger.info("✅ Upsampler created")
-                
-                # Load and process image with size optimization
-                logger.info(f"🖼️  Loading image: {input_path}")
-                img = Image.open(input_path).convert('RGB')
-                original_size = img.size
-                logger.info(f"✅ Image loaded: {original_size}")
+            else:
+                loop = asyncio.get_event_loop()
+                tile_stats = await asyncio.wait_for(
+                    loop.run_in_executor(
+                        None, self._realesrgan_process, input_path, output_path, model, cancel_event,
+                        denoise_strength, encoder_profile
+                    ),
+                    timeout=timeout
+                )
+            if stats is not None:
+                stats.update(tile_stats)
+            return True
+        except (TimeoutError, asyncio.TimeoutError, Exception) as e:
+            # Stop the in-process tile loop so it does not compete with the fallback
+            cancel_event.set()
+            scale = self._model_scale(model)
+            logger.warning(f"Real-ESRGAN failed or timed out: {e}, falling back to Super Enhanced PIL {scale}x")
+            # Fallback to super enhanced PIL at the scale that was asked for
+            return await self._super_enhanced_pil_upscale(
+                input_path, output_path, f'super_enhanced_{scale}x', scale, encoder_profile, stats
+            )
 
-                # More aggressive size limiting for CPU processing
-                max_dimension = 1024  # Further reduced for CPU
-                needs_resize = max(original_size) > max_dimension
-                
-                if needs_resize:
-                    # Calculate new size maintaining aspect ratio
-                    ratio = min(max_dimension / original_size[0], max_dimension / original_size[1])
-                    new_size = (int(original_size[0] * ratio), int(original_size[1] * ratio))
-                    logger.info(f"🔄 Resizing input from {original_size} to {new_size} for CPU performance")
-                    try:
-                        img = img.resize(new_size, Image.LANCZOS)
-                    except AttributeError:
-                        img = img.resize(new_size, Image.Resampling.LANCZOS)
-
-                # Convert to numpy array
-                img_array = np.array(img)
-
-                # Process with Real-ESRGAN (simplified - no 8x support to avoid complexity)
-                if scale_factor == 8:
-                    logger.info("🚀 Processing 8x upscaling - using 4x model")
-                    # Use 4x model instead of double processing for speed
-                    output_array, _ = upsampler.enhance(img_array, outscale=4)
-                else:
-                    logger.info(f"🚀 Processing {scale_factor}x upscaling")
-                    output_array, _ = upsampler.enhance(img_array, outscale=scale_factor)
-
-                # Convert back to PIL and save
-                result_img = Image.fromarray(output_array)
-                final_size = result_img.size
-                logger.info(f"✅ Enhancement completed: {final_size} (scale factor: {final_size[0]/img.size[0]:.1f}x)")
-                
-                # Save result
-                logger.info(f"💾 Saving to: {output_path}")
-                if output_path.endswith('.png'):
-                    result_img.save(output_path, "PNG", optimize=True)
-                else:
-                    result_img.save(output_path, "JPEG", quality=95, optimize=True)
-
-                logger.info("✅ Real-ESRGAN upscaling completed successfully")
-                return True
-                
-            except Exception as e:
-                logger.error(f"❌ Real-ESRGAN upscaling failed: {e}")
-                logger.error(f"   Error type: {type(e).__name__}")
-                import traceback
-                logger.error(f"   Traceback: {traceback.format_exc()}")
-                raise e
-        
+    def _realesrgan_process(self, input_path: str, output_path: str, model: str,
+                            cancel_event: Optional[threading.Event] = None,
+                            denoise_strength: Optional[float] = None,
+                            encoder_profile: Optional[str] = None) -> Dict[str, Any]:
+        """Blocking Real-ESRGAN upscale; runs in an executor thread or a pool worker. Returns tile stats"""
         try:
-            # Run with timeout in thread pool
-            loop = asyncio.get_event_loop()
-            return await loop.run_in_executor(None, process_sync)
-        except (TimeoutError, Exception) as e:
-            logger.warning(f"Real-ESRGAN failed or timed out: {e}, falling back to Super Enhanced PIL")
-            # Fallback to super enhanced PIL
-            return await self._super_enhanced_pil_upscale(input_path, output_path, 'super_enhanced_4x', 4)
-    
-    async def _lanczos_upscale(self, input_path: str, output_path: str, model: str) -> bool:
+            logger.info(f"🔧 Starting Real-ESRGAN upscaling with model: {model}")
+            model_name, backend = split_model_id(model)
+            
+            scale_factor = self._model_scale(model_name)
+            logger.info(f"🖥️  Using scale factor: {scale_factor}x")
+            
+            # Load the full-resolution image; no pre-shrink, tiling bounds the memory
+            logger.info(f"🖼️  Loading image: {input_path}")
+            img_array = np.array(Image.open(input_path).convert('RGB'))
+            height, width = img_array.shape[:2]
+            logger.info(f"✅ Image loaded: {(width, height)}")
+
+            # Process with Real-ESRGAN using the resident upsampler
+            key, loader, network = self._network_spec(model_name, backend, scale_factor, denoise_strength)
+            if scale_factor > key.scale:
+                logger.info(f"🚀 Processing {scale_factor}x upscaling - {key.scale}x model plus Lanczos")
+            else:
+                logger.info(f"🚀 Processing {scale_factor}x upscaling")
+
+            # Tile inference is stateless, so concurrent requests share the model and
+            # the scheduler batches their tiles together
+            output_shape = (height * key.scale, width * key.scale, 3)
+            # Read per job, so a new tile profile applies without reloading the model
+            tile, tile_pad = get_tile_config(network)
+            tile_stats: Dict[str, Any] = {}
+            with self.model_registry.lease(key, loader) as upsampler:
+                infer = lambda tiles: self.scheduler.infer_many(key, upsampler, tiles, key.scale)
+                # Tiles seen before (re-uploads, templated shots) come from the content cache
+                cache = JobTileCache(self.tile_cache, self._cache_model_id(key), tile_stats)
+                with output_buffer(output_shape, output_path) as output_array:
+                    # Flat tiles (backdrops, sky, borders) skip the network
+                    upscale_tiled(
+                        upsampler, img_array, output_array, key.scale, tile, tile_pad,
+                        infer=infer, window=self.scheduler.max_batch_size, cancel_event=cancel_event,
+                        flat_threshold=FLAT_TILE_THRESHOLD, stats=tile_stats, cache=cache
+                    )
+                    tile_stats['estimated_time_saved'] = self._flat_tile_savings(tile_stats, network, tile)
+                    logger.info(f"✅ Enhancement completed: {output_shape[1]}x{output_shape[0]} (scale factor: {key.scale}x)")
+
+                    if scale_factor > key.scale:
+                        # 8x runs the 4x network, then resamples the rest of the way
+                        final_shape = (height * scale_factor, width * scale_factor, 3)
+                        with output_buffer(final_shape, output_path) as final_array:
+                            resize_banded(output_array, final_array, scale_factor // key.scale)
+                            logger.info(f"💾 Saving {final_shape[1]}x{final_shape[0]} to: {output_path}")
+                            tile_stats['encode_seconds'] = round(save_bgr(output_path, final_array, profile=encoder_profile), 3)
+                    else:
+                        # Save result
+                        logger.info(f"💾 Saving to: {output_path}")
+                        tile_stats['encode_seconds'] = round(save_bgr(output_path, output_array, profile=encoder_profile), 3)
+
+            logger.info("✅ Real-ESRGAN upscaling completed successfully")
+            return tile_stats
+            
+        except Exception as e:
+            logger.error(f"❌ Real-ESRGAN upscaling failed: {e}")
+            logger.error(f"   Error type: {type(e).__name__}")
+            import traceback
+            logger.error(f"   Traceback: {traceback.format_exc()}")
+            raise e
+
+    def _network_spec(self, model_name: str, backend: str, scale_factor: int,
+                      denoise_strength: Optional[float] = None):
+        """Registry key, loader and autotuner network id for a Real-ESRGAN model"""
+        if self.available_models.get(model_name, {}).get('compact'):
+            key, loader = self._compact_model_spec(denoise_strength, backend)
+            return key, loader, network_id('SRVGGNetCompact', 4, 32)
+        key, loader = self._realesrgan_model_spec(scale_factor, backend)
+        return key, loader, network_id('RRDBNet', key.scale, 23)
+
+    def _cache_model_id(self, key: ModelKey) -> str:
+        """What decides a tile's output besides its pixels; tile geometry is covered by the pixels"""
+        return f"{key.architecture}/x{key.scale}/{key.precision}/{key.backend}/{key.device}"
+
+    async def upscale_region(self, input_path: str, output_path: str, rect, model: str = 'auto',
+                             denoise_strength: Optional[float] = None,
+                             stats: Optional[Dict[str, Any]] = None,
+                             encoder_profile: Optional[str] = None) -> bool:
+        """
+        Upscale only the part of an image visible in a viewport
+
+        Args:
+            input_path: Path to the full input image
+            output_path: Path to save the upscaled crop
+            rect: (x, y, width, height) in input pixels
+            model: Real-ESRGAN model id, optionally with a backend suffix
+            denoise_strength: As for upscale_image
+            stats: Filled with the crop actually served, tile cache counts and encode time
+            encoder_profile: As for upscale_image
+
+        Only the tiles under the rectangle (plus their context padding) are
+        inferred; outputs are cached per tile, so panning or zooming over
+        the same image only computes the newly exposed tiles.
+        """
+        if model == 'auto':
+            # Regions always need a network; the compact one only when 'auto' prefers it
+            model = 'realesrgan_general_4x' if AUTO_COMPACT else 'realesrgan_4x'
+        model_name, backend = split_model_id(model)
+        if 'realesrgan' not in model_name or not self.available_models.get(model_name, {}).get('available'):
+            raise ValueError(f"Region upscaling needs an available Real-ESRGAN model, got '{model_name}'")
+
+        _, _, width, height = rect
+        timeout = max(REALESRGAN_TIMEOUT, width * height / 1_000_000 * REALESRGAN_SECONDS_PER_MEGAPIXEL)
+        cancel_event = threading.Event()
+        loop = asyncio.get_event_loop()
+        try:
+            # In-process only: the tile cache lives in this process, not in pool workers
+            region_stats = await asyncio.wait_for(
+                loop.run_in_executor(
+                    None, self._region_process, input_path, output_path, f"{model_name}@{backend}",
+                    tuple(rect), cancel_event, denoise_strength, encoder_profile
+                ),
+                timeout=timeout
+            )
+        except (TimeoutError, asyncio.TimeoutError):
+            cancel_event.set()
+            raise
+        if stats is not None:
+            stats.update(region_stats)
+        return True
+
+    def _image_digest(self, input_path: str) -> str:
+        """Content hash of an input file, memoized by path, size and mtime"""
+        info = os.stat(input_path)
+        memo_key = (os.path.abspath(input_path), info.st_size, info.st_mtime_ns)
+        with self._region_lock:
+            digest = self._digests.get(memo_key)
+        if digest is None:
+            sha = hashlib.sha1()
+            with open(input_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+            with self._region_lock:
+                if len(self._digests) > 1024:
+                    self._digests.clear()
+                self._digests[memo_key] = digest
+        return digest
+
+    def _region_image(self, digest: str, input_path: str) -> np.ndarray:
+        """Decoded RGB input, kept for the last few images so panning does not re-decode"""
+        with self._region_lock:
+            image = self._decoded.get(digest)
+            if image is not None:
+                self._decoded.move_to_end(digest)
+                return image
+        with Image.open(input_path) as img:
+            image = np.asarray(img.convert('RGB'))
+        with self._region_lock:
+            self._decoded[digest] = image
+            while len(self._decoded) > REGION_DECODED_IMAGES:
+                self._decoded.popitem(last=False)
+        return image
+
+    def _region_process(self, input_path: str, output_path: str, model: str, rect,
+                        cancel_event: Optional[threading.Event] = None,
+                        denoise_strength: Optional[float] = None,
+                        encoder_profile: Optional[str] = None) -> Dict[str, Any]:
+        """Blocking region upscale; runs in an executor thread. Returns tile cache stats"""
+        model_name, backend = split_model_id(model)
+        scale_factor = self._model_scale(model_name)
+
+        digest = self._image_digest(input_path)
+        image = self._region_image(digest, input_path)
+        height, width = image.shape[:2]
+
+        x, y, w, h = (int(v) for v in rect)
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(width, x + w), min(height, y + h)
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError(f"Region {rect} is outside the {width}x{height} image")
+
+        key, loader, network = self._network_spec(model_name, backend, scale_factor, denoise_strength)
+        scale = key.scale
+        # The tile grid depends on tile size and padding, so both are part of the cache key
+        tile_size, tile_pad = get_tile_config(network)
+        tiles = tiles_in_region(plan_tiles(width, height, tile_size, tile_pad), x0, y0, x1, y1)
+        grid = (digest, str(key), tile_size, tile_pad)
+        cores = {t.index: self.tile_cache.get((*grid, t.index)) for t in tiles}
+        missing = [t for t in tiles if cores[t.index] is None]
+
+        if missing:
+            with self.model_registry.lease(key, loader) as upsampler:
+                window = self.scheduler.max_batch_size
+                for start in range(0, len(missing), window):
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise TimeoutError("Region upscale cancelled")
+                    batch = missing[start:start + window]
+                    # Only the cropped cores are cached (by tile index), not the padded outputs too
+                    outputs = self.scheduler.infer_many(
+                        key, upsampler, [image[t.py0:t.py1, t.px0:t.px1] for t in batch], scale
+                    )
+                    for tile, tile_output in zip(batch, outputs):
+                        core = crop_core(tile, tile_output, scale)
+                        self.tile_cache.put((*grid, tile.index), core)
+                        cores[tile.index] = core
+
+        # Copy the visible part of each tile core into the crop (RGB -> BGR)
+        out = np.empty(((y1 - y0) * scale, (x1 - x0) * scale, 3), dtype=np.uint8)
+        for tile in tiles:
+            ix0, iy0 = max(tile.x0, x0), max(tile.y0, y0)
+            ix1, iy1 = min(tile.x1, x1), min(tile.y1, y1)
+            out[(iy0 - y0) * scale:(iy1 - y0) * scale, (ix0 - x0) * scale:(ix1 - x0) * scale] = \
+                cores[tile.index][(iy0 - tile.y0) * scale:(iy1 - tile.y0) * scale,
+                                  (ix0 - tile.x0) * scale:(ix1 - tile.x0) * scale, ::-1]
+        if scale_factor > scale:
+            # 8x regions resample the 4x network output the rest of the way, as full images do
+            import cv2
+            out = cv2.resize(out, (out.shape[1] * scale_factor // scale, out.shape[0] * scale_factor // scale),
+                             interpolation=cv2.INTER_LANCZOS4)
+            scale = scale_factor
+        encode_seconds = save_bgr(output_path, out, profile=encoder_profile)
+
+        cached = len(tiles) - len(missing)
+        logger.info(f"🔍 Region {x1 - x0}x{y1 - y0} at ({x0}, {y0}): {cached}/{len(tiles)} tiles from cache")
+        return {
+            'region': [x0, y0, x1 - x0, y1 - y0],
+            'scale': scale,
+            'tiles': len(tiles),
+            'tiles_cached': cached,
+            'tiles_computed': len(missing),
+            'hit_ratio': round(cached / len(tiles), 3) if tiles else 0.0,
+            'encode_seconds': round(encode_seconds, 3),
+        }
+
+    def _flat_tile_savings(self, tile_stats: Dict[str, Any], network: str, tile: int) -> Optional[float]:
+        """Seconds the network would have spent on the flat tiles, minus the time resampling took"""
+        if not tile_stats.get('flat_tiles'):
+            return 0.0
+        if tile_stats['neural_tiles']:
+            per_tile = tile_stats['neural_seconds'] / tile_stats['neural_tiles']
+        else:
+            # Nothing went through the network; fall back to the tuned speed for this host
+            seconds_per_megapixel = load_profile().get(network, {}).get('seconds_per_megapixel')
+            if seconds_per_megapixel is None:
+                return None
+            per_tile = seconds_per_megapixel * tile * tile / 1_000_000
+        return round(max(0.0, tile_stats['flat_tiles'] * per_tile - tile_stats['flat_seconds']), 2)
+
+    def preview_upscale(self, input_path: str, output_path: str, scale: int = 4) -> Dict[str, Any]:
+        """Fast capped-size Lanczos preview of an upscale (progressive mode)"""
+        return write_preview(input_path, output_path, scale)
+
+    def _record_encode(self, stats: Optional[Dict[str, Any]], seconds: float) -> None:
+        """Report the output encode as its own stage"""
+        if stats is not None:
+            stats['encode_seconds'] = round(seconds, 3)
+
+    def _load_bgr(self, input_path: str) -> np.ndarray:
+        """Decode any PIL-readable image into a BGR uint8 array"""
+        import cv2
+        with Image.open(input_path) as img:
+            return cv2.cvtColor(np.asarray(img.convert('RGB')), cv2.COLOR_RGB2BGR)
+
+    async def _lanczos_upscale(self, input_path: str, output_path: str, model: str,
+                               encoder_profile: Optional[str] = None,
+                               stats: Optional[Dict[str, Any]] = None) -> bool:
         """Upscale using Lanczos algorithm with sharp processing"""
         def process_sync():
             try:
+                from .fused_filters import lanczos_pipeline
+
                 # Get scale factor from model name
                 scale = int(model.split('_')[1].replace('x', ''))
                 
-                # Load image
-                img = Image.open(input_path).convert('RGB')
-                original_size = img.size
-                
                 logger.info(f"Applying SHARP Lanczos {scale}x upscaling")
-                
-                # Multi-step upscaling for better quality
-                if scale > 2:
-                    # Two-step upscaling
-                    intermediate = img.resize(
-                        (original_size[0] * 2, original_size[1] * 2), 
-                        Image.Resampling.LANCZOS
-                    )
-                    upscaled = intermediate.resize(
-                        (original_size[0] * scale, original_size[1] * scale), 
-                        Image.Resampling.LANCZOS
-                    )
-                else:
-                    upscaled = img.resize(
-                        (original_size[0] * scale, original_size[1] * scale), 
-                        Image.Resampling.LANCZOS
-                    )
-                
-                # SHARP post-processing
-                logger.info("Applying sharp enhancement")
-                
-                # Aggressive unsharp masking
-                upscaled = upscaled.filter(ImageFilter.UnsharpMask(radius=1, percent=200, threshold=0))
-                
-                # Enhanced sharpness
-                enhancer = ImageEnhance.Sharpness(upscaled)
-                upscaled = enhancer.enhance(2.0)
-                
-                # Enhanced contrast
-                enhancer = ImageEnhance.Contrast(upscaled)
-                upscaled = enhancer.enhance(1.3)
-                
-                # Final unsharp mask
-                upscaled = upscaled.filter(ImageFilter.UnsharpMask(radius=2, percent=250, threshold=0))
+                upscaled = lanczos_pipeline(self._load_bgr(input_path), scale)
                 
                 # Save with high quality
-                upscaled.save(output_path, 'JPEG', quality=98, optimize=True)
+                self._record_encode(stats, save_bgr(output_path, upscaled, jpeg_quality=98, profile=encoder_profile))
                 
                 logger.info("✅ Sharp Lanczos upscaling completed")
                 return True
@@ -360,72 +692,24 @@ class UpscalerEngine:
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(None, process_sync)
     
-    async def _super_enhanced_pil_upscale(self, input_path: str, output_path: str, model: str, scale: int = 4) -> bool:
-        """Super Enhanced PIL upscaling with advanced algorithms - restored working version"""
+    async def _super_enhanced_pil_upscale(self, input_path: str, output_path: str, model: str, scale: int = 4,
+                                          encoder_profile: Optional[str] = None,
+                                          stats: Optional[Dict[str, Any]] = None) -> bool:
+        """Super Enhanced upscaling: bilateral denoise, Lanczos and fused sharpen/contrast"""
         def process_sync():
             try:
                 logger.info(f"🎨 Starting super enhanced PIL upscaling: {model} at {scale}x")
                 
-                with Image.open(input_path) as img:
-                    img = img.convert('RGB')
-                    original_size = img.size
-                    logger.info(f"Original size: {original_size}")
-                    
-                    import numpy as np
-                    from PIL import ImageFilter, ImageEnhance
-                    import cv2
-                    
-                    # Convert to numpy for optimized processing
-                    img_array = np.array(img)
-                    
-                    # Quick bilateral filter for noise reduction (reduced parameters for speed)
-                    img_filtered = cv2.bilateralFilter(img_array, 5, 50, 50)  # Reduced from 9, 75, 75
-                    img = Image.fromarray(img_filtered.astype(np.uint8))
-                    
-                    # Optimized upscaling with fewer intermediate steps
-                    if scale <= 2:
-                        # Single-step for 2x or less
-                        new_size = (int(img.width * scale), int(img.height * scale))
-                        try:
-                            upscaled = img.resize(new_size, Image.LANCZOS)
-                        except AttributeError:
-                            upscaled = img.resize(new_size, Image.Resampling.LANCZOS)
-                    else:
-                        # Two-step for 4x: 2x then 2x for better quality
-                        intermediate_size = (img.width * 2, img.height * 2)
-                        try:
-                            intermediate = img.resize(intermediate_size, Image.LANCZOS)
-                        except AttributeError:
-                            intermediate = img.resize(intermediate_size, Image.Resampling.LANCZOS)
-                        
-                        # Quick sharpening on intermediate
-                        intermediate = intermediate.filter(ImageFilter.UnsharpMask(radius=1, percent=120, threshold=2))
-                        
-                        # Final upscale
-                        final_size = (int(img.width * scale), int(img.height * scale))
-                        try:
-                            upscaled = intermediate.resize(final_size, Image.LANCZOS)
-                        except AttributeError:
-                            upscaled = intermediate.resize(final_size, Image.Resampling.LANCZOS)
-                    
-                    # Streamlined final enhancement (reduced from multiple passes)
-                    upscaled = upscaled.filter(ImageFilter.UnsharpMask(radius=2, percent=130, threshold=2))
-                    
-                    # Single contrast enhancement
-                    enhancer = ImageEnhance.Contrast(upscaled)
-                    upscaled = enhancer.enhance(1.15)
-                    
-                    final_size = upscaled.size
-                    scale_achieved = final_size[0] / original_size[0]
-                    logger.info(f"Super enhanced PIL upscaling completed: {final_size} (scale: {scale_achieved:.1f}x)")
-                    
-                    # Save with high quality
-                    if output_path.endswith('.png'):
-                        upscaled.save(output_path, "PNG", optimize=True)
-                    else:
-                        upscaled.save(output_path, "JPEG", quality=95, optimize=True)  # Reduced from 98 for speed
-                    
-                    return True
+                from .fused_filters import super_enhanced_pipeline
+                
+                img = self._load_bgr(input_path)
+                logger.info(f"Original size: {img.shape[1::-1]}")
+                
+                upscaled = super_enhanced_pipeline(img, scale)
+                logger.info(f"Super enhanced PIL upscaling completed: {upscaled.shape[1::-1]} (scale: {scale:.1f}x)")
+                
+                self._record_encode(stats, save_bgr(output_path, upscaled, profile=encoder_profile))
+                return True
                     
             except Exception as e:
                 logger.error(f"❌ Super enhanced PIL upscaling failed: {e}")
@@ -437,52 +721,24 @@ class UpscalerEngine:
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(None, process_sync)
 
-    async def _enhanced_pil_upscale(self, input_path: str, output_path: str, model: str, scale: int = 4) -> bool:
-        """Enhanced PIL upscaling - standard version"""
+    async def _enhanced_pil_upscale(self, input_path: str, output_path: str, model: str, scale: int = 4,
+                                    encoder_profile: Optional[str] = None,
+                                    stats: Optional[Dict[str, Any]] = None) -> bool:
+        """Enhanced upscaling - standard version"""
         def process_sync():
             try:
                 logger.info(f"🎨 Starting enhanced PIL upscaling: {model} at {scale}x")
                 
-                with Image.open(input_path) as img:
-                    img = img.convert('RGB')
-                    original_size = img.size
-                    logger.info(f"Original size: {original_size}")
-                    
-                    # Multi-step upscaling for better quality
-                    current_img = img
-                    current_scale = 1
-                    
-                    while current_scale < scale:
-                        next_scale = min(2, scale // current_scale)
-                        new_size = (
-                            int(current_img.width * next_scale),
-                            int(current_img.height * next_scale)
-                        )
-                        
-                        # Use LANCZOS for upscaling
-                        try:
-                            current_img = current_img.resize(new_size, Image.LANCZOS)
-                        except AttributeError:
-                            # For newer Pillow versions
-                            current_img = current_img.resize(new_size, Image.Resampling.LANCZOS)
-                        
-                        # Apply sharpening after upscaling
-                        from PIL import ImageFilter
-                        current_img = current_img.filter(ImageFilter.UnsharpMask(radius=1, percent=150, threshold=3))
-                        
-                        current_scale *= next_scale
-                        logger.info(f"Intermediate scale: {current_scale}x, size: {current_img.size}")
-                    
-                    final_size = current_img.size
-                    logger.info(f"Enhanced PIL upscaling completed: {final_size} (actual scale: {final_size[0]/original_size[0]:.1f}x)")
-                    
-                    # Save with high quality
-                    if output_path.endswith('.png'):
-                        current_img.save(output_path, "PNG", optimize=True)
-                    else:
-                        current_img.save(output_path, "JPEG", quality=95, optimize=True)
-                    
-                    return True
+                from .fused_filters import enhanced_pipeline
+                
+                img = self._load_bgr(input_path)
+                logger.info(f"Original size: {img.shape[1::-1]}")
+                
+                upscaled = enhanced_pipeline(img, scale)
+                logger.info(f"Enhanced PIL upscaling completed: {upscaled.shape[1::-1]} (scale: {scale}x)")
+                
+                self._record_encode(stats, save_bgr(output_path, upscaled, profile=encoder_profile))
+                return True
                     
             except Exception as e:
                 logger.error(f"❌ Enhanced PIL upscaling failed: {e}")
@@ -492,7 +748,9 @@ class UpscalerEngine:
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(None, process_sync)
 
-    async def _bicubic_upscale(self, input_path: str, output_path: str, model: str) -> bool:
+    async def _bicubic_upscale(self, input_path: str, output_path: str, model: str,
+                               encoder_profile: Optional[str] = None,
+                               stats: Optional[Dict[str, Any]] = None) -> bool:
         """Upscale using Bicubic algorithm"""
         def process_sync():
             try:
@@ -519,7 +777,8 @@ class UpscalerEngine:
                 upscaled = enhancer.enhance(1.1)
                 
                 # Save with good quality
-                upscaled.save(output_path, 'JPEG', quality=95, optimize=True)
+                bgr = np.asarray(upscaled)[..., ::-1]
+                self._record_encode(stats, save_bgr(output_path, bgr, profile=encoder_profile))
                 
                 logger.info("✅ Bicubic upscaling completed")
                 return True
@@ -532,6 +791,12 @@ class UpscalerEngine:
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(None, process_sync)
     
+    def get_readiness(self) -> str:
+        """'ready' while a Real-ESRGAN network is resident (or none is used), else 'cold'"""
+        if not self._check_realesrgan() or self.model_registry.get_stats()['resident_models']:
+            return 'ready'
+        return 'cold'
+    
     def get_module_info(self) -> Dict[str, Any]:
         """Get module information"""
         return {
@@ -539,5 +804,13 @@ class UpscalerEngine:
             "version": "1.0.0",
             "available_models": list(self.get_available_models().keys()),
             "total_models": len(self.available_models),
-            "realesrgan_available": self._check_realesrgan()
+            "realesrgan_available": self._check_realesrgan(),
+            "inference_backends": available_backends(),
+            "default_backend": DEFAULT_BACKEND,
+            "encoder_profiles": list(ENCODER_PROFILES),
+            "default_encoder_profile": DEFAULT_ENCODER_PROFILE,
+            "model_registry": self.model_registry.get_stats(),
+            "resident_memory": self.model_registry.get_owner_stats('upscaler'),
+            "batch_scheduler": self.scheduler.get_stats(),
+            "tile_cache": self.tile_cache.get_stats()
         }
\ No newline at end of file
@@ -0,0 +1,318 @@
+"""
+Worker Pool - Shared Module
+Supervised worker processes for heavy engine calls with hard deadlines and recycling
+"""
+
+import os
+import time
+import queue
+import signal
+import asyncio
+import logging
+import threading
+import multiprocessing
+import concurrent.futures
+from multiprocessing import reduction
+from multiprocessing.connection import Connection
+from typing import Any, Dict, Optional
+
+from .thread_budget import get_thread_budget
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv('AI_WORKER_PROCESSES', '0'))  # 0 disables the pool
+MAX_JOBS_PER_WORKER = int(os.getenv('AI_WORKER_MAX_JOBS', '50'))
+MAX_WORKER_RSS_MB = int(os.getenv('AI_WORKER_MAX_RSS_MB', '4096'))
+# Lets a dispatched job report its own deadline before the caller gives up on it
+DEADLINE_GRACE = 1.0
+
+
+class WorkerTimeoutError(TimeoutError):
+    """A job missed its deadline; its worker process was killed"""
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _worker_main(conn, targets: Dict[str, Any], threads: int) -> None:
+    """Worker loop: run (target, method, args, kwargs) jobs until the pipe closes"""
+    # Each worker gets its slice of the cores instead of all of them
+    get_thread_budget().set_total(threads)
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+
+        target_name, method_name, args, kwargs = job
+        try:
+            result = getattr(targets[target_name], method_name)(*args, **kwargs)
+            if asyncio.iscoroutine(result):
+                result = asyncio.run(result)
+            conn.send(('ok', result, current_rss_bytes()))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}", current_rss_bytes()))
+
+
+def _fork_server_main(conn, parent_end, targets: Dict[str, Any], threads: int) -> None:
+    """
+    Fork server loop: fork one worker per request and hand its pipe end back
+
+    This process is forked from the parent once, before any job has run, and
+    only ever has this one thread, so workers forked from it never inherit
+    a held lock, a running OpenMP pool or a CUDA context.
+    """
+    parent_end.close()
+    # Workers are reaped as they exit
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            return
+        if request is None:
+            return
+
+        worker_end, child_end = multiprocessing.Pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Keep only this worker's own pipe end; siblings' ends live in the parent alone
+            conn.close()
+            worker_end.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            code = 0
+            try:
+                _worker_main(child_end, targets, threads)
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+        child_end.close()
+        conn.send(pid)
+        reduction.send_handle(conn, worker_end.fileno(), os.getppid())
+        worker_end.close()
+
+
+class _Worker:
+    """One worker process, forked by the fork server, and the parent end of its pipe"""
+
+    def __init__(self, pid: int, conn):
+        self.pid = pid
+        self.conn = conn
+        self.jobs = 0
+        self.rss = 0
+
+    def is_alive(self) -> bool:
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def join(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while self.is_alive() and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def kill(self) -> None:
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.join(timeout=5)
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (OSError, BrokenPipeError):
+            pass
+        self.join(timeout=5)
+        if self.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class WorkerPool:
+    """
+    Pool of forked worker processes running engine methods
+
+    A fork server is forked from the parent after models are loaded but
+    before any job has run; it forks every worker, including replacements,
+    so workers start with the weights already in (copy-on-write) memory
+    and never inherit the parent's threads. A job that misses its deadline
+    gets its worker killed and replaced. Workers are recycled after
+    `max_jobs` jobs or once their RSS exceeds `max_rss_mb`, which contains
+    torch allocator fragmentation.
+    """
+
+    def __init__(self, targets: Dict[str, Any], size: Optional[int] = None,
+                 max_jobs: Optional[int] = None, max_rss_mb: Optional[int] = None):
+        self.size = size if size is not None else POOL_SIZE
+        self.max_jobs = max_jobs or MAX_JOBS_PER_WORKER
+        self.max_rss_bytes = (max_rss_mb or MAX_WORKER_RSS_MB) * 1024 * 1024
+        self.threads_per_worker = max(1, get_thread_budget().total // max(1, self.size))
+        ctx = multiprocessing.get_context('fork')
+        self._server_conn, server_end = ctx.Pipe()
+        self._server = ctx.Process(
+            target=_fork_server_main, args=(server_end, self._server_conn, targets, self.threads_per_worker),
+            name='worker-pool-fork-server', daemon=True
+        )
+        self._server.start()
+        server_end.close()
+        self._server_lock = threading.Lock()
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._dispatch = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.size, thread_name_prefix='worker-pool-dispatch'
+        )
+        self._lock = threading.Lock()
+        self._stats = {
+            'jobs': 0,
+            'errors': 0,
+            'timeouts': 0,
+            'crashes': 0,
+            'recycled_rss': 0,
+            'recycled_jobs': 0,
+        }
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+        logger.info(f"✅ Worker pool started with {self.size} processes")
+
+    def _spawn(self) -> _Worker:
+        """Have the fork server fork a worker and receive the parent end of its pipe"""
+        with self._server_lock:
+            self._server_conn.send('spawn')
+            pid = self._server_conn.recv()
+            fd = reduction.recv_handle(self._server_conn)
+        return _Worker(pid, Connection(fd))
+
+    @staticmethod
+    def is_supported(device: str = 'cpu') -> bool:
+        """
+        Workers inherit loaded models through fork, which is POSIX only
+
+        A CUDA context does not survive fork, so engines that run on CUDA
+        stay in-process.
+        """
+        return 'fork' in multiprocessing.get_all_start_methods() and device != 'cuda'
+
+    async def run(self, target: str, method: str, *args, timeout: float, **kwargs) -> Any:
+        """
+        Run `targets[target].method(*args, **kwargs)` in a worker with a hard deadline
+
+        The deadline starts now, so time spent waiting for a free worker counts.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(
+                    self._dispatch, self._run_blocking, target, method, args, kwargs, timeout, deadline
+                ),
+                timeout + DEADLINE_GRACE
+            )
+        except WorkerTimeoutError:
+            raise
+        except asyncio.TimeoutError:
+            # Still queued for a dispatch thread; cancelling the future drops the job
+            self._count('timeouts')
+            raise WorkerTimeoutError(f"{target}.{method} timed out after {timeout:.0f} seconds waiting for a worker")
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _run_blocking(self, target: str, method: str, args: tuple, kwargs: dict,
+                      timeout: float, deadline: float) -> Any:
+        try:
+            worker = self._idle.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            self._count('timeouts')
+            raise WorkerTimeoutError(f"{target}.{method} timed out after {timeout:.0f} seconds waiting for a worker")
+        if deadline <= time.monotonic():
+            self._idle.put(worker)
+            self._count('timeouts')
+            raise WorkerTimeoutError(f"{target}.{method} timed out after {timeout:.0f} seconds waiting for a worker")
+        try:
+            try:
+                worker.conn.send((target, method, args, kwargs))
+                if not worker.conn.poll(max(0.0, deadline - time.monotonic())):
+                    logger.warning(f"⏱️ {target}.{method} missed its {timeout:.0f}s deadline, killing worker {worker.pid}")
+                    self._count('timeouts')
+                    worker.kill()
+                    worker = self._spawn()
+                    raise WorkerTimeoutError(f"{target}.{method} timed out after {timeout:.0f} seconds")
+                status, payload, rss = worker.conn.recv()
+            except WorkerTimeoutError:
+                # A TimeoutError is an OSError; the worker was already replaced above
+                raise
+            except (EOFError, OSError) as e:
+                logger.error(f"❌ Worker {worker.pid} died running {target}.{method}: {e}")
+                self._count('crashes')
+                worker.kill()
+                worker = self._spawn()
+                raise RuntimeError(f"Worker process died while running {target}.{method}")
+
+            self._count('jobs')
+            worker.jobs += 1
+            worker.rss = rss
+            if rss > self.max_rss_bytes or worker.jobs >= self.max_jobs:
+                worker = self._recycle(worker, 'recycled_rss' if rss > self.max_rss_bytes else 'recycled_jobs')
+        finally:
+            self._idle.put(worker)
+
+        if status == 'error':
+            self._count('errors')
+            raise RuntimeError(payload)
+        return payload
+
+    def _recycle(self, worker: _Worker, reason: str) -> _Worker:
+        """Stop a worker and fork its replacement"""
+        logger.info(f"♻️ Recycling worker {worker.pid} after {worker.jobs} jobs ({worker.rss / 1024 / 1024:.0f} MB RSS)")
+        self._count(reason)
+        worker.stop()
+        return self._spawn()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                'size': self.size,
+                'max_jobs_per_worker': self.max_jobs,
+                'max_rss_mb': self.max_rss_bytes // (1024 * 1024),
+                'threads_per_worker': self.threads_per_worker,
+            }
+
+    def shutdown(self) -> None:
+        """Stop all idle workers and the fork server"""
+        self._dispatch.shutdown(wait=False)
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+        with self._server_lock:
+            try:
+                self._server_conn.send(None)
+            except (OSError, BrokenPipeError):
+                pass
+            self._server.join(timeout=5)
+            if self._server.is_alive():
+                self._server.kill()
+            self._server_conn.close()
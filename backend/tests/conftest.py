@@ -0,0 +1,28 @@
+"""
+Shared pytest setup for the backend modules
+
+Run from the backend directory: python -m pytest tests
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+class FakeModel:
+    """Stand-in for a loaded network; the registry sizes it by `resident_bytes`"""
+
+    def __init__(self, nbytes: int = 1024, name: str = 'model'):
+        self.resident_bytes = nbytes
+        self.name = name
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(1234)
@@ -0,0 +1,118 @@
+"""Tests for per-job cost estimates and memory-aware admission"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from modules import admission
+from modules.admission import AdmissionController, AdmissionRejected, JobEstimate, job_family, model_scale
+
+MB = 1024 * 1024
+
+
+def job(mb: int, seconds: float = 1.0) -> JobEstimate:
+    return JobEstimate('realesrgan', 100, 100, 4, mb * MB, seconds)
+
+
+def test_auto_is_costed_as_the_network_it_runs(monkeypatch):
+    assert job_family('upscaling', 'auto') == 'realesrgan'
+    assert job_family('upscaling', 'realesrgan_general_4x@onnx') == 'realesrgan_compact'
+    monkeypatch.setattr(admission, 'AUTO_COMPACT', True)
+    assert job_family('upscaling', 'auto') == 'realesrgan_compact'
+
+
+@pytest.mark.parametrize('operation, model, scale', [
+    ('upscaling', 'realesrgan_2x', 2),
+    ('upscaling', 'realesrgan_8x', 8),
+    ('upscaling', 'auto', 4),
+    ('background_removal', 'u2net', 1),
+    ('photo_restoration', 'gfpgan', 2),
+])
+def test_model_scale(operation, model, scale):
+    assert model_scale(operation, model) == scale
+
+
+def test_estimate_region_charges_the_full_decode(tmp_path):
+    Image = pytest.importorskip('PIL.Image')
+    path = str(tmp_path / 'in.png')
+    Image.fromarray(np.zeros((300, 400, 3), np.uint8)).save(path)
+    region = admission.estimate_region(path, 64, 32, 'auto')
+    tile_only = admission.estimate_job('realesrgan', 64, 32, 4)
+    assert region.peak_bytes == tile_only.peak_bytes + 400 * 300 * admission.DECODE_BYTES_PER_PX
+    assert (region.width, region.height) == (64, 32)
+
+
+def test_unreadable_upload_is_invalid_image(tmp_path):
+    pytest.importorskip('PIL')
+    path = tmp_path / 'in.png'
+    path.write_bytes(b'not an image')
+    with pytest.raises(admission.InvalidImage):
+        admission.read_dimensions(str(path))
+    # A ValueError subclass, so callers that already map ValueError to 400 keep working
+    assert issubclass(admission.InvalidImage, ValueError)
+
+
+def test_job_larger_than_budget_is_rejected_without_retry():
+    controller = AdmissionController(budget_bytes=100 * MB)
+    with pytest.raises(AdmissionRejected) as info:
+        controller.check(job(101))
+    # No Retry-After: the endpoint answers 413
+    assert info.value.retry_after is None
+    assert controller.get_stats()['too_large'] == 1
+
+
+def test_busy_server_rejects_with_retry_after():
+    async def scenario():
+        controller = AdmissionController(budget_bytes=100 * MB, max_wait=5)
+        async with controller.reserve(job(80, seconds=60)):
+            with pytest.raises(AdmissionRejected) as info:
+                controller.check(job(40))
+            # Retry-After: the endpoint answers 429
+            assert 55 <= info.value.retry_after <= 61
+            controller.check(job(20))
+        assert controller.reserved_bytes == 0
+
+    asyncio.run(scenario())
+
+
+def test_queued_jobs_are_admitted_in_fifo_order():
+    async def scenario():
+        controller = AdmissionController(budget_bytes=100 * MB, max_wait=5)
+        order = []
+        release = asyncio.Event()
+
+        async def run(name, estimate):
+            async with controller.reserve(estimate, name):
+                order.append(name)
+                await release.wait()
+
+        first = asyncio.ensure_future(run('first', job(70, seconds=0)))
+        await asyncio.sleep(0)
+        # 'small' would fit next to 'first' but must not overtake 'big'
+        waiting = [asyncio.ensure_future(run('big', job(60, seconds=0))),
+                   asyncio.ensure_future(run('small', job(10, seconds=0)))]
+        await asyncio.sleep(0)
+        assert order == ['first'] and controller.get_stats()['queue_length'] == 2
+        release.set()
+        await asyncio.gather(first, *waiting)
+        assert order == ['first', 'big', 'small']
+        assert controller.get_stats()['queued'] == 2 and controller.reserved_bytes == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        controller = AdmissionController(budget_bytes=100 * MB, max_wait=5)
+        async with controller.reserve(job(90, seconds=0)):
+            waiter = asyncio.ensure_future(controller.reserve(job(50, seconds=0)).__aenter__())
+            await asyncio.sleep(0)
+            assert controller.get_stats()['queue_length'] == 1
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert controller.get_stats()['queue_length'] == 0
+        assert controller.reserved_bytes == 0
+
+    asyncio.run(scenario())
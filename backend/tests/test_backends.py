@@ -0,0 +1,80 @@
+"""Tests for the pluggable Real-ESRGAN inference backends"""
+
+import os
+import types
+
+import numpy as np
+import pytest
+
+from modules.upscaler import backends
+from modules.upscaler.backends import apply_backend, split_model_id
+
+
+def test_split_model_id():
+    assert split_model_id('realesrgan_4x@onnx-int8') == ('realesrgan_4x', 'onnx-int8')
+    assert split_model_id('realesrgan_4x') == ('realesrgan_4x', backends.DEFAULT_BACKEND)
+    with pytest.raises(ValueError, match='Unknown inference backend'):
+        split_model_id('realesrgan_4x@tensorrt')
+
+
+def test_available_backends_follow_capabilities(monkeypatch):
+    installed = {'torch': True, 'onnx': False}
+    monkeypatch.setattr(backends, 'has_capability', lambda name: installed[name])
+    assert backends.available_backends() == ['eager', 'bf16', 'torchscript']
+    installed['onnx'] = True
+    assert backends.available_backends() == list(backends.BACKENDS)
+    installed['torch'] = False
+    assert backends.available_backends() == []
+
+
+def test_artifacts_are_reused_until_the_weights_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(backends, 'COMPILED_DIR', str(tmp_path))
+    artifact = backends._artifact_path('RealESRGAN_x4plus', 'onnx-int8')
+    assert artifact == os.path.join(str(tmp_path), 'RealESRGAN_x4plus.onnx-int8.onnx')
+    assert backends._artifact_path('RealESRGAN_x4plus', 'torchscript').endswith('.torchscript.pt')
+
+    weights = tmp_path / 'RealESRGAN_x4plus.pth'
+    weights.write_bytes(b'w')
+    assert not backends._is_fresh(artifact, str(weights))
+    open(artifact, 'wb').close()
+    os.utime(weights, (1_000, 1_000))
+    assert backends._is_fresh(artifact, str(weights))
+    # Newer weights on disk invalidate the export
+    os.utime(weights, (os.path.getmtime(artifact) + 10,) * 2)
+    assert not backends._is_fresh(artifact, str(weights))
+    # Without a weights file to compare against, an existing export is used
+    assert backends._is_fresh(artifact, None)
+
+
+def test_eager_leaves_the_upsampler_alone():
+    upsampler = types.SimpleNamespace(model=object())
+    model = upsampler.model
+    assert apply_backend(upsampler, 'eager', 'RealESRGAN_x4plus') is upsampler
+    assert upsampler.model is model
+
+
+def test_compiled_runners_are_shared_per_weights(monkeypatch):
+    compiled = []
+    monkeypatch.setattr(backends, '_compiled', {})
+    monkeypatch.setattr(backends, '_compile', lambda net, backend, name, path: compiled.append(name) or object())
+    first = apply_backend(types.SimpleNamespace(model='net'), 'bf16', 'RealESRGAN_x4plus')
+    second = apply_backend(types.SimpleNamespace(model='net'), 'bf16', 'RealESRGAN_x4plus')
+    assert compiled == ['RealESRGAN_x4plus']
+    assert first.model is second.model
+    assert first.backend == 'bf16'
+
+
+def test_torchscript_matches_eager(tmp_path, monkeypatch):
+    torch = pytest.importorskip('torch')
+    monkeypatch.setattr(backends, 'COMPILED_DIR', str(tmp_path))
+    monkeypatch.setattr(backends, '_compiled', {})
+
+    torch.manual_seed(0)
+    net = torch.nn.Sequential(torch.nn.Conv2d(3, 12, 3, padding=1), torch.nn.PixelShuffle(2)).eval()
+    upsampler = types.SimpleNamespace(model=net, device=torch.device('cpu'), half=False, scale=2)
+    report = backends.parity_report(upsampler, 'tiny_x2', backends=['torchscript'], tile=16, runs=1)
+    result = report['backends']['torchscript']
+    assert 'error' not in result
+    assert result['max_abs_error'] <= 1
+    assert (tmp_path / 'tiny_x2.torchscript.pt').exists()
+    assert np.isfinite(report['eager_ms'])
@@ -0,0 +1,157 @@
+"""Tests for cross-request tile batching with a stand-in network"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from modules.thread_budget import ThreadBudget
+from modules.upscaler import batch_scheduler
+from modules.upscaler.batch_scheduler import InferenceScheduler
+from modules.upscaler.tiling import upscale_tiled
+
+
+class RecordingBudget(ThreadBudget):
+    """Thread budget that remembers the lanes each forward pass ran for"""
+
+    def __init__(self):
+        super().__init__(total=8)
+        self.lanes = []
+
+    def torch_work(self, lanes=1):
+        self.lanes.append(lanes)
+        return super().torch_work(lanes)
+
+
+@pytest.fixture
+def forward_calls(monkeypatch):
+    """Replace the network with a 2x nearest upscale; records the tile count of each forward pass"""
+    calls = []
+
+    def infer_batch(upsampler, tiles, scale):
+        if upsampler == 'broken':
+            raise RuntimeError('out of memory')
+        calls.append(len(tiles))
+        return [t.repeat(scale, axis=0).repeat(scale, axis=1) for t in tiles]
+
+    monkeypatch.setattr(batch_scheduler, 'infer_batch', infer_batch)
+    return calls
+
+
+def tiles(count, shape=(4, 4, 3)):
+    return [np.full(shape, i, np.uint8) for i in range(count)]
+
+
+def test_queued_tiles_are_batched_up_to_the_limit(forward_calls):
+    scheduler = InferenceScheduler(max_batch_size=4, max_wait_ms=200, thread_budget=RecordingBudget())
+    outputs = scheduler.infer_many('model', 'net', tiles(8), 2)
+    assert forward_calls == [4, 4]
+    assert [int(o[0, 0, 0]) for o in outputs] == list(range(8))
+    assert outputs[0].shape == (8, 8, 3)
+    stats = scheduler.get_stats()
+    assert stats['batches'] == 2 and stats['batch_size_histogram'] == {4: 2}
+
+
+def test_tiles_from_concurrent_jobs_share_a_batch(forward_calls):
+    budget = RecordingBudget()
+    scheduler = InferenceScheduler(max_batch_size=8, max_wait_ms=300, thread_budget=budget)
+    barrier = threading.Barrier(3)
+    results = {}
+
+    def job(name):
+        barrier.wait()
+        results[name] = scheduler.infer_many('model', 'net', tiles(2), 2)
+
+    threads = [threading.Thread(target=job, args=(name,)) for name in 'abc']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert sorted(results) == ['a', 'b', 'c']
+    assert sum(forward_calls) == 6
+    assert len(forward_calls) < 3
+    # Each forward pass is sized for every job it carries tiles for
+    assert max(budget.lanes) >= 2
+
+
+def test_mixed_shapes_run_as_separate_groups(forward_calls):
+    scheduler = InferenceScheduler(max_batch_size=8, max_wait_ms=200, thread_budget=RecordingBudget())
+    batch = tiles(3) + tiles(2, shape=(4, 2, 3))
+    outputs = scheduler.infer_many('model', 'net', batch, 2)
+    assert sorted(forward_calls) == [2, 3]
+    assert [o.shape for o in outputs] == [(8, 8, 3)] * 3 + [(8, 4, 3)] * 2
+
+
+def test_failed_forward_pass_fails_only_its_tiles(forward_calls):
+    scheduler = InferenceScheduler(max_batch_size=8, max_wait_ms=200, thread_budget=RecordingBudget())
+    good = scheduler.submit('model', 'net', tiles(1)[0], 2)
+    bad = scheduler.submit('model', 'broken', tiles(1)[0], 2)
+    assert good.result(5).shape == (8, 8, 3)
+    with pytest.raises(RuntimeError):
+        bad.result(5)
+
+
+class FailingBudget(ThreadBudget):
+    """Thread budget whose first torch_work() fails before any forward pass"""
+
+    def __init__(self):
+        super().__init__(total=2)
+        self.failures = 1
+
+    def torch_work(self, lanes=1):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('thread pool unavailable')
+        return super().torch_work(lanes)
+
+
+def test_errors_outside_the_forward_pass_fail_the_whole_batch(forward_calls):
+    scheduler = InferenceScheduler(max_batch_size=8, max_wait_ms=200, thread_budget=FailingBudget())
+    futures = [scheduler.submit('model', 'net', tile, 2) for tile in tiles(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match='thread pool unavailable'):
+            future.result(5)
+    # The worker for the key survives and serves the next batch
+    assert scheduler.infer_many('model', 'net', tiles(2), 2)[1].shape == (8, 8, 3)
+
+
+def test_missing_outputs_fail_their_tiles(monkeypatch):
+    monkeypatch.setattr(batch_scheduler, 'infer_batch', lambda upsampler, batch, scale: [batch[0]])
+    scheduler = InferenceScheduler(max_batch_size=8, max_wait_ms=200, thread_budget=RecordingBudget())
+    first, second = [scheduler.submit('model', 'net', tile, 2) for tile in tiles(2)]
+    assert first.result(5) is not None
+    with pytest.raises(RuntimeError, match='no output'):
+        second.result(5)
+
+
+def test_models_get_separate_workers(forward_calls):
+    scheduler = InferenceScheduler(max_batch_size=8, max_wait_ms=50, thread_budget=RecordingBudget())
+    first = scheduler.submit('a', 'net', tiles(1)[0], 2)
+    second = scheduler.submit('b', 'net', tiles(1)[0], 2)
+    first.result(5), second.result(5)
+    assert forward_calls == [1, 1]
+
+
+def test_cancelled_job_stops_submitting_tiles(forward_calls, rng):
+    scheduler = InferenceScheduler(max_batch_size=4, max_wait_ms=0, thread_budget=RecordingBudget())
+    cancel = threading.Event()
+
+    def infer(batch):
+        outputs = scheduler.infer_many('model', 'net', batch, 2)
+        cancel.set()
+        return outputs
+
+    image = rng.integers(0, 256, (32, 32, 3), dtype=np.uint8)
+    with pytest.raises(TimeoutError):
+        upscale_tiled(None, image, np.zeros((64, 64, 3), np.uint8), 2, tile_size=8, tile_pad=0,
+                      infer=infer, window=4, cancel_event=cancel)
+    # The first window finished; none of the other 12 tiles reached the network
+    assert sum(forward_calls) == 4
+
+
+def test_after_fork_forgets_parent_workers(forward_calls):
+    scheduler = InferenceScheduler(max_batch_size=2, max_wait_ms=0, thread_budget=RecordingBudget())
+    scheduler.infer_many('model', 'net', tiles(1), 2)
+    scheduler._after_fork()
+    assert scheduler.get_stats()['active_models'] == 0
+    assert scheduler.infer_many('model', 'net', tiles(1), 2)[0].shape == (8, 8, 3)
@@ -0,0 +1,247 @@
+"""Tests for BackgroundRemover method selection, batching and compositing"""
+
+import sys
+import types
+
+import numpy as np
+import pytest
+
+pytest.importorskip('PIL')
+pytest.importorskip('cv2')
+
+from PIL import Image
+
+from modules import capabilities
+from modules.background_remover import bg_remover, mask_store
+from modules.background_remover.batching import MODEL_INPUTS, postprocess, preprocess
+from modules.background_remover.mask_store import MaskStore
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    """A fresh process-wide mask store on a temporary BG_MASK_STORE_DIR"""
+    fresh = MaskStore(disk_dir=tmp_path / 'masks')
+    monkeypatch.setattr(mask_store, '_store', fresh)
+    return fresh
+
+
+@pytest.fixture
+def photo(tmp_path):
+    """A dark square on a white background"""
+    pixels = np.full((48, 64, 3), 255, np.uint8)
+    pixels[12:36, 16:48] = (40, 80, 120)
+    path = tmp_path / 'photo.png'
+    Image.fromarray(pixels).save(path)
+    return str(path)
+
+
+class BrokenRembgFinder:
+    """Import hook that makes `import rembg` fail like a numba/numpy ABI mismatch"""
+
+    def find_spec(self, name, path=None, target=None):
+        if name == 'rembg' or name.startswith('rembg.'):
+            raise SystemError('numba/numpy ABI mismatch')
+        return None
+
+
+@pytest.fixture
+def broken_rembg(monkeypatch):
+    """rembg is found by the probe but raises SystemError when imported"""
+    monkeypatch.setattr(capabilities, '_probed', {'rembg': True})
+    for name in [name for name in sys.modules if name == 'rembg' or name.startswith('rembg.')]:
+        monkeypatch.delitem(sys.modules, name)
+    monkeypatch.setattr(sys, 'meta_path', [BrokenRembgFinder(), *sys.meta_path])
+
+
+def test_broken_rembg_falls_back_to_grabcut(broken_rembg, store, photo, tmp_path, monkeypatch):
+    remover = bg_remover.BackgroundRemover()
+    assert remover._select_best_method() == 'rembg'
+    grabcut = []
+    monkeypatch.setattr(remover, '_grabcut_mask',
+                        lambda img: grabcut.append(img.shape) or np.full(img.shape[:2], 255, np.uint8))
+
+    assert remover.remove_background(photo, str(tmp_path / 'out.png'), 'auto')
+    assert grabcut == [(48, 64, 3)]
+    # Disabled for the rest of the process, and the mask is stored under GrabCut
+    assert not remover.available_methods['rembg']['available']
+    assert not remover.available_methods['rembg_u2netp']['available']
+    assert remover._select_best_method() == 'grabcut'
+    assert not capabilities.has_capability('rembg')
+    assert remover.get_readiness() == 'ready'
+    assert store.get(mask_store.mask_key(photo, 'grabcut')) is not None
+    assert store.get(mask_store.mask_key(photo, 'rembg')) is None
+
+
+def test_broken_rembg_fails_over_in_compute_mask_and_batches(broken_rembg, store, photo, tmp_path, monkeypatch):
+    remover = bg_remover.BackgroundRemover()
+    monkeypatch.setattr(remover, '_grabcut_mask', lambda img: np.full(img.shape[:2], 7, np.uint8))
+    mask = remover.compute_mask(Image.open(photo).convert('RGB'), 'rembg_u2netp')
+    assert mask.shape == (48, 64) and (mask == 7).all()
+
+    remover = bg_remover.BackgroundRemover()
+    monkeypatch.setattr(remover, '_grabcut_mask', lambda img: np.full(img.shape[:2], 7, np.uint8))
+    assert not remover.available_methods['rembg']['available']
+    assert remover.remove_background_batch([(photo, str(tmp_path / 'a.png'))], 'rembg_u2netp') == [True]
+
+
+@pytest.fixture
+def fake_rembg(monkeypatch):
+    """rembg imports, but nothing may run it image by image"""
+    monkeypatch.setattr(capabilities, '_probed', {'rembg': True})
+    module = types.ModuleType('rembg')
+    module.remove = lambda *args, **kwargs: pytest.fail('batches must not call rembg.remove()')
+    monkeypatch.setitem(sys.modules, 'rembg', module)
+
+
+class FakeOrtSession:
+    """onnxruntime stand-in whose prediction is the normalised red channel"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def get_inputs(self):
+        return [types.SimpleNamespace(name='input.1')]
+
+    def run(self, outputs, feed):
+        inputs = feed['input.1']
+        self.batch_sizes.append(len(inputs))
+        return [inputs[:, :1] * 3 + 1]
+
+
+class FakeSessions:
+    def __init__(self):
+        self.inner_session = FakeOrtSession()
+        self.models = []
+
+    def get(self, model_name):
+        self.models.append(model_name)
+        return self
+
+
+def save_photo(path, box, size=(40, 56)):
+    pixels = np.full((*size, 3), 250, np.uint8)
+    top, left, bottom, right = box
+    pixels[top:bottom, left:right] = (30, 90, 160)
+    Image.fromarray(pixels).save(path)
+    return str(path)
+
+
+def expected_mask(path):
+    image = Image.open(path).convert('RGB')
+    prediction = preprocess(image, MODEL_INPUTS['u2net'])[0] * 3 + 1
+    return postprocess(prediction, image.size)
+
+
+def test_batch_orchestration(fake_rembg, store, tmp_path):
+    # Different sizes and boxes, so a mask handed to the wrong job shows
+    photos = [save_photo(tmp_path / f'in{i}.png', (4 + i, 6 + 2 * i, 30 - i, 40 + i), (40 + 4 * i, 56))
+              for i in range(4)]
+    broken = tmp_path / 'broken.png'
+    broken.write_bytes(b'not an image')
+    inputs = [photos[0], photos[1], str(broken), photos[2], photos[3]]
+    jobs = [(path, str(tmp_path / f'out{i}.png')) for i, path in enumerate(inputs)]
+    stored = np.full((44, 56), 99, np.uint8)
+    store.put(mask_store.mask_key(photos[1], 'rembg'), stored)
+
+    remover = bg_remover.BackgroundRemover()
+    remover.rembg_sessions = sessions = FakeSessions()
+    stats = {}
+    assert remover.remove_background_batch(jobs, 'rembg', batch_size=2, stats=stats) == [True, True, False, True, True]
+
+    # The stored mask skips inference; the unreadable file drops out of its batch
+    assert sessions.models == ['u2net']
+    assert sessions.inner_session.batch_sizes == [1, 2]
+    assert stats['batch']['batch_sizes'] == [1, 2] and stats['batch']['masks_cached'] == 1
+    assert not (tmp_path / 'out2.png').exists()
+
+    # Every output gets its own input's mask
+    alphas = [np.asarray(Image.open(tmp_path / f'out{i}.png').getchannel('A')) for i in (0, 1, 3, 4)]
+    np.testing.assert_array_equal(alphas[1], stored)
+    for alpha, photo in zip([alphas[0], alphas[2], alphas[3]], [photos[0], photos[2], photos[3]]):
+        np.testing.assert_array_equal(alpha, expected_mask(photo))
+    # Masks computed by the batch are stored for later requests
+    np.testing.assert_array_equal(store.get(mask_store.mask_key(photos[3], 'rembg')), expected_mask(photos[3]))
+
+
+def test_batch_honours_mask_only_and_low_res(fake_rembg, store, tmp_path, monkeypatch):
+    monkeypatch.setattr(bg_remover, 'LOWRES_MASK_SIDE', 28)
+    photo = save_photo(tmp_path / 'in.png', (6, 8, 30, 44))
+    remover = bg_remover.BackgroundRemover()
+    remover.rembg_sessions = FakeSessions()
+    assert remover.remove_background_batch([(photo, str(tmp_path / 'mask.png'))], 'rembg', low_res=True,
+                                           refine_band=True, mask_only=True) == [True]
+
+    mask = Image.open(tmp_path / 'mask.png')
+    assert (mask.mode, mask.size) == ('L', (56, 40))
+    # Computed from the low-resolution copy and lifted like the single-image path
+    image = Image.open(photo).convert('RGB')
+    small = remover._mask_input(image, True)
+    assert max(small.size) == 28
+    small_mask = postprocess(preprocess(small, MODEL_INPUTS['u2net'])[0] * 3 + 1, small.size)
+    expected = remover._lift_mask(image, small, small_mask, True)
+    np.testing.assert_array_equal(np.asarray(mask), expected)
+    # Stored under the low-resolution variant, not the full-resolution mask
+    np.testing.assert_array_equal(store.get(mask_store.mask_key(photo, f'rembg@28+band{bg_remover.REFINE_BAND_PX}')), expected)
+    assert store.get(mask_store.mask_key(photo, 'rembg')) is None
+
+
+def test_batch_of_per_image_methods_honours_mask_only(store, photo, tmp_path):
+    remover = bg_remover.BackgroundRemover()
+    assert remover.remove_background_batch([(photo, str(tmp_path / 'mask.png'))], 'threshold',
+                                           mask_only=True) == [True]
+    assert Image.open(tmp_path / 'mask.png').mode == 'L'
+
+
+def test_preview_follows_exif_orientation(fake_rembg, tmp_path):
+    path = tmp_path / 'phone.jpg'
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Rotated 90 degrees clockwise
+    Image.new('RGB', (64, 48), (200, 30, 30)).save(path, exif=exif)
+    sys.modules['rembg'].remove = lambda image, session=None, only_mask=False: Image.new('L', image.size, 255)
+    remover = bg_remover.BackgroundRemover()
+    remover.rembg_sessions = FakeSessions()
+
+    info = remover.preview_removal(str(path), str(tmp_path / 'preview.png'))
+    final = remover._load_rgb(str(path))
+    assert (info['width'], info['height']) == final.size == (48, 64)
+
+
+def rembg_postprocess(prediction, size):
+    """rembg's own post-processing of a u2net-style prediction"""
+    ma, mi = np.max(prediction), np.min(prediction)
+    pred = (prediction - mi) / (ma - mi)
+    mask = Image.fromarray((np.squeeze(pred) * 255).astype('uint8'), mode='L')
+    return np.asarray(mask.resize(size, Image.LANCZOS))
+
+
+@pytest.mark.parametrize('size', [(320, 320), (57, 91), (640, 480)])
+def test_postprocess_matches_rembg(rng, size):
+    prediction = rng.normal(0.3, 2.0, (320, 320)).astype(np.float32)
+    np.testing.assert_array_equal(postprocess(prediction, size), rembg_postprocess(prediction, size))
+
+
+def test_replace_background_reuses_the_mask_from_remove_background(store, photo, tmp_path):
+    remover = bg_remover.BackgroundRemover()
+    assert remover.remove_background(photo, str(tmp_path / 'cutout.png'), 'threshold')
+    cutout_alpha = np.asarray(Image.open(tmp_path / 'cutout.png').getchannel('A'))
+
+    result = remover.replace_background(photo, str(tmp_path / 'swap.png'), 'threshold',
+                                        background='color', color='0,255,0')
+    assert result['mask_cached'] and result['method'] == 'threshold'
+    assert (result['format'], result['width'], result['height']) == ('png', 64, 48)
+
+    original = np.asarray(Image.open(photo).convert('RGB'))
+    swapped = np.asarray(Image.open(tmp_path / 'swap.png'))
+    assert (swapped[cutout_alpha == 0] == (0, 255, 0)).all()
+    np.testing.assert_array_equal(swapped[cutout_alpha == 255], original[cutout_alpha == 255])
+
+
+def test_replace_background_rejects_unsatisfiable_outputs(store, photo, tmp_path):
+    remover = bg_remover.BackgroundRemover()
+    with pytest.raises(ValueError, match='transparent background needs PNG or WebP'):
+        remover.replace_background(photo, str(tmp_path / 'out.jpg'), 'threshold', background='transparent')
+    with pytest.raises(ValueError, match="'image' background needs a background file"):
+        remover.replace_background(photo, str(tmp_path / 'out.png'), 'threshold', background='image')
+    # Rejected before any mask work
+    assert store.get(mask_store.mask_key(photo, 'threshold')) is None
+    assert not list(tmp_path.glob('out.*'))
@@ -0,0 +1,45 @@
+"""Tests for cached optional-dependency probing"""
+
+import importlib.util
+import sys
+
+import pytest
+
+from modules import capabilities
+
+
+@pytest.fixture(autouse=True)
+def fresh_probes(monkeypatch):
+    monkeypatch.setattr(capabilities, '_modules', {})
+    monkeypatch.setattr(capabilities, '_probed', {})
+
+
+def test_probing_does_not_import():
+    assert 'this' not in sys.modules
+    assert capabilities.module_available('this')
+    assert 'this' not in sys.modules
+    assert not capabilities.module_available('surely_not_an_installed_module')
+
+
+def test_probes_are_cached(monkeypatch):
+    calls = []
+
+    def find_spec(name, *args):
+        calls.append(name)
+        return None if name == 'onnx' else object()
+
+    monkeypatch.setattr(importlib.util, 'find_spec', find_spec)
+    assert not capabilities.has_capability('onnx')
+    assert not capabilities.has_capability('onnx')
+    assert capabilities.has_capability('torch')
+    # 'onnx' stops at its first missing module; torch is probed once
+    assert calls == ['onnx', 'onnxruntime', 'torch']
+    assert capabilities.has_capability('realesrgan')
+    assert calls == ['onnx', 'onnxruntime', 'torch', 'realesrgan', 'basicsr']
+
+
+def test_get_capabilities_reports_every_capability(monkeypatch):
+    monkeypatch.setattr(capabilities, 'module_available', lambda name: name != 'gfpgan')
+    report = capabilities.get_capabilities()
+    assert set(report) == set(capabilities.CAPABILITIES)
+    assert report['gfpgan'] is False and report['realesrgan'] is True
@@ -0,0 +1,95 @@
+"""Tests for per-engine executors and the event loop lag monitor"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from modules import executors
+from modules.executors import EngineExecutor
+from modules.loop_monitor import LoopLagMonitor
+
+
+def test_jobs_beyond_size_queue_on_the_engine_executor():
+    async def scenario():
+        executor = EngineExecutor('test', 2)
+        release = threading.Event()
+        names = set()
+
+        def job():
+            names.add(threading.current_thread().name)
+            release.wait(5)
+            return 'done'
+
+        jobs = [asyncio.ensure_future(executor.run(job)) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        stats = executor.get_stats()
+        assert (stats['running'], stats['queued'], stats['size']) == (2, 3, 2)
+        release.set()
+        assert await asyncio.gather(*jobs) == ['done'] * 5
+        stats = executor.get_stats()
+        assert (stats['jobs'], stats['peak_in_flight'], stats['running'], stats['queued']) == (5, 5, 0, 0)
+        assert all(name.startswith('test-engine') for name in names)
+        executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_engine_calls_keep_the_loop_responsive():
+    async def scenario():
+        executor = EngineExecutor('test', 1)
+        blocked = asyncio.ensure_future(executor.run(time.sleep, 0.2))
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        assert time.perf_counter() - start < 0.1
+        await blocked
+        executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_errors_propagate_and_release_the_slot():
+    async def scenario():
+        executor = EngineExecutor('test', 1)
+        with pytest.raises(ZeroDivisionError):
+            await executor.run(lambda x: 1 / x, 0)
+        assert executor.get_stats()['running'] == 0
+        assert await executor.run(lambda x, y=1: x + y, 1, y=2) == 3
+        executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_get_engine_executor_is_shared_and_sized(monkeypatch):
+    monkeypatch.setattr(executors, '_executors', {})
+    monkeypatch.setitem(executors.EXECUTOR_SIZES, 'background_remover', 3)
+    executor = executors.get_engine_executor('background_remover')
+    assert executors.get_engine_executor('background_remover') is executor
+    assert executor.size == 3
+    assert executors.get_engine_executor('unknown').size == 1
+    assert set(executors.get_executor_stats()) == {'background_remover', 'unknown'}
+    for created in executors._executors.values():
+        created.shutdown()
+
+
+def test_loop_monitor_measures_a_blocked_loop():
+    async def scenario():
+        monitor = LoopLagMonitor(interval=0.01)
+        monitor.start()
+        monitor.start()  # Already running on this loop: no second probe
+        await asyncio.sleep(0.05)
+        time.sleep(0.3)  # Blocks the loop, as a synchronous engine call would
+        await asyncio.sleep(0.05)
+        monitor.stop()
+        return monitor.get_stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['samples'] >= 3 and not stats['running']
+    assert stats['max_ms'] >= 250 and stats['stalls'] == 1
+    assert stats['window_max_ms'] == stats['max_ms']
+    assert stats['p50_ms'] < 100
+
+
+def test_loop_monitor_without_samples():
+    assert LoopLagMonitor().get_stats() == {'samples': 0, 'max_ms': 0.0, 'stalls': 0, 'running': False}
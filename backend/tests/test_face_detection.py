@@ -0,0 +1,149 @@
+"""Tests for downscaled face detection and the face cache"""
+
+import numpy as np
+import pytest
+
+from modules.photo_restoration import face_detection
+from modules.photo_restoration.face_detection import FaceCache, Faces, center_face, preset_landmarks
+
+
+def make_faces(*centers):
+    boxes = np.array([[x - 5, y - 5, x + 5, y + 5, 0.99] for x, y in centers], np.float32)
+    landmarks = np.array([[[x - 2, y], [x + 2, y], [x, y + 1], [x - 1, y + 3], [x + 1, y + 3]]
+                          for x, y in centers], np.float32)
+    return Faces(boxes, landmarks)
+
+
+@pytest.fixture
+def detections(monkeypatch):
+    """(resize) of every detector run; each run finds a face near the centre and one in a corner"""
+    calls = []
+
+    def detect_faces(face_helper, img, resize=None):
+        calls.append(resize)
+        return make_faces((10, 10), (img.shape[1] / 2, img.shape[0] / 2))
+
+    monkeypatch.setattr(face_detection, 'detect_faces', detect_faces)
+    return calls
+
+
+@pytest.fixture
+def image_files(tmp_path):
+    paths = [tmp_path / name for name in ('a.jpg', 'copy_of_a.jpg', 'b.jpg')]
+    paths[0].write_bytes(b'image a')
+    paths[1].write_bytes(b'image a')
+    paths[2].write_bytes(b'image b')
+    return [str(p) for p in paths]
+
+
+def test_center_face_keeps_the_face_nearest_the_centre():
+    faces = make_faces((10, 10), (48, 52), (90, 20))
+    centre = center_face(faces, 100, 100)
+    assert len(centre) == 1
+    np.testing.assert_array_equal(centre.boxes[0, :4], [43, 47, 53, 57])
+    np.testing.assert_array_equal(centre.landmarks, faces.landmarks[1:2])
+    single = make_faces((10, 10))
+    assert center_face(single, 100, 100) is single
+
+
+def test_preset_landmarks_replaces_detection_temporarily():
+    class Helper:
+        def get_face_landmarks_5(self, *args, **kwargs):
+            return 'detector ran'
+
+    helper = Helper()
+    faces = make_faces((10, 10), (30, 30))
+    with preset_landmarks(helper, faces):
+        assert helper.get_face_landmarks_5(only_center_face=False, resize=640) == 2
+        assert len(helper.det_faces) == 2 and len(helper.all_landmarks_5) == 2
+        np.testing.assert_array_equal(helper.all_landmarks_5[1], faces.landmarks[1])
+    assert helper.get_face_landmarks_5() == 'detector ran'
+
+
+def test_lookup_caches_by_content_not_path(detections, image_files):
+    cache = FaceCache()
+    img = np.zeros((64, 80, 3), np.uint8)
+    first = cache.lookup(image_files[0], img, None)
+    second = cache.lookup(image_files[1], img, None)
+    assert not first['cached'] and second['cached']
+    cache.lookup(image_files[2], img, None)
+    assert detections == [None, None]
+    assert cache.get_stats()['hits'] == 1
+
+
+def test_only_center_face_is_applied_after_the_cache(detections, image_files):
+    cache = FaceCache()
+    img = np.zeros((64, 80, 3), np.uint8)
+    centre = cache.lookup(image_files[0], img, None, only_center_face=True)
+    assert len(centre['faces']) == 1
+    np.testing.assert_array_equal(centre['faces'].boxes[0, :2], [35, 27])
+    # The same entry answers a request for every face
+    every = cache.lookup(image_files[0], img, None)
+    assert every['cached'] and len(every['faces']) == 2
+    assert detections == [None]
+
+
+def test_resize_is_part_of_the_key(detections, image_files):
+    cache = FaceCache()
+    img = np.zeros((64, 80, 3), np.uint8)
+    cache.lookup(image_files[0], img, None)
+    assert not cache.lookup(image_files[0], img, None, resize=640)['cached']
+    assert cache.lookup(image_files[0], img, None, resize=640)['cached']
+    assert detections == [None, 640]
+
+
+def test_face_cache_is_an_lru():
+    cache = FaceCache(max_entries=2)
+    faces = make_faces((10, 10))
+    cache.put('a', faces)
+    cache.put('b', faces)
+    assert cache.get('a') is faces
+    cache.put('c', faces)
+    assert cache.get('b') is None
+    assert cache.get('a') is faces and cache.get('c') is faces
+    stats = cache.get_stats()
+    assert (stats['entries'], stats['hits'], stats['misses'], stats['hit_ratio']) == (2, 3, 1, 0.75)
+
+
+class FakeRetinaFace:
+    """Finds one face at fixed coordinates of whatever image it is given, and records that image's size"""
+
+    def __init__(self, detections):
+        self.detections = detections
+        self.sizes = []
+
+    def detect_faces(self, img, conf_threshold):
+        self.sizes.append(img.shape[:2])
+        return self.detections
+
+
+def helper_with(detections):
+    return type('FaceHelper', (), {'face_det': FakeRetinaFace(detections)})()
+
+
+def test_detect_faces_maps_boxes_back_to_full_resolution():
+    pytest.importorskip('cv2')
+    pytest.importorskip('torch')
+    # Box, score and landmarks (eyes 20 px apart) in the detector's coordinates
+    detection = [10, 20, 50, 60, 0.99, 20, 30, 40, 30, 30, 40, 22, 50, 38, 50]
+    helper = helper_with(np.array([detection], np.float32))
+    faces = face_detection.detect_faces(helper, np.zeros((400, 800, 3), np.uint8), side=200)
+    assert helper.face_det.sizes == [(100, 200)]
+    np.testing.assert_allclose(faces.boxes, [[40, 80, 200, 240, 0.99]])
+    np.testing.assert_allclose(faces.landmarks[0, :2], [[80, 120], [160, 120]])
+
+    # resize enlarges small images the way get_face_landmarks_5(resize=...) does
+    helper = helper_with(np.array([detection], np.float32))
+    face_detection.detect_faces(helper, np.zeros((100, 150, 3), np.uint8), resize=200)
+    assert helper.face_det.sizes == [(200, 300)]
+
+
+def test_detect_faces_drops_tiny_faces():
+    pytest.importorskip('cv2')
+    pytest.importorskip('torch')
+    # Eyes 1 px apart in the detector's copy: 4 px at full resolution, under the threshold
+    detection = [10, 20, 12, 22, 0.99, 20, 30, 21, 30, 20, 31, 20, 32, 21, 32]
+    helper = helper_with(np.array([detection], np.float32))
+    faces = face_detection.detect_faces(helper, np.zeros((400, 800, 3), np.uint8), side=200)
+    assert len(faces) == 0
+    assert len(face_detection.detect_faces(helper_with(None), np.zeros((10, 10, 3), np.uint8))) == 0
@@ -0,0 +1,148 @@
+"""Tests for the fused OpenCV post-processing chains"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('cv2')
+pytest.importorskip('PIL')
+
+import cv2  # noqa: E402
+from PIL import Image, ImageEnhance, ImageFilter  # noqa: E402
+
+from modules.upscaler import fused_filters  # noqa: E402
+from modules.upscaler.fused_filters import apply_in_place, contrast, sharpness, unsharp  # noqa: E402
+
+
+def photo_like(rng, height=96, width=64):
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([127 + 90 * np.sin(x / 9.0), 127 + 90 * np.cos(y / 7.0), 127 + 60 * np.sin((x + y) / 5.0)], -1)
+    return np.clip(base + rng.normal(0, 8, base.shape), 0, 255).astype(np.uint8)
+
+
+def test_luminance_mean_rounds_like_pil():
+    bgr = np.empty((4, 4, 3), np.uint8)
+    bgr[...] = (10, 20, 30)
+    assert fused_filters.luminance_mean(bgr) == 22.0
+
+
+def test_contrast_stretches_around_the_mean():
+    image = np.array([[[100, 100, 100], [200, 200, 200]]], np.uint8)
+    apply_in_place(image, [contrast(2.0)], mean=150.0)
+    np.testing.assert_array_equal(image[0, :, 0], [50, 250])
+
+
+def test_results_are_clipped_to_8_bit():
+    image = np.array([[[0, 0, 0], [255, 255, 255]]], np.uint8)
+    apply_in_place(image, [contrast(3.0)], mean=128.0)
+    np.testing.assert_array_equal(image[0, :, 0], [0, 255])
+
+
+def test_strips_match_a_whole_image_pass(rng):
+    image = photo_like(rng)
+    ops = [unsharp(radius=1, percent=200, threshold=0), sharpness(2.0), contrast(1.3),
+           unsharp(radius=2, percent=250, threshold=0)]
+    mean = fused_filters.luminance_mean(image)
+    whole = apply_in_place(image.copy(), ops, mean, strip_rows=len(image))
+    strips = apply_in_place(image.copy(), ops, mean, strip_rows=16)
+    # The halo covers the kernels' significant taps; only far-tail weights may differ
+    assert np.abs(whole.astype(np.int16) - strips).max() <= 2
+
+
+def test_apply_in_place_returns_the_same_buffer(rng):
+    image = photo_like(rng, 20, 20)
+    assert apply_in_place(image, [unsharp(1, 150, 3)], mean=0.0) is image
+
+
+@pytest.mark.parametrize('pipeline', [
+    fused_filters.lanczos_pipeline, fused_filters.super_enhanced_pipeline, fused_filters.enhanced_pipeline
+])
+@pytest.mark.parametrize('scale', [2, 4])
+def test_pipelines_return_the_scaled_image(rng, pipeline, scale):
+    image = photo_like(rng, 24, 32)
+    output = pipeline(image, scale)
+    assert output.shape == (24 * scale, 32 * scale, 3)
+    assert output.dtype == np.uint8
+
+
+def test_halo_grows_with_the_chain():
+    assert fused_filters._halo([contrast(1.2)]) == 0
+    # PIL's radius-2 blur is three 1.375-px boxes per axis; a Gaussian reaches 3 sigma
+    assert fused_filters._halo([unsharp(2, 100, 0)]) == 6
+    assert fused_filters._halo([unsharp(2, 100, 0, pil_blur=False)]) == 7
+    assert fused_filters._halo([unsharp(2, 100, 0), sharpness(2.0)]) == 7
+
+
+
+def legacy_lanczos(img, scale):
+    """UpscalerEngine._lanczos_upscale's original PIL chain"""
+    size = img.size
+    if scale > 2:
+        img = img.resize((size[0] * 2, size[1] * 2), Image.Resampling.LANCZOS)
+    img = img.resize((size[0] * scale, size[1] * scale), Image.Resampling.LANCZOS)
+    img = img.filter(ImageFilter.UnsharpMask(radius=1, percent=200, threshold=0))
+    img = ImageEnhance.Sharpness(img).enhance(2.0)
+    img = ImageEnhance.Contrast(img).enhance(1.3)
+    return img.filter(ImageFilter.UnsharpMask(radius=2, percent=250, threshold=0))
+
+
+def legacy_super_enhanced(img, scale):
+    """UpscalerEngine._super_enhanced_pil_upscale's original PIL chain"""
+    img = Image.fromarray(cv2.bilateralFilter(np.array(img), 5, 50, 50))
+    size = img.size
+    if scale > 2:
+        img = img.resize((size[0] * 2, size[1] * 2), Image.Resampling.LANCZOS)
+        img = img.filter(ImageFilter.UnsharpMask(radius=1, percent=120, threshold=2))
+    img = img.resize((size[0] * scale, size[1] * scale), Image.Resampling.LANCZOS)
+    img = img.filter(ImageFilter.UnsharpMask(radius=2, percent=130, threshold=2))
+    return ImageEnhance.Contrast(img).enhance(1.15)
+
+
+def legacy_enhanced(img, scale):
+    """UpscalerEngine._enhanced_pil_upscale's original PIL chain"""
+    current_scale = 1
+    while current_scale < scale:
+        next_scale = min(2, scale // current_scale)
+        img = img.resize((img.width * next_scale, img.height * next_scale), Image.Resampling.LANCZOS)
+        img = img.filter(ImageFilter.UnsharpMask(radius=1, percent=150, threshold=3))
+        current_scale *= next_scale
+    return img
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+@pytest.mark.parametrize('legacy, pipeline', [
+    (legacy_lanczos, fused_filters.lanczos_pipeline),
+    (legacy_enhanced, fused_filters.enhanced_pipeline),
+    (legacy_super_enhanced, fused_filters.super_enhanced_pipeline),
+])
+@pytest.mark.parametrize('scale', [2, 4])
+def test_pipelines_match_the_legacy_pil_chains(rng, legacy, pipeline, scale):
+    # Softened like a camera image; per-pixel noise is the lanczos chain's worst case
+    rgb = cv2.GaussianBlur(photo_like(rng, 96, 128), (0, 0), 0.8)
+    reference = np.asarray(legacy(Image.fromarray(rgb), scale))
+    result = pipeline(np.ascontiguousarray(rgb[..., ::-1]), scale)[..., ::-1]
+    assert psnr(reference, result) >= (50.0 if legacy is legacy_lanczos else 40.0)
+
+
+def test_pil_blur_emulation_matches_gaussian_blur(rng):
+    rgb = cv2.GaussianBlur(photo_like(rng), (0, 0), 0.8)
+    reference = np.asarray(Image.fromarray(rgb).filter(ImageFilter.GaussianBlur(1)))
+    np.testing.assert_array_equal(fused_filters._pil_gaussian_blur(rgb.astype(np.float32), 1), reference)
+    reference = np.asarray(Image.fromarray(rgb).filter(ImageFilter.GaussianBlur(2)))
+    blurred = fused_filters._pil_gaussian_blur(rgb.astype(np.float32), 2)
+    assert np.abs(blurred - reference).max() <= 1
+    assert np.mean(blurred != reference) < 0.1
+
+
+@pytest.mark.parametrize('op, pil_filter', [
+    (sharpness(2.0), lambda img: ImageEnhance.Sharpness(img).enhance(2.0)),
+    (contrast(1.3), lambda img: ImageEnhance.Contrast(img).enhance(1.3)),
+])
+def test_blend_stages_match_pil_exactly(rng, op, pil_filter):
+    rgb = photo_like(rng)
+    reference = np.asarray(pil_filter(Image.fromarray(rgb)))
+    result = apply_in_place(rgb.copy(), [op], mean=fused_filters.luminance_mean(rgb[..., ::-1]))
+    np.testing.assert_array_equal(result, reference)
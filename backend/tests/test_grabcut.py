@@ -0,0 +1,39 @@
+"""Tests for coarse-to-fine GrabCut"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('PIL')
+
+from modules.background_remover import grabcut
+from modules.background_remover.mask_refine import mask_iou
+
+
+def test_foreground_keeps_sure_and_probable_foreground():
+    mask = np.array([[0, 1, 2, 3]], np.uint8)  # GC_BGD, GC_FGD, GC_PR_BGD, GC_PR_FGD
+    np.testing.assert_array_equal(grabcut._foreground(mask), [[0, 1, 0, 1]])
+
+
+def test_band_tiles_cover_only_tiles_with_band_pixels(monkeypatch):
+    monkeypatch.setattr(grabcut, 'GRABCUT_TILE', 10)
+    band = np.zeros((25, 32), bool)
+    band[3, 4] = band[21, 31] = True
+    assert grabcut._band_tiles(band) == [(0, 0, 10, 10), (20, 30, 25, 32)]
+
+
+def test_pyramid_grabcut_segments_a_centred_object(rng, monkeypatch):
+    pytest.importorskip('cv2')
+    monkeypatch.setattr(grabcut, 'GRABCUT_COARSE_SIDE', 128)
+    height, width = 480, 400
+    y, x = np.mgrid[:height, :width]
+    truth = ((y - 240) / 150) ** 2 + ((x - 200) / 120) ** 2 <= 1
+    img = rng.integers(0, 40, (height, width, 3)).astype(np.uint8)
+    img[..., 1] += 120  # Noisy green background
+    img[truth] = rng.integers(0, 40, (np.count_nonzero(truth), 3)).astype(np.uint8) + [20, 20, 200]
+
+    mask, stats = grabcut.pyramid_grabcut(img)
+    assert mask.shape == (height, width) and set(np.unique(mask)) <= {0, 255}
+    assert mask_iou(mask, truth.astype(np.uint8) * 255) > 0.95
+    assert stats['levels'] == 3
+    assert 1 <= stats['coarse_iterations'] <= grabcut.GRABCUT_MAX_ITERATIONS
+    assert stats['refined_tiles'] > 0
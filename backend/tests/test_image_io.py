@@ -0,0 +1,211 @@
+"""Tests for the upscaler's disk-backed buffers and streamed encoders"""
+
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from modules.upscaler import image_io
+
+
+def decode_png(path) -> np.ndarray:
+    """Minimal decoder for the 8-bit RGB PNGs write_png_streamed produces (all five filters)"""
+    data = open(path, 'rb').read()
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    pos, idat = 8, b''
+    while pos < len(data):
+        length, = struct.unpack('>I', data[pos:pos + 4])
+        tag, body = data[pos + 4:pos + 8], data[pos + 8:pos + 8 + length]
+        crc, = struct.unpack('>I', data[pos + 8 + length:pos + 12 + length])
+        assert crc == zlib.crc32(tag + body) & 0xffffffff
+        if tag == b'IHDR':
+            width, height = struct.unpack('>II', body[:8])
+        elif tag == b'IDAT':
+            idat += body
+        pos += 12 + length
+
+    raw = zlib.decompress(idat)
+    stride = width * 3
+    previous = np.zeros(stride, np.int32)
+    rows = []
+    for y in range(height):
+        start = y * (stride + 1)
+        filter_type = raw[start]
+        line = np.frombuffer(raw[start + 1:start + 1 + stride], np.uint8).astype(np.int32)
+        current = np.zeros(stride, np.int32)
+        for x in range(stride):
+            a = current[x - 3] if x >= 3 else 0
+            b = previous[x]
+            c = previous[x - 3] if x >= 3 else 0
+            if filter_type == 0:
+                predictor = 0
+            elif filter_type == 1:
+                predictor = a
+            elif filter_type == 2:
+                predictor = b
+            elif filter_type == 3:
+                predictor = (a + b) // 2
+            else:
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                predictor = a if pa <= pb and pa <= pc else (b if pb <= pc else c)
+            current[x] = (line[x] + predictor) & 255
+        rows.append(current)
+        previous = current
+    return np.array(rows, np.uint8).reshape(height, width, 3)
+
+
+def test_output_buffer_stays_in_ram_when_small(tmp_path):
+    with image_io.output_buffer((4, 4, 3), str(tmp_path / 'out.png')) as buffer:
+        assert not isinstance(buffer, np.memmap)
+        assert buffer.shape == (4, 4, 3) and buffer.dtype == np.uint8
+
+
+def test_output_buffer_maps_large_outputs_next_to_output(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_io, 'OUT_OF_CORE_THRESHOLD_MB', 0)
+    with image_io.output_buffer((8, 8, 3), str(tmp_path / 'out.png')) as buffer:
+        assert isinstance(buffer, np.memmap)
+        assert [p.suffix for p in tmp_path.iterdir()] == ['.raw']
+        buffer[:] = 7
+    # The temp file is removed on exit
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_write_png_streamed_round_trips(rng, tmp_path):
+    image = rng.integers(0, 256, (37, 11, 3), dtype=np.uint8)
+    path = tmp_path / 'out.png'
+    image_io.write_png_streamed(str(path), image, compress_level=1, rows_per_band=8)
+    np.testing.assert_array_equal(decode_png(path), image[..., ::-1])
+
+
+def test_write_png_streamed_reads_from_memmap(rng, tmp_path):
+    image = np.memmap(tmp_path / 'in.raw', dtype=np.uint8, mode='w+', shape=(20, 9, 3))
+    image[:] = rng.integers(0, 256, (20, 9, 3), dtype=np.uint8)
+    path = tmp_path / 'out.png'
+    image_io.write_png_streamed(str(path), image, rows_per_band=7)
+    np.testing.assert_array_equal(decode_png(path), np.asarray(image)[..., ::-1])
+
+
+def test_resize_banded_matches_a_whole_image_resize(rng):
+    cv2 = pytest.importorskip('cv2')
+    src = rng.integers(0, 256, (37, 21, 3), dtype=np.uint8)
+    dst = np.empty((74, 42, 3), np.uint8)
+    image_io.resize_banded(src, dst, 2, rows=16)
+    whole = cv2.resize(src, (42, 74), interpolation=cv2.INTER_LANCZOS4)
+    assert np.abs(dst.astype(np.int16) - whole).max() <= 1
+
+
+def test_adaptive_filter_round_trips_with_every_filter(rng, tmp_path):
+    # Noise, horizontal and vertical gradients and flat areas favour different filters
+    image = rng.integers(0, 256, (48, 40, 3), dtype=np.uint8)
+    image[:16] = np.arange(40, dtype=np.uint8)[None, :, None] * 3
+    image[16:32] = np.arange(16, dtype=np.uint8)[:, None, None] * 5
+    image[32:40] = 200
+    path = tmp_path / 'out.png'
+    image_io.write_png_streamed(str(path), image, adaptive_filter=True, rows_per_band=8)
+    np.testing.assert_array_equal(decode_png(path), image[..., ::-1])
+
+    rows = np.ascontiguousarray(image[..., ::-1]).reshape(48, -1)
+    above = np.vstack([np.zeros((1, rows.shape[1]), np.uint8), rows[:-1]])
+    assert len(set(image_io._adaptive_filter(rows, above)[:, 0])) > 1
+
+
+def test_adaptive_filter_beats_up_on_horizontal_ramps(rng, tmp_path):
+    # Ramps with random row offsets: "Up" leaves noise, "Sub" leaves constants
+    offsets = rng.integers(0, 256, (64, 1, 1))
+    image = ((offsets + np.arange(128)[None, :, None] * 2) % 256).repeat(3, axis=2).astype(np.uint8)
+    up, adaptive = tmp_path / 'up.png', tmp_path / 'adaptive.png'
+    image_io.write_png_streamed(str(up), image, compress_level=9)
+    image_io.write_png_streamed(str(adaptive), image, compress_level=9, adaptive_filter=True)
+    assert adaptive.stat().st_size < up.stat().st_size
+
+
+def test_get_encoder_profile(monkeypatch):
+    assert image_io.get_encoder_profile('fast').png_compress_level == 1
+    assert image_io.get_encoder_profile('smallest').png_adaptive_filter
+    monkeypatch.setattr(image_io, 'DEFAULT_ENCODER_PROFILE', 'fast')
+    assert image_io.get_encoder_profile() is image_io.ENCODER_PROFILES['fast']
+    with pytest.raises(ValueError, match='Unknown encoder profile'):
+        image_io.get_encoder_profile('tiny')
+
+
+def recording(calls, name, save):
+    def record(path, bgr, ext, jpeg_quality, settings):
+        calls.append((name, ext))
+        save(path, bgr, ext, jpeg_quality, settings)
+    return record
+
+
+@pytest.mark.parametrize('ext', ['.jpg', '.webp'])
+def test_fast_profile_encodes_with_cv2(rng, tmp_path, monkeypatch, ext):
+    pytest.importorskip('cv2')
+    calls = []
+    monkeypatch.setattr(image_io, '_save_cv2', recording(calls, 'cv2', image_io._save_cv2))
+    monkeypatch.setattr(image_io, '_save_pil', recording(calls, 'pil', image_io._save_pil))
+    path = tmp_path / f'out{ext}'
+    image_io.save_bgr(str(path), rng.integers(0, 256, (16, 24, 3), dtype=np.uint8), profile='fast')
+    assert calls == [('cv2', ext)] and path.stat().st_size > 0
+
+
+def test_smallest_profile_uses_pil_only_for_webp_method_6(rng, tmp_path, monkeypatch):
+    pytest.importorskip('cv2')
+    Image = pytest.importorskip('PIL.Image')
+    calls, saves = [], []
+    pil_save = Image.Image.save
+
+    def record_save(img, path, fmt, **params):
+        saves.append((fmt, params))
+        pil_save(img, path, fmt, **params)
+
+    monkeypatch.setattr(Image.Image, 'save', record_save)
+    monkeypatch.setattr(image_io, '_save_cv2', recording(calls, 'cv2', image_io._save_cv2))
+    monkeypatch.setattr(image_io, '_save_pil', recording(calls, 'pil', image_io._save_pil))
+    image = rng.integers(0, 256, (16, 24, 3), dtype=np.uint8)
+    for ext in ('.jpg', '.webp'):
+        image_io.save_bgr(str(tmp_path / f'out{ext}'), image, profile='smallest')
+        assert (tmp_path / f'out{ext}').stat().st_size > 0
+    # cv2 sets optimize and progressive itself, straight from the buffer
+    assert calls == [('cv2', '.jpg'), ('pil', '.webp')]
+    assert saves == [('WEBP', {'quality': 95, 'method': 6})]
+
+
+def test_smallest_jpeg_is_progressive(rng, tmp_path):
+    pytest.importorskip('cv2')
+    Image = pytest.importorskip('PIL.Image')
+    path = tmp_path / 'out.jpg'
+    image_io.save_bgr(str(path), rng.integers(0, 256, (16, 24, 3), dtype=np.uint8), profile='smallest')
+    with Image.open(path) as saved:
+        assert saved.info.get('progressive') or saved.info.get('progression')
+
+
+def test_pil_path_falls_back_to_cv2_above_the_out_of_core_threshold(rng, tmp_path, monkeypatch):
+    pytest.importorskip('cv2')
+    calls = []
+    monkeypatch.setattr(image_io, 'OUT_OF_CORE_THRESHOLD_MB', 0)
+    monkeypatch.setattr(image_io, '_save_cv2', recording(calls, 'cv2', image_io._save_cv2))
+    monkeypatch.setattr(image_io, '_save_pil', recording(calls, 'pil', image_io._save_pil))
+    image = rng.integers(0, 256, (16, 24, 3), dtype=np.uint8)
+    for ext in ('.jpg', '.webp'):
+        image_io.save_bgr(str(tmp_path / f'out{ext}'), image, profile='smallest')
+    # No RGB copy of an output this large
+    assert calls == [('cv2', '.jpg'), ('cv2', '.webp')]
+
+
+@pytest.mark.parametrize('ext, image_format', [
+    ('.bmp', 'BMP'), ('.tiff', 'TIFF'), ('.webp', 'WEBP'), ('.jpeg', 'JPEG'),
+])
+def test_save_pil_writes_the_format_of_the_extension(rng, tmp_path, ext, image_format):
+    Image = pytest.importorskip('PIL.Image')
+    path = tmp_path / f'out{ext}'
+    image = rng.integers(0, 256, (16, 24, 3), dtype=np.uint8)
+    image_io._save_pil(str(path), image, ext, 95, image_io.get_encoder_profile('smallest'))
+    with Image.open(path) as saved:
+        assert saved.format == image_format and saved.size == (24, 16)
+
+
+def test_save_pil_rejects_unknown_extensions(tmp_path):
+    pytest.importorskip('PIL')
+    with pytest.raises(ValueError, match='Cannot write .xyz'):
+        image_io._save_pil(str(tmp_path / 'out.xyz'), np.zeros((2, 2, 3), np.uint8), '.xyz', 95,
+                           image_io.get_encoder_profile())
@@ -0,0 +1,83 @@
+"""Tests for guided-filter mask upsampling and boundary refinement"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('PIL')
+
+from modules.background_remover import mask_refine
+
+
+def box_filter_reference(a, radius):
+    height, width = a.shape
+    out = np.empty_like(a, dtype=np.float64)
+    for y in range(height):
+        for x in range(width):
+            out[y, x] = a[max(0, y - radius):y + radius + 1, max(0, x - radius):x + radius + 1].mean()
+    return out
+
+
+def disc(height, width, cy, cx, r):
+    y, x = np.mgrid[:height, :width]
+    return (((y - cy) ** 2 + (x - cx) ** 2) <= r * r).astype(np.float32)
+
+
+def test_box_filter_clips_its_window_at_borders(rng):
+    a = rng.random((13, 9)).astype(np.float32)
+    np.testing.assert_allclose(mask_refine.box_filter(a, 2), box_filter_reference(a, 2), atol=1e-5)
+
+
+def test_resize_bilinear(rng):
+    a = rng.random((7, 5)).astype(np.float32)
+    np.testing.assert_allclose(mask_refine.resize_bilinear(a, 7, 5), a, atol=1e-6)
+    np.testing.assert_allclose(mask_refine.resize_bilinear(np.full((4, 4), 0.3, np.float32), 17, 9), 0.3, atol=1e-6)
+    cv2 = pytest.importorskip('cv2')
+    np.testing.assert_allclose(mask_refine.resize_bilinear(a, 28, 20),
+                               cv2.resize(a, (20, 28), interpolation=cv2.INTER_LINEAR), atol=1e-4)
+
+
+def test_guided_upsample_follows_full_resolution_edges():
+    # A disc whose outline falls between low-resolution pixels
+    guide_full = disc(128, 128, 61.5, 66.3, 37.7) * 0.8 + 0.1
+    truth = guide_full > 0.5
+    guide_small = mask_refine.resize_bilinear(guide_full, 32, 32)
+    mask_small = (guide_small > 0.5).astype(np.float32)
+
+    alpha = mask_refine.guided_upsample(mask_small, guide_small, guide_full, radius=2, eps=1e-4)
+    assert alpha.shape == (128, 128) and alpha.min() >= 0 and alpha.max() <= 1
+    bilinear = mask_refine.resize_bilinear(mask_small, 128, 128)
+    guided_errors = np.count_nonzero((alpha > 0.5) != truth)
+    bilinear_errors = np.count_nonzero((bilinear > 0.5) != truth)
+    assert guided_errors < bilinear_errors / 2
+
+
+def test_boundary_band_surrounds_the_outline():
+    alpha = disc(64, 64, 32, 32, 15)
+    band = mask_refine.boundary_band(alpha, 3)
+    assert band[32, 32 - 15] and band[32, 32 + 15]
+    assert not band[32, 32] and not band[0, 0]
+
+
+def test_refine_boundary_filters_only_the_band(monkeypatch, rng):
+    monkeypatch.setattr(mask_refine, 'REFINE_TILE', 16)
+    alpha = np.clip(disc(80, 72, 30, 40, 20) + rng.normal(0, 0.05, (80, 72)), 0, 1).astype(np.float32)
+    guide = disc(80, 72, 30.4, 39.6, 20.3) * 0.7 + 0.2
+    refined = mask_refine.refine_boundary(alpha, guide, band_width=4, radius=2, eps=1e-3)
+
+    band = mask_refine.boundary_band(alpha, 4)
+    # Padded tiles give exactly what one whole-image filter gives inside the band
+    whole = np.clip(mask_refine.guided_filter(guide, alpha, 2, 1e-3), 0, 1)
+    np.testing.assert_allclose(refined[band], whole[band], atol=1e-4)
+    np.testing.assert_array_equal(refined[~band], alpha[~band])
+
+
+def test_mask_iou():
+    a = np.zeros((4, 4), np.uint8)
+    b = np.zeros((4, 4), np.uint8)
+    assert mask_refine.mask_iou(a, b) == 1.0
+    a[:2] = 255
+    b[1:3] = 200
+    assert mask_refine.mask_iou(a, b) == pytest.approx(4 / 12)
+    region = np.zeros((4, 4), bool)
+    region[1] = True
+    assert mask_refine.mask_iou(a, b, region) == 1.0
@@ -0,0 +1,112 @@
+"""Tests for content-addressed mask storage and background compositing"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('PIL')
+
+from modules.background_remover import compositing
+from modules.background_remover.mask_store import MaskStore, mask_key
+
+
+def test_mask_key_follows_content_and_variant(tmp_path):
+    a, b, c = tmp_path / 'a.jpg', tmp_path / 'b.jpg', tmp_path / 'c.jpg'
+    a.write_bytes(b'same bytes')
+    b.write_bytes(b'same bytes')
+    c.write_bytes(b'other bytes')
+    assert mask_key(str(a), 'u2net') == mask_key(str(b), 'u2net')
+    assert mask_key(str(a), 'u2net') != mask_key(str(c), 'u2net')
+    assert mask_key(str(a), 'u2net') != mask_key(str(a), 'u2netp')
+    assert mask_key(str(a), 'u2net') != mask_key(str(a), 'u2net-lowres')
+
+
+def test_memory_tier_is_an_lru_by_bytes(rng):
+    store = MaskStore(max_bytes=250, disk_dir=None)
+    masks = {key: rng.integers(0, 256, (10, 10), dtype=np.uint8) for key in 'abc'}
+    store.put('a', masks['a'])
+    store.put('b', masks['b'])
+    assert store.get('a') is not None  # 'b' is now least recently used
+    store.put('c', masks['c'])
+    assert store.get('b') is None
+    np.testing.assert_array_equal(store.get('a'), masks['a'])
+    np.testing.assert_array_equal(store.get('c'), masks['c'])
+    stats = store.get_stats()
+    assert (stats['masks'], stats['bytes'], stats['evictions']) == (2, 200, 1)
+    assert (stats['hits'], stats['misses']) == (3, 1)
+    # Stored masks are shared between requests, so they are read-only
+    with pytest.raises(ValueError):
+        store.get('a')[0, 0] = 1
+
+
+def test_masks_over_the_memory_budget_are_not_kept(rng):
+    store = MaskStore(max_bytes=50, disk_dir=None)
+    store.put('big', rng.integers(0, 256, (10, 10), dtype=np.uint8))
+    assert store.get('big') is None and store.get_stats()['bytes'] == 0
+
+
+def test_disk_tier_is_shared_between_stores(rng, tmp_path):
+    mask = rng.integers(0, 256, (12, 7), dtype=np.uint8)
+    MaskStore(disk_dir=tmp_path).put('ab12', mask)
+    assert (tmp_path / 'ab' / 'ab12.png').exists()
+
+    # Another process (a pool worker, or the server after a restart) finds it
+    other = MaskStore(disk_dir=tmp_path)
+    np.testing.assert_array_equal(other.get('ab12'), mask)
+    assert other.get_stats()['disk_hits'] == 1
+    assert other.get('ab12') is not None and other.get_stats()['disk_hits'] == 1
+
+
+def test_unreadable_disk_masks_are_dropped(tmp_path):
+    store = MaskStore(disk_dir=tmp_path)
+    path = tmp_path / 'cd' / 'cd34.png'
+    path.parent.mkdir()
+    path.write_bytes(b'truncated')
+    assert store.get('cd34') is None
+    assert not path.exists()
+
+
+def test_disk_tier_prunes_least_recently_used(rng, tmp_path):
+    store = MaskStore(max_bytes=0, disk_dir=tmp_path, disk_max_bytes=1)
+    for i in range(32):
+        store.put(f"{i:04d}", rng.integers(0, 256, (8, 8), dtype=np.uint8))
+    # The 32nd write checks the budget and prunes everything over it
+    assert store._disk_files() == []
+
+
+def test_blend_rounds_like_float_compositing(rng):
+    foreground = rng.integers(0, 256, (16, 16, 3), dtype=np.uint8)
+    background = rng.integers(0, 256, (16, 16, 3), dtype=np.uint8)
+    alpha = rng.integers(0, 256, (16, 16), dtype=np.uint8)
+    alpha[0, :2] = [0, 255]
+    a = alpha[..., None] / 255
+    expected = np.round(foreground * a + background * (1 - a)).astype(np.uint8)
+    out = compositing.blend(foreground, background, alpha)
+    np.testing.assert_array_equal(out, expected)
+    np.testing.assert_array_equal(out[0, 0], background[0, 0])
+    np.testing.assert_array_equal(out[0, 1], foreground[0, 1])
+
+
+def test_blend_over_a_colour():
+    foreground = np.full((1, 3, 3), 255, np.uint8)
+    alpha = np.array([[0, 128, 255]], np.uint8)
+    out = compositing.blend(foreground, (0, 10, 255), alpha)
+    np.testing.assert_array_equal(out[0], [[0, 10, 255], [128, 133, 255], [255, 255, 255]])
+
+
+@pytest.mark.parametrize('value, rgb', [('#FF8000', (255, 128, 0)), ('00ff7f', (0, 255, 127)), (' 1, 2,3 ', (1, 2, 3))])
+def test_parse_color(value, rgb):
+    assert compositing.parse_color(value) == rgb
+
+
+@pytest.mark.parametrize('value', ['#FFF', 'red', '1,2', '1,2,256', '-1,2,3'])
+def test_parse_color_rejects(value):
+    with pytest.raises(ValueError, match='Invalid color'):
+        compositing.parse_color(value)
+
+
+def test_output_format():
+    assert compositing.output_format('out/x.JPG') == 'JPEG'
+    assert compositing.output_format('x.webp') == 'WEBP'
+    for path in ('x.gif', 'noext'):
+        with pytest.raises(ValueError, match='Unsupported output format'):
+            compositing.output_format(path)
@@ -0,0 +1,145 @@
+"""Tests for the shared model registry: LRU eviction, leases, holds and fork accounting"""
+
+import threading
+
+from conftest import FakeModel
+from modules.model_registry import ModelKey, ModelRegistry, estimate_model_bytes
+
+
+def key(name: str, scale: int = 4) -> ModelKey:
+    return ModelKey(f'RRDBNet/{name}', scale, 'fp32', 'cpu')
+
+
+def loader(nbytes: int, calls: list = None):
+    def load():
+        if calls is not None:
+            calls.append(nbytes)
+        return FakeModel(nbytes)
+    return load
+
+
+def test_lease_loads_once_and_hits_afterwards():
+    registry = ModelRegistry(memory_budget_bytes=10_000, idle_timeout=0)
+    calls = []
+    with registry.lease(key('a'), loader(100, calls)) as first:
+        pass
+    with registry.lease(key('a'), loader(100, calls)) as second:
+        pass
+    assert first is second
+    assert calls == [100]
+    stats = registry.get_stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+    assert stats['resident_bytes'] == 100
+
+
+def test_lru_eviction_keeps_recently_used_models():
+    registry = ModelRegistry(memory_budget_bytes=250, idle_timeout=0)
+    for name in ('a', 'b'):
+        with registry.lease(key(name), loader(100)):
+            pass
+    # Touch 'a' so 'b' is the least recently used
+    with registry.lease(key('a'), loader(100)):
+        pass
+    with registry.lease(key('c'), loader(100)):
+        pass
+    resident = {m['architecture'] for m in registry.get_stats()['models']}
+    assert resident == {'RRDBNet/a', 'RRDBNet/c'}
+    assert registry.get_stats()['evictions'] == 1
+
+
+def test_leased_models_are_never_evicted():
+    registry = ModelRegistry(memory_budget_bytes=150, idle_timeout=0)
+    with registry.lease(key('a'), loader(100)) as pinned:
+        with registry.lease(key('b'), loader(100)):
+            pass
+        stats = registry.get_stats()
+        # Over budget rather than unloading a model in use
+        assert stats['resident_models'] == 2
+        assert stats['evictions'] == 0
+    assert pinned.resident_bytes == 100
+
+
+def test_concurrent_misses_load_a_key_once():
+    registry = ModelRegistry(memory_budget_bytes=10_000, idle_timeout=0)
+    calls = []
+    gate = threading.Event()
+
+    def slow_load():
+        gate.wait(5)
+        calls.append(1)
+        return FakeModel(10)
+
+    results = []
+
+    def worker():
+        with registry.lease(key('a'), slow_load) as model:
+            results.append(model)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert calls == [1]
+    assert len({id(m) for m in results}) == 1
+
+
+def test_hold_pins_until_release():
+    registry = ModelRegistry(memory_budget_bytes=150, idle_timeout=0)
+    held = registry.hold(key('a'), loader(100), owner='photo_restoration')
+    with registry.lease(key('b'), loader(100)):
+        pass
+    assert registry.get_stats()['resident_models'] == 2
+
+    registry.release(key('a'), owner='photo_restoration')
+    # Releasing twice, or for an owner that holds nothing, is a no-op
+    registry.release(key('a'), owner='photo_restoration')
+    registry.release(key('a'), owner='upscaler')
+    with registry.lease(key('c'), loader(100)):
+        pass
+    resident = {m['architecture'] for m in registry.get_stats()['models']}
+    assert 'RRDBNet/a' not in resident
+    assert held.resident_bytes == 100
+
+
+def test_after_fork_keeps_only_held_references():
+    registry = ModelRegistry(memory_budget_bytes=10_000, idle_timeout=0)
+    registry.hold(key('a'), loader(100), owner='photo_restoration')
+    lease = registry.lease(key('a'), loader(100))
+    lease.__enter__()
+    assert registry.get_stats()['models'][0]['in_use'] == 2
+
+    # A child inherits the parent's counters but none of its threads
+    registry._after_fork()
+    assert registry.get_stats()['models'][0]['in_use'] == 1
+    registry.release(key('a'), owner='photo_restoration')
+    assert registry.get_stats()['models'][0]['in_use'] == 0
+
+
+def test_owner_stats_count_shared_models_once_per_owner():
+    registry = ModelRegistry(memory_budget_bytes=10_000, idle_timeout=0)
+    with registry.lease(key('a'), loader(100), owner='upscaler'):
+        pass
+    registry.hold(key('a'), loader(100), owner='photo_restoration')
+    with registry.lease(key('b'), loader(50), owner='upscaler'):
+        pass
+
+    assert registry.get_owner_stats('upscaler') == {'models': 2, 'bytes': 150, 'shared_bytes': 100}
+    assert registry.get_owner_stats('photo_restoration') == {'models': 1, 'bytes': 100, 'shared_bytes': 100}
+    assert registry.get_stats()['shared_saving_bytes'] == 100
+
+
+def test_sweep_idle_unloads_unused_models():
+    registry = ModelRegistry(memory_budget_bytes=10_000, idle_timeout=0.01)
+    registry._ensure_reaper = lambda: None
+    with registry.lease(key('a'), loader(100)):
+        pass
+    threading.Event().wait(0.05)
+    assert registry.sweep_idle() == 1
+    assert registry.get_stats()['resident_models'] == 0
+
+
+def test_estimate_model_bytes_prefers_reported_footprint():
+    assert estimate_model_bytes(FakeModel(123)) == 123
+    assert estimate_model_bytes(object()) == 0
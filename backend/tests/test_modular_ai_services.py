@@ -0,0 +1,225 @@
+"""Tests for ModularAIOrchestrator routing, with stand-in engines"""
+
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip('PIL')
+
+from modular_ai_services import OUTPUT_FORMATS, ModularAIOrchestrator  # noqa: E402
+from modules.loop_monitor import LoopLagMonitor  # noqa: E402
+from modules.thread_budget import ThreadBudget  # noqa: E402
+
+
+class FakeUpscaler:
+    available_models = {'lanczos_4x': {'scale': 4}, 'lanczos_2x': {'scale': 2}}
+
+    def __init__(self, preview_error=None):
+        self.calls = []
+        self.preview_error = preview_error
+
+    def preview_upscale(self, image_path, preview_path, scale):
+        if self.preview_error:
+            raise self.preview_error
+        self.calls.append(('preview', preview_path, scale))
+        return {'scale': scale}
+
+    async def upscale_image(self, input_path, output_path, model, denoise_strength=None, stats=None,
+                            encoder_profile=None):
+        self.calls.append(('full', output_path, model))
+        stats['encode_seconds'] = 0.01
+        return True
+
+
+class FakeBackgroundRemover:
+    def __init__(self):
+        self.batches = []
+        self.options = []
+
+    async def remove_background_batch_async(self, jobs, method, batch_size, stats=None, low_res=False,
+                                            refine_band=False, mask_only=False):
+        self.batches.append(list(jobs))
+        self.options.append({'low_res': low_res, 'refine_band': refine_band, 'mask_only': mask_only})
+        stats['batch'] = {'size': len(jobs)}
+        return [True] * len(jobs)
+
+
+def make_orchestrator(**modules):
+    """An orchestrator around the given engines, without loading the real ones"""
+    orchestrator = ModularAIOrchestrator.__new__(ModularAIOrchestrator)
+    orchestrator.modules = modules
+    orchestrator.worker_pool = None
+    orchestrator.thread_budget = ThreadBudget(total=2)
+    orchestrator.loop_monitor = LoopLagMonitor(interval=60)
+    orchestrator._warmed_modules = set()
+    return orchestrator
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # Outputs go to ./processed
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_output_extension_defaults_and_validation():
+    orchestrator = make_orchestrator()
+    assert orchestrator._output_extension('upscaling', {}) == OUTPUT_FORMATS['upscaling'][0]
+    assert orchestrator._output_extension('upscaling', {'output_format': '.PNG'}) == 'png'
+    assert orchestrator._output_extension('background_removal', {}) == 'png'
+    with pytest.raises(ValueError, match='cannot write'):
+        orchestrator._output_extension('background_removal', {'output_format': 'jpg'})
+
+
+def test_progressive_upscale_sends_the_preview_first():
+    upscaler = FakeUpscaler()
+    orchestrator = make_orchestrator(upscaler=upscaler)
+    previews = []
+
+    async def on_preview(result):
+        previews.append((result, list(upscaler.calls)))
+
+    result = asyncio.run(orchestrator.process_image(
+        'photo.png', 'upscaling', 'lanczos_2x', json.dumps({'output_format': 'png'}), on_preview=on_preview
+    ))
+    assert result['status'] == 'success'
+    assert result['output_path'] == 'processed/upscaled_lanczos_2x_photo.png'
+    assert result['metadata']['preview_time'] is not None
+    assert result['metadata']['encode_time'] == 0.01
+    preview, calls_at_preview = previews[0]
+    assert preview['status'] == 'preview' and preview['metadata'] == {'scale': 2}
+    # The full-quality job had not started when the preview went out
+    assert [call[0] for call in calls_at_preview] == ['preview']
+
+
+def test_failed_preview_only_skips_the_first_phase():
+    orchestrator = make_orchestrator(upscaler=FakeUpscaler(preview_error=OSError('disk full')))
+    previews = []
+
+    async def on_preview(result):
+        previews.append(result)
+
+    result = asyncio.run(orchestrator.process_image('photo.png', 'upscaling', None, on_preview=on_preview))
+    assert result['status'] == 'success'
+    assert result['metadata']['preview_time'] is None
+    assert previews == []
+
+
+def test_unsupported_output_format_is_an_error():
+    result = asyncio.run(make_orchestrator(upscaler=FakeUpscaler()).process_image(
+        'photo.png', 'upscaling', None, json.dumps({'output_format': 'tiff'})
+    ))
+    assert result['status'] == 'error' and 'tiff' in result['error']
+
+
+def test_batch_background_removal_honours_output_format():
+    remover = FakeBackgroundRemover()
+    orchestrator = make_orchestrator(background_remover=remover)
+    results = asyncio.run(orchestrator.process_batch(
+        ['a.jpg', 'b.jpg'], 'background_removal', 'u2net', json.dumps({'output_format': 'webp'})
+    ))
+    assert [r['output_path'] for r in results] == [
+        'processed/bg_removed_u2net_a.webp', 'processed/bg_removed_u2net_b.webp'
+    ]
+    assert remover.batches == [[('a.jpg', results[0]['output_path']), ('b.jpg', results[1]['output_path'])]]
+    assert results[0]['metadata']['batch'] == {'size': 2}
+
+
+def test_batch_background_removal_passes_mask_options_through():
+    remover = FakeBackgroundRemover()
+    options = {'mask_only': True, 'low_res': True, 'refine_band': True}
+    results = asyncio.run(make_orchestrator(background_remover=remover).process_batch(
+        ['a.jpg', 'b.jpg'], 'background_removal', None, json.dumps(options)
+    ))
+    assert remover.options == [options]
+    assert [r['output_path'] for r in results] == ['processed/mask_auto_a.png', 'processed/mask_auto_b.png']
+    assert all(r['metadata'][name] for r in results for name in options)
+
+
+def test_batch_with_unsupported_output_format_fails_every_image():
+    remover = FakeBackgroundRemover()
+    results = asyncio.run(make_orchestrator(background_remover=remover).process_batch(
+        ['a.jpg', 'b.jpg'], 'background_removal', None, json.dumps({'output_format': 'jpg'})
+    ))
+    assert [r['status'] for r in results] == ['error', 'error']
+    assert remover.batches == []
+
+
+def test_batches_of_other_operations_run_image_by_image():
+    upscaler = FakeUpscaler()
+    results = asyncio.run(make_orchestrator(upscaler=upscaler).process_batch(['a.png', 'b.png'], 'upscaling'))
+    assert [r['status'] for r in results] == ['success', 'success']
+    assert [call[1] for call in upscaler.calls] == ['processed/upscaled_auto_a.jpg', 'processed/upscaled_auto_b.jpg']
+
+
+class WarmingModule:
+    """Engine stand-in whose warm-up either starts or is not offered"""
+
+    def __init__(self, state='cold', warms=True):
+        self.state = state
+        self.warms = warms
+        self.loaded_before_fork = False
+        self.warmups = 0
+
+    def get_readiness(self):
+        return self.state
+
+    def start_warmup(self):
+        self.warmups += 1
+        return self.warms
+
+    def load_before_fork(self):
+        self.loaded_before_fork = True
+        return self.warms
+
+
+def test_only_warmed_modules_gate_readiness():
+    restoration, remover = WarmingModule('warming'), WarmingModule('cold', warms=False)
+    orchestrator = make_orchestrator(photo_restoration=restoration, background_remover=remover)
+    orchestrator.start_warmup()
+    assert orchestrator._warmed_modules == {'photo_restoration'}
+    assert orchestrator.get_readiness() == {
+        'ready': False, 'failed': [],
+        'modules': {'photo_restoration': 'warming', 'background_remover': 'cold'},
+    }
+    # The lazily loaded remover stays cold without holding readiness back
+    restoration.state = 'ready'
+    assert orchestrator.get_readiness()['ready']
+
+
+def test_failed_warmup_is_not_ready():
+    orchestrator = make_orchestrator(photo_restoration=WarmingModule('failed'))
+    orchestrator.start_warmup()
+    readiness = orchestrator.get_readiness()
+    assert not readiness['ready'] and readiness['failed'] == ['photo_restoration']
+
+
+def test_no_modules_is_not_ready():
+    assert not make_orchestrator().get_readiness()['ready']
+
+
+def test_worker_pool_forks_after_loading_warmed_models(monkeypatch):
+    import modular_ai_services
+
+    class FakePool:
+        def __init__(self, targets, size):
+            # Every model a worker should inherit is loaded by now
+            assert all(module.loaded_before_fork for module in targets.values())
+            self.size = size
+
+        @staticmethod
+        def is_supported(device):
+            return True
+
+    monkeypatch.setattr(modular_ai_services, 'POOL_SIZE', 2)
+    monkeypatch.setattr(modular_ai_services, 'WorkerPool', FakePool)
+    restoration, remover = WarmingModule('ready'), WarmingModule('cold', warms=False)
+    orchestrator = make_orchestrator(photo_restoration=restoration, background_remover=remover)
+    monkeypatch.setattr(orchestrator, '_engine_device', lambda: 'cpu')
+    orchestrator._start_worker_pool()
+    assert orchestrator.worker_pool.size == 2
+    assert orchestrator._warmed_modules == {'photo_restoration'}
+    # Workers already have the models; no background warm-up in the parent
+    orchestrator.start_warmup()
+    assert restoration.warmups == remover.warmups == 0
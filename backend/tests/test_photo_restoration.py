@@ -0,0 +1,144 @@
+"""Tests for PhotoRestorationEngine's shared background upsampler and its locking"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('PIL')
+
+from conftest import FakeModel  # noqa: E402
+from modules.model_registry import ModelKey, ModelRegistry  # noqa: E402
+from modules.photo_restoration.face_detection import Faces  # noqa: E402
+from modules.photo_restoration.photo_restoration_engine import PhotoRestorationEngine  # noqa: E402
+from modules.upscaler import upscaler_engine  # noqa: E402
+from modules.upscaler.upscaler_engine import tiled_copy  # noqa: E402
+
+X2_KEY = ModelKey('RRDBNet/RealESRGAN_x2plus', 2, 'fp32', 'cpu')
+
+
+class FakeUpsampler(FakeModel):
+    """RealESRGANer stand-in that records the tiling each enhance() ran with"""
+
+    def __init__(self, nbytes=1000):
+        super().__init__(nbytes)
+        self.tile_size, self.tile_pad = 0, 10
+        self.calls = []
+
+    def enhance(self, img, outscale):
+        self.calls.append((self.tile_size, self.tile_pad))
+        return img.repeat(outscale, axis=0).repeat(outscale, axis=1), None
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    engine = PhotoRestorationEngine()
+    engine.model_registry = ModelRegistry(memory_budget_bytes=10_000, idle_timeout=0)
+    monkeypatch.setattr(upscaler_engine, 'realesrgan_model_spec', lambda scale, backend: (X2_KEY, FakeUpsampler))
+    monkeypatch.setattr(engine, '_bg_tile_config', lambda: (256, 16))
+    return engine
+
+
+def test_tiled_copy_shares_the_network_but_not_tiling():
+    shared = FakeUpsampler()
+    shared.model = object()
+    wrapper = tiled_copy(shared, 128, 8)
+    assert wrapper.model is shared.model
+    assert (wrapper.tile_size, wrapper.tile_pad) == (128, 8)
+    assert (shared.tile_size, shared.tile_pad) == (0, 10)
+
+
+def test_model_key_leaves_out_per_call_tiling():
+    assert ModelKey._fields == ('architecture', 'scale', 'precision', 'device', 'backend')
+
+
+def test_background_upsampler_shares_the_upscalers_weights(engine):
+    engine._init_background_upsampler()
+    with engine.model_registry.lease(X2_KEY, FakeUpsampler, owner='upscaler') as shared:
+        assert engine.bg_upsampler is not shared
+        assert engine.bg_upsampler.resident_bytes == shared.resident_bytes
+    stats = engine.model_registry.get_stats()
+    assert (stats['misses'], stats['resident_bytes']) == (1, 1000)
+    assert engine.model_registry.get_owner_stats('photo_restoration') == {
+        'models': 1, 'bytes': 1000, 'shared_bytes': 1000,
+    }
+    # Held for the engine's lifetime: an idle sweep cannot unload it
+    engine.model_registry.sweep_idle()
+    assert engine.model_registry.get_stats()['resident_bytes'] == 1000
+
+
+class LockCheckingGFPGAN:
+    """GFPGANer stand-in that asserts it only runs under the engine's lock"""
+
+    upscale = 2
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.face_helper = type('FaceHelper', (), {})()
+        self.calls = 0
+
+    def enhance(self, img, **kwargs):
+        assert self.engine._gfpgan_lock.locked()
+        assert self.face_helper.get_face_landmarks_5() == 1
+        self.calls += 1
+        return None, None, img.repeat(2, axis=0).repeat(2, axis=1)
+
+
+class LockCheckingFaceCache:
+    def __init__(self, engine, faces):
+        self.engine = engine
+        self.faces = faces
+        self.locked = []
+
+    def lookup(self, image_path, img, face_helper, only_center_face=False, resize=None):
+        # RetinaFace keeps per-call state on the shared face_helper
+        self.locked.append(self.engine._gfpgan_lock.locked())
+        return {'faces': self.faces, 'cached': False, 'time': 0.0}
+
+
+def one_face():
+    return Faces(np.array([[2, 2, 6, 6, 0.99]], np.float32), np.zeros((1, 5, 2), np.float32))
+
+
+def no_faces():
+    return Faces(np.zeros((0, 5), np.float32), np.zeros((0, 5, 2), np.float32))
+
+
+@pytest.mark.parametrize('faces', [one_face(), no_faces()], ids=['face', 'no-face'])
+def test_restore_detects_and_enhances_under_the_lock(engine, rng, faces):
+    pytest.importorskip('cv2')
+    engine._init_background_upsampler()
+    engine.gfpgan_model = LockCheckingGFPGAN(engine)
+    engine.face_cache = LockCheckingFaceCache(engine, faces)
+    image = rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)
+
+    restored, info = engine._restore('photo.png', image)
+    assert restored.shape == (16, 16, 3)
+    assert engine.face_cache.locked == [True]
+    assert info['faces_found'] == len(faces) and info['gfpgan_skipped'] == (len(faces) == 0)
+    assert engine.gfpgan_model.calls == len(faces)
+    # Without faces the background upsampler runs directly, with this request's tiling
+    assert engine.bg_upsampler.calls == ([] if len(faces) else [(256, 16)])
+    assert not engine._gfpgan_lock.locked()
+
+
+class RecordingGFPGAN:
+    """GFPGANer stand-in that records how each enhance() was called"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.calls = []
+
+    def enhance(self, img, has_aligned=False, only_center_face=False, paste_back=True):
+        assert self.engine._gfpgan_lock.locked()
+        self.calls.append((img.shape, has_aligned, paste_back))
+        return [], [], img if paste_back else None
+
+
+def test_warm_up_runs_the_gfpgan_generator(engine, monkeypatch):
+    monkeypatch.setattr(engine, 'ensure_loaded', lambda: None)
+    engine.gfpgan_model = RecordingGFPGAN(engine)
+
+    engine.warm_up()
+    assert engine.get_readiness() == 'ready'
+    # The synthetic photo has no faces, so an aligned crop reaches the generator
+    assert engine.gfpgan_model.calls == [((256, 256, 3), False, True), ((512, 512, 3), True, False)]
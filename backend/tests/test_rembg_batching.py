@@ -0,0 +1,76 @@
+"""Tests for batched rembg inference"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip('PIL')
+
+from modules.background_remover import batching
+from modules.background_remover.batching import BatchRunner, adaptive_batch_size, chunks
+
+MB = 1024 * 1024
+
+
+class FakeOrtSession:
+    """onnxruntime session stand-in returning each input's mean as a (1, H, W) map"""
+
+    def __init__(self, max_batch=None):
+        self.max_batch = max_batch
+        self.batch_sizes = []
+
+    def get_inputs(self):
+        return [SimpleNamespace(name='input.1')]
+
+    def run(self, outputs, feeds):
+        inputs = feeds['input.1']
+        if self.max_batch is not None and len(inputs) > self.max_batch:
+            raise RuntimeError('Got invalid dimensions for input: input.1 index: 0')
+        self.batch_sizes.append(len(inputs))
+        return [inputs.mean(axis=1, keepdims=True)]
+
+
+def test_adaptive_batch_size_fits_available_memory(monkeypatch):
+    monkeypatch.setattr(batching, 'available_memory', lambda: 2000 * MB)
+    # 1000 MB for the batch at 60 MB of activations + 16 B/px (1 MP = ~15 MB) per image
+    assert adaptive_batch_size('u2netp', 1_000_000, limit=100) == 13
+    assert adaptive_batch_size('u2netp', 1_000_000, limit=8) == 8
+    assert adaptive_batch_size('isnet-general-use', 1_000_000) == 1
+    monkeypatch.setattr(batching, 'available_memory', lambda: 0)
+    assert adaptive_batch_size('u2net', 1_000_000) == 1
+
+
+def test_batch_runner_runs_a_batch_in_one_call(rng):
+    ort = FakeOrtSession()
+    inputs = rng.random((3, 3, 8, 8)).astype(np.float32)
+    maps = BatchRunner().run(SimpleNamespace(inner_session=ort), 'u2net', inputs)
+    np.testing.assert_allclose(maps, inputs.mean(axis=1), rtol=1e-6)
+    assert ort.batch_sizes == [3]
+
+
+def test_fixed_batch_models_fall_back_to_single_images(rng):
+    ort = FakeOrtSession(max_batch=1)
+    runner = BatchRunner()
+    session = SimpleNamespace(inner_session=ort)
+    inputs = rng.random((3, 3, 8, 8)).astype(np.float32)
+    np.testing.assert_allclose(runner.run(session, 'silueta', inputs), inputs.mean(axis=1), rtol=1e-6)
+    assert runner.get_stats()['unbatchable_models'] == ['silueta']
+    # Remembered: the next batch is not tried as a whole again
+    runner.run(session, 'silueta', inputs[:2])
+    assert ort.batch_sizes == [1, 1, 1, 1, 1]
+
+
+def test_chunks():
+    assert chunks(list(range(7)), 3) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert chunks([], 4) == []
+
+
+def test_preprocess_normalises_like_rembg():
+    from PIL import Image
+    image = Image.fromarray(np.full((40, 60, 3), 100, np.uint8))
+    spec = batching.MODEL_INPUTS['u2net']
+    tensor = batching.preprocess(image, spec)
+    assert tensor.shape == (3, 320, 320) and tensor.dtype == np.float32
+    expected = (1.0 - np.asarray(spec.mean)) / np.asarray(spec.std)
+    np.testing.assert_allclose(tensor[:, 0, 0], expected, rtol=1e-5)
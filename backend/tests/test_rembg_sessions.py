@@ -0,0 +1,77 @@
+"""Tests for the shared rembg session pool"""
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('PIL')
+
+from modules.background_remover import sessions
+from modules.thread_budget import ThreadBudget
+
+
+@pytest.fixture
+def created(monkeypatch):
+    """Sessions built by the pool, as (model, threads) pairs; loads take 200 ms"""
+    calls = []
+
+    def new_session(model_name, threads):
+        calls.append((model_name, threads))
+        time.sleep(0.2)
+        return object()
+
+    monkeypatch.setattr(sessions, '_new_session', new_session)
+    return calls
+
+
+def use_threads(monkeypatch, total):
+    monkeypatch.setattr(sessions, 'get_thread_budget', lambda: ThreadBudget(total=total))
+
+
+def test_unknown_model_is_rejected(created):
+    with pytest.raises(ValueError, match='Unknown rembg model'):
+        sessions.RembgSessionPool().get('u3net')
+    assert created == []
+
+
+def test_sessions_are_shared_per_model_and_thread_share(created, monkeypatch):
+    pool = sessions.RembgSessionPool()
+    use_threads(monkeypatch, 6)
+    first = pool.get('u2net')
+    assert pool.get('u2net') is first
+    assert pool.get('u2netp') is not first
+    # 6 and 5 threads both round down to a 4-thread session
+    use_threads(monkeypatch, 5)
+    assert pool.get('u2net') is first
+    use_threads(monkeypatch, 2)
+    assert pool.get('u2net') is not first
+    assert created == [('u2net', 4), ('u2netp', 4), ('u2net', 2)]
+    assert pool.get_stats() == {'sessions': ['u2net@2', 'u2net@4', 'u2netp@4']}
+
+
+def test_concurrent_first_use_creates_one_session(created, monkeypatch):
+    use_threads(monkeypatch, 4)
+    pool = sessions.RembgSessionPool()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pool.get('silueta'))) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert created == [('silueta', 4)]
+    assert len({id(s) for s in results}) == 1
+
+
+def test_loading_one_model_does_not_block_another(created, monkeypatch):
+    use_threads(monkeypatch, 4)
+    pool = sessions.RembgSessionPool()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=pool.get, args=(name,)) for name in ('u2net', 'u2netp', 'silueta')]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # Three 200 ms loads overlap instead of queueing behind one lock
+    assert time.perf_counter() - start < 0.45
+    assert sorted(created) == [('silueta', 4), ('u2net', 4), ('u2netp', 4)]
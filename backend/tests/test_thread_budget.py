@@ -0,0 +1,117 @@
+"""Tests for the CPU thread budget shared by torch and onnxruntime jobs"""
+
+import sys
+import threading
+import types
+
+import pytest
+
+from modules.thread_budget import ThreadBudget, session_threads
+
+
+@pytest.fixture
+def fake_torch(monkeypatch):
+    """A torch module that records set_num_threads() calls"""
+    torch = types.SimpleNamespace(calls=[])
+    torch.set_num_threads = torch.calls.append
+    monkeypatch.setitem(sys.modules, 'torch', torch)
+    return torch
+
+
+def test_shares_shrink_and_grow_with_running_jobs():
+    budget = ThreadBudget(total=8)
+    assert budget.threads() == 8
+    with budget.lane('a'):
+        with budget.lane('b'):
+            assert budget.threads() == 4
+            # A batch carrying tiles of both jobs gets both shares
+            assert budget.threads(lanes=2) == 8
+            with budget.lane('c'), budget.lane('d'):
+                assert budget.threads() == 2
+        assert budget.threads() == 8
+    assert budget.get_stats()['peak_lanes'] == 4
+
+
+def test_share_never_drops_below_one_thread():
+    budget = ThreadBudget(total=2)
+    with budget.lane('a'), budget.lane('b'), budget.lane('c'):
+        assert budget.threads() == 1
+
+
+def test_apply_records_the_share_per_thread():
+    budget = ThreadBudget(total=8)
+    with budget.lane('a'), budget.lane('b'):
+        assert budget.apply() == 4
+        assert budget.current() == 4
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(budget.current()))
+        thread.start()
+        thread.join()
+        # Other threads have applied nothing yet and get the live share
+        assert seen == [4]
+
+
+def test_torch_work_sizes_the_pool_once_per_change(fake_torch):
+    budget = ThreadBudget(total=8)
+    with budget.lane('a'), budget.lane('b'):
+        with budget.torch_work() as threads:
+            assert threads == 4
+        with budget.torch_work():
+            pass
+    with budget.torch_work():
+        pass
+    assert fake_torch.calls == [4, 8]
+
+
+def test_torch_work_runs_one_unit_at_a_time_at_the_queued_share(fake_torch):
+    budget = ThreadBudget(total=8)
+    entered, release, finished = threading.Event(), threading.Event(), threading.Event()
+    started = threading.Barrier(4)
+    shares = []
+
+    def job(name, first):
+        with budget.lane(name):
+            started.wait(5)
+            if not first:
+                entered.wait(5)
+            with budget.torch_work() as threads:
+                shares.append((name, threads))
+                if first:
+                    entered.set()
+                    release.wait(5)
+            if first:
+                # Stay a running job (e.g. encoding) while the others take their turns
+                finished.wait(5)
+
+    lanes = [threading.Thread(target=job, args=(name, name == 'a')) for name in 'abcd']
+    for thread in lanes:
+        thread.start()
+    entered.wait(5)
+    # Let the others queue behind the holder before it finishes
+    threading.Event().wait(0.2)
+    release.set()
+    for thread in lanes[1:]:
+        thread.join(5)
+    finished.set()
+    lanes[0].join(5)
+
+    assert [name for name, _ in shares][0] == 'a'
+    assert shares[0][1] == 2
+    # The second unit picks up its own share plus the two lanes still queued behind it
+    assert shares[1][1] == 6
+    assert budget._torch_waiting == 0
+
+
+def test_set_total_and_fork_reset():
+    budget = ThreadBudget(total=8)
+    budget.set_total(2)
+    assert budget.threads() == 2
+    with budget.lane('parent-job'):
+        budget._after_fork()
+        assert budget.get_stats()['active_jobs'] == 0
+        assert budget.get_stats()['torch_threads'] is None
+
+
+@pytest.mark.parametrize('threads, expected', [(1, 1), (3, 2), (4, 4), (7, 4), (16, 16), (0, 1)])
+def test_session_threads_round_down_to_powers_of_two(threads, expected):
+    assert session_threads(threads) == expected
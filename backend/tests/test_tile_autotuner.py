@@ -0,0 +1,100 @@
+"""Tests for the tile autotuner's profile handling and benchmark loop"""
+
+import json
+
+import numpy as np
+import pytest
+
+from modules.upscaler import tile_autotuner, tiling
+
+
+@pytest.fixture
+def profile_path(tmp_path, monkeypatch):
+    path = tmp_path / 'tile_profile.json'
+    monkeypatch.setattr(tile_autotuner, 'PROFILE_PATH', str(path))
+    monkeypatch.setattr(tile_autotuner, '_cached_profile', None)
+    return path
+
+
+def write_profile(path, networks, host=None):
+    path.write_text(json.dumps({'host': host or tile_autotuner.host_fingerprint(), 'networks': networks}))
+
+
+def test_defaults_without_a_profile(profile_path):
+    assert tile_autotuner.get_tile_config('RRDBNet-b23-x4') == (
+        tile_autotuner.DEFAULT_TILE, tile_autotuner.DEFAULT_TILE_PAD
+    )
+
+
+def test_profile_is_read_once_until_reloaded(profile_path):
+    write_profile(profile_path, {'RRDBNet-b23-x4': {'tile': 192, 'tile_pad': 8, 'max_tile': 384}})
+    assert tile_autotuner.get_tile_config('RRDBNet-b23-x4') == (192, 8)
+
+    write_profile(profile_path, {'RRDBNet-b23-x4': {'tile': 384, 'tile_pad': 16, 'max_tile': 512}})
+    # Requests keep the in-memory copy; no file read per call
+    assert tile_autotuner.get_tile_config('RRDBNet-b23-x4') == (192, 8)
+    tile_autotuner.reload_profile()
+    assert tile_autotuner.get_tile_config('RRDBNet-b23-x4') == (384, 16)
+    assert tile_autotuner.max_tile_size('RRDBNet-b23-x4') == 512
+
+
+def test_profile_from_another_host_is_ignored(profile_path):
+    write_profile(profile_path, {'RRDBNet-b23-x4': {'tile': 128, 'tile_pad': 8, 'max_tile': 128}},
+                  host='some-other-host')
+    assert tile_autotuner.load_profile() == {}
+
+
+def test_corrupt_profile_is_ignored(profile_path):
+    profile_path.write_text('{not json')
+    assert tile_autotuner.load_profile() == {}
+
+
+def test_max_tile_size_shrinks_with_batch_size(profile_path):
+    single = tile_autotuner.max_tile_size('RRDBNet-b23-x4', batch_size=1)
+    batched = tile_autotuner.max_tile_size('RRDBNet-b23-x4', batch_size=8)
+    assert batched <= single
+    assert tile_autotuner.estimate_tile_memory('RRDBNet-b23-x4', 256, 10, 8) == \
+        8 * tile_autotuner.estimate_tile_memory('RRDBNet-b23-x4', 256, 10, 1)
+
+
+def test_network_id():
+    assert tile_autotuner.network_id('RRDBNet', 4, 23) == 'RRDBNet-b23-x4'
+    assert tile_autotuner.network_id('SRVGGNetCompact', 4, 32) == 'SRVGGNetCompact-c32-x4'
+    assert set(map(lambda n: n.split('-')[0], tile_autotuner.NETWORKS)) == {'RRDBNet', 'SRVGGNetCompact'}
+
+
+def test_autotune_benchmarks_at_batch_size_and_reloads(profile_path, monkeypatch):
+    forward_sizes = []
+
+    def infer_batch(upsampler, tiles, scale):
+        forward_sizes.append(len(tiles))
+        return [t.repeat(scale, axis=0).repeat(scale, axis=1) for t in tiles]
+
+    monkeypatch.setattr(tiling, 'infer_batch', infer_batch)
+    monkeypatch.setattr(tile_autotuner, '_BenchmarkUpsampler', lambda network: object())
+    monkeypatch.setattr(tile_autotuner, 'BENCHMARK_SIZE', 48)
+    monkeypatch.setattr(tile_autotuner, 'CANDIDATE_TILES', (8, 16))
+    # No context padding, so every tile has the same shape and windows stay whole
+    monkeypatch.setattr(tile_autotuner, 'CANDIDATE_PADS', (0,))
+
+    profile = tile_autotuner.autotune(['RRDBNet-b6-x4'], batch_size=3)
+    entry = profile['RRDBNet-b6-x4']
+    assert entry['batch_size'] == 3
+    assert {(c['tile'], c['tile_pad']) for c in entry['candidates']} == {(8, 0), (16, 0)}
+    assert max(forward_sizes) == 3
+    # Written to disk and picked up without a restart
+    assert json.loads(profile_path.read_text())['networks']['RRDBNet-b6-x4']['tile'] == entry['tile']
+    assert tile_autotuner.get_tile_config('RRDBNet-b6-x4') == (entry['tile'], entry['tile_pad'])
+
+    # Already profiled networks are skipped unless forced
+    forward_sizes.clear()
+    tile_autotuner.autotune(['RRDBNet-b6-x4'], batch_size=3)
+    assert forward_sizes == []
+
+
+def test_infer_grouped_keeps_input_order(monkeypatch):
+    monkeypatch.setattr(tiling, 'infer_batch', lambda upsampler, tiles, scale: [t + 1 for t in tiles])
+    tiles = [np.zeros((4, 4, 3), np.uint8), np.zeros((2, 4, 3), np.uint8), np.ones((4, 4, 3), np.uint8)]
+    outputs = tile_autotuner._infer_grouped(None, tiles, 1)
+    assert [o.shape for o in outputs] == [(4, 4, 3), (2, 4, 3), (4, 4, 3)]
+    assert [int(o[0, 0, 0]) for o in outputs] == [1, 1, 2]
@@ -0,0 +1,170 @@
+"""Tests for the tile output cache"""
+
+import numpy as np
+import pytest
+
+from modules.upscaler.tile_cache import JobTileCache, TileCache
+
+
+def tile(value, side=4):
+    return np.full((side, side, 3), value, np.uint8)
+
+
+def test_lru_is_bounded_by_bytes():
+    cache = TileCache(max_bytes=3 * tile(0).nbytes)
+    for i in range(3):
+        cache.put(('image', i), tile(i))
+    cache.get(('image', 0))  # Most recently used now
+    cache.put(('image', 3), tile(3))
+    assert cache.get(('image', 1)) is None
+    assert cache.get(('image', 0)) is not None and cache.get(('image', 3)) is not None
+    stats = cache.get_stats()
+    assert stats['evictions'] == 1 and stats['bytes'] == 3 * tile(0).nbytes
+
+
+def test_tiles_larger_than_the_cache_are_not_kept():
+    cache = TileCache(max_bytes=10)
+    cache.put('big', tile(1))
+    assert cache.get('big') is None
+
+
+def test_cached_tiles_are_private_read_only_copies():
+    cache = TileCache(max_bytes=1 << 20)
+    batch = np.stack([tile(1), tile(2)])
+    cache.put('a', batch[0])
+    batch[0] = 9
+    stored = cache.get('a')
+    assert int(stored[0, 0, 0]) == 1
+    # The cache does not pin the whole batch the tile came from
+    assert stored.base is None
+    with pytest.raises(ValueError):
+        stored[0, 0, 0] = 5
+
+
+def test_content_key_covers_pixels_shape_and_model():
+    from modules.upscaler.tile_cache import content_key
+    base = content_key(tile(1), 'RRDBNet/x4/fp32/eager/cpu')
+    assert base == content_key(tile(1), 'RRDBNet/x4/fp32/eager/cpu')
+    assert base != content_key(tile(2), 'RRDBNet/x4/fp32/eager/cpu')
+    assert base != content_key(tile(1), 'RRDBNet/x4/fp32/onnx/cpu')
+    assert content_key(np.zeros((2, 8, 3), np.uint8), 'm') != content_key(np.zeros((8, 2, 3), np.uint8), 'm')
+    # Same padded pixels, core placed differently (image edge vs interior)
+    assert content_key(tile(1), 'm', (0, 0, 2, 2)) != content_key(tile(1), 'm', (2, 2, 2, 2))
+
+
+def test_job_cache_stores_cores_on_first_sight():
+    cache = TileCache(max_bytes=1 << 20)
+    first, second = {}, {}
+    job = JobTileCache(cache, 'm', first)
+    key = job.key(tile(1), (1, 1, 2, 2))
+    assert job.get(key) is None
+    job.put(key, tile(1, side=2))
+    assert cache.get_stats()['tiles'] == 1
+    assert first['tile_cache'] == {'hits': 0, 'misses': 1, 'skipped': 0, 'hit_ratio': 0.0}
+
+    again = JobTileCache(cache, 'm', second)
+    np.testing.assert_array_equal(again.get(again.key(tile(1), (1, 1, 2, 2))), tile(1, side=2))
+    assert second['tile_cache'] == {'hits': 1, 'misses': 0, 'skipped': 0, 'hit_ratio': 1.0}
+    assert again.get(again.key(tile(1), (0, 0, 2, 2))) is None
+
+
+def test_require_repeat_stores_cores_on_the_second_sighting():
+    cache = TileCache(max_bytes=1 << 20)
+    stats = {}
+    job = JobTileCache(cache, 'm', stats, require_repeat=True)
+    key = job.key(tile(1), (0, 0, 4, 4))
+    job.put(key, tile(1))
+    # One-off content costs a hash, not a copy
+    assert cache.get_stats()['tiles'] == 0 and cache.get_stats()['skipped'] == 1
+    assert stats['tile_cache']['skipped'] == 1
+    job.put(key, tile(1))
+    assert cache.get_stats()['tiles'] == 1 and stats['tile_cache']['skipped'] == 1
+
+
+def test_seen_keys_are_bounded(monkeypatch):
+    from modules.upscaler import tile_cache
+    monkeypatch.setattr(tile_cache, 'SEEN_KEYS', 2)
+    cache = TileCache(max_bytes=1 << 20)
+    assert not cache.seen('a') and not cache.seen('b')
+    assert cache.seen('a')
+    cache.seen('c')  # Evicts 'b', the least recently seen
+    assert not cache.seen('b')
+    cache.clear()
+    assert not cache.seen('a')
+
+
+def test_shared_cache_has_no_disk_tier_unless_configured(tmp_path, monkeypatch):
+    from modules.upscaler import tile_cache
+    monkeypatch.setattr(tile_cache, '_cache', None)
+    monkeypatch.setattr(tile_cache, 'DISK_CACHE_DIR', '')
+    assert tile_cache.get_tile_cache().disk_dir is None
+
+    monkeypatch.setattr(tile_cache, '_cache', None)
+    monkeypatch.setattr(tile_cache, 'DISK_CACHE_DIR', str(tmp_path))
+    assert tile_cache.get_tile_cache().disk_dir == str(tmp_path)
+
+
+def test_disk_tier_is_written_on_a_repeat_hit(tmp_path):
+    key = 'ab' + '0' * 30
+    cache = TileCache(max_bytes=1 << 20, disk_dir=str(tmp_path))
+    cache.put(key, tile(7))
+    cache.flush()
+    # One-off content never reaches the disk
+    assert list(tmp_path.rglob('*.npz')) == []
+    cache.get(key)
+    cache.get(key)
+    cache.flush()
+    assert len(list(tmp_path.rglob('*.npz'))) == 1 and cache.get_stats()['disk_writes'] == 1
+
+    restarted = TileCache(max_bytes=1 << 20, disk_dir=str(tmp_path))
+    np.testing.assert_array_equal(restarted.get(key), tile(7))
+    assert restarted.get_stats()['disk_hits'] == 1
+    # Already on disk: later hits do not write it again
+    restarted.get(key)
+    restarted.flush()
+    assert restarted.get_stats()['disk_writes'] == 0
+    # Only content-hash (string) keys are persisted
+    restarted.put(('image', 0), tile(1))
+    restarted.get(('image', 0))
+    restarted.flush()
+    assert len(list(tmp_path.rglob('*.npz'))) == 1
+
+
+def test_disk_writes_run_off_the_calling_thread(tmp_path, monkeypatch):
+    import threading
+    cache = TileCache(max_bytes=1 << 20, disk_dir=str(tmp_path))
+    writers = []
+    disk_put = cache._disk_put
+    monkeypatch.setattr(cache, '_disk_put', lambda key, t: writers.append(threading.current_thread()) or disk_put(key, t))
+    cache.put('cd' + '0' * 30, tile(3))
+    cache.get('cd' + '0' * 30)
+    cache.flush()
+    assert writers and threading.current_thread() not in writers
+    assert cache.get_stats()['disk_pending'] == 0
+
+
+def test_disk_writes_beyond_the_queue_are_dropped(tmp_path, monkeypatch):
+    from modules.upscaler import tile_cache
+    monkeypatch.setattr(tile_cache, 'DISK_MAX_PENDING', 0)
+    cache = TileCache(max_bytes=1 << 20, disk_dir=str(tmp_path))
+    key = 'ef' + '0' * 30
+    cache.put(key, tile(3))
+    cache.get(key)
+    assert cache.get_stats()['disk_dropped'] == 1
+    # Retried on the next hit once there is room
+    monkeypatch.setattr(tile_cache, 'DISK_MAX_PENDING', 4)
+    cache.get(key)
+    cache.flush()
+    assert cache.get_stats()['disk_writes'] == 1
+
+
+def test_disk_tier_is_pruned_to_its_budget(tmp_path, rng):
+    noise = [rng.integers(0, 256, (8, 8, 3), dtype=np.uint8) for _ in range(6)]
+    cache = TileCache(max_bytes=1 << 20, disk_dir=str(tmp_path), disk_max_bytes=1500)
+    for i, t in enumerate(noise):
+        cache.put(f'{i:02d}' + 'f' * 30, t)
+        cache.get(f'{i:02d}' + 'f' * 30)
+        cache.flush()
+    files = list(tmp_path.rglob('*.npz'))
+    assert sum(f.stat().st_size for f in files) <= 1500
+    assert 0 < len(files) < 6
@@ -0,0 +1,202 @@
+"""Tests for tiled Real-ESRGAN inference with a stand-in network"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from modules.upscaler import tiling
+from modules.upscaler.tiling import plan_tiles, tiles_in_region, upscale_tiled
+
+SCALE = 2
+
+
+def nearest(tile: np.ndarray, scale: int = SCALE) -> np.ndarray:
+    """Stand-in network: nearest-neighbour upscale, so tiled output must equal whole-image output"""
+    return tile.repeat(scale, axis=0).repeat(scale, axis=1)
+
+
+def fake_infer(batches: list = None):
+    def infer(tiles):
+        if batches is not None:
+            batches.append(len(tiles))
+        return [nearest(t) for t in tiles]
+    return infer
+
+
+@pytest.mark.parametrize('width, height', [(64, 64), (70, 45), (1, 1), (33, 100)])
+def test_plan_tiles_covers_image_once(width, height):
+    covered = np.zeros((height, width), np.int32)
+    for tile in plan_tiles(width, height, tile_size=32, tile_pad=5):
+        covered[tile.y0:tile.y1, tile.x0:tile.x1] += 1
+        assert 0 <= tile.px0 <= tile.x0 and tile.x1 <= tile.px1 <= width
+        assert 0 <= tile.py0 <= tile.y0 and tile.y1 <= tile.py1 <= height
+        assert tile.x0 - tile.px0 <= 5 and tile.px1 - tile.x1 <= 5
+    assert (covered == 1).all()
+
+
+def test_upscale_tiled_matches_whole_image(rng):
+    image = rng.integers(0, 256, (45, 70, 3), dtype=np.uint8)
+    out = np.zeros((90, 140, 3), np.uint8)
+    count = upscale_tiled(None, image, out, SCALE, tile_size=16, tile_pad=4, infer=fake_infer())
+    assert count == len(plan_tiles(70, 45, 16, 4))
+    # Tiles come back RGB and are stored BGR
+    np.testing.assert_array_equal(out, nearest(image)[..., ::-1])
+
+
+def test_upscale_tiled_writes_into_memmap(rng, tmp_path):
+    image = rng.integers(0, 256, (20, 30, 3), dtype=np.uint8)
+    out = np.memmap(tmp_path / 'out.raw', dtype=np.uint8, mode='w+', shape=(40, 60, 3))
+    upscale_tiled(None, image, out, SCALE, tile_size=8, tile_pad=2, infer=fake_infer())
+    np.testing.assert_array_equal(np.asarray(out), nearest(image)[..., ::-1])
+
+
+def test_upscale_tiled_groups_tiles_by_window(rng):
+    image = rng.integers(0, 256, (32, 40, 3), dtype=np.uint8)
+    batches = []
+    upscale_tiled(None, image, np.zeros((64, 80, 3), np.uint8), SCALE, tile_size=8, tile_pad=2,
+                  infer=fake_infer(batches), window=6)
+    assert sum(batches) == 20
+    assert max(batches) == 6
+
+
+def test_upscale_tiled_stops_when_cancelled(rng):
+    image = rng.integers(0, 256, (32, 32, 3), dtype=np.uint8)
+    cancel = threading.Event()
+    calls = []
+
+    def infer(tiles):
+        calls.append(len(tiles))
+        cancel.set()
+        return [nearest(t) for t in tiles]
+
+    with pytest.raises(TimeoutError):
+        upscale_tiled(None, image, np.zeros((64, 64, 3), np.uint8), SCALE, tile_size=8, tile_pad=2,
+                      infer=infer, cancel_event=cancel)
+    assert calls == [1]
+
+
+def test_tiles_in_region():
+    tiles = plan_tiles(64, 64, tile_size=16, tile_pad=4)
+    picked = {t.index for t in tiles_in_region(tiles, 10, 20, 33, 33)}
+    assert picked == {(1, 0), (1, 1), (1, 2), (2, 0), (2, 1), (2, 2)}
+    assert tiles_in_region(tiles, 16, 16, 16, 32) == []
+
+
+def test_crop_core_drops_padding(rng):
+    image = rng.integers(0, 256, (40, 40, 3), dtype=np.uint8)
+    for tile in plan_tiles(40, 40, tile_size=16, tile_pad=3):
+        output = nearest(image[tile.py0:tile.py1, tile.px0:tile.px1])
+        core = tiling.crop_core(tile, output, SCALE)
+        np.testing.assert_array_equal(core, nearest(image[tile.y0:tile.y1, tile.x0:tile.x1]))
+
+
+def test_tile_texture_scores_busiest_block(rng):
+    flat = np.full((64, 64, 3), 90, np.uint8)
+    assert tiling.tile_texture(flat) == 0.0
+    busy = flat.copy()
+    # A small textured object on a flat backdrop still marks the tile as detailed
+    busy[8:24, 8:24] = rng.integers(0, 256, (16, 16, 3), dtype=np.uint8)
+    assert tiling.tile_texture(busy) > 20
+    assert tiling.tile_texture(busy) > 4 * float(np.abs(np.diff(busy.astype(np.float32), axis=1)).mean())
+
+
+@pytest.fixture
+def constant_outputs(monkeypatch):
+    """Network tiles come back as 200 everywhere and resampled flat tiles as 0, so blending is visible"""
+    monkeypatch.setattr(tiling, 'resample_tile',
+                        lambda region, scale: np.zeros((region.shape[0] * scale, region.shape[1] * scale, 3), np.uint8))
+    return lambda tiles: [np.full((t.shape[0] * SCALE, t.shape[1] * SCALE, 3), 200, np.uint8) for t in tiles]
+
+
+def textured_corner(rng, size=96, detail=16):
+    """Flat image except for detail in the top-left tile (tile size 32, pad 8)"""
+    image = np.zeros((size, size, 3), np.uint8)
+    image[:detail, :detail] = rng.integers(0, 256, (detail, detail, 3), dtype=np.uint8)
+    return image
+
+
+def test_flat_tiles_skip_the_network(rng, constant_outputs):
+    image = textured_corner(rng)
+    seen = []
+    stats = {}
+
+    def infer(tiles):
+        seen.extend(t.shape for t in tiles)
+        return constant_outputs(tiles)
+
+    upscale_tiled(None, image, np.zeros((192, 192, 3), np.uint8), SCALE, tile_size=32, tile_pad=8,
+                  infer=infer, flat_threshold=4.0, stats=stats)
+    assert len(seen) == 1
+    assert (stats['tiles'], stats['neural_tiles'], stats['flat_tiles']) == (9, 1, 8)
+    assert stats['skipped_fraction'] == round(8 / 9, 3)
+
+
+def test_flat_routing_is_off_by_default(rng, constant_outputs):
+    stats = {}
+    upscale_tiled(None, textured_corner(rng), np.zeros((192, 192, 3), np.uint8), SCALE, tile_size=32, tile_pad=8,
+                  infer=constant_outputs, stats=stats)
+    assert stats['flat_tiles'] == 0
+
+
+def test_flat_tile_edges_fade_from_network_output(rng, constant_outputs):
+    out = np.zeros((192, 192, 3), np.uint8)
+    upscale_tiled(None, textured_corner(rng), out, SCALE, tile_size=32, tile_pad=8,
+                  infer=constant_outputs, flat_threshold=4.0)
+    seam = 64  # Output column where tile (0, 1) starts
+    edge = out[:64, seam:seam + 16, 0].astype(np.int16)
+    # Close to the network's value at the seam, fading to the resampled value over the padding
+    assert edge[:, 0].min() >= 190
+    assert (np.diff(edge, axis=1) <= 0).all()
+    assert (out[:64, seam + 16:128, 0] == 0).all()
+
+
+def test_diagonal_flat_tile_corner_is_blended(rng, constant_outputs):
+    out = np.zeros((192, 192, 3), np.uint8)
+    upscale_tiled(None, textured_corner(rng), out, SCALE, tile_size=32, tile_pad=8,
+                  infer=constant_outputs, flat_threshold=4.0)
+    corner = out[64:80, 64:80, 0].astype(np.int16)
+    # Weight 1 only at the shared corner, falling off along both axes
+    assert corner[0, 0] >= 180
+    assert corner[-1, -1] < 10
+    assert (np.diff(corner, axis=0) <= 0).all() and (np.diff(corner, axis=1) <= 0).all()
+    # No step where the corner meets the edge-blended tiles above and to the left
+    above, left = out[63, 64:80, 0].astype(np.int16), out[64:80, 63, 0].astype(np.int16)
+    assert np.abs(corner[0] - above).max() <= 16
+    assert np.abs(corner[:, 0] - left).max() <= 16
+
+
+def test_cached_cores_skip_the_network(rng):
+    from modules.upscaler.tile_cache import JobTileCache, TileCache
+    cache = TileCache(max_bytes=1 << 20)
+    image = rng.integers(0, 256, (45, 70, 3), dtype=np.uint8)
+    tiles = len(plan_tiles(70, 45, 16, 4))
+
+    batches, first = [], {}
+    upscale_tiled(None, image, np.zeros((90, 140, 3), np.uint8), SCALE, tile_size=16, tile_pad=4,
+                  infer=fake_infer(batches), window=4, cache=JobTileCache(cache, 'm', first))
+    assert sum(batches) == tiles and first['tile_cache']['misses'] == tiles
+    # Only the cores are kept
+    assert cache.get_stats()['bytes'] == image.nbytes * SCALE * SCALE
+
+    batches, second = [], {}
+    out = np.zeros((90, 140, 3), np.uint8)
+    upscale_tiled(None, image, out, SCALE, tile_size=16, tile_pad=4,
+                  infer=fake_infer(batches), window=4, cache=JobTileCache(cache, 'm', second))
+    assert batches == [] and second['tile_cache']['hits'] == tiles
+    np.testing.assert_array_equal(out, nearest(image)[..., ::-1])
+
+
+def test_tiles_next_to_flat_tiles_bypass_the_cache(rng, constant_outputs):
+    from modules.upscaler.tile_cache import JobTileCache, TileCache
+    cache = TileCache(max_bytes=1 << 20)
+    image = textured_corner(rng)
+    runs = []
+    for _ in range(2):
+        batches = []
+        upscale_tiled(None, image, np.zeros((192, 192, 3), np.uint8), SCALE, tile_size=32, tile_pad=8,
+                      infer=lambda tiles: batches.append(len(tiles)) or constant_outputs(tiles),
+                      flat_threshold=4.0, cache=JobTileCache(cache, 'm'))
+        runs.append(batches)
+    # Its padding is needed again to blend the seams with its flat neighbours
+    assert runs == [[1], [1]]
@@ -0,0 +1,107 @@
+"""Tests for UpscalerEngine model selection and the Real-ESRGAN tile path, with a stand-in network"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip('PIL')
+
+from PIL import Image  # noqa: E402
+
+from modules.model_registry import ModelKey, ModelRegistry  # noqa: E402
+from modules.upscaler import upscaler_engine  # noqa: E402
+from modules.upscaler.batch_scheduler import InferenceScheduler  # noqa: E402
+from modules.upscaler.upscaler_engine import UpscalerEngine  # noqa: E402
+
+
+def nearest(tile, scale):
+    return tile.repeat(scale, axis=0).repeat(scale, axis=1)
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = UpscalerEngine(model_registry=ModelRegistry(idle_timeout=0), scheduler=InferenceScheduler())
+    # A 4x RRDBNet stand-in: the scheduler hands tiles straight to a nearest-neighbour "network"
+    key = ModelKey('RRDBNet/fake', 4, 'fp32', 'cpu')
+    monkeypatch.setattr(engine, '_network_spec', lambda *args, **kwargs: (key, object, 'RRDBNet-b23-x4'))
+    monkeypatch.setattr(engine.scheduler, 'infer_many',
+                        lambda key, upsampler, tiles, scale: [nearest(t, scale) for t in tiles])
+    engine.tile_cache.clear()
+    return engine
+
+
+@pytest.fixture
+def photo(tmp_path, rng):
+    path = tmp_path / 'input.png'
+    Image.fromarray(rng.integers(0, 256, (24, 40, 3), dtype=np.uint8)).save(path)
+    return path
+
+
+def test_auto_keeps_super_enhanced_unless_compact_is_enabled(engine, monkeypatch):
+    engine.available_models['realesrgan_general_4x']['available'] = True
+    assert engine._select_best_model() == 'super_enhanced_4x'
+    monkeypatch.setattr(upscaler_engine, 'AUTO_COMPACT', True)
+    assert engine._select_best_model() == 'realesrgan_general_4x'
+
+
+@pytest.mark.parametrize('model, scale', [
+    ('realesrgan_2x', 2), ('realesrgan_8x', 8), ('realesrgan_4x@onnx', 4),
+    ('custom_2x', 2), ('custom_8x', 8), ('custom', 4),
+])
+def test_model_scale(engine, model, scale):
+    assert engine._model_scale(model) == scale
+
+
+def test_unknown_models_fall_back_at_the_requested_scale(engine, monkeypatch):
+    calls = []
+
+    async def fallback(input_path, output_path, model, scale, encoder_profile, stats):
+        calls.append((model, scale))
+        return True
+
+    monkeypatch.setattr(engine, '_super_enhanced_pil_upscale', fallback)
+    assert asyncio.run(engine.upscale_image('in.png', 'out.png', model='realesrgan_2x'))
+    assert calls == [('super_enhanced_2x', 2)]
+
+
+def test_realesrgan_4x_tiles_the_whole_image(engine, photo, tmp_path):
+    pytest.importorskip('cv2')
+    output = tmp_path / 'out.png'
+    stats = engine._realesrgan_process(str(photo), str(output), 'realesrgan_4x')
+    expected = nearest(np.array(Image.open(photo)), 4)
+    np.testing.assert_array_equal(np.array(Image.open(output)), expected)
+    assert stats['tiles'] >= 1
+
+
+def test_realesrgan_8x_writes_an_8x_output(engine, photo, tmp_path):
+    pytest.importorskip('cv2')
+    output = tmp_path / 'out.png'
+    engine._realesrgan_process(str(photo), str(output), 'realesrgan_8x')
+    assert Image.open(output).size == (40 * 8, 24 * 8)
+
+
+def test_region_reuses_tiles_when_panning(engine, photo, tmp_path):
+    pytest.importorskip('cv2')
+    engine.available_models['realesrgan_4x']['available'] = True
+    full = nearest(np.array(Image.open(photo)), 4)[..., ::-1]
+    crops = []
+    for i, rect in enumerate([(0, 0, 20, 16), (8, 4, 20, 16)]):
+        output = tmp_path / f'region{i}.png'
+        crops.append(engine._region_process(str(photo), str(output), 'realesrgan_4x', rect))
+        x, y, w, h = rect
+        np.testing.assert_array_equal(np.array(Image.open(output))[..., ::-1], full[y * 4:(y + h) * 4, x * 4:(x + w) * 4])
+    assert crops[0]['tiles_cached'] == 0
+    # The second viewport overlaps the first, so its shared tiles come from the cache
+    assert crops[1]['tiles_cached'] > 0
+    assert crops[1]['tiles_computed'] < crops[1]['tiles']
+
+
+def test_region_outside_the_image_is_rejected(engine, photo, tmp_path):
+    with pytest.raises(ValueError, match='outside'):
+        engine._region_process(str(photo), str(tmp_path / 'out.png'), 'realesrgan_4x', (100, 100, 10, 10))
+
+
+def test_region_needs_a_network_model(engine, photo, tmp_path):
+    with pytest.raises(ValueError, match='Real-ESRGAN'):
+        asyncio.run(engine.upscale_region(str(photo), str(tmp_path / 'out.png'), (0, 0, 8, 8), model='lanczos_4x'))
@@ -0,0 +1,122 @@
+"""Tests for the supervised worker pool: deadlines, crashes, recycling and pipe ownership"""
+
+import asyncio
+import os
+import time
+
+import pytest
+
+from modules.worker_pool import WorkerPool, WorkerTimeoutError
+
+pytestmark = pytest.mark.skipif(not WorkerPool.is_supported(), reason='worker pool needs fork')
+
+
+class Engine:
+    """Stand-in engine; workers inherit it through fork"""
+
+    def pid(self):
+        return os.getpid()
+
+    def echo(self, value, suffix=''):
+        return f"{value}{suffix}"
+
+    async def echo_async(self, value):
+        return value * 2
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+        return os.getpid()
+
+    def crash(self):
+        os._exit(3)
+
+    def fail(self):
+        raise ValueError('bad input')
+
+    def sockets(self):
+        links = []
+        for fd in os.listdir('/proc/self/fd'):
+            try:
+                links.append(os.readlink(f'/proc/self/fd/{fd}'))
+            except OSError:
+                pass  # The descriptor listdir() itself used
+        return sorted(link for link in links if link.startswith('socket:'))
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(**kwargs):
+        pool = WorkerPool({'engine': Engine()}, **{'size': 1, **kwargs})
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.shutdown()
+
+
+def run(pool, method, *args, timeout=10.0, **kwargs):
+    return asyncio.run(pool.run('engine', method, *args, timeout=timeout, **kwargs))
+
+
+def test_runs_jobs_in_a_worker_process(make_pool):
+    pool = make_pool()
+    assert run(pool, 'echo', 'a', suffix='b') == 'ab'
+    assert run(pool, 'echo_async', 21) == 42
+    assert run(pool, 'pid') != os.getpid()
+    assert pool.get_stats()['jobs'] == 3
+
+
+def test_job_errors_come_back_as_runtime_errors(make_pool):
+    pool = make_pool()
+    first = run(pool, 'pid')
+    with pytest.raises(RuntimeError, match='ValueError: bad input'):
+        run(pool, 'fail')
+    # An exception in the job does not cost the worker
+    assert run(pool, 'pid') == first
+    assert pool.get_stats()['errors'] == 1
+
+
+def test_missed_deadline_kills_and_replaces_the_worker(make_pool):
+    pool = make_pool()
+    first = run(pool, 'pid')
+    started = time.monotonic()
+    with pytest.raises(WorkerTimeoutError):
+        run(pool, 'sleep', 30, timeout=0.5)
+    assert time.monotonic() - started < 5
+    assert run(pool, 'pid') != first
+    assert pool.get_stats()['timeouts'] == 1
+
+
+def test_crashed_worker_is_replaced(make_pool):
+    pool = make_pool()
+    with pytest.raises(RuntimeError, match='died'):
+        run(pool, 'crash')
+    assert run(pool, 'echo', 'ok') == 'ok'
+    assert pool.get_stats()['crashes'] == 1
+
+
+def test_workers_are_recycled_after_max_jobs(make_pool):
+    pool = make_pool(max_jobs=2)
+    pids = [run(pool, 'pid') for _ in range(4)]
+    assert pids[0] == pids[1] and pids[2] == pids[3]
+    assert pids[1] != pids[2]
+    assert pool.get_stats()['recycled_jobs'] == 2
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='needs /proc')
+def test_workers_hold_only_their_own_pipe(make_pool):
+    # Sockets the test process already had (e.g. a socket on stdin) are inherited by design
+    inherited = set(Engine().sockets())
+    pool = make_pool(size=2)
+    first = set(run(pool, 'sockets')) - inherited
+    second = set(run(pool, 'sockets')) - inherited
+    # Each worker keeps its one pipe end; no sibling's or fork server's end leaks in
+    assert len(first) == 1 and len(second) == 1
+    assert first != second
+
+
+def test_cuda_engines_stay_in_process():
+    assert not WorkerPool.is_supported('cuda')